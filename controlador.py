@@ -2,15 +2,17 @@ import os
 import logging
 import pandas as pd
 from datetime import datetime
-from typing import Optional, Dict, Any, Tuple
-from dataclasses import dataclass, asdict
+from typing import Optional, Dict, Any, List, Tuple
+from dataclasses import dataclass, asdict, field
 from pathlib import Path
 from threading import Lock
 
-from procesamiento.paso1 import validar_renovaciones, validator, ValidationResult
+from procesamiento.paso1 import validar_renovaciones, obtener_validador, ValidationResult
+from procesamiento.canonico import quitar_columnas_tecnicas
+from procesamiento.exportador_excel import exportar_dataframe_excel
+from procesamiento.db_sqlite import eliminar_sesion
+from procesamiento.sesiones import en_sesion, sesion_actual, validar_sesion
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -34,24 +36,60 @@ class EstadoValidacion:
             'success': self.success
         }
 
+@dataclass
+class SesionValidacion:
+    """Estado de validación de una sesión (ver procesamiento.sesiones)"""
+    id: str
+    estado: Optional[EstadoValidacion] = None
+    historial: List[Dict[str, Any]] = field(default_factory=list)
+    lock: Lock = field(default_factory=Lock, repr=False)
+
+
 class ControladorValidacion:
-    """Controlador mejorado para validación de archivos WorkOrder"""
+    """
+    Controlador mejorado para validación de archivos WorkOrder.
+
+    El resultado y el historial son de cada sesión: validaciones de sesiones
+    distintas se ejecutan a la vez sin sobrescribirse. Los métodos usan la
+    sesión del contexto actual salvo que se indique `sesion`.
+    """
     
     def __init__(self):
-        self._estado_validacion: Optional[EstadoValidacion] = None
-        self._lock = Lock()  # Para thread-safety
-        self._historial_validaciones = []  # Historial de validaciones
+        self._sesiones: Dict[str, SesionValidacion] = {}
+        self._lock = Lock()  # Solo protege el registro de sesiones
     
-    def validar_archivo_workorder(self, ruta_archivo: str) -> Tuple[bool, str, Dict[str, Any]]:
+    def _sesion(self, sesion: Optional[str] = None) -> SesionValidacion:
+        """Estado de la sesión indicada (o la actual), creándolo si no existe"""
+        sesion = validar_sesion(sesion or sesion_actual())
+        with self._lock:
+            estado = self._sesiones.get(sesion)
+            if estado is None:
+                estado = self._sesiones[sesion] = SesionValidacion(sesion)
+            return estado
+
+    def _buscar_sesion(self, sesion: Optional[str] = None) -> Optional[SesionValidacion]:
+        """Estado de la sesión indicada (o la actual) sin crearlo: para consultas"""
+        sesion = validar_sesion(sesion or sesion_actual())
+        with self._lock:
+            return self._sesiones.get(sesion)
+    
+    def validar_archivo_workorder(self, ruta_archivo: str,
+                                  sesion: Optional[str] = None) -> Tuple[bool, str, Dict[str, Any]]:
         """
-        Valida un archivo WorkOrder y almacena el resultado
+        Valida un archivo WorkOrder y almacena el resultado en la sesión
         
         Args:
             ruta_archivo: Ruta al archivo Excel a validar
+            sesion: Sesión del resultado y de temp_paso1 (por defecto, la actual)
             
         Returns:
             Tuple con (success, mensaje, estadisticas)
         """
+        estado_sesion = self._sesion(sesion)
+        with en_sesion(estado_sesion.id):
+            return self._validar(ruta_archivo, estado_sesion)
+    
+    def _validar(self, ruta_archivo: str, estado_sesion: SesionValidacion) -> Tuple[bool, str, Dict[str, Any]]:
         try:
             logger.info(f"Iniciando validación de archivo: {ruta_archivo}")
 
@@ -66,7 +104,7 @@ class ControladorValidacion:
                 return False, "El archivo debe ser un archivo Excel (.xlsx o .xls)", {}
 
             # Realizar validación usando el validador mejorado
-            resultado = validator.validar_renovaciones(ruta_archivo)
+            resultado = obtener_validador().validar_renovaciones(ruta_archivo)
             
             if not resultado.success or resultado.data is None:
                 return False, resultado.message, {}
@@ -82,80 +120,121 @@ class ControladorValidacion:
                 'correctos': resultado.stats['registros_correctos'],
                 'incorrectos': resultado.stats['registros_incorrectos'],
                 'advertencias': resultado.stats['advertencias'],
-                'grupos_procesados': resultado.stats['grupos_procesados']
+                'grupos_procesados': resultado.stats['grupos_procesados'],
+                'timings': resultado.stats.get('timings', {})
             }
+            if 'memoria' in resultado.stats:
+                stats['memoria'] = resultado.stats['memoria']
 
-            with self._lock:
-                self._estado_validacion = EstadoValidacion(
-                    archivo_procesado=ruta_archivo,
-                    timestamp=datetime.now(),
-                    df_validado=df_resultado,
-                    mensaje=mensaje,
-                    estadisticas=stats,
-                    success=True
-                )
-                self._historial_validaciones.append(self._estado_validacion.to_dict())
+            estado = EstadoValidacion(
+                archivo_procesado=ruta_archivo,
+                timestamp=datetime.now(),
+                df_validado=df_resultado,
+                mensaje=mensaje,
+                estadisticas=stats,
+                success=True
+            )
+            with estado_sesion.lock:
+                estado_sesion.estado = estado
+                estado_sesion.historial.append(estado.to_dict())
                 # Mantener solo las últimas 10 validaciones
-                if len(self._historial_validaciones) > 10:
-                    self._historial_validaciones = self._historial_validaciones[-10:]
+                if len(estado_sesion.historial) > 10:
+                    estado_sesion.historial = estado_sesion.historial[-10:]
 
-            logger.info(f"Validación completada - Success: {self._estado_validacion.success}")
-            return self._estado_validacion.success, self._estado_validacion.mensaje, self._estado_validacion.estadisticas
+            logger.info(f"Validación completada - Success: {estado.success} (sesión {estado_sesion.id})")
+            return estado.success, estado.mensaje, estado.estadisticas
 
         except Exception as e:
             error_msg = f"Error inesperado durante la validación: {str(e)}"
             logger.error(error_msg, exc_info=True)
             return False, error_msg, {}
     
-    def obtener_resultado_validacion(self) -> Optional[EstadoValidacion]:
+    def obtener_resultado_validacion(self, sesion: Optional[str] = None) -> Optional[EstadoValidacion]:
         """
-        Obtiene el último resultado de validación
+        Obtiene el último resultado de validación de la sesión
         
         Returns:
             EstadoValidacion o None si no hay validación previa
         """
-        with self._lock:
-            return self._estado_validacion
+        estado_sesion = self._buscar_sesion(sesion)
+        if estado_sesion is None:
+            return None
+        with estado_sesion.lock:
+            return estado_sesion.estado
     
-    def obtener_dataframe_validado(self) -> Optional[pd.DataFrame]:
+    def obtener_dataframe_validado(self, sesion: Optional[str] = None) -> Optional[pd.DataFrame]:
         """
-        Obtiene el DataFrame validado de la última validación exitosa
+        Obtiene el DataFrame validado de la última validación exitosa de la sesión
         
         Returns:
             DataFrame validado o None si no hay validación exitosa
         """
-        with self._lock:
-            if self._estado_validacion and self._estado_validacion.success:
-                return self._estado_validacion.df_validado
-            return None
+        estado = self.obtener_resultado_validacion(sesion)
+        if estado and estado.success:
+            return estado.df_validado
+        return None
     
-    def obtener_estadisticas_actuales(self) -> Dict[str, Any]:
+    def obtener_estadisticas_actuales(self, sesion: Optional[str] = None) -> Dict[str, Any]:
         """
-        Obtiene las estadísticas de la última validación
+        Obtiene las estadísticas de la última validación de la sesión
         
         Returns:
             Diccionario con estadísticas
         """
-        with self._lock:
-            if self._estado_validacion:
-                return self._estado_validacion.estadisticas
-            return {}
+        estado = self.obtener_resultado_validacion(sesion)
+        return estado.estadisticas if estado else {}
     
-    def obtener_historial_validaciones(self) -> list:
+    def obtener_historial_validaciones(self, sesion: Optional[str] = None) -> list:
         """
-        Obtiene el historial de validaciones recientes
+        Obtiene el historial de validaciones recientes de la sesión
         
         Returns:
             Lista con las últimas validaciones
         """
+        estado_sesion = self._buscar_sesion(sesion)
+        if estado_sesion is None:
+            return []
+        with estado_sesion.lock:
+            return estado_sesion.historial.copy()
+    
+    def limpiar_estado(self, sesion: Optional[str] = None):
+        """Limpia el estado actual de validación de la sesión"""
+        estado_sesion = self._buscar_sesion(sesion)
+        if estado_sesion is None:
+            return
+        with estado_sesion.lock:
+            estado_sesion.estado = None
+        logger.info(f"Estado de validación limpiado (sesión {estado_sesion.id})")
+    
+    def listar_sesiones(self) -> List[Dict[str, Any]]:
+        """Sesiones con estado en el controlador y su última validación"""
         with self._lock:
-            return self._historial_validaciones.copy()
+            sesiones = list(self._sesiones.values())
+        resumen = []
+        for estado_sesion in sesiones:
+            with estado_sesion.lock:
+                estado = estado_sesion.estado
+                resumen.append({
+                    'sesion': estado_sesion.id,
+                    'validaciones': len(estado_sesion.historial),
+                    'ultima': estado.to_dict() if estado else None,
+                })
+        return resumen
     
-    def limpiar_estado(self):
-        """Limpia el estado actual de validación"""
+    def cerrar_sesion(self, sesion: str) -> bool:
+        """
+        Descarta el estado de una sesión y su base de datos temporal
+        (la sesión principal solo se limpia).
+        
+        Returns:
+            True si la sesión existía
+        """
+        sesion = validar_sesion(sesion)
         with self._lock:
-            self._estado_validacion = None
-            logger.info("Estado de validación limpiado")
+            existia = self._sesiones.pop(sesion, None) is not None
+        existia = eliminar_sesion(sesion) or existia
+        logger.info(f"Sesión cerrada: {sesion}")
+        return existia
     
     def exportar_resultado(self, ruta_destino: str, formato: str = 'xlsx') -> Tuple[bool, str]:
         """
@@ -172,12 +251,13 @@ class ControladorValidacion:
             df_validado = self.obtener_dataframe_validado()
             if df_validado is None:
                 return False, "No hay datos validados para exportar"
+            df_validado = quitar_columnas_tecnicas(df_validado)
             
             # Crear directorio si no existe
             Path(ruta_destino).parent.mkdir(parents=True, exist_ok=True)
             
             if formato.lower() == 'xlsx':
-                df_validado.to_excel(ruta_destino, index=False)
+                exportar_dataframe_excel(df_validado, ruta_destino, titulo_hoja="Validacion")
             elif formato.lower() == 'csv':
                 df_validado.to_csv(ruta_destino, index=False)
             else:
@@ -197,39 +277,38 @@ class ControladorValidacion:
         extension = Path(ruta_archivo).suffix.lower()
         return extension in extensiones_validas
     
-    def obtener_resumen_validacion(self) -> Dict[str, Any]:
+    def obtener_resumen_validacion(self, sesion: Optional[str] = None) -> Dict[str, Any]:
         """
-        Obtiene un resumen completo de la última validación
+        Obtiene un resumen completo de la última validación de la sesión
         
         Returns:
             Diccionario con resumen detallado
         """
-        with self._lock:
-            if not self._estado_validacion:
-                return {'estado': 'Sin validación previa'}
-            
-            estado = self._estado_validacion
-            resumen = {
-                'archivo': os.path.basename(estado.archivo_procesado),
-                'fecha_validacion': estado.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                'estado': 'Exitosa' if estado.success else 'Fallida',
-                'mensaje': estado.mensaje,
-                'total_registros': len(estado.df_validado) if estado.df_validado is not None else 0,
-                'estadisticas': estado.estadisticas
-            }
-            
-            # Agregar estadísticas adicionales si hay datos
-            if estado.df_validado is not None:
-                df = estado.df_validado
-                resumen.update({
-                    'registros_correctos': len(df[df['estado'] == 'Correcto']),
-                    'registros_incorrectos': len(df[df['estado'] == 'Incorrecto']),
-                    'porcentaje_exito': round(
-                        (len(df[df['estado'] == 'Correcto']) / len(df)) * 100, 2
-                    ) if len(df) > 0 else 0
-                })
-            
-            return resumen
+        estado = self.obtener_resultado_validacion(sesion)
+        if not estado:
+            return {'estado': 'Sin validación previa'}
+        
+        resumen = {
+            'archivo': os.path.basename(estado.archivo_procesado),
+            'fecha_validacion': estado.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            'estado': 'Exitosa' if estado.success else 'Fallida',
+            'mensaje': estado.mensaje,
+            'total_registros': len(estado.df_validado) if estado.df_validado is not None else 0,
+            'estadisticas': estado.estadisticas
+        }
+        
+        # Agregar estadísticas adicionales si hay datos
+        if estado.df_validado is not None:
+            df = estado.df_validado
+            resumen.update({
+                'registros_correctos': len(df[df['estado'] == 'Correcto']),
+                'registros_incorrectos': len(df[df['estado'] == 'Incorrecto']),
+                'porcentaje_exito': round(
+                    (len(df[df['estado'] == 'Correcto']) / len(df)) * 100, 2
+                ) if len(df) > 0 else 0
+            })
+        
+        return resumen
 
 # Instancia global del controlador
 controlador = ControladorValidacion()
@@ -281,6 +360,9 @@ def limpiar_estado_validacion():
 
 # Ejemplo de uso
 if __name__ == "__main__":
+    from procesamiento.bitacora import configurar_logging
+    configurar_logging(consola=True)
+
     # Ejemplo de uso del controlador mejorado
     ruta_test = "ejemplo_workorder.xlsx"
     
@@ -1,13 +1,15 @@
+import time
+_INICIO_PROCESO = time.perf_counter()
+
 import os
 import logging
 import threading
-import time
 import base64
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 from dataclasses import dataclass
-from bottle import Bottle, static_file, template, TEMPLATE_PATH
+from bottle import Bottle, template, TEMPLATE_PATH, request, response
 import webview
 import pandas as pd
 import json
@@ -17,6 +19,7 @@ import platform
 import tempfile
 import sys
 import io
+import functools
 # Forzar codificación UTF-8 solo si hay consola
 if sys.stdout and hasattr(sys.stdout, "buffer") and sys.stdout.isatty():
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8")
@@ -32,32 +35,22 @@ from controlador import (
     obtener_estadisticas_validacion
 )
 from procesamiento.db_sqlite import init_db, get_db_path
-
-# --- util JSON safe ---
-import math
-from datetime import datetime, date
-
-def _json_safe(value):
-    try:
-        import pandas as pd, numpy as np
-    except Exception:
-        pd = None; np = None
-
-    if isinstance(value, dict):
-        return {k: _json_safe(v) for k, v in value.items()}
-    if isinstance(value, list):
-        return [_json_safe(v) for v in value]
-    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
-        return None
-    if pd is not None:
-        try:
-            if pd.isna(value):
-                return None
-        except Exception:
-            pass
-    if isinstance(value, (datetime, date)):
-        return value.isoformat()
-    return value
+from procesamiento.canonico import quitar_columnas_tecnicas
+from procesamiento.exportador_excel import exportar_dataframe_excel
+from procesamiento.trabajos import EVENTO_FIN, flujo_sse, gestor_trabajos, reportar_etapa
+from procesamiento.subidas import TAMANO_BLOQUE, ErrorSubida, RegistroSubidas
+from procesamiento.almacen import AlmacenContenido
+from procesamiento.formato_columnar import formatear_filas, normalizar_formato_respuesta
+from procesamiento.serializacion import detalle_paso1, json_seguro, registros_json
+from procesamiento.consultas import consultar_origen, fijar_cruce_en_memoria, olvidar_cruce_en_memoria, opciones_consulta
+from procesamiento.servidor import ServidorMultihilo, huella_estaticos, servir_estatico
+from procesamiento.arranque import PRECALENTAMIENTOS, ArranqueApp
+from procesamiento.lote import ejecutar_lote, normalizar_paralelo, pares_desde_payload
+from procesamiento.sesiones import en_sesion, nueva_sesion, sesion_actual, validar_sesion
+from procesamiento.metricas import MAX_MUESTRAS, medido, medir, registro_tiempos
+from procesamiento.memoria import activar_perfil_memoria, perfil_memoria_activo
+from procesamiento.bitacora import configurar_logging
+from procesamiento.perfilado import activar_perfil_cpu, fijar_directorio_perfiles, perfil_cpu_activo, perfilado, perfiles_recientes
 
 # --------------------------------------
 # CONFIGURACIÓN GENERAL
@@ -73,6 +66,8 @@ STATIC_DIR = os.path.join(BASE_DIR, 'static')
 EXPORTS_DIR = os.path.join(BASE_DIR, 'datos', 'exports')
 TEMP_DIR = os.path.join(BASE_DIR, 'datos', 'temp')
 LOG_DIR = os.path.join(BASE_DIR, 'logs')
+# Espera máxima del long-poll de eventos con el servidor de un solo hilo (segundos)
+ESPERA_MAX_UN_HILO = 1.0
 
 os.makedirs(EXPORTS_DIR, exist_ok=True)
 os.makedirs(TEMP_DIR, exist_ok=True)
@@ -80,21 +75,8 @@ os.makedirs(LOG_DIR, exist_ok=True)
 
 TEMPLATE_PATH.insert(0, TEMPLATES_DIR)
 
-handlers = [
-    logging.FileHandler(os.path.join(LOG_DIR, 'wogest.log'), encoding='utf-8')
-]
-if sys.stdout and not sys.stdout.closed:
-    try:
-        if sys.stdout.isatty():
-            handlers.append(logging.StreamHandler(sys.stdout))
-    except Exception:
-        pass
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=handlers
-)
+# Logs en cola: JSON en logs/wogest.jsonl y consola si la hay (ver procesamiento.bitacora)
+configurar_logging(LOG_DIR)
 
 logger = logging.getLogger(__name__)
 
@@ -103,34 +85,42 @@ logger = logging.getLogger(__name__)
 # --------------------------------------
 app_web = Bottle()
 
+def _pagina(nombre: str):
+    # Los estáticos se enlazan con la huella de static/ (caché de larga duración)
+    return template(f'components/{nombre}', estaticos=f"/static/v/{huella_estaticos(STATIC_DIR)}")
+
 @app_web.route('/')
 def index():
-    return template('components/home.html')
+    return _pagina('home.html')
 
 @app_web.route('/home')
 def home():
-    return template('components/home.html')
+    return _pagina('home.html')
 
 @app_web.route('/step1')
 def step1():
-    return template('components/step1.html')
+    return _pagina('step1.html')
 
 @app_web.route('/step2')
 def step2():
-    return template('components/step2.html')
+    return _pagina('step2.html')
 
 @app_web.route('/step3')
 def step3():
-    return template('components/step3.html')
+    return _pagina('step3.html')
 
 @app_web.route('/step4')
 def step4():
-    return template('components/step4.html')
+    return _pagina('step4.html')
+
+@app_web.route('/static/v/<huella>/<filepath:path>')
+def serve_static_versionado(huella, filepath):
+    return servir_estatico(filepath, STATIC_DIR, versionado=huella == huella_estaticos(STATIC_DIR))
 
 @app_web.route('/static/<filepath:path>')
 def serve_static(filepath):
     logger.debug(f"Sirviendo archivo estático: {filepath}")
-    return static_file(filepath, root=STATIC_DIR)
+    return servir_estatico(filepath, STATIC_DIR)
 
 @app_web.route('/health')
 def health():
@@ -140,6 +130,18 @@ def health():
         "static": STATIC_DIR
     }
 
+@app_web.route('/metrics')
+def metrics():
+    """
+    Percentiles de duración por tramo (paso1.lectura, api.realizar_cruce_datos, ...)
+    sobre las últimas MAX_MUESTRAS ejecuciones. ?prefijo=paso1 filtra los tramos.
+    """
+    return {
+        "success": True,
+        "muestras_por_tramo": MAX_MUESTRAS,
+        "tramos": registro_tiempos.resumen(request.query.get("prefijo") or ""),
+    }
+
 # --------------------------------------
 # CONFIGURACIÓN DE APLICACIÓN
 # --------------------------------------
@@ -153,6 +155,11 @@ class ConfiguracionApp:
     directorio_logs: str = LOG_DIR
     directorio_exports: str = EXPORTS_DIR
     max_file_size: int = 50 * 1024 * 1024
+    max_bytes_almacen: int = 500 * 1024 * 1024  # archivos recibidos sin retener que se conservan (LRU)
+    umbral_cruce_en_memoria: int = 500_000  # filas Paso1 + Paso2; por encima, cruce fuera de memoria
+    filas_vista_previa_cruce: int = 5_000
+    servidor_multihilo: bool = True  # False: servidor wsgiref de un solo hilo
+    limite_trabajo_segundos: int = 15 * 60  # deadline por defecto de los trabajos en segundo plano
     extensiones_permitidas: Optional[List[str]] = None
 
     def __post_init__(self):
@@ -162,6 +169,24 @@ class ConfiguracionApp:
 # --------------------------------------
 # API JS PARA WEBVIEW
 # --------------------------------------
+def _con_sesion(metodo):
+    """
+    Ejecuta el método de la API en la sesión indicada en el payload ('sesion').
+    Sin 'sesion' se usa la del contexto (la principal en la ventana).
+    """
+    @functools.wraps(metodo)
+    def envoltura(self, payload=None, *args, **kwargs):
+        sesion = payload.get("sesion") if isinstance(payload, dict) else None
+        if not sesion:
+            return metodo(self, payload, *args, **kwargs)
+        try:
+            sesion = validar_sesion(sesion)
+        except ValueError as e:
+            return {"success": False, "message": str(e)}
+        with en_sesion(sesion):
+            return metodo(self, payload, *args, **kwargs)
+    return envoltura
+
 class WOGestAPI:
     def obtener_estado_global(self):
         try:
@@ -187,6 +212,8 @@ class WOGestAPI:
                 "total_registros_paso2": 0,
                 "error": str(e)
             }
+    @medido("api.obtener_datos_para_rpa")
+    @perfilado("api.obtener_datos_para_rpa")
     def obtener_datos_para_rpa(self) -> dict:
         try:
             from procesamiento.db_sqlite import leer_temp_paso1, leer_temp_paso2
@@ -200,15 +227,13 @@ class WOGestAPI:
             if df2.empty:
                 return {"success": False, "message": "No hay datos del Paso 2 (WOQ)"}
 
-            datos_p1 = df1.to_dict(orient="records")
-            datos_p2 = df2.to_dict(orient="records")
-            resultado = cruce_p3(datos_p1, datos_p2)
+            resultado = cruce_p3(df1, df2)
 
             if not resultado.get("success"):
                 return {"success": False, "message": resultado.get("message", "Error en cruce")}
 
             datos = resultado.get("datos_cruzados", [])
-            return _json_safe({
+            return json_seguro({
                 "success": True,
                 "registros_rpa": datos,
                 "estadisticas": resultado.get("estadisticas", {}),
@@ -219,46 +244,26 @@ class WOGestAPI:
 
     def __init__(self, config: ConfiguracionApp):
         self.config = config
-        self._archivos_temporales = []
         self._inicializar_directorios()
+        fijar_directorio_perfiles(self.config.directorio_logs)
+        # Archivos recibidos por contenido; cada sesión retiene los que usa hasta limpiar_estado / cerrar_sesion
+        self._almacen = AlmacenContenido(os.path.join(self.config.directorio_temp, "almacen"),
+                                         self.config.max_bytes_almacen)
+        self._subidas = RegistroSubidas(self.config.directorio_temp, self.config.max_file_size, self._almacen)
         app_web.route('/procesar_paso2', method='POST')(self.procesar_paso2)
+        app_web.route('/subidas', method='POST')(self._iniciar_subida)
+        app_web.route('/subidas/<subida_id>', method='PUT')(self._recibir_bloque_subida)
+        app_web.route('/subidas/<subida_id>/fin', method='POST')(self._finalizar_subida)
+        app_web.route('/subidas/<subida_id>', method='DELETE')(self._cancelar_subida)
+        app_web.route('/lotes', method='POST')(self._ejecutar_lote)
+        app_web.route('/lotes/<trabajo_id>', method='GET')(self._estado_lote)
+        app_web.route('/trabajos/<trabajo_id>/eventos', method='GET')(self._eventos_trabajo)
         logger.info("API inicializada")
 
     def _inicializar_directorios(self):
         for d in [self.config.directorio_temp, self.config.directorio_logs, self.config.directorio_exports]:
             Path(d).mkdir(parents=True, exist_ok=True)
 
-    def _convertir_dataframe_a_detalle(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
-        if df is None or df.empty:
-            return []
-
-        detalle = []
-        for index, row in df.iterrows():
-            registro = {}
-            for col in df.columns:
-                value = row.get(col, "")
-                if pd.notna(value):
-                    if col.lower() in ['cantidad', 'precio', 'cuota'] and isinstance(value, (int, float)):
-                        registro[col.lower()] = float(value) if value != 0 else 0.0
-                    elif col.lower() == 'fecha' and isinstance(value, (pd.Timestamp, datetime)):
-                        registro[col.lower()] = value.strftime('%Y-%m-%d')
-                    elif col.lower() == 'fecha' and isinstance(value, str):
-                        try:
-                            fecha_obj = pd.to_datetime(value)
-                            registro[col.lower()] = fecha_obj.strftime('%Y-%m-%d')
-                        except:
-                            registro[col.lower()] = str(value)
-                    else:
-                        registro[col.lower()] = str(value)
-                else:
-                    if col.lower() in ['cantidad', 'precio', 'cuota']:
-                        registro[col.lower()] = 0.0
-                    else:
-                        registro[col.lower()] = ""
-            registro["rpa"] = "Sí" if row.get("estado") == "Correcto" else "No"
-            detalle.append(registro)
-        return detalle
-
     def _generar_estadisticas_frontend(self, df: pd.DataFrame) -> Dict[str, Any]:
         if df is None or df.empty:
             return {"total": 0, "correctos": 0, "incorrectos": 0, "advertencias": 0}
@@ -270,13 +275,175 @@ class WOGestAPI:
 
         return {"total": total, "correctos": correctos, "incorrectos": incorrectos, "advertencias": advertencias}
 
+    # --------------------------------------
+    # SUBIDAS BINARIAS POR BLOQUES (ver procesamiento.subidas)
+    # Rutas de Bottle con "_" para que pywebview no las exponga en el puente JS
+    # --------------------------------------
+    def _respuesta_subida(self, operacion) -> dict:
+        try:
+            return {"success": True, **operacion().to_dict()}
+        except ErrorSubida as e:
+            response.status = e.estado
+            return {"success": False, "message": str(e)}
+        except (TypeError, ValueError) as e:
+            response.status = 400
+            return {"success": False, "message": f"Petición de subida inválida: {e}"}
+
+    def _sesion_subida(self, datos: Optional[Dict[str, Any]] = None) -> str:
+        """Sesión que retiene el archivo subido: 'sesion' del cuerpo o de la query; si no, la actual"""
+        sesion = (datos or {}).get("sesion") or request.query.get("sesion")
+        return validar_sesion(sesion) if sesion else sesion_actual()
+
+    def _iniciar_subida(self):
+        datos = request.json or {}
+        resultado = self._respuesta_subida(
+            lambda: self._subidas.iniciar(datos.get("nombre"), datos.get("tamano"), datos.get("sha256"),
+                                          self._sesion_subida(datos)))
+        if resultado["success"]:
+            resultado["tamano_bloque"] = TAMANO_BLOQUE
+        return resultado
+
+    def _recibir_bloque_subida(self, subida_id: str):
+        def _escribir():
+            longitud = request.content_length
+            if longitud < 0:
+                raise ErrorSubida("Falta la cabecera Content-Length", 411)
+            offset = request.get_header("X-Offset")
+            # Se lee el socket directamente: request.body copiaría el bloque entero antes
+            return self._subidas.escribir_bloque(subida_id, request.environ["wsgi.input"], longitud,
+                                                 int(offset) if offset not in (None, "") else None)
+        return self._respuesta_subida(_escribir)
+
+    def _finalizar_subida(self, subida_id: str):
+        return self._respuesta_subida(lambda: self._subidas.finalizar(subida_id, self._sesion_subida()))
+
+    def _cancelar_subida(self, subida_id: str):
+        if not self._subidas.cancelar(subida_id):
+            response.status = 404
+            return {"success": False, "message": "Subida no encontrada"}
+        return {"success": True}
+
+    # --------------------------------------
+    # EVENTOS DE PROGRESO DE LOS TRABAJOS (SSE / long-poll, ver procesamiento.trabajos)
+    # --------------------------------------
+    def _eventos_trabajo(self, trabajo_id: str):
+        """
+        GET /trabajos/<id>/eventos                      text/event-stream hasta el evento 'fin'
+        GET /trabajos/<id>/eventos?formato=json&desde=n&espera=s
+                                                        long-poll: eventos con id > n (espera hasta s segundos)
+        Al reconectar, EventSource envía Last-Event-ID y se continúa desde ahí.
+
+        Con el servidor wsgiref de un solo hilo (servidor_multihilo=False) un
+        flujo SSE abierto ocuparía el único hilo: se rechaza con 503 y el
+        long-poll se limita a ESPERA_MAX_UN_HILO segundos.
+        """
+        trabajo = gestor_trabajos.obtener(trabajo_id)
+        if trabajo is None:
+            response.status = 404
+            return {"success": False, "message": "Trabajo no encontrado"}
+        try:
+            desde = int(request.get_header("Last-Event-ID") or request.query.get("desde") or 0)
+            espera = min(max(float(request.query.get("espera") or 0), 0.0), 30.0)
+        except ValueError:
+            response.status = 400
+            return {"success": False, "message": "Parámetros 'desde' / 'espera' inválidos"}
+
+        if not self.config.servidor_multihilo:
+            espera = min(espera, ESPERA_MAX_UN_HILO)
+
+        if request.query.get("formato") == "json":
+            eventos = trabajo.eventos_desde(desde, espera)
+            return json_seguro({
+                "success": True,
+                "eventos": eventos,
+                "ultimo": eventos[-1]["id"] if eventos else desde,
+                "finalizado": any(e["tipo"] == EVENTO_FIN for e in eventos),
+            })
+
+        if not self.config.servidor_multihilo:
+            response.status = 503
+            return {"success": False, "message": "SSE no disponible con un servidor de un solo hilo; use ?formato=json"}
+
+        response.content_type = "text/event-stream; charset=UTF-8"
+        response.set_header("Cache-Control", "no-cache")
+        return flujo_sse(trabajo, desde)
+
+    # --------------------------------------
+    # PROCESAMIENTO POR LOTES SIN INTERFAZ (ver procesamiento.lote)
+    # --------------------------------------
+    def _ejecutar_lote(self):
+        """
+        POST /lotes {"pares": [{"nombre", "workorder", "woq": [...]}, ...],
+                     "carpeta_salida", "formato", "paralelo", "asincrono"}
+        Con "asincrono": true se lanza como trabajo y se consulta en GET /lotes/<trabajo_id>.
+        """
+        datos = request.json or {}
+        try:
+            pares = pares_desde_payload(datos)
+            paralelo = normalizar_paralelo(datos.get("paralelo"))
+        except (TypeError, ValueError, AttributeError) as e:
+            response.status = 400
+            return {"success": False, "message": f"Petición de lote inválida: {e}"}
+        carpeta = datos.get("carpeta_salida") or os.path.join(self.config.directorio_exports, "lotes")
+        formato = datos.get("formato") or "xlsx"
+
+        if datos.get("asincrono"):
+            trabajo = gestor_trabajos.enviar("lote", ejecutar_lote, pares, carpeta, formato, paralelo)
+            response.status = 202
+            return {"success": True, "trabajo_id": trabajo.id, "estado": trabajo.estado}
+        return json_seguro(ejecutar_lote(pares, carpeta, formato, paralelo))
+
+    def _estado_lote(self, trabajo_id: str):
+        trabajo = gestor_trabajos.obtener(trabajo_id)
+        if trabajo is None or trabajo.tipo != "lote":
+            response.status = 404
+            return {"success": False, "message": "Trabajo no encontrado"}
+        return json_seguro({"success": True, **trabajo.to_dict(entregar=True)})
+
+    def _nombre_archivo_payload(self, payload: Dict[str, Any]) -> Optional[str]:
+        """Nombre del archivo del payload; con 'archivo_id' vale el de la subida"""
+        if payload.get("nombre"):
+            return payload["nombre"]
+        subida = self._subidas.obtener(payload.get("archivo_id") or "")
+        return subida.nombre if subida else None
+
+    def _archivo_recibido(self, payload: Dict[str, Any], extension: str) -> str:
+        """
+        Ruta en disco del archivo de un payload de validación, retenido en el
+        almacén para la ejecución actual:
+        - 'archivo_id': subida binaria ya escrita en disco (no se copia)
+        - 'base64': contenido en el JSON (formato anterior); solo se escribe
+          si el almacén no tiene ya ese contenido
+
+        Raises:
+            ErrorSubida: subida desconocida o eliminada del almacén, o archivo demasiado grande
+        """
+        archivo_id = payload.get("archivo_id")
+        if archivo_id:
+            ruta = self._subidas.ruta_archivo(archivo_id)
+            subida = self._subidas.obtener(archivo_id)
+            if subida is not None and subida.en_almacen:
+                ruta = self._almacen.adquirir(subida.clave_almacen, sesion_actual())
+                if ruta is None:
+                    raise ErrorSubida("El archivo ya no está disponible, vuelva a subirlo", 410)
+            return ruta
+
+        decoded = base64.b64decode(payload.get("base64") or "")
+        if len(decoded) > self.config.max_file_size:
+            logger.warning("⚠️ Archivo demasiado grande: %s bytes", len(decoded))
+            raise ErrorSubida("Archivo demasiado grande", 413)
+        return self._almacen.guardar_bytes(decoded, extension, sesion_actual())
+
+    @medido("api.validar_archivo_workorder")
+    @_con_sesion
+    @perfilado("api.validar_archivo_workorder")
     def validar_archivo_workorder(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         try:
-            nombre = payload.get("nombre")
-            base64_data = payload.get("base64")
+            nombre = self._nombre_archivo_payload(payload)
+            formato_respuesta = normalizar_formato_respuesta(payload.get("formato_respuesta"))
             logger.info("📥 Recibido archivo WorkOrder: %s", nombre)
 
-            if not nombre or not base64_data:
+            if not nombre or not (payload.get("base64") or payload.get("archivo_id")):
                 logger.warning("⚠️ Nombre o contenido faltante")
                 return {"success": False, "message": "Nombre o contenido faltante"}
 
@@ -290,20 +457,13 @@ class WOGestAPI:
                     logger.warning("⚠️ Extensión no permitida: %s", extension)
                     return {"success": False, "message": "Extensión no permitida"}
 
-            decoded = base64.b64decode(base64_data)
-            if len(decoded) > self.config.max_file_size:
-                logger.warning("⚠️ Archivo demasiado grande: %s bytes", len(decoded))
-                return {"success": False, "message": "Archivo demasiado grande"}
-
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            temp_file = os.path.join(
-                self.config.directorio_temp,
-                f"{Path(nombre).stem}_{timestamp}{extension}"
-            )
-            with open(temp_file, 'wb') as f:
-                f.write(decoded)
+            reportar_etapa("recepcion", 1)
+            try:
+                temp_file = self._archivo_recibido(payload, extension)
+            except ErrorSubida as e:
+                logger.warning("⚠️ %s", e)
+                return {"success": False, "message": str(e)}
             logger.info("📄 Archivo temporal guardado en: %s", temp_file)
-            self._archivos_temporales.append(temp_file)
 
             logger.info("🚀 Validando archivo con controlador...")
             success, msg, backend_stats = controlador.validar_archivo_workorder(temp_file)
@@ -319,24 +479,25 @@ class WOGestAPI:
                 return {"success": False, "message": "Error: No se pudieron obtener los datos validados",
                         "detalle": [], "estadisticas": {"total": 0, "correctos": 0, "incorrectos": 0, "advertencias": 0}}
 
-            detalle = self._convertir_dataframe_a_detalle(df_validado)
-            estadisticas = self._generar_estadisticas_frontend(df_validado)
-            logger.info("📊 Total registros procesados: %d", len(detalle))
-            return {"success": True, "message": msg, "detalle": detalle, "estadisticas": estadisticas}
+            reportar_etapa("serializacion", 95)
+            with medir("api.validar_archivo_workorder.serializacion"):
+                detalle = detalle_paso1(df_validado)
+                estadisticas = self._generar_estadisticas_frontend(df_validado)
+                logger.info("📊 Total registros procesados: %d", len(detalle))
+                return {"success": True, "message": msg, "estadisticas": estadisticas,
+                        "timings": backend_stats.get("timings", {}),
+                        "detalle": formatear_filas(detalle, formato_respuesta)}
 
         except Exception as e:
             logger.exception("❌ Error inesperado durante validación")
             return {"success": False, "message": f"Error: {str(e)}", "detalle": [],
                     "estadisticas": {"total": 0, "correctos": 0, "incorrectos": 0, "advertencias": 0}}
+    @medido("api.guardar_estado_paso1")
     def guardar_estado_paso1(self, datos_validacion: Dict[str, Any]) -> Dict[str, Any]:
         try:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            archivo_estado = os.path.join(
-                self.config.directorio_temp,
-                f"estado_paso1_{timestamp}.json"
-            )
-            with open(archivo_estado, 'w', encoding='utf-8') as f:
-                json.dump(datos_validacion, f, ensure_ascii=False, indent=2)
+            # JSON compacto en el almacén: el mismo estado guardado dos veces no se reescribe
+            contenido = json.dumps(datos_validacion, ensure_ascii=False, separators=(",", ":"))
+            archivo_estado = self._almacen.guardar_bytes(contenido.encode("utf-8"), ".json", sesion_actual())
 
             logger.info("💾 Estado del paso 1 guardado en: %s", archivo_estado)
             return {"success": True, "message": "Estado guardado correctamente", "archivo": archivo_estado}
@@ -345,6 +506,8 @@ class WOGestAPI:
             logger.exception("❌ Error al guardar estado del paso 1")
             return {"success": False, "message": f"Error al guardar estado: {str(e)}"}
 
+    @medido("api.exportar_excel")
+    @perfilado("api.exportar_excel")
     def exportar_excel(self, datos_validacion: Dict[str, Any]) -> Dict[str, Any]:
         try:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -362,13 +525,14 @@ class WOGestAPI:
             logger.exception("❌ Error al exportar Excel")
             return {"success": False, "message": f"Error al exportar Excel: {str(e)}"}
 
-    def limpiar_estado(self) -> Dict[str, Any]:
+    @_con_sesion
+    def limpiar_estado(self, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Limpia el estado de la sesión ('sesion' en el payload; sin ella, la actual)"""
         try:
             limpiar_estado_validacion()
-            for archivo in self._archivos_temporales:
-                if os.path.exists(archivo):
-                    os.remove(archivo)
-            self._archivos_temporales.clear()
+            # Los archivos de la sesión quedan libres para el desalojo LRU del almacén
+            liberados = self._almacen.liberar_ejecucion(sesion_actual())
+            logger.info("🧹 %d archivo(s) liberados en el almacén (%s)", liberados, self._almacen.estado())
             return {"success": True, "message": "Estado limpiado"}
         except Exception as e:
             logger.exception("Error limpiando estado")
@@ -388,14 +552,29 @@ class WOGestAPI:
         except Exception as e:
             return {"success": False, "message": str(e)}
 
+    @medido("api.exportar_excel_con_ruta")
+    @_con_sesion
+    @perfilado("api.exportar_excel_con_ruta")
     def exportar_excel_con_ruta(self, payload: dict) -> dict:
+        """
+        payload = {
+            'datos': {'contexto': 'step1_p1'|..., 'origen': {...} | None, 'detalle': [...] (legacy)},
+            'carpeta_destino': None|str,
+            'formato': 'xlsx'|'csv'|... (solo Paso 4),
+            'particiones': int, 'max_filas_particion': int (solo Paso 4, opcionales)
+        }
+        Con 'origen' = {'paso': ..., 'filtros': {...}} el backend exporta desde sus
+        propios datos (ver procesamiento.origenes) y la UI no reenvía 'detalle'.
+        """
         import pandas as pd
         from datetime import datetime
         import os
+        from procesamiento.paso4 import opciones_particion
         try:
             datos = payload.get("datos", {}) or {}
+            origen = payload.get("origen") or datos.get("origen")
             detalle = datos.get("detalle", [])
-            if not detalle:
+            if not detalle and not origen:
                 return {"success": False, "message": "No hay datos para exportar"}
 
             carpeta_destino = payload.get("carpeta_destino") or os.path.join(os.path.expanduser("~"), "Downloads")
@@ -403,61 +582,45 @@ class WOGestAPI:
             prefix_map = {"step1_p1": "WorkOrder_P1_", "step2_p2": "WOQ_P2_", "step3_p3": "Cruce_P3_", "step4_rpa": "Aptos_RPA_P4_"}
             ts = datetime.now().strftime("%Y%m%d_%H%M%S")
 
+            if origen:
+                from procesamiento.origenes import normalizar_origen
+                paso = normalizar_origen(origen)
+                formato = payload.get("formato") or datos.get("formato")
+                particion = opciones_particion(payload) if paso == "step4_rpa" else (None, None)
+                return self._exportar_desde_origen(origen, carpeta_destino, f"{prefix_map[paso]}{ts}",
+                                                   formato, *particion)
+
             if contexto == "step4_rpa":
-                def _val(dic, *keys):
-                    for k in keys:
-                        if k in dic and dic[k] is not None:
-                            return str(dic[k]).strip()
-                    return ""
-
-                def _es_cerrado(dic):
-                    v = _val(dic, "es_cerrado", "ES_CERRADO", "woq_es_cerrado", "WOQ_ES_CERRADO", "woq_cerrado", "WOQ_CERRADO").upper()
-                    if v in ("1", "SI", "SÍ", "TRUE", "YES"): return 1
-                    if v in ("0", "NO", "FALSE"): return 0
-                    return 0
-
-                def _apto(dic):
-                    v = _val(dic, "Apto RPA", "APTO_RPA", "apto_rpa").upper()
-                    if v in ("SI", "SÍ", "TRUE", "YES", "1"): return "SÍ"
-                    if v in ("NO", "FALSE", "0"): return "NO"
-                    return ""
-
-                def _estado(dic):
-                    return _val(dic, "Estado_Paso1", "estado_paso1").upper()
-
-                def _wo(dic):
-                    return _val(dic, "WO", "wo", "N_WO", "N°_WO", "N_WO2")
-
-                def _orden(dic):
-                    return _val(dic, "ORDEN_CONTRATO", "CONTRATO", "woq_contrato", "WOQ_CONTRATO")
-
-                filas = []
-                for r in detalle:
-                    if _es_cerrado(r) != 0: continue
-                    if _estado(r) != "CORRECTO": continue
-                    if _apto(r) != "SÍ": continue
-                    filas.append({"WO": _wo(r), "ORDEN_CONTRATO": _orden(r)})
-
-                if not filas:
+                from procesamiento.paso4 import seleccionar_exportables, escribir_seleccion_rpa, exportar_particionado
+                from procesamiento.exportador_texto import normalizar_formato, extension_formato
+
+                formato = normalizar_formato(payload.get("formato") or datos.get("formato"))
+                particiones, max_filas = opciones_particion(payload)
+                reportar_etapa("seleccion", 10)
+                df = seleccionar_exportables(detalle, incluir_contrato=True)
+                if df.empty:
                     return {"success": False, "message": "No hay registros que cumplan las condiciones del Paso 4."}
 
-                df = pd.DataFrame(filas)
-                nombre_archivo = f"{prefix_map['step4_rpa']}{ts}.xlsx"
-                ruta_final = os.path.join(carpeta_destino, nombre_archivo)
-                df.to_excel(ruta_final, index=False)
-                try:
-                    from procesamiento.db_sqlite import limpiar_tablas_temporales
-                    limpiar_tablas_temporales()
-                except Exception as e:
-                    logging.getLogger(__name__).warning(f"No se pudieron limpiar temporales: {e}")
+                if (particiones or 1) > 1 or max_filas:
+                    reportar_etapa("escritura", 30)
+                    resultado = exportar_particionado(df, carpeta_destino, formato, particiones, max_filas)
+                    self._limpiar_tras_exportar_rpa(resultado)
+                    return resultado
 
-                return {"success": True, "archivo": ruta_final, "message": f"Archivo exportado: {nombre_archivo}",
-                        "total_registros": len(filas), "redirect_home": True}
+                nombre_archivo = f"{prefix_map['step4_rpa']}{ts}{extension_formato(formato)}"
+                ruta_final = os.path.join(carpeta_destino, nombre_archivo)
+                reportar_etapa("escritura", 30)
+                escribir_seleccion_rpa(df, ruta_final, formato)
+                resultado = {"success": True, "archivo": ruta_final, "message": f"Archivo exportado: {nombre_archivo}",
+                             "total_registros": len(df)}
+                self._limpiar_tras_exportar_rpa(resultado)
+                return resultado
 
             df = pd.DataFrame(detalle)
             nombre_archivo = f"{prefix_map.get(contexto, 'validacion_resultado_')}{ts}.xlsx"
             ruta_final = os.path.join(carpeta_destino, nombre_archivo)
-            df.to_excel(ruta_final, index=False)
+            reportar_etapa("escritura", 30)
+            exportar_dataframe_excel(df, ruta_final)
             return {"success": True, "archivo": ruta_final, "message": f"Archivo exportado como: {nombre_archivo}"}
 
         except Exception as e:
@@ -479,72 +642,113 @@ class WOGestAPI:
         except Exception as e:
             return {"success": False, "message": f"Error al abrir carpeta: {str(e)}"}
 
+    @medido("api.procesar_paso2")
+    @perfilado("api.procesar_paso2")
     def procesar_paso2(self):
         try:
-            upload = app_web.request.files.get('archivo')
+            upload = request.files.get('archivo')
             if not upload:
                 return {"error": "No se recibió archivo"}
 
-            nombre_archivo = upload.filename
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            nombre_archivo_unico = f"{Path(nombre_archivo).stem}_{timestamp}{Path(nombre_archivo).suffix}"
-            ruta_guardado = os.path.join(self.config.directorio_temp, nombre_archivo_unico)
-            upload.save(ruta_guardado)
+            contenido = upload.file.read(self.config.max_file_size + 1)
+            if len(contenido) > self.config.max_file_size:
+                return {"error": "Archivo demasiado grande"}
+            ruta_guardado = self._almacen.guardar_bytes(contenido, Path(upload.filename).suffix, sesion_actual())
 
             from procesamiento.paso2 import procesar_woq
             df = procesar_woq(ruta_guardado)
             if df is None:
                 return {"error": "Error al procesar el archivo"}
 
-            return _json_safe({"data": df.to_dict(orient='records')})
+            return {"data": registros_json(df)}
 
         except Exception as e:
             return {"error": str(e)}
 
+    @medido("api.procesar_archivo_woq")
+    @_con_sesion
+    @perfilado("api.procesar_archivo_woq")
     def procesar_archivo_woq(self, payload: dict) -> dict:
+        """
+        Procesa el WOQ del Paso 2 y lo guarda en temp_paso2. 'estadisticas'
+        resume todo el archivo (total, cerrados, pendientes). Con 'por_pagina'
+        solo se devuelve la primera página en 'detalle' y su paginación en
+        'consulta'; el resto se pide con consultar_datos.
+        """
         logger.info("✅ [procesar_archivo_woq] llamado desde frontend")
         try:
-            nombre = payload.get("nombre")
-            base64_data = payload.get("base64")
-            if not nombre or not base64_data:
+            nombre = self._nombre_archivo_payload(payload)
+            formato_respuesta = normalizar_formato_respuesta(payload.get("formato_respuesta"))
+            if not nombre or not (payload.get("base64") or payload.get("archivo_id")):
                 return {"success": False, "message": "Nombre o contenido faltante", "detalle": []}
 
-            decoded = base64.b64decode(base64_data)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            reportar_etapa("recepcion", 1)
             extension = Path(nombre).suffix.lower()
-            nombre_archivo = f"woq_{timestamp}{extension or '.csv'}"
-            ruta = os.path.join(self.config.directorio_temp, nombre_archivo)
-            with open(ruta, 'wb') as f:
-                f.write(decoded)
+            try:
+                ruta = self._archivo_recibido(payload, extension or '.csv')
+            except ErrorSubida as e:
+                return {"success": False, "message": str(e), "detalle": []}
 
             from procesamiento.paso2 import procesar_woq
             df = procesar_woq(ruta)
             if df is None or df.empty:
                 return {"success": False, "message": "Archivo sin datos", "detalle": []}
 
-            if "ES_CERRADO" in df.columns:
-                df["ES_CERRADO"] = df["ES_CERRADO"].map({True: "SI", False: "NO"})
-                df.rename(columns={"ES_CERRADO": "es_cerrado"}, inplace=True)
+            reportar_etapa("serializacion", 90)
+            cerrados = int((df["ES_CERRADO"] == 1).sum()) if "ES_CERRADO" in df.columns else 0
+            resultado = {
+                "success": True,
+                "message": f"Archivo procesado: {len(df)} registros",
+                "estadisticas": {"total": len(df), "cerrados": cerrados, "pendientes": len(df) - cerrados},
+            }
+
+            if payload.get("por_pagina"):
+                from procesamiento.origenes import ORIGEN_PASO2
+                pagina, por_pagina, orden, filtros = opciones_consulta(payload)
+                consulta = consultar_origen(ORIGEN_PASO2, pagina, por_pagina, orden, filtros)
+                filas = consulta.pop("filas")
+                consulta.pop("success")
+                resultado["consulta"] = consulta
+            else:
+                filas = quitar_columnas_tecnicas(df)
+                if "ES_CERRADO" in filas.columns:
+                    filas["ES_CERRADO"] = filas["ES_CERRADO"].map({1: "SI", 0: "NO"})
+                    filas.rename(columns={"ES_CERRADO": "es_cerrado"}, inplace=True)
+                filas = filas.fillna("")
 
-            detalle = df.fillna("").to_dict(orient="records")
-            return _json_safe({"success": True, "message": f"Archivo procesado: {len(detalle)} registros", "detalle": detalle})
+            resultado["detalle"] = formatear_filas(filas, formato_respuesta)
+            return json_seguro(resultado)
 
         except Exception as e:
             logger.exception("❌ Error en procesar_archivo_woq")
             return {"success": False, "message": str(e), "detalle": []}
 
-    def exportar_woq(self, datos_woq: list) -> dict:
+    @medido("api.exportar_woq")
+    @perfilado("api.exportar_woq")
+    def exportar_woq(self, datos_woq=None) -> dict:
+        """
+        datos_woq: lista de registros (legacy) o {'filtros': {...}} / None para
+        exportar directamente desde temp_paso2.
+        """
         try:
             logger.info("✅ [exportar_woq] llamado desde frontend")
-            if not datos_woq or len(datos_woq) == 0:
-                return {"success": False, "message": "No hay datos para exportar"}
+            if not isinstance(datos_woq, list) or len(datos_woq) == 0:
+                from procesamiento.origenes import ORIGEN_PASO2
+                filtros = datos_woq.get("filtros") if isinstance(datos_woq, dict) else None
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                carpeta_destino = os.path.join(os.path.expanduser("~"), "Downloads")
+                res = self._exportar_desde_origen({"paso": ORIGEN_PASO2, "filtros": filtros},
+                                                  carpeta_destino, f"woq_exportado_{timestamp}")
+                if res.get("success"):
+                    res["filepath"] = res["archivo"]
+                return res
 
             df = pd.DataFrame(datos_woq)
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             nombre_archivo = f"woq_exportado_{timestamp}.xlsx"
             carpeta_destino = os.path.join(os.path.expanduser("~"), "Downloads")
             ruta_final = os.path.join(carpeta_destino, nombre_archivo)
-            df.to_excel(ruta_final, index=False)
+            exportar_dataframe_excel(df, ruta_final)
 
             logger.info("📊 WOQ exportado exitosamente: %s", ruta_final)
             return {"success": True, "filepath": ruta_final, "message": f"Archivo exportado exitosamente como: {nombre_archivo}"}
@@ -553,28 +757,256 @@ class WOGestAPI:
             logger.exception("❌ Error en exportar_woq")
             return {"success": False, "message": f"Error al exportar: {str(e)}"}
 
-    def realizar_cruce_datos(self) -> dict:
+    def _exportar_desde_origen(self, origen: Dict[str, Any], carpeta_destino: str,
+                               nombre_base: str, formato: Optional[str] = None,
+                               particiones: Optional[int] = None,
+                               max_filas: Optional[int] = None) -> dict:
+        """
+        Exporta por lotes los datos que el backend tiene guardados para un paso.
+        En el Paso 4, con particiones / max_filas, se generan varios ficheros
+        y un manifiesto (ver paso4.exportar_particionado).
+        """
+        from procesamiento.origenes import ORIGEN_RPA, lotes_origen, normalizar_origen
+        from procesamiento.exportador_texto import extension_formato, normalizar_formato
+
+        paso = normalizar_origen(origen)
+        formato = normalizar_formato(formato) if paso == ORIGEN_RPA else "xlsx"
+        nombre_archivo = f"{nombre_base}{extension_formato(formato)}"
+        ruta_final = os.path.join(carpeta_destino, nombre_archivo)
+
+        reportar_etapa("escritura", 10)
+        lotes = lotes_origen(origen)
+        if paso == ORIGEN_RPA and ((particiones or 1) > 1 or max_filas):
+            import pandas as pd
+            from procesamiento.paso4 import exportar_particionado
+            # Un contrato puede estar repartido entre lotes: se particiona la selección completa
+            lotes = list(lotes)
+            if not lotes:
+                return {"success": False, "message": "No hay registros que cumplan las condiciones del Paso 4."}
+            seleccion = pd.concat(lotes, ignore_index=True)
+            resultado = exportar_particionado(seleccion, carpeta_destino, formato, particiones, max_filas)
+            self._limpiar_tras_exportar_rpa(resultado)
+            return resultado
+
+        if paso == ORIGEN_RPA:
+            from procesamiento.paso4 import escribir_seleccion_rpa
+            total = escribir_seleccion_rpa(lotes, ruta_final, formato)
+        else:
+            total = exportar_dataframe_excel(lotes, ruta_final)
+
+        if total == 0:
+            if os.path.exists(ruta_final):
+                os.remove(ruta_final)
+            mensaje = ("No hay registros que cumplan las condiciones del Paso 4."
+                       if paso == ORIGEN_RPA else "No hay datos para exportar")
+            return {"success": False, "message": mensaje}
+
+        logger.info("📊 Exportados %d registros de %s a %s", total, paso, ruta_final)
+        resultado = {"success": True, "archivo": ruta_final, "total_registros": total,
+                     "message": f"Archivo exportado: {nombre_archivo}"}
+        if paso == ORIGEN_RPA:
+            self._limpiar_tras_exportar_rpa(resultado)
+        return resultado
+
+    def _limpiar_tras_exportar_rpa(self, resultado: dict):
+        """Tras exportar el Paso 4 se limpian las tablas temporales y la UI vuelve al inicio"""
+        if not resultado.get("success"):
+            return
+        reportar_etapa("limpieza", 95)
+        try:
+            from procesamiento.db_sqlite import limpiar_tablas_temporales
+            limpiar_tablas_temporales()
+        except Exception as e:
+            logger.warning(f"No se pudieron limpiar temporales: {e}")
+        resultado["redirect_home"] = True
+
+    @medido("api.realizar_cruce_datos")
+    @_con_sesion
+    @perfilado("api.realizar_cruce_datos")
+    def realizar_cruce_datos(self, opciones: Optional[Dict[str, Any]] = None) -> dict:
+        """
+        opciones = {'modo': 'auto' | 'memoria' | 'disco',
+                    'formato_respuesta': 'filas' | 'columnar' | 'columnar.gz',
+                    'por_pagina': n}
+        En modo 'disco' (o 'auto' con tablas grandes) el cruce se hace por lotes
+        en SQLite (temp_cruce) y solo se devuelve una vista previa de las filas.
+        Con 'por_pagina' solo se devuelve la primera página del cruce y su
+        paginación en 'consulta'; el resto se pide con consultar_datos.
+        """
         try:
             logger.info("✅ [realizar_cruce_datos] Iniciando cruce de datos")
-            from procesamiento.db_sqlite import leer_temp_paso1, leer_temp_paso2
-            df1 = leer_temp_paso1()
-            df2 = leer_temp_paso2()
-
-            if df1.empty:
+            reportar_etapa("lectura", 2)
+            from procesamiento.db_sqlite import leer_temp_paso1, leer_temp_paso2, contar_registros
+            opciones = opciones or {}
+            formato_respuesta = normalizar_formato_respuesta(opciones.get("formato_respuesta"))
+            n1 = contar_registros("temp_paso1")
+            n2 = contar_registros("temp_paso2")
+
+            if n1 == 0:
                 return {"success": False, "message": "No hay datos del Paso 1 (WorkOrder)"}
-            if df2.empty:
+            if n2 == 0:
                 return {"success": False, "message": "No hay datos del Paso 2 (WOQ)"}
 
-            logger.info(f"📊 Datos paso1: {len(df1)} registros, paso2: {len(df2)} registros")
-            from procesamiento.paso3 import realizar_cruce_datos as cruce_p3
-            datos_paso1 = df1.to_dict(orient="records")
-            datos_paso2 = df2.to_dict(orient="records")
-            resultado = cruce_p3(datos_paso1, datos_paso2)
-            return _json_safe(resultado)
+            logger.info(f"📊 Datos paso1: {n1} registros, paso2: {n2} registros")
+            paginado = bool(opciones.get("por_pagina"))
+            modo = (opciones.get("modo") or "auto").lower()
+            if modo == "disco" or (modo == "auto" and n1 + n2 > self.config.umbral_cruce_en_memoria):
+                resultado = self._realizar_cruce_fuera_de_memoria(vista_previa=not paginado)
+            else:
+                from procesamiento.db_sqlite import eliminar_temp_cruce
+                from procesamiento.paso3 import realizar_cruce_datos as cruce_p3
+                # Un temp_cruce anterior taparía este cruce en consultas y exportaciones
+                eliminar_temp_cruce()
+                resultado = cruce_p3(leer_temp_paso1(), leer_temp_paso2(), incluir_filas=not paginado)
+                if paginado and resultado.get("success"):
+                    fijar_cruce_en_memoria(resultado.pop("cruce"))
+
+            if resultado.get("success") and paginado:
+                from procesamiento.origenes import ORIGEN_CRUCE
+                reportar_etapa("serializacion", 90)
+                pagina, por_pagina, orden, filtros = opciones_consulta(opciones)
+                consulta = consultar_origen(ORIGEN_CRUCE, pagina, por_pagina, orden, filtros)
+                resultado["datos_cruzados"] = consulta.pop("filas")
+                consulta.pop("success")
+                resultado["consulta"] = consulta
+            with medir("api.realizar_cruce_datos.serializacion"):
+                if resultado.get("success"):
+                    resultado["datos_cruzados"] = formatear_filas(resultado["datos_cruzados"], formato_respuesta)
+                return json_seguro(resultado)
 
         except Exception as e:
             logger.exception("❌ Error en realizar_cruce_datos")
             return {"success": False, "message": f"Error al realizar el cruce: {str(e)}", "datos_cruzados": [], "estadisticas": {}}
+
+    def _realizar_cruce_fuera_de_memoria(self, vista_previa: bool = True) -> dict:
+        from procesamiento.db_sqlite import leer_temp_cruce
+        from procesamiento.paso3 import realizar_cruce_datos_sqlite, registros_visibles
+
+        logger.info("💽 Cruce fuera de memoria (sort-merge por wo_key)")
+        resultado = realizar_cruce_datos_sqlite()
+        if not resultado.get("success") or not vista_previa:
+            return resultado
+
+        vista = leer_temp_cruce(limite=self.config.filas_vista_previa_cruce)
+        resultado["datos_cruzados"] = registros_visibles(vista)
+        resultado["parcial"] = len(vista) < resultado["estadisticas"]["total_cruzados"]
+        return resultado
+
+    @medido("api.consultar_datos")
+    @_con_sesion
+    @perfilado("api.consultar_datos")
+    def consultar_datos(self, consulta: Dict[str, Any]) -> dict:
+        """
+        Una página de los datos guardados de un paso, filtrada y ordenada en el backend.
+        consulta = {'origen': 'step1_p1' | 'step2_p2' | 'step3_p3', 'pagina': 1,
+                    'por_pagina': 50, 'orden': ['-CONTRATO'], 'filtros': {...},
+                    'formato_respuesta': 'filas' | 'columnar' | 'columnar.gz'}
+        """
+        try:
+            consulta = consulta or {}
+            formato_respuesta = normalizar_formato_respuesta(consulta.get("formato_respuesta"))
+            pagina, por_pagina, orden, filtros = opciones_consulta(consulta)
+            resultado = consultar_origen(consulta.get("origen"), pagina, por_pagina, orden, filtros)
+            resultado["filas"] = formatear_filas(resultado["filas"], formato_respuesta)
+            return json_seguro(resultado)
+        except ValueError as e:
+            return {"success": False, "message": str(e), "filas": []}
+        except Exception as e:
+            logger.exception("❌ Error en consultar_datos")
+            return {"success": False, "message": f"Error al consultar los datos: {str(e)}", "filas": []}
+
+    def configurar_perfil_memoria(self, activo: Optional[bool] = None) -> dict:
+        """
+        Activa / desactiva el perfil de memoria por etapa (ver procesamiento.memoria).
+        Sin argumento solo devuelve el estado actual.
+        """
+        if activo is not None:
+            activar_perfil_memoria(bool(activo))
+        return {"success": True, "activo": perfil_memoria_activo()}
+
+    def configurar_perfil_cpu(self, activo: Optional[bool] = None) -> dict:
+        """
+        Activa / desactiva la captura de perfiles de CPU (ver procesamiento.perfilado).
+        Sin argumento solo devuelve el estado actual y los últimos perfiles escritos.
+        """
+        if activo is not None:
+            activar_perfil_cpu(bool(activo))
+        return {"success": True, "activo": perfil_cpu_activo(), **perfiles_recientes()}
+
+    # ---------------------- Trabajos en segundo plano ----------------------
+    def _operaciones_en_segundo_plano(self) -> Dict[str, Any]:
+        return {
+            "validar_workorder": self.validar_archivo_workorder,
+            "procesar_woq": self.procesar_archivo_woq,
+            "cruce": self.realizar_cruce_datos,
+            "exportar": self.exportar_excel_con_ruta,
+        }
+
+    def iniciar_trabajo(self, tipo: str, payload: Optional[Dict[str, Any]] = None,
+                        limite_segundos: Optional[float] = None) -> dict:
+        """
+        Lanza una operación larga en segundo plano y devuelve su trabajo_id.
+        La UI consulta estado_trabajo(trabajo_id) hasta que 'finalizado' sea True.
+
+        tipo: 'validar_workorder' | 'procesar_woq' | 'cruce' | 'exportar'
+        payload: mismo argumento que el método síncrono equivalente
+                 (con 'sesion', el trabajo se ejecuta en esa sesión)
+        """
+        operacion = self._operaciones_en_segundo_plano().get(tipo)
+        if operacion is None:
+            return {"success": False, "message": f"Tipo de trabajo desconocido: {tipo}"}
+        args = () if payload is None else (payload,)
+        try:
+            sesion = validar_sesion((payload or {}).get("sesion") or sesion_actual())
+        except (AttributeError, ValueError) as e:
+            return {"success": False, "message": str(e)}
+        # El trabajo hereda la sesión del contexto en el que se envía
+        with en_sesion(sesion):
+            trabajo = gestor_trabajos.enviar(
+                tipo, operacion, *args,
+                limite_segundos=limite_segundos or self.config.limite_trabajo_segundos,
+            )
+        return {"success": True, "trabajo_id": trabajo.id, "estado": trabajo.estado, "sesion": sesion,
+                "eventos_sse": self.config.servidor_multihilo}
+
+    def estado_trabajo(self, trabajo_id: str) -> dict:
+        trabajo = gestor_trabajos.obtener(trabajo_id)
+        if trabajo is None:
+            return {"success": False, "message": "Trabajo no encontrado"}
+        return json_seguro({"success": True, **trabajo.to_dict(entregar=True)})
+
+    def cancelar_trabajo(self, trabajo_id: str) -> dict:
+        if gestor_trabajos.cancelar(trabajo_id):
+            return {"success": True, "message": "Cancelación solicitada"}
+        return {"success": False, "message": "El trabajo no existe o ya ha finalizado"}
+
+    def listar_trabajos(self) -> dict:
+        return json_seguro({"success": True, "trabajos": gestor_trabajos.listar()})
+
+    # ---------------------- Sesiones (ver procesamiento.sesiones) ----------------------
+    def crear_sesion(self) -> dict:
+        """
+        Sesión nueva con su propio resultado de validación y tablas temporales.
+        Se indica como 'sesion' en el payload de validar_archivo_workorder,
+        procesar_archivo_woq, realizar_cruce_datos, consultar_datos e iniciar_trabajo.
+        """
+        sesion = nueva_sesion()
+        logger.info("🗂️ Sesión creada: %s", sesion)
+        return {"success": True, "sesion": sesion}
+
+    def cerrar_sesion(self, sesion: str) -> dict:
+        """Descarta el estado, la base de datos temporal, el cruce en caché y los archivos retenidos de una sesión"""
+        try:
+            existia = controlador.cerrar_sesion(sesion)
+            olvidar_cruce_en_memoria(validar_sesion(sesion))
+            self._almacen.liberar_ejecucion(validar_sesion(sesion))
+            return {"success": True, "message": "Sesión cerrada" if existia else "La sesión no tenía datos"}
+        except ValueError as e:
+            return {"success": False, "message": str(e)}
+
+    def listar_sesiones(self) -> dict:
+        return json_seguro({"success": True, "sesiones": controlador.listar_sesiones()})
+
 # --------------------------------------
 # FUNCIÓN PRINCIPAL
 # --------------------------------------
@@ -687,19 +1119,29 @@ def aplicar_icono_directo():
     return False
 
 def main():
-    config = ConfiguracionApp()
-    api = WOGestAPI(config)
+    arranque = ArranqueApp(inicio=_INICIO_PROCESO)
+    arranque.registrar("importaciones", time.perf_counter() - _INICIO_PROCESO)
+
+    for nombre, funcion in PRECALENTAMIENTOS.items():
+        arranque.en_segundo_plano(nombre, funcion)
+
+    with arranque.fase("configuración"):
+        config = ConfiguracionApp()
+        api = WOGestAPI(config)
 
     def lanzar_servidor():
-        app_web.run(host='localhost', port=58833, quiet=True)
+        servidor = ServidorMultihilo if config.servidor_multihilo else 'wsgiref'
+        app_web.run(host='localhost', port=58833, quiet=True, server=servidor)
 
     threading.Thread(target=lanzar_servidor, daemon=True).start()
-    time.sleep(1.5)
 
     icon_path = os.path.join(STATIC_DIR, "img", "icon.ico")
 
-    logger.info(f"[WOGest] SQLite en: {get_db_path()}")
-    init_db()
+    with arranque.fase("base de datos"):
+        logger.info(f"[WOGest] SQLite en: {get_db_path()}")
+        init_db()
+
+    arranque.esperar_servidor(f"{config.template_principal.rstrip('/')}/health")
 
     webview.create_window(
         config.titulo,
@@ -720,7 +1162,9 @@ def main():
     else:
         logger.info("⚠️ No se aplicará ícono: Sistema no Windows o archivo no encontrado")
 
+    arranque.registrar_resumen()
     webview.start(debug=True, gui='edgechromium')
+    gestor_trabajos.cerrar()
 
 if __name__ == "__main__":
     main()
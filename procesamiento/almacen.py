@@ -0,0 +1,218 @@
+"""
+almacen.py - Almacén de archivos por contenido (SHA-256)
+WOGest - Sistema de Validación de Renovaciones
+
+Cada archivo recibido se guardaba en datos/temp con un nombre nuevo
+(nombre_fecha.ext) y solo se borraba al limpiar el estado: el directorio
+crecía sin límite y el mismo Excel subido varias veces ocupaba varias copias.
+
+Ahora los archivos se guardan una sola vez por contenido:
+
+    datos/temp/almacen/<sha256><ext>
+    datos/temp/almacen/indice.json     # orden LRU y tamaños
+
+- guardar_bytes / importar_archivo: si el contenido ya está, no se escribe
+  nada (solo se marca como usado recientemente).
+- Referencias por ejecución: cada archivo lo retienen las ejecuciones
+  (sesiones de la UI) que lo usan; liberar_ejecucion las suelta al limpiar el
+  estado.
+- Límite de tamaño: al superarlo se eliminan los archivos menos usados
+  recientemente que no retiene ninguna ejecución.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_INDICE = "indice.json"
+_PATRON_OBJETO = re.compile(r"^[0-9a-f]{64}(\.[A-Za-z0-9]{1,10})?$")
+
+
+@dataclass
+class EntradaAlmacen:
+    """Archivo guardado: clave = '<sha256><ext>'"""
+    clave: str
+    tamano: int
+    ultimo_uso: float = field(default_factory=time.time)
+    ejecuciones: Set[str] = field(default_factory=set)
+
+
+def clave_contenido(sha256: str, extension: str = "") -> str:
+    extension = (extension or "").lower()
+    if extension and not extension.startswith("."):
+        extension = "." + extension
+    return f"{sha256.lower()}{extension}"
+
+
+class AlmacenContenido:
+    """Archivos direccionados por contenido con índice LRU y límite de tamaño"""
+
+    def __init__(self, directorio: str, max_bytes: int):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self._entradas: "OrderedDict[str, EntradaAlmacen]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+        self._cargar_indice()
+
+    # ---------------------- Índice ----------------------
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, clave)
+
+    def _cargar_indice(self):
+        try:
+            with open(os.path.join(self.directorio, NOMBRE_INDICE), encoding="utf-8") as f:
+                guardado = json.load(f)
+        except FileNotFoundError:
+            guardado = []
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Índice del almacén ilegible, se reconstruye: {e}")
+            guardado = []
+
+        for item in sorted(guardado, key=lambda e: e.get("ultimo_uso", 0)):
+            clave = item.get("clave", "")
+            if _PATRON_OBJETO.match(clave) and os.path.isfile(self._ruta(clave)):
+                self._entradas[clave] = EntradaAlmacen(clave, os.path.getsize(self._ruta(clave)),
+                                                       item.get("ultimo_uso", 0))
+
+        # Archivos sin entrada (p. ej. un cierre a mitad de escritura)
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith(".tmp") or (_PATRON_OBJETO.match(nombre) and nombre not in self._entradas):
+                self._eliminar_archivo(nombre)
+
+    def _guardar_indice(self):
+        datos = [{"clave": e.clave, "tamano": e.tamano, "ultimo_uso": e.ultimo_uso}
+                 for e in self._entradas.values()]
+        ruta = os.path.join(self.directorio, NOMBRE_INDICE)
+        temporal = f"{ruta}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(datos, f, separators=(",", ":"))
+        os.replace(temporal, ruta)
+
+    def _eliminar_archivo(self, clave: str):
+        try:
+            os.remove(self._ruta(clave))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"No se pudo eliminar {clave} del almacén: {e}")
+
+    # ---------------------- Uso ----------------------
+
+    @property
+    def bytes_ocupados(self) -> int:
+        with self._lock:
+            return sum(e.tamano for e in self._entradas.values())
+
+    def obtener(self, clave: str) -> Optional[str]:
+        """Ruta del archivo si está en el almacén"""
+        with self._lock:
+            return self._ruta(clave) if clave in self._entradas else None
+
+    def _usar(self, clave: str, ejecucion: Optional[str]) -> str:
+        """Marca la entrada como la más reciente (con el lock tomado)"""
+        entrada = self._entradas[clave]
+        entrada.ultimo_uso = time.time()
+        if ejecucion:
+            entrada.ejecuciones.add(ejecucion)
+        self._entradas.move_to_end(clave)
+        return self._ruta(clave)
+
+    def _registrar(self, clave: str, temporal: str, ejecucion: Optional[str]) -> str:
+        """Incorpora un archivo ya escrito en `temporal` (si otro hilo lo añadió antes, se descarta)"""
+        with self._lock:
+            if clave in self._entradas:
+                os.remove(temporal)
+                ruta = self._usar(clave, ejecucion)
+            else:
+                os.replace(temporal, self._ruta(clave))
+                self._entradas[clave] = EntradaAlmacen(clave, os.path.getsize(self._ruta(clave)))
+                ruta = self._usar(clave, ejecucion)
+                # La entrada recién añadida no se desaloja aunque nadie la retenga todavía
+                self._desalojar(proteger=clave)
+            self._guardar_indice()
+        return ruta
+
+    def guardar_bytes(self, datos: bytes, extension: str = "", ejecucion: Optional[str] = None) -> str:
+        """
+        Guarda un contenido (p. ej. el base64 ya decodificado) y devuelve su ruta.
+        Si ya estaba, no se escribe nada.
+        """
+        clave = clave_contenido(hashlib.sha256(datos).hexdigest(), extension)
+        with self._lock:
+            if clave in self._entradas:
+                ruta = self._usar(clave, ejecucion)
+                self._guardar_indice()
+                logger.info(f"♻️ Contenido ya almacenado: {clave[:12]}… ({len(datos)} bytes, sin escritura)")
+                return ruta
+
+        temporal = self._ruta(f"{clave}.{uuid.uuid4().hex[:8]}.tmp")
+        with open(temporal, "wb") as f:
+            f.write(datos)
+        return self._registrar(clave, temporal, ejecucion)
+
+    def importar_archivo(self, ruta_origen: str, sha256: str, extension: str = "",
+                         ejecucion: Optional[str] = None) -> str:
+        """
+        Mueve al almacén un archivo ya escrito cuyo SHA-256 se conoce (una
+        subida por bloques). Si el contenido ya estaba, el archivo se elimina.
+        """
+        clave = clave_contenido(sha256, extension)
+        temporal = self._ruta(f"{clave}.{uuid.uuid4().hex[:8]}.tmp")
+        os.replace(ruta_origen, temporal)
+        return self._registrar(clave, temporal, ejecucion)
+
+    def adquirir(self, clave: str, ejecucion: Optional[str] = None) -> Optional[str]:
+        """Retiene una entrada existente para una ejecución; None si no está"""
+        with self._lock:
+            if clave not in self._entradas:
+                return None
+            ruta = self._usar(clave, ejecucion)
+            self._guardar_indice()
+            return ruta
+
+    def liberar_ejecucion(self, ejecucion: str) -> int:
+        """Suelta las entradas retenidas por una ejecución y aplica el límite de tamaño"""
+        with self._lock:
+            liberadas = 0
+            for entrada in self._entradas.values():
+                if ejecucion in entrada.ejecuciones:
+                    entrada.ejecuciones.discard(ejecucion)
+                    liberadas += 1
+            self._desalojar()
+            self._guardar_indice()
+        return liberadas
+
+    def _desalojar(self, proteger: Optional[str] = None):
+        """Elimina las entradas menos recientes sin referencias (salvo `proteger`) hasta cumplir el límite"""
+        ocupados = sum(e.tamano for e in self._entradas.values())
+        for clave in list(self._entradas):
+            if ocupados <= self.max_bytes:
+                break
+            entrada = self._entradas[clave]
+            if entrada.ejecuciones or clave == proteger:
+                continue
+            del self._entradas[clave]
+            self._eliminar_archivo(clave)
+            ocupados -= entrada.tamano
+            logger.info(f"🧹 Almacén: eliminado {clave[:12]}… ({entrada.tamano} bytes, LRU)")
+
+    def estado(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "archivos": len(self._entradas),
+                "bytes": sum(e.tamano for e in self._entradas.values()),
+                "retenidos": sum(1 for e in self._entradas.values() if e.ejecuciones),
+                "max_bytes": self.max_bytes,
+            }
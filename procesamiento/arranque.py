@@ -0,0 +1,151 @@
+"""
+arranque.py - Arranque de la aplicación guiado por disponibilidad
+WOGest - Sistema de Validación de Renovaciones
+
+main() lanzaba el servidor Bottle, esperaba un time.sleep(1.5) fijo e
+inicializaba la BD antes de abrir la ventana, y el catálogo de reglas del
+Paso 1 se cargaba al importar paso1. Ahora:
+
+- la ventana se abre en cuanto /health responde (sondeo cada pocos ms)
+- el catálogo de reglas y las partes de pandas / openpyxl que se cargan en
+  el primer uso se precalientan en hilos en segundo plano
+- cada fase queda medida y el desglose se escribe en el log al terminar
+"""
+
+import io
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTERVALO_SONDEO_SEGUNDOS = 0.05
+LIMITE_SONDEO_SEGUNDOS = 10.0
+
+
+class ArranqueApp:
+    """Mide las fases del arranque y coordina el precalentamiento"""
+
+    def __init__(self, inicio: Optional[float] = None):
+        # `inicio` permite contar también las importaciones previas a main()
+        self.inicio = inicio if inicio is not None else time.perf_counter()
+        self._fases: List[Tuple[str, float, str]] = []
+        self._hilos: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def registrar(self, nombre: str, segundos: float, modo: str = "principal"):
+        with self._lock:
+            self._fases.append((nombre, segundos, modo))
+
+    @contextmanager
+    def fase(self, nombre: str):
+        """Mide un bloque del hilo principal"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nombre, time.perf_counter() - t0)
+
+    def en_segundo_plano(self, nombre: str, funcion: Callable[[], None]) -> threading.Thread:
+        """Ejecuta `funcion` en un hilo daemon; un fallo solo se registra (se repetirá en el primer uso)"""
+        def _ejecutar():
+            t0 = time.perf_counter()
+            try:
+                funcion()
+            except Exception as e:
+                logger.warning(f"⚠️ Precalentamiento '{nombre}' falló: {e}")
+            finally:
+                self.registrar(nombre, time.perf_counter() - t0, "segundo plano")
+
+        hilo = threading.Thread(target=_ejecutar, name=f"precalentar-{nombre}", daemon=True)
+        hilo.start()
+        self._hilos.append(hilo)
+        return hilo
+
+    def esperar_servidor(self, url: str, limite_segundos: float = LIMITE_SONDEO_SEGUNDOS) -> bool:
+        """
+        Sondea `url` hasta obtener un 200 o agotar el límite.
+
+        Returns:
+            True si el servidor respondió a tiempo
+        """
+        with self.fase("servidor listo"):
+            # Sin proxies del sistema: el servidor es local
+            cliente = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+            limite = time.monotonic() + limite_segundos
+            intentos = 0
+            while time.monotonic() < limite:
+                intentos += 1
+                try:
+                    with cliente.open(url, timeout=1) as respuesta:
+                        if respuesta.status == 200:
+                            logger.info(f"✅ Servidor disponible tras {intentos} sondeo(s)")
+                            return True
+                except (urllib.error.URLError, ConnectionError, TimeoutError):
+                    pass
+                time.sleep(INTERVALO_SONDEO_SEGUNDOS)
+        logger.warning(f"⚠️ El servidor no respondió en {limite_segundos:.0f}s ({url}); se abre la ventana igualmente")
+        return False
+
+    def resumen(self) -> Dict[str, object]:
+        with self._lock:
+            fases = list(self._fases)
+        return {
+            "total_segundos": round(time.perf_counter() - self.inicio, 3),
+            "fases": [{"fase": n, "segundos": round(s, 3), "modo": m} for n, s, m in fases],
+        }
+
+    def _escribir_resumen(self, titulo: str):
+        datos = self.resumen()
+        lineas = [f"    {f['fase']:<22} {f['segundos'] * 1000:8.0f} ms  ({f['modo']})" for f in datos["fases"]]
+        logger.info(f"⏱️ {titulo}: {datos['total_segundos'] * 1000:.0f} ms desde el inicio\n" + "\n".join(lineas))
+
+    def registrar_resumen(self):
+        """Escribe el desglose ahora y, cuando termine el precalentamiento, el definitivo"""
+        self._escribir_resumen("Ventana lista")
+        pendientes = [h for h in self._hilos if h.is_alive()]
+        if not pendientes:
+            return
+
+        def _al_terminar():
+            for hilo in pendientes:
+                hilo.join()
+            self._escribir_resumen("Precalentamiento completado")
+
+        threading.Thread(target=_al_terminar, name="resumen-arranque", daemon=True).start()
+
+
+# ---------------------- Precalentamiento ----------------------
+
+def precalentar_reglas():
+    """Carga el catálogo de reglas del Paso 1 (config/combinaciones.db)"""
+    from procesamiento.paso1 import obtener_validador
+    obtener_validador()
+
+
+def precalentar_pandas():
+    """Módulos de pandas que se importan en la primera lectura CSV / SQL"""
+    import pandas as pd
+    import pandas.io.sql  # noqa: F401  (read_sql_query)
+
+    pd.read_csv(io.StringIO("a;b\n1;x\n"), sep=";", dtype=str).astype({"a": "Int64"})
+
+
+def precalentar_openpyxl():
+    """Lector de Excel de pandas / openpyxl (primera validación del Paso 1)"""
+    import openpyxl.reader.excel  # noqa: F401
+    import pandas.io.excel._openpyxl  # noqa: F401
+    from openpyxl import Workbook
+
+    Workbook(write_only=True).create_sheet()
+
+
+PRECALENTAMIENTOS = {
+    "reglas": precalentar_reglas,
+    "pandas": precalentar_pandas,
+    "openpyxl": precalentar_openpyxl,
+}
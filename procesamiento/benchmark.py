@@ -0,0 +1,325 @@
+"""
+benchmark.py - Medición de rendimiento de extremo a extremo
+WOGest - Sistema de Validación de Renovaciones
+
+Ejecuta el flujo completo sobre juegos de datos sintéticos
+(procesamiento.sintetico) y guarda el tiempo de cada etapa en JSON, para
+detectar regresiones comparando con una base guardada:
+
+    1. paso1         validar_renovaciones (lectura, limpieza, validación, guardado...)
+    2. paso2         procesar_woq (lectura CSV, limpieza, guardado...)
+    3. paso3         lectura de temp_paso1/2, cruce en memoria y serialización de filas
+    4. paso3_sqlite  cruce fuera de memoria (sort-merge en SQLite)
+    5. paso4         selección RPA y escritura csv / xlsx
+
+Los tiempos de cada etapa son los tramos de procesamiento.metricas (los
+mismos que publica /metrics). Cada repetición se ejecuta en una sesión propia
+que se elimina al terminar; se guardan la mejor y la mediana de las
+repeticiones, y la comparación usa la mejor (la menos afectada por ruido).
+
+    python -m procesamiento.benchmark --tamanos 10k 100k --repeticiones 3
+    python -m procesamiento.benchmark --tamanos 10k --guardar-base      # fija la base
+    python -m procesamiento.benchmark --tamanos 10k --base benchmarks/base.json
+
+Con regresiones (mejor > base * (1 + tolerancia)) el proceso termina con código 1.
+Con --perfil-memoria se activa el perfil de memoria por etapa
+(procesamiento.memoria) y cada caso guarda los picos de la última repetición;
+los tiempos medidos así no son comparables con una base sin perfil.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from procesamiento.bitacora import configurar_logging
+from procesamiento.db_sqlite import eliminar_sesion
+from procesamiento.memoria import activar_perfil_memoria
+from procesamiento.metricas import registro_tiempos
+from procesamiento.sesiones import en_sesion, nueva_sesion
+from procesamiento.sintetico import CatalogoSintetico, filas_desde_tamano, generar_juego
+
+logger = logging.getLogger(__name__)
+
+VERSION_FORMATO = 1
+CARPETA_DATOS = os.path.join("benchmarks", "datos")
+CARPETA_RESULTADOS = os.path.join("benchmarks", "resultados")
+RUTA_BASE = os.path.join("benchmarks", "base.json")
+
+TOLERANCIA = 0.15
+# Diferencias menores que esto (segundos) no cuentan como regresión
+MINIMO_SEGUNDOS = 0.02
+
+# Tramos que suman el flujo de la UI (paso3_sqlite es la alternativa para tablas grandes)
+TRAMOS_FLUJO = ("paso1", "paso2", "paso3.lectura_temp", "paso3", "paso3.serializacion", "paso4")
+
+
+def _tramos(paso: str) -> Dict[str, float]:
+    """Últimas duraciones del paso y de sus etapas ('paso3' no incluye 'paso3_sqlite')"""
+    return {nombre: segundos for nombre, segundos in registro_tiempos.ultimas(paso).items()
+            if nombre == paso or nombre.startswith(paso + ".")}
+
+
+def _cronometrar(tiempos: Dict[str, float], nombre: str, funcion, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcion(*args, **kwargs)
+    tiempos[nombre] = time.perf_counter() - inicio
+    return resultado
+
+
+def ejecutar_repeticion(juego: Dict[str, Any], carpeta_salida: str) -> Dict[str, Any]:
+    """
+    Una pasada completa sobre un juego de datos en una sesión nueva.
+
+    Returns:
+        {"tiempos": {tramo: segundos}, "filas": {...}, "memoria": {paso: resumen}}
+        ('memoria' solo tiene datos con el perfil de memoria activo)
+
+    Raises:
+        RuntimeError: si alguna etapa falla (el benchmark no mide ejecuciones fallidas)
+    """
+    from procesamiento.db_sqlite import leer_temp_paso1, leer_temp_paso2
+    from procesamiento.paso1 import obtener_validador
+    from procesamiento.paso2 import procesar_woq
+    from procesamiento.paso3 import realizar_cruce_datos, realizar_cruce_datos_sqlite, registros_visibles
+    from procesamiento.paso4 import escribir_seleccion_rpa, seleccionar_exportables
+
+    tiempos: Dict[str, float] = {}
+    filas: Dict[str, int] = {}
+    memoria: Dict[str, Any] = {}
+    sesion = nueva_sesion()
+    try:
+        with en_sesion(sesion):
+            validacion = obtener_validador().validar_renovaciones(juego["workorder"]["ruta"])
+            if not validacion.success:
+                raise RuntimeError(f"Paso 1: {validacion.message}")
+            tiempos.update(_tramos("paso1"))
+            filas["workorder"] = int(validacion.stats["total_registros"])
+            filas["correctos"] = int(validacion.stats["registros_correctos"])
+            _resumir_memoria(memoria, "paso1", validacion.stats)
+
+            if procesar_woq(juego["woq"]["ruta"]) is None:
+                raise RuntimeError("Paso 2: no se pudo procesar el WOQ")
+            tiempos.update(_tramos("paso2"))
+
+            df1 = _cronometrar(tiempos, "paso3.lectura_temp", leer_temp_paso1)
+            inicio = time.perf_counter()
+            df2 = leer_temp_paso2()
+            tiempos["paso3.lectura_temp"] += time.perf_counter() - inicio
+            filas["woq"] = len(df2)
+            cruce = realizar_cruce_datos(df1, df2, incluir_filas=False)
+            if not cruce.get("success"):
+                raise RuntimeError(f"Paso 3: {cruce.get('message')}")
+            tiempos.update(_tramos("paso3"))
+            _cronometrar(tiempos, "paso3.serializacion", registros_visibles, cruce["cruce"])
+            filas["cruce"] = len(cruce["cruce"])
+            _resumir_memoria(memoria, "paso3", cruce)
+
+            cruce_sqlite = realizar_cruce_datos_sqlite()
+            if not cruce_sqlite.get("success"):
+                raise RuntimeError(f"Paso 3 (SQLite): {cruce_sqlite.get('message')}")
+            tiempos.update(_tramos("paso3_sqlite"))
+            _resumir_memoria(memoria, "paso3_sqlite", cruce_sqlite)
+
+            seleccion = _cronometrar(tiempos, "paso4.seleccion", seleccionar_exportables, cruce["cruce"])
+            filas["rpa"] = len(seleccion)
+            for formato in ("csv", "xlsx"):
+                ruta = os.path.join(carpeta_salida, f"rpa_{sesion}.{formato}")
+                _cronometrar(tiempos, f"paso4.escritura_{formato}", escribir_seleccion_rpa, seleccion, ruta, formato)
+                os.remove(ruta)
+            tiempos["paso4"] = sum(s for t, s in tiempos.items() if t.startswith("paso4."))
+    finally:
+        eliminar_sesion(sesion)
+
+    return {"tiempos": tiempos, "filas": filas, "memoria": memoria}
+
+
+def _resumir_memoria(memoria: Dict[str, Any], paso: str, resultado: Dict[str, Any]):
+    informe = resultado.get("memoria")
+    if informe:
+        memoria[paso] = {clave: informe[clave] for clave in ("pico_python_mb", "etapa_pico_python", "pico_rss_mb")}
+
+
+def medir_juego(juego: Dict[str, Any], repeticiones: int = 3) -> Dict[str, Any]:
+    """Repite el flujo sobre un juego de datos y resume cada tramo (mejor y mediana, en segundos)"""
+    muestras: Dict[str, List[float]] = {}
+    filas: Dict[str, int] = {}
+    memoria: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory(prefix="wogest_benchmark_") as carpeta:
+        for i in range(repeticiones):
+            pasada = ejecutar_repeticion(juego, carpeta)
+            filas, memoria = pasada["filas"], pasada["memoria"]
+            for tramo, segundos in pasada["tiempos"].items():
+                muestras.setdefault(tramo, []).append(segundos)
+            logger.info(f"⏱️ {juego['filas']} filas, repetición {i + 1}/{repeticiones}: "
+                        f"paso1 {pasada['tiempos'].get('paso1', 0):.2f} s, paso2 {pasada['tiempos'].get('paso2', 0):.2f} s")
+
+    etapas = {tramo: {"mejor": round(min(valores), 4), "mediana": round(statistics.median(valores), 4)}
+              for tramo, valores in sorted(muestras.items())}
+    total = sum(etapas[t]["mejor"] for t in TRAMOS_FLUJO if t in etapas)
+    filas_entrada = juego["workorder"]["filas"] + juego["woq"]["filas"]
+    caso = {
+        "filas_solicitadas": juego["filas"],
+        "semilla": juego["semilla"],
+        "filas": filas,
+        "esperado_paso1": juego["workorder"]["esperado"],
+        "bytes_entrada": {"workorder": os.path.getsize(juego["workorder"]["ruta"]),
+                          "woq": os.path.getsize(juego["woq"]["ruta"])},
+        "etapas": etapas,
+        "segundos_flujo": round(total, 4),
+        "filas_por_segundo": round(filas_entrada / total, 1) if total else None,
+    }
+    if memoria:
+        caso["memoria"] = memoria
+    return caso
+
+
+def _entorno() -> Dict[str, Any]:
+    import numpy
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": numpy.__version__,
+        "sistema": platform.platform(),
+        "procesador": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def ejecutar_benchmark(tamanos: Sequence[int], repeticiones: int = 3, semilla: int = 0,
+                       carpeta_datos: str = CARPETA_DATOS) -> Dict[str, Any]:
+    """Genera (o reutiliza) los juegos de datos y mide cada tamaño"""
+    from procesamiento.arranque import PRECALENTAMIENTOS
+    from procesamiento.db_sqlite import init_db
+
+    init_db()
+    # Catálogo de reglas e importaciones diferidas fuera de la medición
+    for precalentar in PRECALENTAMIENTOS.values():
+        precalentar()
+
+    catalogo = CatalogoSintetico.desde_db()
+    casos = {}
+    for filas in tamanos:
+        juego = generar_juego(carpeta_datos, filas, semilla, catalogo=catalogo)
+        casos[str(filas)] = medir_juego(juego, repeticiones)
+    return {
+        "version": VERSION_FORMATO,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "repeticiones": repeticiones,
+        "entorno": _entorno(),
+        "casos": casos,
+    }
+
+
+def comparar_con_base(resultado: Dict[str, Any], base: Dict[str, Any], tolerancia: float = TOLERANCIA,
+                      minimo_segundos: float = MINIMO_SEGUNDOS) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Compara la mejor marca de cada tramo con la de la base.
+
+    Returns:
+        {"regresiones": [...], "mejoras": [...], "sin_base": [caso/tramo, ...]}
+        cada diferencia: {"caso", "tramo", "base", "actual", "variacion"} (variacion = actual / base - 1)
+    """
+    comparacion: Dict[str, List[Any]] = {"regresiones": [], "mejoras": [], "sin_base": []}
+    for caso, datos in resultado.get("casos", {}).items():
+        etapas_base = base.get("casos", {}).get(caso, {}).get("etapas", {})
+        for tramo, marcas in datos["etapas"].items():
+            if tramo not in etapas_base:
+                comparacion["sin_base"].append(f"{caso}/{tramo}")
+                continue
+            anterior, actual = etapas_base[tramo]["mejor"], marcas["mejor"]
+            if abs(actual - anterior) < minimo_segundos or anterior <= 0:
+                continue
+            diferencia = {"caso": caso, "tramo": tramo, "base": anterior, "actual": actual,
+                          "variacion": round(actual / anterior - 1, 4)}
+            if actual > anterior * (1 + tolerancia):
+                comparacion["regresiones"].append(diferencia)
+            elif actual < anterior * (1 - tolerancia):
+                comparacion["mejoras"].append(diferencia)
+    return comparacion
+
+
+def _registrar_tabla(resultado: Dict[str, Any], base: Optional[Dict[str, Any]]):
+    for caso, datos in resultado["casos"].items():
+        etapas_base = (base or {}).get("casos", {}).get(caso, {}).get("etapas", {})
+        lineas = []
+        for tramo, marcas in datos["etapas"].items():
+            linea = f"    {tramo:<28} {marcas['mejor'] * 1000:9.1f} ms  (mediana {marcas['mediana'] * 1000:9.1f} ms)"
+            if tramo in etapas_base and etapas_base[tramo]["mejor"] > 0:
+                linea += f"  base {etapas_base[tramo]['mejor'] * 1000:9.1f} ms  {marcas['mejor'] / etapas_base[tramo]['mejor'] - 1:+.0%}"
+            lineas.append(linea)
+        logger.info(f"📊 Benchmark {caso} filas: {datos['segundos_flujo']:.2f} s, "
+                    f"{datos['filas_por_segundo']} filas/s\n" + "\n".join(lineas))
+
+
+def _escribir_json(ruta: str, datos: Dict[str, Any]):
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, indent=2)
+
+
+# ---------------------- Línea de comandos ----------------------
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    configurar_logging(consola=True)
+    parser = argparse.ArgumentParser(prog="python -m procesamiento.benchmark",
+                                     description="Mide cada etapa del flujo sobre datos sintéticos.")
+    parser.add_argument("--tamanos", nargs="+", default=["10k"], help="10k, 100k, 1m o número de filas")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--datos", default=CARPETA_DATOS, help="Carpeta de los juegos de datos generados")
+    parser.add_argument("-o", "--salida", help="JSON de resultados (por defecto benchmarks/resultados/benchmark_<fecha>.json)")
+    parser.add_argument("--base", default=RUTA_BASE, help="JSON con la base con la que comparar")
+    parser.add_argument("--guardar-base", action="store_true", help="Guarda el resultado como nueva base")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA, help="Empeoramiento admitido (0.15 = 15%%)")
+    parser.add_argument("--perfil-memoria", action="store_true", help="Perfil de memoria por etapa (más lento)")
+    args = parser.parse_args(argv)
+
+    try:
+        tamanos = [filas_desde_tamano(t) for t in args.tamanos]
+    except ValueError as e:
+        parser.error(str(e))
+    if args.repeticiones < 1:
+        parser.error("--repeticiones debe ser al menos 1")
+
+    if args.perfil_memoria:
+        activar_perfil_memoria(True)
+    resultado = ejecutar_benchmark(tamanos, args.repeticiones, args.semilla, args.datos)
+    resultado["perfil_memoria"] = args.perfil_memoria
+
+    base = None
+    if not args.guardar_base and os.path.exists(args.base):
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        resultado["comparacion"] = comparar_con_base(resultado, base, args.tolerancia)
+        resultado["comparacion"]["base"] = args.base
+        resultado["comparacion"]["tolerancia"] = args.tolerancia
+    _registrar_tabla(resultado, base)
+
+    salida = args.salida or os.path.join(
+        CARPETA_RESULTADOS, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    _escribir_json(salida, resultado)
+    logger.info(f"💾 Resultados en {salida}")
+    if args.guardar_base:
+        _escribir_json(args.base, resultado)
+        logger.info(f"📌 Base guardada en {args.base}")
+        return 0
+
+    regresiones = resultado.get("comparacion", {}).get("regresiones", [])
+    for r in regresiones:
+        logger.warning(f"⚠️ Regresión {r['caso']}/{r['tramo']}: {r['base'] * 1000:.1f} ms → "
+                       f"{r['actual'] * 1000:.1f} ms ({r['variacion']:+.0%})")
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
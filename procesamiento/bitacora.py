@@ -0,0 +1,199 @@
+"""
+bitacora.py - Logging centralizado, asíncrono y estructurado
+WOGest - Sistema de Validación de Renovaciones
+
+El Paso 2 y el guardado en SQLite escribían con print() en cada ejecución
+(listas de columnas, arrays de valores únicos), main.py escribía en
+logs/wogest.log de forma síncrona desde el hilo que procesaba y varios módulos
+llamaban a logging.basicConfig por su cuenta (el primero en importarse ganaba:
+el FileHandler de main.py no llegaba a instalarse).
+
+Ahora hay un único punto de configuración, configurar_logging():
+
+- el logger raíz solo tiene un QueueHandler: emitir un log es encolar el
+  registro; un QueueListener en su propio hilo lo escribe en disco y en
+  consola. Ningún bucle de procesamiento espera a la escritura de archivos
+- el archivo (logs/wogest.jsonl, con rotación) guarda un objeto JSON por
+  línea: fecha, nivel, logger, mensaje, hilo, sesión, trabajo, excepción y
+  los datos estructurados pasados con extra={"datos": {...}}
+- la consola conserva el formato legible de siempre
+- Muestreo: diagnósticos por fila / grupo (las primeras N y luego 1 de cada M)
+- depurar(): cargas de depuración (columnas, valores únicos) que solo se
+  calculan si el nivel DEBUG está activo
+
+    configurar_logging(LOG_DIR)          # al arrancar (main.py o una CLI)
+    logger = logging.getLogger(__name__)  # en cada módulo, como siempre
+
+El nivel se cambia con la variable de entorno WOGEST_LOG_NIVEL (DEBUG, INFO...).
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from procesamiento.sesiones import sesion_actual
+from procesamiento.trabajos import trabajo_actual
+
+VARIABLE_NIVEL = "WOGEST_LOG_NIVEL"
+ARCHIVO_LOG = "wogest.jsonl"
+MAX_BYTES_LOG = 10 * 1024 * 1024
+COPIAS_LOG = 5
+FORMATO_CONSOLA = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Muestreo por defecto de los diagnósticos por fila
+MUESTRAS_INICIALES = 5
+MUESTREO_CADA = 1000
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class FormatoJSON(logging.Formatter):
+    """Un objeto JSON por registro (una línea)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        datos = {
+            "fecha": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+            "hilo": record.threadName,
+            "sesion": getattr(record, "sesion", None),
+        }
+        if getattr(record, "trabajo", None):
+            datos["trabajo"] = record.trabajo
+        if getattr(record, "datos", None) is not None:
+            datos["datos"] = record.datos
+        if record.exc_text:
+            datos["excepcion"] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class _ColaContexto(logging.handlers.QueueHandler):
+    """
+    QueueHandler que fija en el registro lo que el hilo del listener no
+    conoce: el mensaje ya formateado, la traza de la excepción y la sesión /
+    trabajo de las ContextVar del hilo que emite.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.sesion = sesion_actual()
+        trabajo = trabajo_actual()
+        record.trabajo = trabajo.id if trabajo is not None else None
+        return record
+
+
+def _nivel_por_defecto() -> int:
+    nombre = os.environ.get(VARIABLE_NIVEL, "").strip().upper()
+    nivel = logging.getLevelName(nombre) if nombre else logging.INFO
+    return nivel if isinstance(nivel, int) else logging.INFO
+
+
+def _consola_interactiva() -> bool:
+    try:
+        return bool(sys.stderr) and sys.stderr.isatty()
+    except Exception:
+        return False
+
+
+def configurar_logging(directorio: Optional[str] = None, nivel: Optional[int] = None,
+                       consola: Optional[bool] = None):
+    """
+    Instala el pipeline de logging (idempotente: una segunda llamada lo sustituye).
+
+    Args:
+        directorio: carpeta del archivo JSON; None = sin archivo
+        nivel: nivel del logger raíz (por defecto WOGEST_LOG_NIVEL o INFO)
+        consola: escribir también en la consola; None = solo si hay terminal
+    """
+    global _listener
+    detener_logging()
+
+    destinos = []
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+        archivo = logging.handlers.RotatingFileHandler(
+            os.path.join(directorio, ARCHIVO_LOG), maxBytes=MAX_BYTES_LOG,
+            backupCount=COPIAS_LOG, encoding="utf-8")
+        archivo.setFormatter(FormatoJSON())
+        destinos.append(archivo)
+    if consola if consola is not None else _consola_interactiva():
+        pantalla = logging.StreamHandler()
+        pantalla.setFormatter(logging.Formatter(FORMATO_CONSOLA))
+        destinos.append(pantalla)
+
+    cola: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    raiz = logging.getLogger()
+    for handler in list(raiz.handlers):
+        raiz.removeHandler(handler)
+        handler.close()
+    raiz.addHandler(_ColaContexto(cola))
+    raiz.setLevel(nivel if nivel is not None else _nivel_por_defecto())
+
+    _listener = logging.handlers.QueueListener(cola, *destinos, respect_handler_level=True)
+    _listener.start()
+
+
+def detener_logging():
+    """Vacía la cola y cierra los destinos (se llama también al salir)"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+atexit.register(detener_logging)
+
+
+class Muestreo:
+    """
+    Diagnósticos por fila o grupo sin inundar el log: registra las primeras
+    `primeras` ocurrencias y después una de cada `cada`. Si el nivel no está
+    activo no formatea nada. cerrar() anota cuántas se omitieron.
+    """
+
+    def __init__(self, logger: logging.Logger, nombre: str, nivel: int = logging.DEBUG,
+                 primeras: int = MUESTRAS_INICIALES, cada: int = MUESTREO_CADA):
+        self.logger = logger
+        self.nombre = nombre
+        self.nivel = nivel
+        self.primeras = primeras
+        self.cada = max(cada, 1)
+        self.total = 0
+        self.omitidas = 0
+        self._activo = logger.isEnabledFor(nivel)
+
+    def registrar(self, mensaje: str, *args, datos: Any = None):
+        self.total += 1
+        if not self._activo:
+            return
+        if self.total <= self.primeras or self.total % self.cada == 0:
+            self.logger.log(self.nivel, f"[{self.nombre} #{self.total}] {mensaje}", *args,
+                            extra={"datos": datos} if datos is not None else None)
+        else:
+            self.omitidas += 1
+
+    def cerrar(self):
+        if self._activo and self.omitidas:
+            self.logger.log(self.nivel, f"[{self.nombre}] {self.total} diagnósticos, "
+                                        f"{self.omitidas} omitidos por muestreo")
+
+
+def depurar(logger: logging.Logger, mensaje: str, carga: Callable[[], Any], *args):
+    """logger.debug con datos estructurados que solo se calculan si DEBUG está activo"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(mensaje, *args, extra={"datos": carga()})
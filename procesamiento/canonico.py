@@ -0,0 +1,168 @@
+"""
+canonico.py - Claves canónicas tipadas
+WOGest - Sistema de Validación de Renovaciones
+
+Este módulo normaliza, una sola vez y en el momento de la ingesta (Paso 1 y
+Paso 2), las claves que el resto de pasos necesitan para cruzar y filtrar:
+
+- wo_key:     número de WO normalizado como entero (Int64, nulo si no es numérico)
+- es_cerrado: indicador entero 0/1 de WO cerrado (solo Paso 2)
+- estado_cod: estado de validación del Paso 1 codificado como EstadoCodigo
+
+Todas las funciones trabajan por columnas completas (sin bucles por fila) y
+son idempotentes: si la columna canónica ya existe con su tipo, no se recalcula.
+"""
+
+from enum import IntEnum
+from typing import Iterable, Optional
+
+import pandas as pd
+
+# Nombres de las columnas canónicas
+COL_WO_KEY = "wo_key"
+COL_ES_CERRADO = "es_cerrado"
+COL_ESTADO_COD = "estado_cod"
+
+# Columnas internas que no se muestran en la UI ni se exportan al usuario
+COLUMNAS_TECNICAS = ("id", COL_WO_KEY, COL_ESTADO_COD)
+
+# Variantes de nombre de columna admitidas (se prueban una vez por DataFrame)
+CANDIDATAS_WO_PASO1 = ("wo", "WO")
+CANDIDATAS_WO_PASO2 = ("N°_WO", "N_WO", "N_WO2", "WO", "wo")
+CANDIDATAS_CERRADO = ("ES_CERRADO", "es_cerrado", "woq_es_cerrado", "WOQ_ES_CERRADO", "woq_cerrado", "WOQ_CERRADO")
+CANDIDATAS_ESTADO = ("estado", "Estado", "ESTADO")
+
+VALORES_VERDADEROS = ("1", "SI", "SÍ", "S", "TRUE", "YES", "X")
+
+
+class EstadoCodigo(IntEnum):
+    """Estados de validación del Paso 1 codificados como enteros"""
+    SIN_ESTADO = 0
+    CORRECTO = 1
+    ADVERTENCIA = 2
+    INCORRECTO = 3
+
+
+_ESTADO_POR_TEXTO = {
+    "CORRECTO": EstadoCodigo.CORRECTO,
+    "ADVERTENCIA": EstadoCodigo.ADVERTENCIA,
+    "INCORRECTO": EstadoCodigo.INCORRECTO,
+}
+
+
+def primera_columna(df: pd.DataFrame, candidatas: Iterable[str]) -> Optional[str]:
+    """Devuelve la primera columna de `candidatas` presente en el DataFrame"""
+    for col in candidatas:
+        if col in df.columns:
+            return col
+    return None
+
+
+def normalizar_wo(serie: pd.Series) -> pd.Series:
+    """
+    Normaliza una columna de números de WO a enteros Int64
+
+    Acepta enteros, flotantes ('12345.0') y textos con espacios. Los valores
+    no numéricos, vacíos o con decimales quedan como nulo (<NA>).
+    """
+    if pd.api.types.is_bool_dtype(serie):
+        return pd.Series(pd.NA, index=serie.index, dtype="Int64")
+    if pd.api.types.is_integer_dtype(serie):
+        return serie.astype("Int64")
+    if pd.api.types.is_float_dtype(serie):
+        valores = serie
+    else:
+        texto = serie.astype("string").str.strip().str.replace(r"\.0+$", "", regex=True)
+        valores = pd.to_numeric(texto, errors="coerce")
+    valores = valores.where(valores == valores.round())
+    return valores.astype("Int64")
+
+
+def normalizar_cerrado(serie: pd.Series) -> pd.Series:
+    """Convierte una columna de cerrado (bool, 0/1, 'SI', 'X', ...) a int8 0/1"""
+    if pd.api.types.is_bool_dtype(serie):
+        return serie.fillna(False).astype("int8")
+    if pd.api.types.is_numeric_dtype(serie):
+        return (serie.fillna(0) != 0).astype("int8")
+    texto = serie.astype("string").str.strip().str.upper()
+    numerico = pd.to_numeric(texto, errors="coerce")
+    cerrado = texto.isin(VALORES_VERDADEROS) | (numerico.fillna(0) != 0)
+    return cerrado.fillna(False).astype("int8")
+
+
+def codificar_estado(serie: pd.Series) -> pd.Series:
+    """Codifica una columna de estado ('Correcto', 'Incorrecto', ...) como int8"""
+    texto = serie.astype("string").str.strip().str.upper()
+    return texto.map(_ESTADO_POR_TEXTO).fillna(EstadoCodigo.SIN_ESTADO).astype("int8")
+
+
+def canonicalizar_paso1(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Añade las columnas canónicas del Paso 1 (wo_key, estado_cod)
+
+    Args:
+        df: DataFrame de renovaciones validadas (columnas en minúsculas o no)
+
+    Returns:
+        El mismo DataFrame con wo_key (Int64) y estado_cod (int8)
+    """
+    if df is None:
+        return df
+    if COL_WO_KEY not in df.columns or df[COL_WO_KEY].dtype != "Int64":
+        col_wo = primera_columna(df, (COL_WO_KEY,) + CANDIDATAS_WO_PASO1)
+        df[COL_WO_KEY] = (
+            normalizar_wo(df[col_wo]) if col_wo
+            else pd.Series(pd.NA, index=df.index, dtype="Int64")
+        )
+    if COL_ESTADO_COD in df.columns and df[COL_ESTADO_COD].dtype != "int8":
+        # Leído de SQLite: ya viene codificado, solo se ajusta el tipo
+        df[COL_ESTADO_COD] = pd.to_numeric(df[COL_ESTADO_COD], errors="coerce").fillna(0).astype("int8")
+    elif COL_ESTADO_COD not in df.columns:
+        col_estado = primera_columna(df, CANDIDATAS_ESTADO)
+        df[COL_ESTADO_COD] = (
+            codificar_estado(df[col_estado]) if col_estado
+            else pd.Series(EstadoCodigo.SIN_ESTADO, index=df.index, dtype="int8")
+        )
+    return df
+
+
+def canonicalizar_paso2(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Añade las columnas canónicas del Paso 2 (wo_key, indicador de cerrado)
+
+    El indicador se guarda en la columna de cerrado ya existente ('ES_CERRADO'
+    recién procesado o 'es_cerrado' leído de SQLite) convertido a int8 0/1.
+
+    Args:
+        df: DataFrame WOQ (recién procesado o leído de temp_paso2)
+
+    Returns:
+        El mismo DataFrame con wo_key (Int64) y el cerrado como int8
+    """
+    if df is None:
+        return df
+    if COL_WO_KEY not in df.columns or df[COL_WO_KEY].dtype != "Int64":
+        col_wo = primera_columna(df, (COL_WO_KEY,) + CANDIDATAS_WO_PASO2)
+        df[COL_WO_KEY] = (
+            normalizar_wo(df[col_wo]) if col_wo
+            else pd.Series(pd.NA, index=df.index, dtype="Int64")
+        )
+    col_cerrado = primera_columna(df, CANDIDATAS_CERRADO)
+    if col_cerrado is None:
+        df[COL_ES_CERRADO] = pd.Series(0, index=df.index, dtype="int8")
+    elif df[col_cerrado].dtype != "int8":
+        df[col_cerrado] = normalizar_cerrado(df[col_cerrado])
+    return df
+
+
+def columna_cerrado(df: pd.DataFrame) -> Optional[str]:
+    """Nombre de la columna de cerrado canónica del DataFrame (si existe)"""
+    return primera_columna(df, CANDIDATAS_CERRADO)
+
+
+def quitar_columnas_tecnicas(df: pd.DataFrame) -> pd.DataFrame:
+    """Devuelve una vista del DataFrame sin las columnas internas"""
+    if df is None:
+        return df
+    tecnicas = [c for c in df.columns if c in COLUMNAS_TECNICAS]
+    return df.drop(columns=tecnicas) if tecnicas else df
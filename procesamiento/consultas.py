@@ -0,0 +1,312 @@
+"""
+consultas.py - Consultas paginadas sobre los datos guardados de cada paso
+WOGest - Sistema de Validación de Renovaciones
+
+Las tablas de la UI recibían todas las filas de un paso y paginaban, filtraban
+y ordenaban en el navegador. Con consultar_origen la UI pide solo la página
+visible:
+
+    {"origen": "step3_p3", "pagina": 2, "por_pagina": 50,
+     "orden": ["-CONTRATO"],                       # '-' = descendente
+     "filtros": {"contiene": {"N_WO": "12"}, "igual": {"Apto RPA": "SÍ"}}}
+
+y recibe las filas de esa página con los totales ('total' sin filtros,
+'total_filtrado' con ellos). Los filtros son los de origenes.aplicar_filtros.
+
+- step2_p2 y el cruce fuera de memoria (temp_cruce) se consultan en SQLite
+  con WHERE / ORDER BY / LIMIT; las igualdades sobre columnas numéricas o
+  codificadas (es_cerrado, apto_rpa_cod) usan los índices de
+  db_sqlite.INDICES_CONSULTA.
+- step1_p1 (DataFrame del controlador) y el cruce en memoria se filtran y
+  ordenan con pandas; el cruce se guarda en caché (uno por sesión) hasta que
+  cambian las tablas temporales (db_sqlite.version_datos).
+"""
+
+import logging
+import math
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from procesamiento.canonico import COLUMNAS_TECNICAS, quitar_columnas_tecnicas
+from procesamiento.db_sqlite import (contar_registros, get_connection, leer_temp_paso1,
+                                     leer_temp_paso2, version_datos)
+from procesamiento.origenes import (ORIGEN_CRUCE, ORIGEN_PASO1, ORIGEN_PASO2, VALOR_NULO,
+                                    aplicar_filtros, normalizar_origen, presentar_paso2)
+from procesamiento.paso3 import COLUMNAS_TECNICAS_CRUCE, construir_cruce
+from procesamiento.serializacion import detalle_paso1, registros_json
+from procesamiento.sesiones import sesion_actual
+
+logger = logging.getLogger(__name__)
+
+ORIGENES_CONSULTA = (ORIGEN_PASO1, ORIGEN_PASO2, ORIGEN_CRUCE)
+
+POR_PAGINA = 50
+MAX_POR_PAGINA = 1000
+
+# Igualdades que se resuelven sobre una columna numérica indexada:
+# columna visible → (columna en la tabla, {valor de la UI: código})
+_CODIGOS_PASO2 = {"es_cerrado": ("es_cerrado", {"SI": 1, "NO": 0})}
+_CODIGOS_CRUCE = {
+    **_CODIGOS_PASO2,
+    "Apto RPA": ("apto_rpa_cod", {"SÍ": 1, "SI": 1, "NO": 0, VALOR_NULO: -1}),
+}
+
+# sesión → (versión de los datos, cruce)
+_cache_cruce: Dict[str, Tuple[int, pd.DataFrame]] = {}
+_lock_cache = threading.Lock()
+
+
+class _TablaConsulta:
+    """Origen guardado en una tabla SQLite"""
+
+    def __init__(self, tabla: str, clave_orden: str, ocultas: Sequence[str],
+                 codigos: Dict[str, Tuple[str, Dict[str, int]]], presentar=None):
+        self.tabla = tabla
+        self.clave_orden = clave_orden
+        self.ocultas = set(ocultas)
+        self.codigos = codigos
+        self.presentar = presentar
+
+
+_PASO2 = _TablaConsulta("temp_paso2", "id", COLUMNAS_TECNICAS, _CODIGOS_PASO2, presentar=presentar_paso2)
+_CRUCE_DISCO = _TablaConsulta("temp_cruce", "id_paso2", COLUMNAS_TECNICAS_CRUCE, _CODIGOS_CRUCE)
+
+
+def opciones_consulta(payload: Dict[str, Any]) -> Tuple[int, int, List[Tuple[str, bool]], Optional[Dict[str, Any]]]:
+    """
+    (pagina, por_pagina, orden, filtros) validados de una petición de la UI.
+
+    'orden' admite "COL", "-COL", una lista de ellos o
+    [{"columna": "COL", "descendente": true}, ...].
+
+    Raises:
+        ValueError: con una página o un tamaño de página no válidos
+    """
+    try:
+        pagina = int(payload.get("pagina") or 1)
+        por_pagina = payload.get("por_pagina")
+        por_pagina = POR_PAGINA if por_pagina in (None, "") else int(por_pagina)
+    except (TypeError, ValueError):
+        raise ValueError("'pagina' y 'por_pagina' deben ser números enteros") from None
+    if pagina < 1 or not 1 <= por_pagina <= MAX_POR_PAGINA:
+        raise ValueError(f"Página no válida (pagina >= 1, por_pagina entre 1 y {MAX_POR_PAGINA})")
+
+    orden = payload.get("orden") or []
+    if isinstance(orden, (str, dict)):
+        orden = [orden]
+    claves = []
+    for criterio in orden:
+        if isinstance(criterio, dict):
+            columna, descendente = str(criterio.get("columna") or ""), bool(criterio.get("descendente"))
+        else:
+            columna = str(criterio or "")
+            descendente = columna.startswith("-")
+            columna = columna.lstrip("-+")
+        if columna:
+            claves.append((columna, descendente))
+
+    return pagina, por_pagina, claves, payload.get("filtros")
+
+
+# ---------------------- SQLite ----------------------
+
+def _texto_sql(valor: Any) -> Optional[str]:
+    """Mismo texto que origenes._texto_columna (mayúsculas, sin espacios)"""
+    return None if valor is None else str(valor).strip().upper()
+
+
+def _patron_like(texto: str) -> str:
+    escapado = texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escapado}%"
+
+
+def _numero(texto: str) -> Optional[float]:
+    try:
+        numero = float(texto)
+    except ValueError:
+        return None
+    return numero if math.isfinite(numero) else None
+
+
+def _where_sql(origen: _TablaConsulta, tipos: Dict[str, str],
+               filtros: Optional[Dict[str, Any]]) -> Tuple[str, List[Any]]:
+    condiciones, parametros = [], []
+    if not filtros:
+        return "", parametros
+
+    for columna, valor in (filtros.get("contiene") or {}).items():
+        texto = str(valor or "").strip().upper()
+        if texto and columna in tipos and columna not in origen.ocultas:
+            condiciones.append(f'wg_texto("{columna}") LIKE ? ESCAPE \'\\\'')
+            parametros.append(_patron_like(texto))
+
+    for columna, valor in (filtros.get("igual") or {}).items():
+        if valor in (None, "") or columna not in tipos or columna in origen.ocultas:
+            continue
+        esperado = str(valor).strip().upper()
+        codificada = origen.codigos.get(columna)
+        if codificada and esperado in codificada[1]:
+            condiciones.append(f'"{codificada[0]}" = ?')
+            parametros.append(codificada[1][esperado])
+        elif esperado == VALOR_NULO:
+            condiciones.append(f'"{columna}" IS NULL')
+        elif tipos[columna] in ("INTEGER", "REAL") and _numero(esperado) is not None:
+            condiciones.append(f'"{columna}" = ?')
+            parametros.append(_numero(esperado))
+        else:
+            condiciones.append(f'wg_texto("{columna}") = ?')
+            parametros.append(esperado)
+
+    return (" WHERE " + " AND ".join(condiciones)) if condiciones else "", parametros
+
+
+def _consultar_tabla(origen: _TablaConsulta, pagina: int, por_pagina: int,
+                     orden: List[Tuple[str, bool]], filtros: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    conn = get_connection()
+    try:
+        conn.create_function("wg_texto", 1, _texto_sql, deterministic=True)
+        tipos = {fila[1]: (fila[2] or "").upper() for fila in conn.execute(f"PRAGMA table_info({origen.tabla})")}
+        for columna, _ in orden:
+            if columna not in tipos or columna in origen.ocultas:
+                raise ValueError(f"No se puede ordenar por la columna: {columna}")
+
+        where, parametros = _where_sql(origen, tipos, filtros)
+        total = conn.execute(f"SELECT COUNT(*) FROM {origen.tabla}").fetchone()[0]
+        total_filtrado = (conn.execute(f"SELECT COUNT(*) FROM {origen.tabla}{where}", parametros).fetchone()[0]
+                          if where else total)
+
+        criterios = [f'"{col}" {"DESC" if desc else "ASC"}' for col, desc in orden]
+        criterios.append(f'"{origen.clave_orden}"')
+        consulta = (f"SELECT * FROM {origen.tabla}{where} ORDER BY {', '.join(criterios)} "
+                    f"LIMIT ? OFFSET ?")
+        df = pd.read_sql_query(consulta, conn, params=[*parametros, por_pagina, (pagina - 1) * por_pagina])
+    finally:
+        conn.close()
+
+    df = df.drop(columns=[c for c in df.columns if c in origen.ocultas])
+    if origen.presentar:
+        df = origen.presentar(df)
+    return {"datos": quitar_columnas_tecnicas(df), "total": total, "total_filtrado": total_filtrado}
+
+
+# ---------------------- Memoria ----------------------
+
+def fijar_cruce_en_memoria(cruce: pd.DataFrame):
+    """Guarda el cruce recién calculado para servir sus páginas sin recalcularlo"""
+    with _lock_cache:
+        _cache_cruce[sesion_actual()] = (version_datos(), cruce)
+
+
+def olvidar_cruce_en_memoria(sesion: str):
+    """Libera el cruce en caché de una sesión cerrada"""
+    with _lock_cache:
+        _cache_cruce.pop(sesion, None)
+
+
+def _cruce_en_memoria() -> pd.DataFrame:
+    sesion, version = sesion_actual(), version_datos()
+    with _lock_cache:
+        guardado = _cache_cruce.get(sesion)
+        if guardado is not None and guardado[0] == version:
+            return guardado[1]
+
+    df1 = leer_temp_paso1()
+    df2 = leer_temp_paso2()
+    cruce = construir_cruce(df1, df2) if not (df1.empty or df2.empty) else pd.DataFrame()
+    with _lock_cache:
+        _cache_cruce[sesion] = (version, cruce)
+    return cruce
+
+
+def _ordenar(df: pd.DataFrame, orden: List[Tuple[str, bool]]) -> pd.DataFrame:
+    # Del criterio menos al más importante, con orden estable. Los nulos van
+    # donde los pone SQLite: primero en ascendente, al final en descendente
+    for columna, descendente in reversed(orden):
+        if columna not in df.columns:
+            raise ValueError(f"No se puede ordenar por la columna: {columna}")
+        opciones = {"ascending": not descendente, "kind": "stable",
+                    "na_position": "last" if descendente else "first"}
+        try:
+            df = df.sort_values(columna, **opciones)
+        except TypeError:
+            # Columnas con tipos mezclados: se ordenan como texto
+            df = df.sort_values(columna, key=lambda s: s.astype("string"), **opciones)
+    return df
+
+
+def _consultar_dataframe(df: pd.DataFrame, pagina: int, por_pagina: int,
+                         orden: List[Tuple[str, bool]], filtros: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    filtrado = aplicar_filtros(df, filtros)
+    if orden and len(df.columns):
+        filtrado = _ordenar(filtrado, orden)
+    inicio = (pagina - 1) * por_pagina
+    return {"datos": filtrado.iloc[inicio:inicio + por_pagina], "total": len(df), "total_filtrado": len(filtrado)}
+
+
+def _columnas_paso1(df: pd.DataFrame, orden: List[Tuple[str, bool]],
+                    filtros: Optional[Dict[str, Any]]) -> Tuple[List[Tuple[str, bool]], Optional[Dict[str, Any]]]:
+    """La tabla del Paso 1 usa las columnas en minúsculas (detalle_paso1): se traducen a las del DataFrame"""
+    nombres = {str(c).lower(): c for c in df.columns}
+    orden = [(nombres.get(col.lower(), col), desc) for col, desc in orden]
+    if filtros:
+        filtros = {tipo: {nombres.get(str(col).lower(), col): valor for col, valor in (valores or {}).items()}
+                   for tipo, valores in filtros.items()}
+    return orden, filtros
+
+
+# ---------------------- API ----------------------
+
+def consultar_origen(origen: Any, pagina: int = 1, por_pagina: int = POR_PAGINA,
+                     orden: Optional[List[Tuple[str, bool]]] = None,
+                     filtros: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Una página de los datos guardados de un paso.
+
+    Args:
+        origen: 'step1_p1' | 'step2_p2' | 'step3_p3'
+        pagina: Página pedida (desde 1)
+        por_pagina: Filas por página
+        orden: [(columna, descendente), ...] (ver opciones_consulta)
+        filtros: {'contiene': {...}, 'igual': {...}} (ver origenes.aplicar_filtros)
+
+    Returns:
+        {'success', 'filas', 'total', 'total_filtrado', 'pagina', 'por_pagina', 'total_paginas'}
+
+    Raises:
+        ValueError: origen no consultable o columna de orden inexistente
+    """
+    paso = normalizar_origen(origen)
+    orden = orden or []
+    if paso not in ORIGENES_CONSULTA:
+        raise ValueError(f"El origen {paso} no admite consultas paginadas")
+
+    if paso == ORIGEN_PASO2:
+        pagina_datos = _consultar_tabla(_PASO2, pagina, por_pagina, orden, filtros)
+    elif paso == ORIGEN_CRUCE and contar_registros("temp_cruce") > 0:
+        pagina_datos = _consultar_tabla(_CRUCE_DISCO, pagina, por_pagina, orden, filtros)
+    elif paso == ORIGEN_CRUCE:
+        cruce = _cruce_en_memoria()
+        visibles = cruce.drop(columns=[c for c in cruce.columns if c in COLUMNAS_TECNICAS_CRUCE])
+        pagina_datos = _consultar_dataframe(visibles, pagina, por_pagina, orden, filtros)
+    else:
+        from controlador import obtener_resultado_validacion
+        df = obtener_resultado_validacion()
+        df = quitar_columnas_tecnicas(df) if df is not None else pd.DataFrame()
+        orden, filtros = _columnas_paso1(df, orden, filtros)
+        pagina_datos = _consultar_dataframe(df, pagina, por_pagina, orden, filtros)
+        pagina_datos["datos"] = detalle_paso1(pagina_datos["datos"])
+
+    total_filtrado = pagina_datos["total_filtrado"]
+    logger.info(f"🔎 Consulta {paso}: página {pagina} ({por_pagina}/pág), "
+                f"{total_filtrado} de {pagina_datos['total']} registros")
+    return {
+        "success": True,
+        "filas": registros_json(pagina_datos["datos"]),
+        "total": pagina_datos["total"],
+        "total_filtrado": total_filtrado,
+        "pagina": pagina,
+        "por_pagina": por_pagina,
+        "total_paginas": math.ceil(total_filtrado / por_pagina),
+    }
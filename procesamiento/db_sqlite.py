@@ -1,20 +1,39 @@
+import itertools
+import logging
 import os, sys, sqlite3
+import threading
 from pathlib import Path
+from typing import Dict, Optional
 import pandas as pd
 
+from procesamiento.canonico import canonicalizar_paso1, canonicalizar_paso2
+from procesamiento.sesiones import SESION_PRINCIPAL, sesion_actual, validar_sesion
+
+logger = logging.getLogger(__name__)
+
 # === Ruta segura para la BD ===
-def get_db_path() -> str:
-    """
-    Devuelve una ruta ABSOLUTA y escribible para la BD SQLite.
-    En ejecutable (PyInstaller) usa ~/.wogest/temp_wogest.sqlite3
-    En desarrollo usa <proyecto>/.wogest/temp_wogest.sqlite3
-    """
+def _directorio_bd() -> Path:
     if getattr(sys, "frozen", False):  # ejecutable PyInstaller
         base = Path(os.path.expanduser("~")) / ".wogest"
     else:
         base = Path(__file__).resolve().parent.parent / ".wogest"
     base.mkdir(parents=True, exist_ok=True)
-    return str(base / "temp_wogest.sqlite3")
+    return base
+
+def get_db_path(sesion: Optional[str] = None) -> str:
+    """
+    Devuelve una ruta ABSOLUTA y escribible para la BD SQLite de la sesión
+    (por defecto, la del contexto actual; ver procesamiento.sesiones).
+    En ejecutable (PyInstaller) usa ~/.wogest/temp_wogest.sqlite3
+    En desarrollo usa <proyecto>/.wogest/temp_wogest.sqlite3
+    Las demás sesiones usan .wogest/sesiones/<sesion>.sqlite3
+    """
+    sesion = validar_sesion(sesion or sesion_actual())
+    base = _directorio_bd()
+    if sesion == SESION_PRINCIPAL:
+        return str(base / "temp_wogest.sqlite3")
+    (base / "sesiones").mkdir(exist_ok=True)
+    return str(base / "sesiones" / f"{sesion}.sqlite3")
 
 # === Conexión centralizada ===
 def get_connection():
@@ -33,6 +52,159 @@ def init_db():
     with sqlite3.connect(get_db_path()) as _:
         pass
 
+# === Esquemas de tablas temporales ===
+COLUMNAS_TEMP_PASO1 = {
+    "wo": "INTEGER",
+    "mant": "INTEGER",
+    "fecha": "TEXT",
+    "cliente": "INTEGER",
+    "referencia": "TEXT",
+    "tipo": "TEXT",
+    "precio": "REAL",
+    "cantidad": "INTEGER",
+    "cuota": "INTEGER",
+    "tecnico": "INTEGER",
+    "pago": "INTEGER",
+    "cant_antiguo": "INTEGER",
+    "cant_nuevo": "INTEGER",
+    "cant_total": "INTEGER",
+    "estado": "TEXT",
+    "observaciones": "TEXT",
+    "rpa": "TEXT",
+    "wo_key": "INTEGER",
+    "estado_cod": "INTEGER",
+}
+
+COLUMNAS_TEMP_PASO2 = {
+    "DC": "TEXT",
+    "N_WO": "INTEGER",
+    "TIPO": "TEXT",
+    "CONTRATO": "INTEGER",
+    "DEALER": "INTEGER",
+    "STATUS1": "TEXT",
+    "STATUS2": "TEXT",
+    "CERRADO": "TEXT",
+    "F_SIST": "TEXT",
+    "CLIENTE": "TEXT",
+    "TIPO2": "TEXT",
+    "F_RECEP": "TEXT",
+    "MARCA": "TEXT",
+    "MODELO": "TEXT",
+    "SERIE": "TEXT",
+    "S_SERIE": "TEXT",
+    "CA": "TEXT",
+    "LEC_ANT": "INTEGER",
+    "LEC_NUE": "INTEGER",
+    "T_PRICE": "TEXT",
+    "F_F": "TEXT",
+    "CERRADO2": "TEXT",
+    "MTRIC": "TEXT",
+    "INSTALACION": "INTEGER",
+    "N_CONTRATO": "TEXT",
+    "MATRI_CERRADO": "TEXT",
+    "N_WO2": "INTEGER",
+    "ORDEN_CONTRATO": "INTEGER",
+    "es_cerrado": "INTEGER",
+    "wo_key": "INTEGER",
+}
+
+# Resultado del cruce (Paso 3) cuando se calcula fuera de memoria
+COLUMNAS_TEMP_CRUCE = {
+    "id_paso2": "INTEGER",
+    **COLUMNAS_TEMP_PASO2,
+    "Estado_Paso1": "TEXT",
+    "Apto RPA": "TEXT",
+    "confianza_correlacion": "REAL",
+    "estado_paso1_cod": "INTEGER",
+    "apto_rpa_cod": "INTEGER",
+}
+
+# Índices para filtrar / ordenar en las consultas paginadas (procesamiento.consultas)
+INDICES_CONSULTA = {
+    "temp_paso2": ("N_WO", "CONTRATO", "es_cerrado"),
+    "temp_cruce": ("N_WO", "CONTRATO", "apto_rpa_cod", "id_paso2"),
+}
+
+# El cruce por lotes se escribe aquí y solo sustituye a temp_cruce cuando termina:
+# un cruce cancelado o fallido nunca deja un temp_cruce a medias
+TABLA_CRUCE_PARCIAL = "temp_cruce_parcial"
+
+# Cambia cada vez que se reescriben las tablas temporales de una sesión (invalida cachés).
+# El contador es global: dos sesiones nunca comparten número de versión.
+_versiones = itertools.count(1)
+_version_por_sesion: Dict[str, int] = {}
+_lock_versiones = threading.Lock()
+
+def _marcar_cambio():
+    with _lock_versiones:
+        _version_por_sesion[sesion_actual()] = next(_versiones)
+
+def version_datos() -> int:
+    """Versión de los datos guardados de la sesión actual; cambia con cada guardado o limpieza"""
+    return _version_por_sesion.get(sesion_actual(), 0)
+
+def eliminar_sesion(sesion: str) -> bool:
+    """
+    Borra el archivo SQLite de una sesión (la principal solo se vacía).
+    Devuelve True si había archivo.
+    """
+    sesion = validar_sesion(sesion)
+    # Se olvida su versión: el contador global nunca repite las anteriores
+    with _lock_versiones:
+        _version_por_sesion.pop(sesion, None)
+    if sesion == SESION_PRINCIPAL:
+        return False
+    ruta = get_db_path(sesion)
+    existia = False
+    for sufijo in ("", "-wal", "-shm", "-journal"):
+        try:
+            os.remove(ruta + sufijo)
+            existia = existia or sufijo == ""
+        except FileNotFoundError:
+            pass
+    return existia
+
+def _crear_tabla_temporal(cursor, tabla: str, columnas: dict, indices: bool = True):
+    """
+    Crea la tabla temporal con el esquema indicado.
+    Si existe con un esquema anterior (sin claves canónicas) se recrea:
+    son tablas de trabajo que se vacían en cada guardado.
+    Con indices=False no se crean índices (ver _crear_indices).
+    """
+    existentes = {fila[1]: (fila[2] or "").upper() for fila in cursor.execute(f"PRAGMA table_info({tabla})")}
+    esperadas = {"id": "INTEGER", **columnas}
+    if existentes and existentes != esperadas:
+        cursor.execute(f"DROP TABLE {tabla}")
+
+    definicion = ",\n                ".join(f'"{col}" {tipo}' for col, tipo in columnas.items())
+    cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {tabla} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                {definicion}
+            )
+        ''')
+    if indices:
+        _crear_indices(cursor, tabla, columnas)
+
+def _crear_indices(cursor, tabla: str, columnas: dict):
+    """Índice por wo_key (cruce sort-merge) y los de INDICES_CONSULTA"""
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabla}_wo_key ON {tabla}(wo_key)")
+    for columna in INDICES_CONSULTA.get(tabla, ()):
+        if columna in columnas:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabla}_{columna.lower()} ON {tabla}("{columna}")')
+
+def _filas_sqlite(df, columnas):
+    """Filas del DataFrame como tuplas con tipos nativos (nulos -> None)"""
+    datos = df.reindex(columns=list(columnas)).astype(object)
+    datos = datos.where(datos.notna(), None)
+    return list(datos.itertuples(index=False, name=None))
+
+def _insertar_filas(cursor, tabla: str, columnas, filas):
+    """INSERT masivo (executemany) de tuplas en el orden de `columnas`"""
+    nombres = ", ".join(f'"{col}"' for col in columnas)
+    marcadores = ", ".join("?" * len(columnas))
+    cursor.executemany(f"INSERT INTO {tabla} ({nombres}) VALUES ({marcadores})", filas)
+
 def guardar_paso1_sqlite(df, db_path="config/combinaciones.db"):
     conn = None
     try:
@@ -44,52 +216,21 @@ def guardar_paso1_sqlite(df, db_path="config/combinaciones.db"):
         conn = sqlite3.connect(get_db_path(), check_same_thread=False)
         cursor = conn.cursor()
 
-        # ✅ Tabla con ID autoincremental
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS temp_paso1 (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                wo INTEGER,
-                mant INTEGER,
-                fecha TEXT,
-                cliente INTEGER,
-                referencia TEXT,
-                tipo TEXT,
-                precio REAL,
-                cantidad INTEGER,
-                cuota INTEGER,
-                tecnico INTEGER,
-                pago INTEGER,
-                cant_antiguo INTEGER,
-                cant_nuevo INTEGER,
-                cant_total INTEGER,
-                estado TEXT,
-                observaciones TEXT,
-                rpa TEXT
-            )
-        ''')
+        # ✅ Tabla con ID autoincremental (incluye claves canónicas wo_key/estado_cod)
+        _crear_tabla_temporal(cursor, "temp_paso1", COLUMNAS_TEMP_PASO1)
 
-        # Limpiar tabla
+        # Limpiar tabla (el cruce guardado deja de ser válido)
         cursor.execute('DELETE FROM temp_paso1')
+        cursor.execute('DROP TABLE IF EXISTS temp_cruce')
 
-        for _, row in df.iterrows():
-            cursor.execute('''
-                INSERT INTO temp_paso1 (
-                    wo, mant, fecha, cliente, referencia, tipo, precio,
-                    cantidad, cuota, tecnico, pago, cant_antiguo,
-                    cant_nuevo, cant_total, estado, observaciones, rpa
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                row["wo"], row["mant"], row["fecha"], row["cliente"], row["referencia"],
-                row["tipo"], row["precio"], row["cantidad"], row["cuota"],
-                row["tecnico"], row["pago"], row["cant_antiguo"],
-                row["cant_nuevo"], row["cant_total"], row["estado"],
-                row["observaciones"], row["rpa"]
-            ))
+        columnas = list(COLUMNAS_TEMP_PASO1)
+        _insertar_filas(cursor, "temp_paso1", columnas, _filas_sqlite(df, columnas))
 
         conn.commit()
+        _marcar_cambio()
 
     except Exception as e:
-        print("❌ Error al guardar en SQLite:", e)
+        logger.error(f"❌ Error al guardar paso1 en SQLite: {e}")
         raise
     finally:
         if conn:
@@ -109,71 +250,21 @@ def guardar_paso2_sqlite(df, db_path="config/combinaciones.db"):
         conn = sqlite3.connect(get_db_path(), check_same_thread=False)
         cursor = conn.cursor()
 
-        # Crear tabla sin restricciones conflictivas
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS temp_paso2 (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                DC TEXT,
-                N_WO INTEGER,
-                TIPO TEXT,
-                CONTRATO INTEGER,
-                DEALER INTEGER,
-                STATUS1 TEXT,
-                STATUS2 TEXT,
-                CERRADO TEXT,
-                F_SIST TEXT,
-                CLIENTE TEXT,
-                TIPO2 TEXT,
-                F_RECEP TEXT,
-                MARCA TEXT,
-                MODELO TEXT,
-                SERIE TEXT,
-                S_SERIE TEXT,
-                CA TEXT,
-                LEC_ANT INTEGER,
-                LEC_NUE INTEGER,
-                T_PRICE TEXT,
-                F_F TEXT,
-                CERRADO2 TEXT,
-                MTRIC TEXT,
-                INSTALACION INTEGER,
-                N_CONTRATO TEXT,
-                MATRI_CERRADO TEXT,
-                N_WO2 INTEGER,
-                ORDEN_CONTRATO INTEGER,
-                es_cerrado TEXT
-            )
-        ''')
+        # Crear tabla sin restricciones conflictivas (es_cerrado 0/1, wo_key entero)
+        _crear_tabla_temporal(cursor, "temp_paso2", COLUMNAS_TEMP_PASO2)
 
-        # Limpiar datos anteriores
+        # Limpiar datos anteriores (el cruce guardado deja de ser válido)
         cursor.execute('DELETE FROM temp_paso2')
+        cursor.execute('DROP TABLE IF EXISTS temp_cruce')
 
-        for _, row in df.iterrows():
-            cursor.execute('''
-                INSERT INTO temp_paso2 (
-                    DC, N_WO, TIPO, CONTRATO, DEALER, STATUS1, STATUS2,
-                    CERRADO, F_SIST, CLIENTE, TIPO2, F_RECEP, MARCA,
-                    MODELO, SERIE, S_SERIE, CA, LEC_ANT, LEC_NUE,
-                    T_PRICE, F_F, CERRADO2, MTRIC, INSTALACION,
-                    N_CONTRATO, MATRI_CERRADO, N_WO2, ORDEN_CONTRATO, es_cerrado
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                row.get("DC", ""), row.get("N_WO", 0), row.get("TIPO", ""),
-                row.get("CONTRATO", 0), row.get("DEALER", 0), row.get("STATUS1", ""),
-                row.get("STATUS2", ""), row.get("CERRADO", ""), row.get("F_SIST", ""),
-                row.get("CLIENTE", ""), row.get("TIPO2", ""), row.get("F_RECEP", ""),
-                row.get("MARCA", ""), row.get("MODELO", ""), row.get("SERIE", ""),
-                row.get("S_SERIE", ""), row.get("CA", ""), row.get("LEC_ANT", 0),
-                row.get("LEC_NUE", 0), row.get("T_PRICE", ""), row.get("F_F", ""),
-                row.get("CERRADO2", ""), row.get("MTRIC", ""), row.get("INSTALACION", 0),
-                row.get("N_CONTRATO", ""), row.get("MATRI_CERRADO", ""),
-                row.get("N_WO2", 0), row.get("ORDEN_CONTRATO", 0), row.get("es_cerrado", "")
-            ))
+        columnas = list(COLUMNAS_TEMP_PASO2)
+        _insertar_filas(cursor, "temp_paso2", columnas, _filas_sqlite(df, columnas))
 
         conn.commit()
+        _marcar_cambio()
 
     except Exception as e:
-        print("❌ Error al guardar paso2 en SQLite:", e)
+        logger.error(f"❌ Error al guardar paso2 en SQLite: {e}")
         raise
 
     finally:
@@ -184,17 +275,102 @@ def leer_temp_paso1(db_path="config/combinaciones.db"):
     conn = get_connection()
     df = pd.read_sql_query("SELECT * FROM temp_paso1", conn)
     conn.close()
-    return df
+    return canonicalizar_paso1(df)
 
 def leer_temp_paso2(db_path="config/combinaciones.db"):
     conn = get_connection()
     df = pd.read_sql_query("SELECT * FROM temp_paso2", conn)
     conn.close()
-    return df
+    return canonicalizar_paso2(df)
+
+def preparar_temp_cruce(conn):
+    """Crea vacía la tabla TABLA_CRUCE_PARCIAL (sin índices) para escribir un cruce por lotes"""
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLA_CRUCE_PARCIAL}")
+    _crear_tabla_temporal(cursor, TABLA_CRUCE_PARCIAL, COLUMNAS_TEMP_CRUCE, indices=False)
+    conn.commit()
+
+def insertar_lote_cruce(conn, df):
+    """Inserta un lote del cruce (DataFrame de construir_cruce) en TABLA_CRUCE_PARCIAL"""
+    columnas = list(COLUMNAS_TEMP_CRUCE)
+    _insertar_filas(conn.cursor(), TABLA_CRUCE_PARCIAL, columnas, _filas_sqlite(df, columnas))
+    conn.commit()
+
+def publicar_temp_cruce(conn):
+    """El cruce por lotes ya completo sustituye a temp_cruce (en una sola transacción)"""
+    conn.commit()
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute("DROP TABLE IF EXISTS temp_cruce")
+        cursor.execute(f"ALTER TABLE {TABLA_CRUCE_PARCIAL} RENAME TO temp_cruce")
+        _crear_indices(cursor, "temp_cruce", COLUMNAS_TEMP_CRUCE)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    _marcar_cambio()
+
+def descartar_temp_cruce_parcial(conn):
+    """Borra un cruce por lotes que no llegó a publicarse (cancelado o con error)"""
+    conn.rollback()
+    conn.execute(f"DROP TABLE IF EXISTS {TABLA_CRUCE_PARCIAL}")
+    conn.commit()
+
+def eliminar_temp_cruce():
+    """
+    Borra el cruce fuera de memoria guardado. Se llama antes de un cruce en
+    memoria para que un temp_cruce anterior no tape el resultado nuevo.
+    """
+    conn = get_connection()
+    try:
+        existia = conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'temp_cruce'").fetchone()[0]
+        conn.execute("DROP TABLE IF EXISTS temp_cruce")
+        conn.commit()
+    finally:
+        conn.close()
+    if existia:
+        _marcar_cambio()
+
+def cursor_ordenado_por_wo(conn, tabla: str, columnas: str = "*", solo_con_clave: bool = False):
+    """
+    Cursor sobre `tabla` ordenado por (wo_key, id) usando el índice idx_<tabla>_wo_key.
+    Las filas se leen bajo demanda (fetchmany), sin cargar la tabla en memoria.
+    """
+    filtro = "WHERE wo_key IS NOT NULL" if solo_con_clave else ""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {columnas} FROM {tabla} {filtro} ORDER BY wo_key, id")
+    return cursor
+
+def contar_registros(tabla: str) -> int:
+    """Número de filas de una tabla temporal (0 si no existe)"""
+    conn = get_connection()
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+
+def leer_temp_cruce(limite=None, db_path="config/combinaciones.db"):
+    conn = get_connection()
+    consulta = "SELECT * FROM temp_cruce ORDER BY id_paso2"
+    if limite:
+        consulta += f" LIMIT {int(limite)}"
+    df = pd.read_sql_query(consulta, conn)
+    conn.close()
+    return canonicalizar_paso2(df)
+
 def limpiar_tablas_temporales(db_path="config/combinaciones.db"):
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM temp_paso1")
-    cursor.execute("DELETE FROM temp_paso2")
+    existentes = {fila[0] for fila in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for tabla in ("temp_paso1", "temp_paso2"):
+        if tabla in existentes:  # una sesión nueva aún no tiene tablas
+            cursor.execute(f"DELETE FROM {tabla}")
+    cursor.execute("DROP TABLE IF EXISTS temp_cruce")
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLA_CRUCE_PARCIAL}")
     conn.commit()
     conn.close()
+    _marcar_cambio()
@@ -0,0 +1,189 @@
+"""
+exportador_excel.py - Exportación a Excel en streaming
+WOGest - Sistema de Validación de Renovaciones
+
+Todas las exportaciones .xlsx de la aplicación pasan por este módulo:
+- Paso 1: resultado de validación (controlador.exportar_resultado)
+- Paso 2/3: tablas de la UI (WOGestAPI.exportar_excel_con_ruta / exportar_woq)
+- Paso 3: exportar_datos_rpa y ejecutar_paso3_y_exportar
+- Paso 4: fichero WO / ORDEN_CONTRATO para el RPA
+
+Se usan libros openpyxl `write_only`: cada fila se serializa al disco en el
+momento de añadirla, por lo que la memoria no crece con el número de filas.
+El formato (cabecera, bordes, filas alternas) se define una sola vez como
+estilos con nombre en lugar de recorrer las celdas después de escribirlas.
+"""
+
+import logging
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import openpyxl
+import pandas as pd
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Border, Font, NamedStyle, PatternFill, Side
+
+from procesamiento.metricas import medido
+
+logger = logging.getLogger(__name__)
+
+# Estilos con nombre registrados en cada libro
+ESTILO_ENCABEZADO = "wogest_encabezado"
+ESTILO_CELDA = "wogest_celda"
+ESTILO_CELDA_ALTERNA = "wogest_celda_alterna"
+
+COLOR_ENCABEZADO = "366092"
+COLOR_FILA_ALTERNA = "F2F2F2"
+
+# Filas convertidas por lote al recorrer un DataFrame
+TAMANO_LOTE = 50_000
+
+DatosExcel = Union[pd.DataFrame, Iterable[pd.DataFrame]]
+
+
+def _estilos_wogest() -> List[NamedStyle]:
+    """Estilos comunes de las exportaciones (cabecera azul, bordes finos, fila alterna gris)"""
+    fino = Side(style="thin")
+    borde = Border(left=fino, right=fino, top=fino, bottom=fino)
+
+    encabezado = NamedStyle(name=ESTILO_ENCABEZADO)
+    encabezado.font = Font(bold=True, color="FFFFFF")
+    encabezado.fill = PatternFill(start_color=COLOR_ENCABEZADO, end_color=COLOR_ENCABEZADO, fill_type="solid")
+    encabezado.border = borde
+
+    celda = NamedStyle(name=ESTILO_CELDA)
+    celda.border = borde
+
+    alterna = NamedStyle(name=ESTILO_CELDA_ALTERNA)
+    alterna.border = borde
+    alterna.fill = PatternFill(start_color=COLOR_FILA_ALTERNA, end_color=COLOR_FILA_ALTERNA, fill_type="solid")
+
+    return [encabezado, celda, alterna]
+
+
+def _celdas_con_estilo(hoja, num_columnas: int, estilo: str) -> List[WriteOnlyCell]:
+    """
+    Celdas reutilizables con un estilo ya asignado.
+
+    En modo write_only cada fila se serializa al hacer append, así que basta
+    con cambiar el valor de estas celdas en cada fila.
+    """
+    celdas = []
+    for _ in range(num_columnas):
+        celda = WriteOnlyCell(hoja)
+        celda.style = estilo
+        celdas.append(celda)
+    return celdas
+
+
+def filas_dataframe(datos: DatosExcel, columnas: Optional[Sequence[str]] = None,
+                    tamano_lote: int = TAMANO_LOTE) -> Iterator[tuple]:
+    """
+    Recorre un DataFrame (o un iterable de DataFrames por lotes) como tuplas
+    de valores nativos, con nulos convertidos a None.
+
+    Args:
+        datos: DataFrame o iterable de DataFrames con las mismas columnas
+        columnas: Columnas a emitir (por defecto, todas)
+        tamano_lote: Filas convertidas a la vez de cada DataFrame
+    """
+    lotes = [datos] if isinstance(datos, pd.DataFrame) else datos
+    for df in lotes:
+        if columnas is not None:
+            df = df.reindex(columns=list(columnas))
+        for inicio in range(0, len(df), tamano_lote):
+            lote = df.iloc[inicio:inicio + tamano_lote].astype(object)
+            lote = lote.where(lote.notna(), None)
+            yield from lote.itertuples(index=False, name=None)
+
+
+def escribir_excel(ruta: str, encabezados: Sequence[str], filas: Iterable[Sequence[Any]],
+                   titulo_hoja: str = "Datos", anchos: Optional[Dict[str, float]] = None,
+                   bordes: bool = False, filas_alternas: bool = False,
+                   fijar_encabezado: bool = True) -> int:
+    """
+    Escribe un .xlsx fila a fila con un libro write_only.
+
+    Args:
+        ruta: Ruta del archivo a crear
+        encabezados: Nombres de columna (primera fila, con ESTILO_ENCABEZADO)
+        filas: Iterable de secuencias de valores (puede ser un generador)
+        titulo_hoja: Nombre de la hoja
+        anchos: Ancho por letra de columna, p. ej. {"A": 20}
+        bordes: Aplica ESTILO_CELDA a las filas de datos
+        filas_alternas: Alterna ESTILO_CELDA_ALTERNA en las filas pares (implica bordes)
+        fijar_encabezado: Congela la primera fila
+
+    Returns:
+        Número de filas de datos escritas
+    """
+    carpeta = os.path.dirname(ruta)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+
+    libro = openpyxl.Workbook(write_only=True)
+    for estilo in _estilos_wogest():
+        libro.add_named_style(estilo)
+    hoja = libro.create_sheet(title=titulo_hoja)
+
+    for letra, ancho in (anchos or {}).items():
+        hoja.column_dimensions[letra].width = ancho
+    if fijar_encabezado:
+        hoja.freeze_panes = "A2"
+
+    num_columnas = len(encabezados)
+    cabecera = _celdas_con_estilo(hoja, num_columnas, ESTILO_ENCABEZADO)
+    for celda, nombre in zip(cabecera, encabezados):
+        celda.value = nombre
+    hoja.append(cabecera)
+
+    total = 0
+    if bordes or filas_alternas:
+        normales = _celdas_con_estilo(hoja, num_columnas, ESTILO_CELDA)
+        alternas = _celdas_con_estilo(hoja, num_columnas, ESTILO_CELDA_ALTERNA) if filas_alternas else normales
+        for total, fila in enumerate(filas, start=1):
+            # La fila de Excel es total + 1: las pares llevan el relleno alterno
+            celdas = alternas if total % 2 == 1 else normales
+            for celda, valor in zip(celdas, fila):
+                celda.value = valor
+            hoja.append(celdas)
+    else:
+        for total, fila in enumerate(filas, start=1):
+            hoja.append(tuple(fila))
+
+    libro.save(ruta)
+    logger.info(f"📄 Excel escrito en streaming: {total} filas → {ruta}")
+    return total
+
+
+@medido("exportar.excel", perfil_memoria=True)
+def exportar_dataframe_excel(datos: DatosExcel, ruta: str, columnas: Optional[Sequence[str]] = None,
+                             **opciones) -> int:
+    """
+    Exporta un DataFrame (o lotes de DataFrames) con escribir_excel.
+
+    Args:
+        datos: DataFrame o iterable de DataFrames con las mismas columnas
+        ruta: Ruta del archivo a crear
+        columnas: Columnas a exportar (por defecto, las del primer lote)
+        **opciones: Argumentos de formato de escribir_excel
+
+    Returns:
+        Número de filas de datos escritas
+    """
+    if isinstance(datos, pd.DataFrame):
+        encabezados = list(columnas) if columnas is not None else [str(c) for c in datos.columns]
+        return escribir_excel(ruta, encabezados, filas_dataframe(datos, columnas), **opciones)
+
+    lotes = iter(datos)
+    primero = next(lotes, None)
+    if primero is None:
+        return escribir_excel(ruta, list(columnas or []), iter(()), **opciones)
+    columnas = list(columnas) if columnas is not None else list(primero.columns)
+
+    def _todos():
+        yield primero
+        yield from lotes
+
+    encabezados = [str(c) for c in columnas]
+    return escribir_excel(ruta, encabezados, filas_dataframe(_todos(), columnas), **opciones)
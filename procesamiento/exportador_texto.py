@@ -0,0 +1,135 @@
+"""
+exportador_texto.py - Exportaciones ligeras en streaming (CSV / JSON Lines)
+WOGest - Sistema de Validación de Renovaciones
+
+Los bots RPA solo necesitan las columnas WO y ORDEN_CONTRATO. Para esos
+traspasos no hace falta un libro Excel: las filas de la selección se escriben
+directamente al archivo (opcionalmente comprimido con gzip), sin construir
+DataFrames intermedios ni workbooks.
+
+Formatos admitidos (clave 'formato' del payload de exportación):
+- xlsx      → exportador_excel.escribir_excel
+- csv       → texto separado por comas, UTF-8
+- csv.gz    → CSV comprimido con gzip
+- jsonl     → un objeto JSON por línea
+- jsonl.gz  → JSON Lines comprimido con gzip
+"""
+
+import csv
+import gzip
+import json
+import logging
+import os
+from typing import Any, Iterable, Sequence
+
+from procesamiento.exportador_excel import escribir_excel
+
+logger = logging.getLogger(__name__)
+
+# Formato → extensión del archivo generado
+FORMATOS_EXPORTACION = {
+    "xlsx": ".xlsx",
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "jsonl": ".jsonl",
+    "jsonl.gz": ".jsonl.gz",
+}
+FORMATO_POR_DEFECTO = "xlsx"
+
+# Nivel de gzip: prioriza velocidad de escritura sobre tamaño
+NIVEL_GZIP = 6
+
+
+def normalizar_formato(formato: Any) -> str:
+    """
+    Valida el formato pedido en el payload ('CSV', '.jsonl.gz', None, ...)
+
+    Raises:
+        ValueError: si el formato no está soportado
+    """
+    if not formato:
+        return FORMATO_POR_DEFECTO
+    clave = str(formato).strip().lower().lstrip(".")
+    if clave not in FORMATOS_EXPORTACION:
+        soportados = ", ".join(FORMATOS_EXPORTACION)
+        raise ValueError(f"Formato de exportación no soportado: {formato} (use {soportados})")
+    return clave
+
+
+def extension_formato(formato: str) -> str:
+    """Extensión (con punto) del archivo para un formato ya normalizado"""
+    return FORMATOS_EXPORTACION[formato]
+
+
+def _abrir_texto(ruta: str, comprimir: bool):
+    if comprimir:
+        return gzip.open(ruta, "wt", encoding="utf-8", newline="", compresslevel=NIVEL_GZIP)
+    return open(ruta, "w", encoding="utf-8", newline="")
+
+
+def escribir_csv(ruta: str, encabezados: Sequence[str], filas: Iterable[Sequence[Any]],
+                 comprimir: bool = False, separador: str = ",") -> int:
+    """
+    Escribe las filas como CSV (UTF-8) a medida que se recorren.
+
+    Returns:
+        Número de filas de datos escritas
+    """
+    total = 0
+    with _abrir_texto(ruta, comprimir) as destino:
+        escritor = csv.writer(destino, delimiter=separador)
+        escritor.writerow(encabezados)
+        for fila in filas:
+            escritor.writerow(fila)
+            total += 1
+    return total
+
+
+def escribir_jsonl(ruta: str, encabezados: Sequence[str], filas: Iterable[Sequence[Any]],
+                   comprimir: bool = False) -> int:
+    """
+    Escribe un objeto JSON por fila ({encabezado: valor}) a medida que se recorren.
+
+    Returns:
+        Número de filas de datos escritas
+    """
+    total = 0
+    claves = list(encabezados)
+    with _abrir_texto(ruta, comprimir) as destino:
+        for fila in filas:
+            destino.write(json.dumps(dict(zip(claves, fila)), ensure_ascii=False, default=str))
+            destino.write("\n")
+            total += 1
+    return total
+
+
+def escribir_filas(ruta: str, formato: str, encabezados: Sequence[str],
+                   filas: Iterable[Sequence[Any]], **opciones_excel) -> int:
+    """
+    Escribe `filas` en `ruta` con el formato indicado.
+
+    Args:
+        ruta: Ruta del archivo a crear
+        formato: Uno de FORMATOS_EXPORTACION (ver normalizar_formato)
+        encabezados: Nombres de columna
+        filas: Iterable de secuencias de valores (puede ser un generador)
+        **opciones_excel: Formato para escribir_excel (solo 'xlsx')
+
+    Returns:
+        Número de filas de datos escritas
+    """
+    formato = normalizar_formato(formato)
+    carpeta = os.path.dirname(ruta)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+
+    comprimir = formato.endswith(".gz")
+    if formato == "xlsx":
+        total = escribir_excel(ruta, encabezados, filas, **opciones_excel)
+    elif formato.startswith("csv"):
+        total = escribir_csv(ruta, encabezados, filas, comprimir=comprimir)
+    else:
+        total = escribir_jsonl(ruta, encabezados, filas, comprimir=comprimir)
+
+    logger.info(f"📄 Exportación {formato}: {total} filas → {ruta}")
+    return total
@@ -0,0 +1,109 @@
+"""
+formato_columnar.py - Formato compacto de las filas enviadas a la UI
+WOGest - Sistema de Validación de Renovaciones
+
+Las respuestas de la API devuelven 'detalle' / 'datos_cruzados' como una lista
+de diccionarios: el nombre de cada columna se repite en cada fila. Si la UI lo
+pide (clave 'formato_respuesta' del payload), las filas se envían por columnas:
+
+    {"formato": "columnar",
+     "columnas": ["wo", "estado", ...],
+     "filas": 3,
+     "valores": [["1", "2", "3"],                                # valores tal cual
+                 {"dic": ["Correcto", "Incorrecto"], "idx": [0, 1, 0]},  # diccionario
+                 ...]}
+
+Las columnas de texto con muchos valores repetidos (estado, observaciones,
+STATUS...) se codifican con diccionario; un índice -1 es un nulo. Con
+'columnar.gz' el JSON anterior se comprime con gzip y viaja en base64:
+
+    {"formato": "columnar.gz", "filas": 3, "datos": "<base64>"}
+
+static/js/formato-columnar.js reconstruye la lista de filas en el navegador.
+"""
+
+import base64
+import gzip
+import json
+from typing import Any, Dict, Iterable, List, Union
+
+import pandas as pd
+
+from procesamiento.serializacion import registros_json, valores_json
+
+FORMATO_FILAS = "filas"
+FORMATO_COLUMNAR = "columnar"
+FORMATO_COLUMNAR_GZ = "columnar.gz"
+FORMATOS_RESPUESTA = (FORMATO_FILAS, FORMATO_COLUMNAR, FORMATO_COLUMNAR_GZ)
+
+# Se usa diccionario si los valores distintos no superan esta fracción de las filas
+UMBRAL_DICCIONARIO = 0.5
+
+NIVEL_GZIP = 6
+
+DatosFilas = Union[pd.DataFrame, Iterable[Dict[str, Any]]]
+
+
+def normalizar_formato_respuesta(formato: Any) -> str:
+    """
+    Valida el 'formato_respuesta' pedido (None = lista de filas).
+
+    Raises:
+        ValueError: si el formato no está soportado
+    """
+    if not formato:
+        return FORMATO_FILAS
+    clave = str(formato).strip().lower()
+    if clave not in FORMATOS_RESPUESTA:
+        raise ValueError(f"Formato de respuesta no soportado: {formato} (use {', '.join(FORMATOS_RESPUESTA)})")
+    return clave
+
+
+def _codificar_columna(serie: pd.Series) -> Union[List[Any], Dict[str, Any]]:
+    if len(serie) and (pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie)
+                       or isinstance(serie.dtype, pd.CategoricalDtype)):
+        codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+        if len(unicos) <= len(serie) * UMBRAL_DICCIONARIO:
+            return {"dic": valores_json(pd.Series(unicos, dtype=object)), "idx": codigos.tolist()}
+    return valores_json(serie)
+
+
+def codificar_columnar(datos: DatosFilas, comprimir: bool = False) -> Dict[str, Any]:
+    """
+    Codifica filas por columnas (ver el formato en el módulo).
+
+    Args:
+        datos: DataFrame o lista de diccionarios (las claves que falten en una fila son nulos)
+        comprimir: Comprime con gzip y envía en base64 ('columnar.gz')
+    """
+    df = datos if isinstance(datos, pd.DataFrame) else pd.DataFrame.from_records(list(datos or []))
+    carga = {
+        "columnas": [str(c) for c in df.columns],
+        "filas": len(df),
+        "valores": [_codificar_columna(df.iloc[:, i]) for i in range(df.shape[1])],
+    }
+    if not comprimir:
+        return {"formato": FORMATO_COLUMNAR, **carga}
+
+    bruto = json.dumps(carga, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return {
+        "formato": FORMATO_COLUMNAR_GZ,
+        "filas": len(df),
+        "datos": base64.b64encode(gzip.compress(bruto, compresslevel=NIVEL_GZIP)).decode("ascii"),
+    }
+
+
+def formatear_filas(datos: DatosFilas, formato: Any = None) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Filas de una respuesta en el formato pedido por la UI.
+
+    Args:
+        datos: DataFrame o lista de diccionarios
+        formato: 'filas' (por defecto, lista de diccionarios), 'columnar' o 'columnar.gz'
+    """
+    formato = normalizar_formato_respuesta(formato)
+    if formato == FORMATO_FILAS:
+        if isinstance(datos, pd.DataFrame):
+            return registros_json(datos)
+        return datos if isinstance(datos, list) else list(datos or [])
+    return codificar_columnar(datos, comprimir=formato == FORMATO_COLUMNAR_GZ)
@@ -0,0 +1,350 @@
+"""
+lote.py - Procesamiento por lotes sin interfaz (Paso 1 → Paso 4)
+WOGest - Sistema de Validación de Renovaciones
+
+El flujo completo solo podía ejecutarse desde la ventana de pywebview. Este
+módulo lo ejecuta de principio a fin para cada par de archivos (un WorkOrder y
+uno o varios WOQ), reutilizando las mismas piezas que la UI:
+
+    1. validación    RenovacionValidator (obtener_validador)
+    2. ingesta WOQ   paso2.procesar_woq (varios WOQ se concatenan)
+    3. cruce         paso3.realizar_cruce_datos
+    4. exportación   paso4.seleccionar_exportables + escribir_seleccion_rpa
+
+Cada par se ejecuta en su propia sesión (procesamiento.sesiones): sus tablas
+temporales no se mezclan con las de la ventana ni con las de otros pares, y con
+--paralelo N se procesan varios pares a la vez.
+
+Al terminar se escribe un resumen de rendimiento (tiempos por etapa, filas por
+segundo) en el log y en resumen_lote_<fecha>.json dentro de la carpeta de salida.
+
+Uso desde la línea de comandos:
+
+    python -m procesamiento.lote --workorder WO.xlsx --woq WOQ.csv [--woq WOQ2.csv] -o salida/
+    python -m procesamiento.lote --manifiesto pares.json -o salida/ --formato csv.gz --paralelo 4
+
+El manifiesto es una lista JSON de pares:
+    [{"nombre": "norte", "workorder": "norte/WO.xlsx", "woq": ["norte/WOQ.csv"]}, ...]
+(las rutas relativas se resuelven desde la carpeta del manifiesto).
+
+También se expone como POST /lotes en el servidor Bottle (ver main.py).
+"""
+
+import argparse
+import contextvars
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from procesamiento.bitacora import configurar_logging
+from procesamiento.canonico import EstadoCodigo
+from procesamiento.db_sqlite import eliminar_sesion
+from procesamiento.exportador_texto import FORMATO_POR_DEFECTO, extension_formato, normalizar_formato
+from procesamiento.sesiones import en_sesion, nueva_sesion
+from procesamiento.trabajos import reportar_etapa
+
+logger = logging.getLogger(__name__)
+
+ETAPAS_LOTE = ("validacion", "ingesta_woq", "cruce", "exportacion")
+
+
+@dataclass
+class ParLote:
+    """Un WorkOrder y los WOQ que se cruzan con él"""
+    nombre: str
+    workorder: str
+    woq: List[str] = field(default_factory=list)
+
+    @classmethod
+    def desde_dict(cls, datos: Dict[str, Any], base: str = "") -> "ParLote":
+        """
+        Raises:
+            ValueError: sin 'workorder' o sin 'woq'
+        """
+        workorder = datos.get("workorder")
+        woq = datos.get("woq") or []
+        if isinstance(woq, str):
+            woq = [woq]
+        if not workorder or not woq:
+            raise ValueError("Cada par necesita 'workorder' y al menos un 'woq'")
+        workorder = os.path.join(base, workorder)
+        nombre = datos.get("nombre") or os.path.splitext(os.path.basename(workorder))[0]
+        return cls(nombre=str(nombre), workorder=workorder, woq=[os.path.join(base, r) for r in woq])
+
+
+def pares_desde_manifiesto(ruta: str) -> List[ParLote]:
+    """Lee un manifiesto JSON (lista de pares o {"pares": [...]})"""
+    with open(ruta, encoding="utf-8") as f:
+        datos = json.load(f)
+    if isinstance(datos, dict):
+        datos = datos.get("pares", [])
+    base = os.path.dirname(os.path.abspath(ruta))
+    return [ParLote.desde_dict(par, base) for par in datos]
+
+
+def normalizar_paralelo(valor: Any) -> int:
+    """
+    Pares a la vez pedidos ('paralelo'); vacío = 1 y los valores menores que 1 se suben a 1.
+
+    Raises:
+        ValueError: si no es un número entero
+    """
+    if valor in (None, ""):
+        return 1
+    if isinstance(valor, float) and not valor.is_integer():
+        raise ValueError(f"'paralelo' debe ser un número entero: {valor!r}")
+    try:
+        return max(1, int(valor))
+    except (TypeError, ValueError):
+        raise ValueError(f"'paralelo' debe ser un número entero: {valor!r}") from None
+
+
+def nombre_archivo_rpa(par: ParLote, indice: int, formato: str) -> str:
+    """
+    Nombre del archivo RPA de un par: Aptos_RPA_<índice>_<nombre saneado><ext>.
+    El índice (desde 1) distingue pares con el mismo nombre y el saneado impide
+    que un nombre con '/' o '..' escriba fuera de la carpeta de salida.
+    """
+    nombre = re.sub(r"[^\w.-]", "_", par.nombre)[:80].strip(".") or "par"
+    return f"Aptos_RPA_{indice:03d}_{nombre}{extension_formato(formato)}"
+
+
+def _tamano_entrada(par: ParLote) -> int:
+    return sum(os.path.getsize(r) for r in [par.workorder, *par.woq] if os.path.isfile(r))
+
+
+def ejecutar_par(par: ParLote, carpeta_salida: str, formato: str = FORMATO_POR_DEFECTO,
+                 indice: int = 1) -> Dict[str, Any]:
+    """
+    Ejecuta el flujo completo para un par en una sesión propia (que se
+    elimina al terminar) y escribe el archivo del RPA.
+
+    Args:
+        indice: Posición del par en el lote (desde 1), parte del nombre del archivo RPA
+
+    Returns:
+        {"success", "nombre", "message", "etapas": {etapa: segundos},
+         "filas": {...}, "bytes_entrada", "archivo_rpa", "segundos"}
+    """
+    resultado: Dict[str, Any] = {"success": False, "nombre": par.nombre, "etapas": {}, "filas": {},
+                                 "bytes_entrada": _tamano_entrada(par), "archivo_rpa": None}
+    inicio = time.perf_counter()
+    sesion = nueva_sesion()
+    try:
+        with en_sesion(sesion):
+            _ejecutar_etapas(par, carpeta_salida, formato, indice, resultado)
+    except Exception as e:
+        logger.exception(f"❌ Error en el par {par.nombre}")
+        resultado["message"] = str(e)
+    finally:
+        eliminar_sesion(sesion)
+        resultado["segundos"] = round(time.perf_counter() - inicio, 4)
+    return resultado
+
+
+def _ejecutar_etapas(par: ParLote, carpeta_salida: str, formato: str, indice: int, resultado: Dict[str, Any]):
+    """Etapas de un par; rellena `resultado` (success=True solo si llega al final)"""
+    from procesamiento.paso1 import obtener_validador
+    from procesamiento.paso2 import procesar_woq
+    from procesamiento.paso3 import realizar_cruce_datos
+    from procesamiento.paso4 import escribir_seleccion_rpa, seleccionar_exportables
+
+    def _medir(etapa: str, t0: float):
+        resultado["etapas"][etapa] = round(time.perf_counter() - t0, 4)
+
+    t0 = time.perf_counter()
+    validacion = obtener_validador().validar_renovaciones(par.workorder)
+    _medir("validacion", t0)
+    if not validacion.success or validacion.data is None:
+        resultado["message"] = f"Validación: {validacion.message}"
+        return
+    # Igual que temp_paso1: solo los registros correctos participan en el cruce
+    df_paso1 = validacion.data[validacion.data["estado_cod"] == EstadoCodigo.CORRECTO]
+    resultado["filas"]["workorder"] = int(validacion.stats.get("total_registros", len(validacion.data)))
+    resultado["filas"]["workorder_correctos"] = len(df_paso1)
+
+    t0 = time.perf_counter()
+    marcos = []
+    for ruta in par.woq:
+        df = procesar_woq(ruta)
+        if df is None or df.empty:
+            resultado["message"] = f"WOQ sin datos o ilegible: {ruta}"
+            _medir("ingesta_woq", t0)
+            return
+        marcos.append(df)
+    df_paso2 = marcos[0] if len(marcos) == 1 else pd.concat(marcos, ignore_index=True)
+    _medir("ingesta_woq", t0)
+    resultado["filas"]["woq"] = len(df_paso2)
+
+    t0 = time.perf_counter()
+    cruce = realizar_cruce_datos(df_paso1, df_paso2, incluir_filas=False)
+    _medir("cruce", t0)
+    if not cruce.get("success"):
+        resultado["message"] = cruce.get("message", "Error en el cruce")
+        return
+    resultado["filas"]["cruce"] = len(cruce["cruce"])
+    resultado["estadisticas_cruce"] = cruce["estadisticas"]
+
+    t0 = time.perf_counter()
+    seleccion = seleccionar_exportables(cruce["cruce"])
+    ruta_rpa = os.path.join(carpeta_salida, nombre_archivo_rpa(par, indice, formato))
+    resultado["filas"]["rpa"] = escribir_seleccion_rpa(seleccion, ruta_rpa, formato)
+    _medir("exportacion", t0)
+
+    resultado.update(success=True, archivo_rpa=ruta_rpa,
+                     message=f"{resultado['filas']['rpa']} registros aptos para RPA")
+
+
+def resumen_rendimiento(resultados: List[Dict[str, Any]], segundos: float) -> Dict[str, Any]:
+    """Totales del lote: pares, filas y bytes procesados, tiempo por etapa y ritmo"""
+    correctos = [r for r in resultados if r["success"]]
+    filas = sum(r["filas"].get("workorder", 0) + r["filas"].get("woq", 0) for r in correctos)
+    bytes_entrada = sum(r["bytes_entrada"] for r in correctos)
+    etapas = {e: round(sum(r["etapas"].get(e, 0.0) for r in resultados), 4) for e in ETAPAS_LOTE}
+    return {
+        "pares": len(resultados),
+        "pares_correctos": len(correctos),
+        "pares_con_error": len(resultados) - len(correctos),
+        "segundos": round(segundos, 3),
+        "segundos_por_etapa": etapas,
+        "filas_entrada": filas,
+        "filas_rpa": sum(r["filas"].get("rpa", 0) for r in correctos),
+        "bytes_entrada": bytes_entrada,
+        "pares_por_minuto": round(len(resultados) / segundos * 60, 2) if segundos else None,
+        "filas_por_segundo": round(filas / segundos, 1) if segundos else None,
+        "mb_por_segundo": round(bytes_entrada / 1_048_576 / segundos, 3) if segundos else None,
+    }
+
+
+def _registrar_resumen(resumen: Dict[str, Any], resultados: List[Dict[str, Any]]):
+    lineas = [
+        f"    {r['nombre']:<24} {'OK ' if r['success'] else 'ERR'} {r['segundos']:8.2f} s  "
+        f"rpa={r['filas'].get('rpa', 0):<7} {'' if r['success'] else r.get('message', '')}"
+        for r in resultados
+    ]
+    etapas = ", ".join(f"{e} {s:.2f}s" for e, s in resumen["segundos_por_etapa"].items())
+    logger.info(
+        f"📊 Lote terminado: {resumen['pares_correctos']}/{resumen['pares']} pares en {resumen['segundos']:.2f} s "
+        f"({resumen['filas_por_segundo']} filas/s, {resumen['mb_por_segundo']} MB/s, "
+        f"{resumen['pares_por_minuto']} pares/min)\n    etapas: {etapas}\n" + "\n".join(lineas)
+    )
+
+
+def ejecutar_lote(pares: Sequence[ParLote], carpeta_salida: str,
+                  formato: str = FORMATO_POR_DEFECTO, paralelo: int = 1) -> Dict[str, Any]:
+    """
+    Ejecuta todos los pares (un par con error no detiene el lote).
+
+    Args:
+        paralelo: Pares que se procesan a la vez (cada uno en su sesión)
+
+    Returns:
+        {"success", "message", "resultados": [...], "resumen": {...}, "archivo_resumen"}
+    """
+    try:
+        formato = normalizar_formato(formato)
+        paralelo = normalizar_paralelo(paralelo)
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
+    if not pares:
+        return {"success": False, "message": "No hay pares que procesar"}
+    os.makedirs(carpeta_salida, exist_ok=True)
+
+    paralelo = min(paralelo, len(pares))
+    inicio = time.perf_counter()
+    resultados: List[Optional[Dict[str, Any]]] = [None] * len(pares)
+    if paralelo == 1:
+        for i, par in enumerate(pares):
+            reportar_etapa(f"par {i + 1}/{len(pares)}", 100 * i / len(pares), par.nombre)
+            logger.info(f"🚚 Lote: par {i + 1}/{len(pares)} '{par.nombre}'")
+            resultados[i] = ejecutar_par(par, carpeta_salida, formato, i + 1)
+    else:
+        logger.info(f"🚚 Lote: {len(pares)} pares, {paralelo} a la vez")
+        with ThreadPoolExecutor(max_workers=paralelo, thread_name_prefix="wogest-lote") as pool:
+            # Cada hilo recibe una copia del contexto (registro del trabajo en curso)
+            futuros = {pool.submit(contextvars.copy_context().run, ejecutar_par, par, carpeta_salida, formato, i + 1): i
+                       for i, par in enumerate(pares)}
+            for hechos, futuro in enumerate(as_completed(futuros), start=1):
+                i = futuros[futuro]
+                resultados[i] = futuro.result()
+                reportar_etapa(f"par {hechos}/{len(pares)}", 100 * hechos / len(pares), pares[i].nombre)
+    resumen = resumen_rendimiento(resultados, time.perf_counter() - inicio)
+    resumen["paralelo"] = paralelo
+
+    _registrar_resumen(resumen, resultados)
+    archivo_resumen = os.path.join(carpeta_salida, f"resumen_lote_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    salida = {
+        "success": resumen["pares_con_error"] == 0,
+        "message": f"{resumen['pares_correctos']} de {resumen['pares']} pares procesados",
+        "resultados": resultados,
+        "resumen": resumen,
+        "archivo_resumen": archivo_resumen,
+    }
+    with open(archivo_resumen, "w", encoding="utf-8") as f:
+        json.dump(salida, f, ensure_ascii=False, indent=2, default=str)
+    return salida
+
+
+def pares_desde_payload(payload: Dict[str, Any]) -> List[ParLote]:
+    """
+    Pares de una petición JSON: {"pares": [...]} o un único par
+    {"workorder": ..., "woq": [...]}.
+
+    Raises:
+        ValueError: payload sin pares válidos
+    """
+    if payload.get("pares") is not None:
+        return [ParLote.desde_dict(par) for par in payload["pares"]]
+    return [ParLote.desde_dict(payload)]
+
+
+# ---------------------- Línea de comandos ----------------------
+
+def _argumentos(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m procesamiento.lote",
+        description="Ejecuta validación, ingesta WOQ, cruce y exportación RPA sin interfaz.")
+    parser.add_argument("--manifiesto", help="JSON con la lista de pares (nombre, workorder, woq)")
+    parser.add_argument("--workorder", help="Archivo WorkOrder (un solo par)")
+    parser.add_argument("--woq", action="append", default=[], help="Archivo WOQ (repetible)")
+    parser.add_argument("--nombre", help="Nombre del par (por defecto, el del WorkOrder)")
+    parser.add_argument("-o", "--salida", required=True, help="Carpeta donde se escriben los archivos RPA")
+    parser.add_argument("--formato", default=FORMATO_POR_DEFECTO, help="xlsx, csv, csv.gz, jsonl o jsonl.gz")
+    parser.add_argument("--paralelo", type=int, default=1, help="Pares que se procesan a la vez")
+    args = parser.parse_args(argv)
+    if bool(args.manifiesto) == bool(args.workorder):
+        parser.error("indique --manifiesto o --workorder/--woq")
+    if args.workorder and not args.woq:
+        parser.error("--workorder necesita al menos un --woq")
+    return args
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    configurar_logging(consola=True)
+    args = _argumentos(argv)
+
+    from procesamiento.db_sqlite import init_db
+    init_db()
+
+    if args.manifiesto:
+        pares = pares_desde_manifiesto(args.manifiesto)
+    else:
+        pares = [ParLote.desde_dict({"nombre": args.nombre, "workorder": args.workorder, "woq": args.woq})]
+
+    resultado = ejecutar_lote(pares, args.salida, args.formato, args.paralelo)
+    print(json.dumps({k: resultado.get(k) for k in ("message", "resumen", "archivo_resumen")},
+                     ensure_ascii=False, indent=2, default=str))
+    return 0 if resultado["success"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
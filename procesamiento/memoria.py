@@ -0,0 +1,239 @@
+"""
+memoria.py - Perfil de memoria por etapa (modo opcional)
+WOGest - Sistema de Validación de Renovaciones
+
+En los portátiles de los operadores aparecen errores por falta de memoria y
+no se sabía qué etapa los provoca. Con el perfil de memoria activado, en cada
+frontera de etapa (las de procesamiento.metricas.Cronometro: Paso 1, Paso 2,
+cruce) y en cada exportación se anota:
+
+- pico de memoria de Python de la etapa (tracemalloc) y memoria viva al final
+- RSS del proceso y su pico (high-water mark): la etapa que sube el pico es
+  la que acerca el proceso al límite
+- los sitios (archivo:línea) que más memoria retienen al terminar la etapa
+
+El informe se escribe en el log y el paso lo incluye en su resultado
+(ValidationResult.stats['memoria'], 'memoria' del cruce).
+
+Se activa con la variable de entorno WOGEST_PERFIL_MEMORIA=1, con
+activar_perfil_memoria() / WOGestAPI.configurar_perfil_memoria, o con
+--perfil-memoria en el benchmark. tracemalloc ralentiza el proceso y es
+global: con varias operaciones a la vez los picos de Python se mezclan.
+"""
+
+import ctypes
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+VARIABLE_ENTORNO = "WOGEST_PERFIL_MEMORIA"
+# Marcos de pila que guarda tracemalloc por asignación (los sitios se agrupan
+# por archivo:línea, basta el más interno; más marcos multiplican el coste)
+MARCOS_TRACEMALLOC = 1
+# Sitios de asignación que se informan por etapa
+TOP_SITIOS = 5
+
+_MB = 1024 * 1024
+
+_activo = os.environ.get(VARIABLE_ENTORNO, "").strip().lower() in ("1", "true", "si", "sí", "yes")
+_perfiles_abiertos: List["PerfilMemoria"] = []
+_lock = threading.Lock()
+
+
+def perfil_memoria_activo() -> bool:
+    return _activo
+
+
+def activar_perfil_memoria(activo: bool = True):
+    """Activa o desactiva el perfil (al desactivarlo se detiene tracemalloc)"""
+    global _activo
+    with _lock:
+        _activo = bool(activo)
+        if not _activo and not _perfiles_abiertos and tracemalloc.is_tracing():
+            tracemalloc.stop()
+    logger.info(f"🧠 Perfil de memoria {'activado' if activo else 'desactivado'}")
+
+
+# ---------------------- Memoria del proceso ----------------------
+
+def _memoria_proceso_windows() -> Dict[str, Optional[int]]:
+    from ctypes import wintypes
+
+    class CONTADORES(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    contadores = CONTADORES()
+    contadores.cb = ctypes.sizeof(CONTADORES)
+    proceso = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(proceso, ctypes.byref(contadores), contadores.cb):
+        return {"rss": None, "pico_rss": None}
+    return {"rss": contadores.WorkingSetSize, "pico_rss": contadores.PeakWorkingSetSize}
+
+
+def _memoria_proceso_linux() -> Dict[str, Optional[int]]:
+    valores: Dict[str, Optional[int]] = {"rss": None, "pico_rss": None}
+    with open("/proc/self/status", encoding="ascii", errors="replace") as f:
+        for linea in f:
+            if linea.startswith("VmRSS:"):
+                valores["rss"] = int(linea.split()[1]) * 1024
+            elif linea.startswith("VmHWM:"):
+                valores["pico_rss"] = int(linea.split()[1]) * 1024
+    return valores
+
+
+def memoria_proceso() -> Dict[str, Optional[int]]:
+    """RSS actual y pico de RSS del proceso en bytes (None si el sistema no lo ofrece)"""
+    try:
+        if sys.platform == "win32":
+            return _memoria_proceso_windows()
+        if os.path.exists("/proc/self/status"):
+            return _memoria_proceso_linux()
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss: bytes en macOS, KiB en el resto
+        return {"rss": None, "pico_rss": pico if sys.platform == "darwin" else pico * 1024}
+    except Exception as e:
+        logger.debug(f"No se pudo leer la memoria del proceso: {e}")
+        return {"rss": None, "pico_rss": None}
+
+
+def _mb(valor: Optional[int]) -> Optional[float]:
+    return None if valor is None else round(valor / _MB, 2)
+
+
+# ---------------------- Perfil ----------------------
+
+def _reiniciar_pico():
+    """
+    Reinicia el pico de tracemalloc conservando antes el valor en los perfiles
+    abiertos: un perfil anidado (p. ej. una exportación dentro de una etapa)
+    no borra el pico de la etapa que lo contiene.
+    """
+    with _lock:
+        pico = tracemalloc.get_traced_memory()[1]
+        for perfil in _perfiles_abiertos:
+            perfil._pico_etapa = max(perfil._pico_etapa, pico)
+        tracemalloc.reset_peak()
+
+
+# Sitios propios del perfil que no se informan. Se descartan tras comparar las
+# instantáneas (Snapshot.filter_traces recorre cada traza y cuesta casi un segundo)
+_SITIOS_IGNORADOS = (tracemalloc.__file__, __file__, "<frozen importlib._bootstrap>")
+
+
+def _instantanea() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot()
+
+
+def _sitios_retenidos(antes: tracemalloc.Snapshot, despues: tracemalloc.Snapshot) -> List[Dict[str, Any]]:
+    """Sitios que más memoria han retenido entre dos instantáneas"""
+    sitios = []
+    for diferencia in despues.compare_to(antes, "lineno"):
+        marco = diferencia.traceback[0]
+        if diferencia.size_diff <= 0 or marco.filename in _SITIOS_IGNORADOS:
+            continue
+        sitios.append({"sitio": f"{marco.filename}:{marco.lineno}", "kb": round(diferencia.size_diff / 1024, 1),
+                       "bloques": diferencia.count_diff})
+        if len(sitios) >= TOP_SITIOS:
+            break
+    return sitios
+
+
+class PerfilMemoria:
+    """Memoria por etapa de una operación; se usa desde Cronometro o de forma independiente"""
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self._etapas: List[Dict[str, Any]] = []
+        self._etapa: Optional[str] = None
+        self._pico_etapa = 0
+        self._inicio = time.perf_counter()
+        self._terminado = False
+
+        with _lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(MARCOS_TRACEMALLOC)
+            _perfiles_abiertos.append(self)
+        self._pico_rss_inicial = memoria_proceso()["pico_rss"]
+        self._pico_rss_anterior = self._pico_rss_inicial
+        self._instantanea = _instantanea()
+        _reiniciar_pico()
+        self._pico_etapa = 0
+
+    def _cerrar_etapa(self):
+        if self._etapa is None:
+            return
+        actual, pico = tracemalloc.get_traced_memory()
+        proceso = memoria_proceso()
+        instantanea = _instantanea()
+        pico_rss = proceso["pico_rss"]
+        subida = (pico_rss - self._pico_rss_anterior
+                  if pico_rss is not None and self._pico_rss_anterior is not None else None)
+        self._etapas.append({
+            "etapa": self._etapa,
+            "pico_python_mb": _mb(max(pico, self._pico_etapa)),
+            "python_mb": _mb(actual),
+            "rss_mb": _mb(proceso["rss"]),
+            "pico_rss_mb": _mb(pico_rss),
+            "pico_rss_incremento_mb": _mb(subida),
+            "sitios": _sitios_retenidos(self._instantanea, instantanea),
+        })
+        self._instantanea = instantanea
+        self._pico_rss_anterior = pico_rss
+
+    def etapa(self, nombre: str):
+        """Cierra la etapa anterior y empieza `nombre`"""
+        self._cerrar_etapa()
+        self._etapa = nombre
+        _reiniciar_pico()
+        self._pico_etapa = 0
+
+    def terminar(self) -> Dict[str, Any]:
+        """Cierra la última etapa, escribe el informe en el log y lo devuelve"""
+        if not self._terminado:
+            self._cerrar_etapa()
+            self._etapa = None
+            self._terminado = True
+            with _lock:
+                if self in _perfiles_abiertos:
+                    _perfiles_abiertos.remove(self)
+                if not _activo and not _perfiles_abiertos and tracemalloc.is_tracing():
+                    tracemalloc.stop()
+            self._registrar()
+        return self.informe()
+
+    def informe(self) -> Dict[str, Any]:
+        etapas = self._etapas
+        peor = max(etapas, key=lambda e: e["pico_python_mb"] or 0, default=None)
+        picos_rss = [e["pico_rss_mb"] for e in etapas if e["pico_rss_mb"] is not None]
+        return {
+            "etapas": etapas,
+            "pico_python_mb": peor["pico_python_mb"] if peor else None,
+            "etapa_pico_python": peor["etapa"] if peor else None,
+            "pico_rss_mb": max(picos_rss) if picos_rss else None,
+            "pico_rss_inicial_mb": _mb(self._pico_rss_inicial),
+            "segundos": round(time.perf_counter() - self._inicio, 3),
+        }
+
+    def _registrar(self):
+        informe = self.informe()
+        lineas = []
+        for e in informe["etapas"]:
+            linea = (f"    {e['etapa']:<16} pico Python {e['pico_python_mb'] or 0:9.1f} MB   "
+                     f"vivo {e['python_mb'] or 0:9.1f} MB")
+            if e["pico_rss_mb"] is not None:
+                linea += f"   pico RSS {e['pico_rss_mb']:9.1f} MB ({e['pico_rss_incremento_mb'] or 0:+.1f})"
+            lineas.append(linea)
+            lineas.extend(f"        {s['kb']:10.1f} KB  {s['sitio']}" for s in e["sitios"][:3])
+        logger.info(f"🧠 Memoria {self.nombre}: pico Python {informe['pico_python_mb'] or 0:.1f} MB "
+                    f"en '{informe['etapa_pico_python']}', pico RSS {informe['pico_rss_mb']} MB\n" + "\n".join(lineas))
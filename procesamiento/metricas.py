@@ -0,0 +1,213 @@
+"""
+metricas.py - Tiempos por tramo (span) de los pasos y de la API
+WOGest - Sistema de Validación de Renovaciones
+
+Una ejecución lenta no decía dónde se había ido el tiempo (lectura del Excel,
+limpieza, validación de grupos, guardado en SQLite o serialización de la
+respuesta). Cada tramo se mide ahora con perf_counter y se guarda en un
+registro en memoria:
+
+- Cronometro: tramos consecutivos de un paso (paso1.lectura → paso1.limpieza
+  → ...); con porcentaje, cada frontera se informa también al trabajo en curso
+  (reportar_etapa). terminar() devuelve el desglose en segundos, que el paso
+  incluye en su resultado (ValidationResult.stats['timings'], 'timings' del cruce)
+- medido / medir: una llamada o un bloque completo (métodos de WOGestAPI,
+  escritura del Paso 4)
+- registro_tiempos: por cada tramo, las últimas MAX_MUESTRAS duraciones en un
+  buffer circular y sus percentiles (GET /metrics)
+
+Con el perfil de memoria activado (procesamiento.memoria), las mismas
+fronteras de etapa anotan también la memoria de cada etapa.
+
+    crono = Cronometro("paso2")
+    crono.etapa("lectura", 10)
+    ...
+    tiempos = crono.terminar()   # {"lectura": 0.41, ..., "total": 1.2}
+    crono.informe()              # {"timings": {...}} (+ "memoria" con el perfil activo)
+"""
+
+import functools
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from procesamiento.memoria import PerfilMemoria, perfil_memoria_activo
+from procesamiento.trabajos import reportar_etapa
+
+logger = logging.getLogger(__name__)
+
+# Duraciones que se conservan por tramo para calcular percentiles
+MAX_MUESTRAS = 512
+
+PERCENTILES = (50, 90, 99)
+
+
+def _percentil(ordenadas: List[float], p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    indice = max(math.ceil(p / 100 * len(ordenadas)) - 1, 0)
+    return ordenadas[indice]
+
+
+class RegistroTiempos:
+    """Duraciones recientes por tramo (buffer circular) y contadores acumulados"""
+
+    def __init__(self, max_muestras: int = MAX_MUESTRAS):
+        self.max_muestras = max_muestras
+        self._muestras: Dict[str, Deque[float]] = {}
+        self._llamadas: Dict[str, int] = {}
+        self._errores: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, nombre: str, segundos: float, error: bool = False):
+        with self._lock:
+            muestras = self._muestras.get(nombre)
+            if muestras is None:
+                muestras = self._muestras[nombre] = deque(maxlen=self.max_muestras)
+            muestras.append(segundos)
+            self._llamadas[nombre] = self._llamadas.get(nombre, 0) + 1
+            if error:
+                self._errores[nombre] = self._errores.get(nombre, 0) + 1
+
+    def resumen(self, prefijo: str = "") -> Dict[str, Dict[str, Any]]:
+        """
+        Percentiles (ms) de las últimas muestras de cada tramo cuyo nombre empieza por `prefijo`.
+        'llamadas' y 'errores' cuentan desde el arranque; el resto, solo las muestras del buffer.
+        """
+        with self._lock:
+            copia = {n: sorted(m) for n, m in self._muestras.items() if n.startswith(prefijo)}
+            llamadas, errores = dict(self._llamadas), dict(self._errores)
+
+        resumen = {}
+        for nombre in sorted(copia):
+            ordenadas = copia[nombre]
+            datos = {
+                "llamadas": llamadas.get(nombre, 0),
+                "errores": errores.get(nombre, 0),
+                "muestras": len(ordenadas),
+                "media_ms": round(sum(ordenadas) / len(ordenadas) * 1000, 2),
+                "max_ms": round(ordenadas[-1] * 1000, 2),
+            }
+            for p in PERCENTILES:
+                datos[f"p{p}_ms"] = round(_percentil(ordenadas, p) * 1000, 2)
+            resumen[nombre] = datos
+        return resumen
+
+    def ultimas(self, prefijo: str = "") -> Dict[str, float]:
+        """Última duración (segundos) de cada tramo cuyo nombre empieza por `prefijo`"""
+        with self._lock:
+            return {n: m[-1] for n, m in self._muestras.items() if n.startswith(prefijo) and m}
+
+    def reiniciar(self):
+        with self._lock:
+            self._muestras.clear()
+            self._llamadas.clear()
+            self._errores.clear()
+
+
+# Instancia global
+registro_tiempos = RegistroTiempos()
+
+
+class Cronometro:
+    """Tramos consecutivos de un paso; cada etapa() cierra la anterior"""
+
+    def __init__(self, nombre: str, registro: Optional[RegistroTiempos] = None):
+        self.nombre = nombre
+        self._registro = registro or registro_tiempos
+        self._inicio = time.perf_counter()
+        self._etapa: Optional[str] = None
+        self._inicio_etapa = self._inicio
+        self._tiempos: Dict[str, float] = {}
+        self._terminado = False
+        self._memoria = PerfilMemoria(nombre) if perfil_memoria_activo() else None
+        self.memoria: Optional[Dict[str, Any]] = None
+
+    def _cerrar_etapa(self, ahora: float):
+        if self._etapa is None:
+            return
+        segundos = ahora - self._inicio_etapa
+        # Una etapa repetida (p. ej. por lotes) acumula
+        self._tiempos[self._etapa] = self._tiempos.get(self._etapa, 0.0) + segundos
+        self._registro.registrar(f"{self.nombre}.{self._etapa}", segundos)
+
+    def etapa(self, nombre: str, porcentaje: Optional[float] = None):
+        """
+        Empieza el tramo `nombre`. Con porcentaje, informa además la etapa al
+        trabajo en curso (puede lanzar TrabajoCancelado, ver reportar_etapa).
+        """
+        ahora = time.perf_counter()
+        self._cerrar_etapa(ahora)
+        if self._memoria is not None:
+            # Las instantáneas de tracemalloc no cuentan en el tiempo de la etapa
+            self._memoria.etapa(nombre)
+            ahora = time.perf_counter()
+        self._etapa, self._inicio_etapa = nombre, ahora
+        if porcentaje is not None:
+            reportar_etapa(nombre, porcentaje)
+
+    def terminar(self, error: bool = False) -> Dict[str, float]:
+        """Cierra el último tramo y devuelve el desglose en segundos (llamadas repetidas no vuelven a medir)"""
+        if not self._terminado:
+            ahora = time.perf_counter()
+            self._cerrar_etapa(ahora)
+            self._etapa = None
+            self._tiempos["total"] = ahora - self._inicio
+            self._registro.registrar(self.nombre, self._tiempos["total"], error)
+            self._terminado = True
+            logger.debug(f"⏱️ {self.nombre}: " + ", ".join(f"{e} {s * 1000:.0f} ms" for e, s in self._tiempos.items()))
+            if self._memoria is not None:
+                self.memoria = self._memoria.terminar()
+        return {etapa: round(segundos, 4) for etapa, segundos in self._tiempos.items()}
+
+    def informe(self) -> Dict[str, Any]:
+        """{'timings': {...}} y, con el perfil de memoria activo, 'memoria' (termina el cronómetro)"""
+        informe: Dict[str, Any] = {"timings": self.terminar()}
+        if self.memoria is not None:
+            informe["memoria"] = self.memoria
+        return informe
+
+
+@contextmanager
+def medir(nombre: str, registro: Optional[RegistroTiempos] = None) -> Iterator[None]:
+    """Mide un bloque como un único tramo (una excepción cuenta como error)"""
+    registro = registro or registro_tiempos
+    inicio = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        registro.registrar(nombre, time.perf_counter() - inicio, error)
+
+
+def medido(nombre: str, perfil_memoria: bool = False) -> Callable[[Callable], Callable]:
+    """
+    Decorador: mide cada llamada como el tramo `nombre`. Las respuestas
+    {"success": False, ...} de la API cuentan como error. Con perfil_memoria,
+    la llamada se perfila también como una etapa cuando el perfil está activo
+    (exportaciones).
+    """
+    def decorador(funcion: Callable) -> Callable:
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            memoria = PerfilMemoria(nombre) if perfil_memoria and perfil_memoria_activo() else None
+            if memoria is not None:
+                memoria.etapa(nombre.rsplit(".", 1)[-1])
+            inicio = time.perf_counter()
+            error = True
+            try:
+                resultado = funcion(*args, **kwargs)
+                error = isinstance(resultado, dict) and resultado.get("success") is False
+                return resultado
+            finally:
+                registro_tiempos.registrar(nombre, time.perf_counter() - inicio, error)
+                if memoria is not None:
+                    memoria.terminar()
+        return envoltura
+    return decorador
@@ -0,0 +1,174 @@
+"""
+origenes.py - Datos de cada paso guardados en el backend
+WOGest - Sistema de Validación de Renovaciones
+
+Permite que la UI haga referencia a los datos de un paso ('origen') en lugar
+de reenviar la lista 'detalle' completa por el puente de pywebview. Cada
+origen se lee por lotes de DataFrames desde donde ya está guardado:
+
+- step1_p1:  DataFrame validado del controlador (última validación)
+- step2_p2:  tabla temp_paso2 (SQLite)
+- step3_p3:  tabla temp_cruce si el cruce se hizo fuera de memoria, si no el
+             cruce se calcula desde temp_paso1 / temp_paso2
+- step4_rpa: selección WO / ORDEN_CONTRATO del cruce (paso4.seleccionar_exportables)
+
+Los filtros opcionales se aplican por columnas en cada lote:
+
+    {"contiene": {"N_WO": "1234"},        # subcadena, sin distinguir mayúsculas
+     "igual":    {"es_cerrado": "NO"}}    # valor exacto ("NULL" = vacío)
+"""
+
+from typing import Any, Dict, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from procesamiento.canonico import quitar_columnas_tecnicas
+from procesamiento.db_sqlite import contar_registros, get_connection, leer_temp_paso1, leer_temp_paso2
+from procesamiento.paso3 import COLUMNAS_TECNICAS_CRUCE, construir_cruce
+from procesamiento.paso4 import seleccionar_exportables
+
+# Identificadores de origen (coinciden con el 'contexto' de exportación de la UI)
+ORIGEN_PASO1 = "step1_p1"
+ORIGEN_PASO2 = "step2_p2"
+ORIGEN_CRUCE = "step3_p3"
+ORIGEN_RPA = "step4_rpa"
+ORIGENES = (ORIGEN_PASO1, ORIGEN_PASO2, ORIGEN_CRUCE, ORIGEN_RPA)
+
+TAMANO_LOTE = 50_000
+
+VALOR_NULO = "NULL"
+
+# es_cerrado guardado (1 / 0) → texto de la UI
+CERRADO_UI = {1: "SI", 0: "NO"}
+
+
+def _texto_columna(df: pd.DataFrame, columna: str) -> pd.Series:
+    """Columna como texto en mayúsculas sin espacios ('' para nulos)"""
+    return df[columna].astype("string").str.strip().str.upper().fillna("")
+
+
+def aplicar_filtros(df: pd.DataFrame, filtros: Optional[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Filtra un DataFrame con máscaras por columna (ver formato en el módulo).
+    Las columnas que no existen en el DataFrame se ignoran.
+    """
+    if not filtros or df.empty:
+        return df
+
+    mascara = np.ones(len(df), dtype=bool)
+    for columna, valor in (filtros.get("contiene") or {}).items():
+        texto = str(valor or "").strip().upper()
+        if texto and columna in df.columns:
+            mascara &= _texto_columna(df, columna).str.contains(texto, regex=False).to_numpy(dtype=bool)
+
+    for columna, valor in (filtros.get("igual") or {}).items():
+        if valor in (None, "") or columna not in df.columns:
+            continue
+        esperado = str(valor).strip().upper()
+        if esperado == VALOR_NULO:
+            mascara &= df[columna].isna().to_numpy(dtype=bool)
+        else:
+            mascara &= (_texto_columna(df, columna) == esperado).to_numpy(dtype=bool)
+
+    return df[mascara]
+
+
+def _lotes_paso1(tamano_lote: int) -> Iterator[pd.DataFrame]:
+    from controlador import obtener_resultado_validacion
+
+    df = obtener_resultado_validacion()
+    if df is None or df.empty:
+        return
+    df = quitar_columnas_tecnicas(df)
+    for inicio in range(0, len(df), tamano_lote):
+        yield df.iloc[inicio:inicio + tamano_lote]
+
+
+def _lotes_tabla(consulta: str, tamano_lote: int) -> Iterator[pd.DataFrame]:
+    conn = get_connection()
+    try:
+        yield from pd.read_sql_query(consulta, conn, chunksize=tamano_lote)
+    finally:
+        conn.close()
+
+
+def presentar_paso2(df: pd.DataFrame) -> pd.DataFrame:
+    """Filas de temp_paso2 como las muestra la UI del Paso 2 (cerrado como SI / NO)"""
+    df = quitar_columnas_tecnicas(df)
+    df["es_cerrado"] = df["es_cerrado"].map(CERRADO_UI)
+    return df
+
+
+def _lotes_paso2(tamano_lote: int) -> Iterator[pd.DataFrame]:
+    if contar_registros("temp_paso2") == 0:
+        return
+    for lote in _lotes_tabla("SELECT * FROM temp_paso2 ORDER BY id", tamano_lote):
+        yield presentar_paso2(lote)
+
+
+def _lotes_cruce_completo(tamano_lote: int) -> Iterator[pd.DataFrame]:
+    """Lotes del cruce con sus columnas técnicas tipadas (para la selección RPA)"""
+    if contar_registros("temp_cruce") > 0:
+        yield from _lotes_tabla("SELECT * FROM temp_cruce ORDER BY id_paso2", tamano_lote)
+        return
+    df1 = leer_temp_paso1()
+    df2 = leer_temp_paso2()
+    if df1.empty or df2.empty:
+        return
+    yield construir_cruce(df1, df2)
+
+
+def _lotes_cruce(tamano_lote: int) -> Iterator[pd.DataFrame]:
+    for lote in _lotes_cruce_completo(tamano_lote):
+        yield lote.drop(columns=[c for c in lote.columns if c in COLUMNAS_TECNICAS_CRUCE])
+
+
+def _lotes_rpa(tamano_lote: int) -> Iterator[pd.DataFrame]:
+    for lote in _lotes_cruce_completo(tamano_lote):
+        # CONTRATO no se escribe en el fichero del RPA; sirve para particionar
+        yield seleccionar_exportables(lote, incluir_contrato=True)
+
+
+_LECTORES = {
+    ORIGEN_PASO1: _lotes_paso1,
+    ORIGEN_PASO2: _lotes_paso2,
+    ORIGEN_CRUCE: _lotes_cruce,
+    ORIGEN_RPA: _lotes_rpa,
+}
+
+
+def normalizar_origen(origen: Any) -> str:
+    """
+    Acepta 'step2_p2' o {'paso': 'step2_p2', ...} y devuelve el identificador.
+
+    Raises:
+        ValueError: si el origen no existe
+    """
+    paso = origen.get("paso") if isinstance(origen, dict) else origen
+    paso = str(paso or "").strip().lower()
+    if paso not in _LECTORES:
+        raise ValueError(f"Origen de datos desconocido: {paso or '(vacío)'}")
+    return paso
+
+
+def lotes_origen(origen: Any, filtros: Optional[Dict[str, Any]] = None,
+                 tamano_lote: int = TAMANO_LOTE) -> Iterator[pd.DataFrame]:
+    """
+    Lee los datos guardados de un paso por lotes, con filtros opcionales.
+
+    Args:
+        origen: Identificador del paso (ORIGENES) o {'paso': ..., 'filtros': ...}
+        filtros: Filtros por columna (si no se pasan, se usan los del origen)
+        tamano_lote: Filas por lote al leer de SQLite
+
+    Returns:
+        Iterador de DataFrames (los lotes que quedan vacíos tras filtrar se omiten)
+    """
+    paso = normalizar_origen(origen)
+    if filtros is None and isinstance(origen, dict):
+        filtros = origen.get("filtros")
+    for lote in _LECTORES[paso](tamano_lote):
+        lote = aplicar_filtros(lote, filtros)
+        if not lote.empty:
+            yield lote
@@ -9,9 +9,14 @@ from pathlib import Path
 import sys
 import pkgutil
 import sqlite3  # <-- Importa sqlite3 aquí
+import threading
 from procesamiento.db_sqlite import guardar_paso1_sqlite  # Importar función de guardado
+from procesamiento.canonico import canonicalizar_paso1, EstadoCodigo
+from procesamiento.trabajos import reportar_metrica, reportar_progreso
+from procesamiento.metricas import Cronometro
+from procesamiento.perfilado import perfilado
+from procesamiento.bitacora import Muestreo
 # Configurar logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -315,23 +320,44 @@ class RenovacionValidator:
             'rpa': rpa
         }
     
+    @perfilado("paso1")
     def validar_renovaciones(self, path_excel: str) -> ValidationResult:
-        """Función principal que valida las renovaciones"""
+        """
+        Función principal que valida las renovaciones.
+        stats['timings'] lleva el tiempo de cada etapa en segundos (ver procesamiento.metricas)
+        y, con el perfil de memoria activo, stats['memoria'] la memoria de cada etapa.
+        """
+        crono = Cronometro("paso1")
+        resultado = None
+        try:
+            resultado = self._validar_renovaciones(path_excel, crono)
+            return resultado
+        finally:
+            crono.terminar(error=resultado is None or not resultado.success)
+            if resultado is not None:
+                resultado.stats.update(crono.informe())
+
+    def _validar_renovaciones(self, path_excel: str, crono: Cronometro) -> ValidationResult:
         try:
             logger.info(f"Iniciando validación de renovaciones para: {path_excel}")
             
             # Validar archivo
+            crono.etapa("archivo")
             archivo_valido, mensaje_archivo = self._validar_archivo(path_excel)
             if not archivo_valido:
                 return ValidationResult(False, None, mensaje_archivo, {})
             
             # Leer Excel
+            crono.etapa("lectura", 5)
             df, mensaje_lectura = self._leer_excel(path_excel)
             if df is None:
                 return ValidationResult(False, None, mensaje_lectura, {})
+            reportar_metrica("filas_leidas", len(df))
             
             # Limpiar datos
+            crono.etapa("limpieza", 30)
             df_limpio = self._limpiar_datos(df)
+            reportar_metrica("filas_validas", len(df_limpio), len(df))
             
             if df_limpio.empty:
                 return ValidationResult(
@@ -341,7 +367,9 @@ class RenovacionValidator:
                 )
             
             # Procesar grupos AQUI PUEDO CAMBIAR  CONSULTANDO LA LOGICA
+            crono.etapa("validacion", 40)
             agrupado = df_limpio.groupby(['CLIENTE', 'MANT']) 
+            total_grupos = max(agrupado.ngroups, 1)
             resultados = []
             
             stats = {
@@ -351,12 +379,20 @@ class RenovacionValidator:
                 'grupos_procesados': 0,
                 'advertencias': 0
             }
+            # Diagnóstico de grupos no correctos (DEBUG, muestreado)
+            diagnosticos = Muestreo(logger, "paso1.grupos")
             
             for (cliente, mant), grupo in agrupado:
                 stats['grupos_procesados'] += 1
+                if stats['grupos_procesados'] % 500 == 0:
+                    reportar_progreso(40 + 45 * stats['grupos_procesados'] / total_grupos)
+                    reportar_metrica("grupos_validados", stats['grupos_procesados'], total_grupos)
 
                 # Procesar validaciones del grupo completo
                 resultado_grupo = self._procesar_grupo(grupo, mant, cliente)
+                if resultado_grupo['estado'] != 'Correcto':
+                    diagnosticos.registrar("Grupo %s/%s %s: %s", cliente, mant, resultado_grupo['estado'],
+                                           resultado_grupo['observaciones'], datos={"filas": len(grupo)})
 
                 # Agregar resultados para cada fila del grupo
                 for _, row in grupo.iterrows():
@@ -381,6 +417,9 @@ class RenovacionValidator:
                         stats['registros_incorrectos'] += 1
                        
             
+            diagnosticos.cerrar()
+            reportar_metrica("grupos_validados", stats['grupos_procesados'], total_grupos)
+            crono.etapa("resultado")
             df_resultado = pd.DataFrame(resultados)
             
             # 🔧 Eliminar columnas "Unnamed" antes de normalizar nombres
@@ -391,14 +430,18 @@ class RenovacionValidator:
             
             # 🔧 Normalizar nombres de columna a minúsculas
             df_resultado.columns = [col.lower() for col in df_resultado.columns]
+
+            # 🔑 Claves canónicas tipadas (wo_key Int64, estado_cod) para los pasos siguientes
+            df_resultado = canonicalizar_paso1(df_resultado)
             
             # Las estadísticas ya se calcularon durante el procesamiento
             # El método _limpiar_datos ya filtró por DMCE/AMCE
             
             # 💾 INSERTAR REGISTROS A LA BASE DE DATOS - Solo registros correctos
+            crono.etapa("guardado", 90)
             try:
                 # Filtrar solo registros correctos
-                df_correctos = df_resultado[df_resultado['estado'] == 'Correcto'].copy()
+                df_correctos = df_resultado[df_resultado['estado_cod'] == EstadoCodigo.CORRECTO].copy()
                 
                 if not df_correctos.empty:
                     # Normalizar nombres de columnas para la BD
@@ -424,6 +467,7 @@ class RenovacionValidator:
                     
                     # Guardar en SQLite
                     guardar_paso1_sqlite(df_correctos_bd)
+                    reportar_metrica("filas_guardadas", len(df_correctos_bd))
                     logger.info(f"✅ {len(df_correctos)} registros correctos guardados en SQLite")
                 else:
                     logger.info("⚠️ No hay registros correctos para guardar en SQLite")
@@ -454,8 +498,27 @@ class RenovacionValidator:
             logger.error(error_msg, exc_info=True)
             return ValidationResult(False, None, error_msg, {})
 
-# Instancia global del validador
-validator = RenovacionValidator()
+# Instancia global del validador: el catálogo de reglas se carga en el primer
+# uso (o en el precalentamiento del arranque, ver procesamiento.arranque)
+_validador: Optional[RenovacionValidator] = None
+_lock_validador = threading.Lock()
+
+
+def obtener_validador() -> RenovacionValidator:
+    """Instancia global del validador, creada una sola vez"""
+    global _validador
+    if _validador is None:
+        with _lock_validador:
+            if _validador is None:
+                _validador = RenovacionValidator()
+    return _validador
+
+
+def __getattr__(nombre: str):
+    # Compatibilidad con `from procesamiento.paso1 import validator`
+    if nombre == "validator":
+        return obtener_validador()
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
 
 
 def validar_renovaciones(path_excel: str) -> Tuple[Optional[pd.DataFrame], str]:
@@ -468,7 +531,7 @@ def validar_renovaciones(path_excel: str) -> Tuple[Optional[pd.DataFrame], str]:
     Returns:
         Tuple con (DataFrame resultado, mensaje)
     """
-    resultado = validator.validar_renovaciones(path_excel)
+    resultado = obtener_validador().validar_renovaciones(path_excel)
     return resultado.data, resultado.message
 
 def obtener_estadisticas_validacion(path_excel: str) -> Dict[str, Any]:
@@ -481,11 +544,14 @@ def obtener_estadisticas_validacion(path_excel: str) -> Dict[str, Any]:
     Returns:
         Diccionario con estadísticas de validación
     """
-    resultado = validator.validar_renovaciones(path_excel)
+    resultado = obtener_validador().validar_renovaciones(path_excel)
     return resultado.stats
 
 # Ejemplo de uso
 if __name__ == "__main__":
+    from procesamiento.bitacora import configurar_logging
+    configurar_logging(consola=True)
+
     # Ejemplo de uso del validador
     ruta_archivo = "ejemplo_renovaciones.xlsx"
     
@@ -500,7 +566,7 @@ if __name__ == "__main__":
         print(f"❌ {mensaje}")
     
     # Usar la nueva interfaz con estadísticas
-    resultado_completo = validator.validar_renovaciones(ruta_archivo)
+    resultado_completo = obtener_validador().validar_renovaciones(ruta_archivo)
     if resultado_completo.success:
         print(f"\n📊 Estadísticas detalladas:")
         for key, value in resultado_completo.stats.items():
@@ -1,5 +1,13 @@
+import logging
 import pandas as pd
 from procesamiento.db_sqlite import guardar_paso2_sqlite  # Importar función de guardado
+from procesamiento.trabajos import reportar_metrica
+from procesamiento.metricas import Cronometro
+from procesamiento.perfilado import perfilado
+from procesamiento.canonico import canonicalizar_paso2
+from procesamiento.bitacora import depurar
+
+logger = logging.getLogger(__name__)
 
 # Diccionario de columnas a conservar y renombrar
 def get_column_map():
@@ -30,10 +38,14 @@ def get_column_map():
         "Column45": "MATRI_CERRADO"
     }
 
+@perfilado("paso2")
 def procesar_woq(ruta_archivo):
     import os
+    crono = Cronometro("paso2")
+    df = None
     try:
-        print(f"📥 Procesando archivo WOQ: {ruta_archivo}")
+        logger.info(f"📥 Procesando archivo WOQ: {ruta_archivo}")
+        crono.etapa("archivo")
         
         # Validar que el archivo existe
         if not os.path.exists(ruta_archivo):
@@ -46,7 +58,7 @@ def procesar_woq(ruta_archivo):
         # Validar extensión del archivo
         extension = os.path.splitext(ruta_archivo)[1].lower()
         if extension not in ['.csv', '.txt', '']:  # '' para archivos sin extensión
-            print(f"⚠️ Advertencia: Extensión de archivo no estándar: {extension}. Intentando procesar de todos modos.")
+            logger.warning(f"⚠️ Advertencia: Extensión de archivo no estándar: {extension}. Intentando procesar de todos modos.")
             # No interrumpimos el proceso, solo advertimos
             
         # Intentar abrir el archivo para verificar si se puede leer
@@ -67,6 +79,7 @@ def procesar_woq(ruta_archivo):
             raise ValueError(f"Error al leer el archivo: {str(e)}")
         
         # Permitir leer aunque no tenga extensión, forzando encoding latin1
+        crono.etapa("lectura", 10)
         try:
             # Intentar primero con delimitador punto y coma (estándar)
             # Nota: pandas > 1.0 usa on_bad_lines en vez de error_bad_lines/warn_bad_lines
@@ -94,11 +107,11 @@ def procesar_woq(ruta_archivo):
                             temp_df = pd.read_csv(ruta_archivo, delimiter=delim, encoding='latin1', 
                                                 header=None, on_bad_lines='warn')
                         if temp_df.shape[1] > 1:
-                            print(f"✅ El archivo usa delimitador '{delim}' en lugar de ';'")
+                            logger.info(f"✅ El archivo usa delimitador '{delim}' en lugar de ';'")
                             df = temp_df
                             break
                     except Exception as delim_error:
-                        print(f"⚠️ Error al probar con delimitador '{delim}': {str(delim_error)}")
+                        logger.warning(f"⚠️ Error al probar con delimitador '{delim}': {str(delim_error)}")
                         continue
             
             # Validar que tiene al menos una columna y filas
@@ -108,8 +121,8 @@ def procesar_woq(ruta_archivo):
             # Si hay muy pocas columnas, es probable que el formato sea incorrecto
             min_columnas_requeridas = 5  # Ejemplo: necesitamos al menos estas columnas
             if df.shape[1] < min_columnas_requeridas:
-                print(f"⚠️ Advertencia: El archivo tiene muy pocas columnas ({df.shape[1]}). " +
-                      f"Se esperaban al menos {min_columnas_requeridas}.")
+                logger.warning(f"⚠️ Advertencia: El archivo tiene muy pocas columnas ({df.shape[1]}). " +
+                               f"Se esperaban al menos {min_columnas_requeridas}.")
                 
         except pd.errors.EmptyDataError:
             raise ValueError("El archivo CSV está vacío.")
@@ -118,17 +131,19 @@ def procesar_woq(ruta_archivo):
         except Exception as e:
             raise ValueError(f"No se pudo procesar el archivo WOQ: {str(e)}")
             
-        print(f"✅ CSV cargado, shape: {df.shape}")
+        logger.info(f"✅ CSV cargado, shape: {df.shape}")
+        reportar_metrica("filas_leidas", df.shape[0])
 
         # Paso 1: Asignar nombres genéricos
+        crono.etapa("limpieza", 50)
         df.columns = [f"Column{i+1}" for i in range(df.shape[1])]
-        print(f"🧩 Columnas renombradas: {list(df.columns)}")
+        depurar(logger, "🧩 Columnas renombradas: %d", lambda: list(df.columns), df.shape[1])
 
         # Paso 2: Obtener mapeo y validar columnas
         renombrar = get_column_map()
         columnas_validas = list(renombrar.keys())
         columnas_presentes = [col for col in df.columns if col in columnas_validas]
-        print(f"🧪 Columnas válidas detectadas: {len(columnas_presentes)} / {len(columnas_validas)}")
+        logger.debug(f"🧪 Columnas válidas detectadas: {len(columnas_presentes)} / {len(columnas_validas)}")
         df = df[columnas_presentes]
 
         # Paso 3: Renombrar columnas
@@ -144,10 +159,11 @@ def procesar_woq(ruta_archivo):
             df["ORDEN_CONTRATO"] = df.groupby("CONTRATO").cumcount() + 1
 
         # Paso 6: Marcar si está cerrado (adaptativo a diferentes formatos)
+        crono.etapa("validacion", 65)
         if "CERRADO" in df.columns:
             # Intentamos detectar el formato de la columna CERRADO
             valores_unicos = df["CERRADO"].astype(str).str.upper().str.strip().unique()
-            print(f"🔍 Valores únicos en columna CERRADO: {valores_unicos}")
+            depurar(logger, "🔍 Valores únicos en columna CERRADO: %d", lambda: valores_unicos.tolist(), len(valores_unicos))
             
             # Verificamos si usa 'X' para marcar cerrados
             if "X" in valores_unicos:
@@ -160,12 +176,12 @@ def procesar_woq(ruta_archivo):
                 df["ES_CERRADO"] = df["CERRADO"].astype(str).str.upper().str.strip().isin(["TRUE", "1"])
             else:
                 # Si no podemos determinar el formato, asumimos que no hay cerrados
-                print("⚠️ No se pudo determinar el formato de la columna CERRADO. Asumiendo todos NO.")
+                logger.warning("⚠️ No se pudo determinar el formato de la columna CERRADO. Asumiendo todos NO.")
                 df["ES_CERRADO"] = False
             
         else:
             # Si no existe la columna CERRADO, la creamos con valores NO
-            print("⚠️ No se encontró columna CERRADO. Creando con valores NO.")
+            logger.warning("⚠️ No se encontró columna CERRADO. Creando con valores NO.")
             df["CERRADO"] = "NO_DATA"
             df["ES_CERRADO"] = False
 
@@ -174,7 +190,7 @@ def procesar_woq(ruta_archivo):
         columnas_faltantes = [col for col in columnas_criticas if col not in df.columns]
         
         if columnas_faltantes:
-            print(f"⚠️ Advertencia: Faltan columnas críticas: {columnas_faltantes}")
+            logger.warning(f"⚠️ Advertencia: Faltan columnas críticas: {columnas_faltantes}")
             # Agregamos las columnas faltantes con valores vacíos para evitar errores
             for col in columnas_faltantes:
                 df[col] = ""
@@ -183,9 +199,13 @@ def procesar_woq(ruta_archivo):
         if "ORDEN_CONTRATO" not in df.columns:
             df["ORDEN_CONTRATO"] = range(1, len(df) + 1)
 
-        print(f"✅ DataFrame final listo: {df.shape}")
+        # Claves canónicas tipadas: wo_key (Int64) y ES_CERRADO como entero 0/1
+        df = canonicalizar_paso2(df)
+
+        logger.info(f"✅ DataFrame final listo: {df.shape}")
         
         # 💾 INSERTAR REGISTROS A LA BASE DE DATOS
+        crono.etapa("guardado", 80)
         try:
             # Normalizar nombres de columnas para la BD
             df_bd = df.copy()
@@ -218,7 +238,8 @@ def procesar_woq(ruta_archivo):
                 "MATRI_CERRADO": "MATRI_CERRADO",
                 "N_WO": "N_WO2",
                 "ORDEN_CONTRATO": "ORDEN_CONTRATO",
-                "ES_CERRADO": "es_cerrado"
+                "ES_CERRADO": "es_cerrado",
+                "wo_key": "wo_key"
             }
             
             # Renombrar solo las columnas que existen
@@ -231,26 +252,28 @@ def procesar_woq(ruta_archivo):
                 "CERRADO", "F_SIST", "CLIENTE", "TIPO2", "F_RECEP", "MARCA", 
                 "MODELO", "SERIE", "S_SERIE", "CA", "LEC_ANT", "LEC_NUE",
                 "T_PRICE", "F_F", "CERRADO2", "MTRIC", "INSTALACION",
-                "N_CONTRATO", "MATRI_CERRADO", "N_WO2", "ORDEN_CONTRATO", "es_cerrado"
+                "N_CONTRATO", "MATRI_CERRADO", "N_WO2", "ORDEN_CONTRATO", "es_cerrado", "wo_key"
             ]
             
             for col in required_columns:
                 if col not in df_bd.columns:
-                    df_bd[col] = "" if col in ["DC", "TIPO", "STATUS1", "STATUS2", "CERRADO", "F_SIST", "CLIENTE", "TIPO2", "F_RECEP", "MARCA", "MODELO", "SERIE", "S_SERIE", "CA", "T_PRICE", "F_F", "CERRADO2", "MTRIC", "N_CONTRATO", "MATRI_CERRADO", "es_cerrado"] else 0
+                    df_bd[col] = "" if col in ["DC", "TIPO", "STATUS1", "STATUS2", "CERRADO", "F_SIST", "CLIENTE", "TIPO2", "F_RECEP", "MARCA", "MODELO", "SERIE", "S_SERIE", "CA", "T_PRICE", "F_F", "CERRADO2", "MTRIC", "N_CONTRATO", "MATRI_CERRADO"] else 0
             
             # Guardar en SQLite
             guardar_paso2_sqlite(df_bd)
-            print(f"✅ {len(df_bd)} registros guardados en SQLite (paso2)")
+            reportar_metrica("filas_guardadas", len(df_bd))
+            logger.info(f"✅ {len(df_bd)} registros guardados en SQLite (paso2)")
                     
         except Exception as e:
-            print(f"❌ Error al guardar registros en SQLite: {str(e)}")
+            logger.error(f"❌ Error al guardar registros en SQLite: {str(e)}")
             # No interrumpir el flujo principal, solo registrar el error
         
         return df
 
     except Exception as e:
-        print(f"❌ Error al procesar WOQ: {e}")
-        # Registrar stack trace para diagnóstico
-        import traceback
-        print(traceback.format_exc())
+        # Con la traza para diagnóstico
+        logger.exception(f"❌ Error al procesar WOQ: {e}")
+        df = None
         return None
+    finally:
+        crono.terminar(error=df is None)
@@ -13,120 +13,446 @@ Funcionalidades:
 - Exportación de datos aptos para RPA
 """
 
+import heapq
+import numpy as np
 import pandas as pd
-import openpyxl
+from openpyxl.utils import get_column_letter
 import os
 import logging
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 
+from procesamiento.canonico import (
+    COL_ESTADO_COD,
+    COL_WO_KEY,
+    COLUMNAS_TECNICAS,
+    EstadoCodigo,
+    canonicalizar_paso1,
+    canonicalizar_paso2,
+    columna_cerrado,
+    primera_columna,
+)
+from procesamiento.exportador_excel import escribir_excel, exportar_dataframe_excel
+from procesamiento.serializacion import registros_json
+from procesamiento.trabajos import reportar_metrica, reportar_progreso
+from procesamiento.metricas import Cronometro
+from procesamiento.perfilado import perfilado
+
 # Configurar logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def realizar_cruce_datos(datos_paso1: List[Dict], datos_paso2: List[Dict]) -> Dict[str, Any]:
+# Columnas tipadas del cruce que no se envían a la UI
+COLUMNAS_TECNICAS_CRUCE = COLUMNAS_TECNICAS + ("estado_paso1_cod", "apto_rpa_cod", "id_paso2")
+
+def _como_dataframe(datos) -> pd.DataFrame:
+    """Acepta un DataFrame o una lista de diccionarios y devuelve un DataFrame"""
+    if isinstance(datos, pd.DataFrame):
+        return datos.copy()
+    return pd.DataFrame(list(datos or []))
+
+def construir_cruce(df_paso1: pd.DataFrame, df_paso2: pd.DataFrame) -> pd.DataFrame:
+    """
+    Construye el cruce Paso 2 ⟵ Paso 1 sobre las claves canónicas tipadas.
+
+    Devuelve TODAS las filas del Paso 2 (mismo orden de columnas) más:
+    - 'Estado_Paso1' y 'Apto RPA' (columnas visibles en la UI)
+    - 'confianza_correlacion' (puntuación de integridad del par, ver
+      validar_integridad_cruce_lote)
+    - 'estado_paso1_cod' y 'apto_rpa_cod' (columnas técnicas int8;
+      apto_rpa_cod: 1 = apto, 0 = no apto, -1 = sin cruce)
+
+    Args:
+        df_paso1: Registros del Paso 1 (temp_paso1)
+        df_paso2: Registros del Paso 2 (temp_paso2)
+
+    Returns:
+        DataFrame con el cruce completo
+    """
+    df1 = canonicalizar_paso1(df_paso1)
+    df2 = canonicalizar_paso2(df_paso2)
+
+    # Índices desde Paso 1 (el último estado de cada WO prevalece)
+    p1 = df1[df1[COL_WO_KEY].notna()]
+    ultimo = p1.drop_duplicates(subset=COL_WO_KEY, keep="last").set_index(COL_WO_KEY, drop=False)
+    wos_correctos = p1.loc[p1[COL_ESTADO_COD] == EstadoCodigo.CORRECTO, COL_WO_KEY].unique()
+
+    claves = df2[COL_WO_KEY]
+    en_paso1 = claves.isin(ultimo.index).fillna(False).to_numpy(dtype=bool)
+    correcto = claves.isin(wos_correctos).fillna(False).to_numpy(dtype=bool)
+
+    p1_alineado = ultimo.reindex(claves.to_numpy())
+    p1_alineado.index = df2.index
+    return _completar_cruce(df2, p1_alineado, en_paso1, correcto)
+
+def _completar_cruce(df2: pd.DataFrame, p1_alineado: pd.DataFrame,
+                     en_paso1: np.ndarray, correcto: np.ndarray) -> pd.DataFrame:
+    """
+    Añade a las filas del Paso 2 las columnas del cruce.
+
+    Args:
+        df2: Filas del Paso 2 ya canonicalizadas
+        p1_alineado: Último registro del Paso 1 de cada fila (mismo índice que df2)
+        en_paso1: Máscara de filas con WO presente en el Paso 1
+        correcto: Máscara de filas con WO 'Correcto' en el Paso 1
+    """
+    cerrado = df2[columna_cerrado(df2)].to_numpy() != 0
+
+    # Orden exacto de columnas del Paso 2 excluyendo las técnicas de SQLite
+    columnas_p2 = [c for c in df2.columns if c.lower() != 'id']
+    cruce = df2[columnas_p2].copy()
+
+    estado_txt = p1_alineado["estado"] if "estado" in p1_alineado.columns else pd.Series(None, index=df2.index)
+    cruce["Estado_Paso1"] = estado_txt.astype(object).where(en_paso1, None)
+    cruce["Apto RPA"] = np.where(correcto, np.where(cerrado, "NO", "SÍ"), None)
+    cruce["estado_paso1_cod"] = (
+        pd.to_numeric(p1_alineado[COL_ESTADO_COD], errors="coerce")
+        .fillna(EstadoCodigo.SIN_ESTADO).astype("int8")
+    )
+    cruce["apto_rpa_cod"] = np.where(correcto, np.where(cerrado, 0, 1), -1).astype("int8")
+
+    # Puntuación de integridad de cada par WO ⟷ WOQ (0.0 si no hay cruce)
+    integridad = _puntuar_pares(p1_alineado, df2, en_paso1)
+    cruce["confianza_correlacion"] = integridad["puntuacion_confianza"]
+    return cruce
+
+def _tiene_valor(df: pd.DataFrame, columna: str) -> pd.Series:
+    """Equivalente vectorizado de `bool(registro.get(columna))` (nulo, '' y 0 cuentan como vacío)"""
+    if columna not in df.columns:
+        return pd.Series(False, index=df.index)
+    serie = df[columna]
+    if pd.api.types.is_numeric_dtype(serie):
+        return (serie.notna() & (serie != 0)).fillna(False).astype(bool)
+    return (serie.notna() & serie.astype("string").str.strip().ne("")).fillna(False).astype(bool)
+
+def _texto_normalizado(df: pd.DataFrame, columna: str) -> pd.Series:
+    """Texto en mayúsculas sin espacios ni sufijo '.0' (los enteros leídos como float)"""
+    if columna not in df.columns:
+        return pd.Series("", index=df.index, dtype="string")
+    texto = df[columna].astype("string").str.strip().str.upper()
+    return texto.str.replace(r"\.0+$", "", regex=True).fillna("")
+
+def _puntuar_pares(p1: pd.DataFrame, p2: pd.DataFrame, emparejado: np.ndarray) -> pd.DataFrame:
+    """
+    Aplica las reglas de validar_integridad_cruce a todos los pares a la vez.
+
+    La coincidencia del número de orden no se puntúa: los pares se forman
+    por wo_key, así que siempre coincide y solo sumaría una constante. La
+    puntuación es la media de la consistencia del cliente y la completitud.
+
+    Args:
+        p1: Filas del Paso 1 alineadas con p2 (mismo índice; nulos si no hay par)
+        p2: Filas del Paso 2
+        emparejado: Máscara de filas de p2 que tienen registro en el Paso 1
+
+    Returns:
+        DataFrame con los dos indicadores y la puntuacion_confianza (0.0 sin par)
+    """
+    cliente_p1 = _texto_normalizado(p1, "cliente")
+    cliente_p2 = _texto_normalizado(p2, "CLIENTE")
+    cliente = (cliente_p1.eq("") | cliente_p2.eq("") | cliente_p1.eq(cliente_p2)).astype(bool)
+
+    completos = pd.Series(True, index=p2.index)
+    for campo in ("wo", "cliente", "referencia", "tipo"):
+        completos &= _tiene_valor(p1, campo)
+    for campo in ("N_WO", "CONTRATO", "CLIENTE"):
+        completos &= _tiene_valor(p2, campo)
+
+    puntuacion = (cliente.astype(float) + completos.astype(float)) / 2
+    return pd.DataFrame({
+        "cliente_consistente": cliente & emparejado,
+        "datos_completos": completos & emparejado,
+        "puntuacion_confianza": puntuacion.where(emparejado, 0.0).round(4),
+    }, index=p2.index)
+
+def validar_integridad_cruce_lote(df_paso1: pd.DataFrame, df_paso2: pd.DataFrame) -> pd.DataFrame:
+    """
+    Versión por lotes de validar_integridad_cruce: puntúa todos los pares
+    WO ⟷ WOQ del cruce en una sola pasada vectorizada.
+
+    Cada fila del Paso 2 se empareja con el último registro del Paso 1 con la
+    misma wo_key (el mismo que aporta 'Estado_Paso1').
+
+    Args:
+        df_paso1: Registros del Paso 1 (temp_paso1)
+        df_paso2: Registros del Paso 2 (temp_paso2)
+
+    Returns:
+        DataFrame alineado con df_paso2 con las columnas cliente_consistente,
+        datos_completos y puntuacion_confianza
+    """
+    df1 = canonicalizar_paso1(_como_dataframe(df_paso1))
+    df2 = canonicalizar_paso2(_como_dataframe(df_paso2))
+    ultimo = (
+        df1[df1[COL_WO_KEY].notna()]
+        .drop_duplicates(subset=COL_WO_KEY, keep="last")
+        .set_index(COL_WO_KEY, drop=False)
+    )
+    p1_alineado = ultimo.reindex(df2[COL_WO_KEY].to_numpy())
+    p1_alineado.index = df2.index
+    emparejado = df2[COL_WO_KEY].isin(ultimo.index).fillna(False).to_numpy(dtype=bool)
+    return _puntuar_pares(p1_alineado, df2, emparejado)
+
+def estadisticas_cruce(cruce: pd.DataFrame) -> Dict[str, Any]:
+    """Calcula las estadísticas del cruce a partir de las columnas tipadas"""
+    total = len(cruce)
+    col_cerrado = columna_cerrado(cruce)
+    cerrados = int((cruce[col_cerrado] != 0).sum()) if col_cerrado else 0
+    aptos = int((cruce["apto_rpa_cod"] == 1).sum())
+    no_cruce = int((cruce["apto_rpa_cod"] == -1).sum())
+    emparejados = cruce["Estado_Paso1"].notna()
+    return {
+        "total_cruzados": total,
+        "pendientes_cierre": total - cerrados,
+        "cerrados": cerrados,
+        "aptos_rpa": aptos,
+        "sin_woq": no_cruce,
+        "porcentaje_cruce": round((aptos / total) * 100, 2) if total > 0 else 0.0,
+        "confianza_promedio": round(float(cruce.loc[emparejados, "confianza_correlacion"].mean()), 4)
+        if emparejados.any() else 0.0
+    }
+
+def registros_visibles(cruce: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Registros del cruce para la UI (sin columnas técnicas)"""
+    visibles = [c for c in cruce.columns if c not in COLUMNAS_TECNICAS_CRUCE]
+    return registros_json(cruce[visibles])
+
+@perfilado("paso3")
+def realizar_cruce_datos(datos_paso1, datos_paso2, incluir_filas: bool = True) -> Dict[str, Any]:
     """
     NUEVA LÓGICA PASO 3:
     - Base = TODOS los registros del Paso 2 (mismo orden de columnas).
     - Columnas nuevas al final: 'Estado_Paso1' y 'Apto RPA'.
     - Estadísticas: total_paso2, aptos_rpa, no_aptos, no_cruce, porcentaje_aptos.
     - No añade campos extra (wo, woq_*, estado_cruce, etc.).
+    - El cruce se hace por la clave canónica wo_key (ver procesamiento.canonico).
+
+    Acepta DataFrames (p. ej. leer_temp_paso1/2) o listas de diccionarios.
+    Con incluir_filas=False no se serializan las filas: se devuelve el
+    DataFrame del cruce en 'cruce' (la UI lo pide por páginas).
+    'timings' lleva el tiempo de cada etapa en segundos ('memoria', con el perfil de memoria activo).
     """
+    crono = Cronometro("paso3")
     try:
         logger.info("🔍 Paso 3 (base en Paso 2) — iniciando cruce")
-        if not datos_paso2:
+        crono.etapa("preparacion")
+        df2 = _como_dataframe(datos_paso2)
+        if df2.empty:
             return {"success": False, "message": "No hay datos del Paso 2"}
 
-        from collections import OrderedDict
-
-        # Normalizador de WO
-        def _norm_wo(v):
-            return str(v).strip().upper() if v is not None else ""
-
-        # Índices desde Paso 1
-        wos_p1_correctos = set()
-        estado_por_wo = {}
-        for r in (datos_paso1 or []):
-            # Capturar estado por WO (aunque no sea 'Correcto', para mostrar en 'Estado_Paso1')
-            wo = None
-            for k in ('wo', 'WO', 'N_WO', 'N°_WO', 'N_WO2'):
-                if k in r and r[k]:
-                    wo = r[k]; break
-            if wo is not None:
-                wo_n = _norm_wo(wo)
-                estado_por_wo[wo_n] = r.get('estado')
-                if str(r.get('estado', '')).strip().lower() == 'correcto':
-                    wos_p1_correctos.add(wo_n)
-
-        # Helper: determinar si Paso 2 está cerrado
-        def _esta_cerrado(reg):
-            v = reg.get('ES_CERRADO', reg.get('es_cerrado', None))
-            if isinstance(v, bool):
-                return v
-            if v is None:
-                return False
-            return str(v).strip().upper() in ('SI', 'SÍ', 'TRUE', '1', 'YES')
-
-        # Orden exacto de columnas del Paso 2 (1–27) excluyendo 'id' técnico de SQLite
-        columnas_p2 = [c for c in list(datos_paso2[0].keys()) if c.lower() != 'id']
-
-        resultado: List[Dict[str, Any]] = []
-        aptos = no_aptos = no_cruce = 0
-
-        for row in datos_paso2:
-            # Copia 1:1 de la fila del Paso 2 en el MISMO ORDEN
-            fila = OrderedDict((k, row.get(k)) for k in columnas_p2)
-
-            # WO de la fila del Paso 2
-            wo_p2 = None
-            for k in ('N°_WO', 'N_WO', 'N_WO2', 'WO', 'wo'):
-                if k in row and row[k]:
-                    wo_p2 = row[k]; break
-            wo_key = _norm_wo(wo_p2)
-
-            # Columna 28: Estado_Paso1
-            fila["Estado_Paso1"] = estado_por_wo.get(wo_key, None)
-
-            # Columna 29: Apto RPA
-            if wo_key and wo_key in wos_p1_correctos:
-                if _esta_cerrado(row):
-                    fila["Apto RPA"] = "NO"
-                    no_aptos += 1
+        crono.etapa("cruce", 20)
+        cruce = construir_cruce(_como_dataframe(datos_paso1), df2)
+        reportar_metrica("filas_cruzadas", len(cruce), len(df2))
+        crono.etapa("estadisticas", 70)
+        estadisticas = estadisticas_cruce(cruce)
+
+        reporte = construir_reporte_cruce(cruce, estadisticas)
+        if not incluir_filas:
+            return {"success": True, "cruce": cruce, "estadisticas": estadisticas, "reporte": reporte,
+                    **crono.informe()}
+
+        crono.etapa("serializacion", 85)
+        resultado = registros_visibles(cruce)
+
+        return {"success": True, "datos_cruzados": resultado, "estadisticas": estadisticas, "reporte": reporte,
+                **crono.informe()}
+    except Exception as e:
+        logger.error(f"Error en Paso 3 (base Paso 2): {e}", exc_info=True)
+        crono.terminar(error=True)
+        return {"success": False, "message": f"Error en cruce: {str(e)}"}
+    finally:
+        crono.terminar()
+
+def _grupos_paso1(cursor, columnas: List[str], tamano_lote: int):
+    """
+    Recorre temp_paso1 ordenado por wo_key y genera, por cada WO,
+    (wo_key, último registro, hay_correcto) sin cargar la tabla completa.
+    """
+    i_wo = columnas.index(COL_WO_KEY)
+    i_cod = columnas.index(COL_ESTADO_COD)
+    clave_actual, ultimo, hay_correcto = None, None, False
+    while True:
+        filas = cursor.fetchmany(tamano_lote)
+        if not filas:
+            break
+        for fila in filas:
+            if fila[i_wo] != clave_actual:
+                if ultimo is not None:
+                    yield clave_actual, ultimo, hay_correcto
+                clave_actual, hay_correcto = fila[i_wo], False
+            ultimo = fila
+            hay_correcto = hay_correcto or fila[i_cod] == EstadoCodigo.CORRECTO
+    if ultimo is not None:
+        yield clave_actual, ultimo, hay_correcto
+
+def _tamano_tablas_temporales(*args, **kwargs) -> str:
+    from procesamiento.db_sqlite import contar_registros
+    return f"{contar_registros('temp_paso1')}+{contar_registros('temp_paso2')}filas"
+
+@perfilado("paso3_sqlite", tamano=_tamano_tablas_temporales)
+def realizar_cruce_datos_sqlite(tamano_lote: int = 20000) -> Dict[str, Any]:
+    """
+    Cruce fuera de memoria (sort-merge join) para tablas muy grandes.
+
+    Lee temp_paso1 y temp_paso2 ordenados por wo_key desde cursores SQLite
+    indexados, los combina en una sola pasada y escribe el resultado por
+    lotes de `tamano_lote` filas en una tabla parcial que solo sustituye a
+    temp_cruce al terminar; si el cruce se cancela o falla, la tabla parcial
+    se descarta. La memoria usada depende solo del tamaño de lote, no del
+    tamaño de las tablas.
+
+    Las filas de temp_cruce quedan en orden de wo_key; 'id_paso2' conserva
+    el orden original del Paso 2 (leer_temp_cruce lo usa para ordenar).
+
+    Returns:
+        Diccionario con success, tabla de salida, estadísticas, reporte
+        (construir_reporte_cruce_sqlite) y total de lotes
+    """
+    from procesamiento.db_sqlite import (
+        get_connection,
+        cursor_ordenado_por_wo,
+        preparar_temp_cruce,
+        insertar_lote_cruce,
+        publicar_temp_cruce,
+        descartar_temp_cruce_parcial,
+    )
+
+    conn = cur1 = cur2 = None
+    publicado = False
+    crono = Cronometro("paso3_sqlite")
+    try:
+        logger.info("🔍 Paso 3 (fuera de memoria) — iniciando cruce por lotes")
+        crono.etapa("preparacion")
+        conn = get_connection()
+        preparar_temp_cruce(conn)
+        crono.etapa("cruce", 5)
+        total_paso2 = max(conn.execute("SELECT COUNT(*) FROM temp_paso2").fetchone()[0], 1)
+
+        cols_p1 = [COL_WO_KEY, "id", "estado", COL_ESTADO_COD, "wo", "cliente", "referencia", "tipo"]
+        cur1 = cursor_ordenado_por_wo(conn, "temp_paso1", ", ".join(cols_p1), solo_con_clave=True)
+        grupos = _grupos_paso1(cur1, cols_p1, tamano_lote)
+        grupo = next(grupos, None)
+
+        cur2 = cursor_ordenado_por_wo(conn, "temp_paso2")
+        cols_p2 = [d[0] for d in cur2.description]
+        i_wo = cols_p2.index(COL_WO_KEY)
+
+        total = cerrados = aptos = no_cruce = emparejados = lotes = 0
+        suma_confianza = 0.0
+        while True:
+            filas = cur2.fetchmany(tamano_lote)
+            if not filas:
+                break
+
+            # Merge: avanzar el Paso 1 hasta la wo_key de cada fila del Paso 2
+            pares, en_paso1, correcto = [], [], []
+            for fila in filas:
+                clave = fila[i_wo]
+                if clave is not None:
+                    while grupo is not None and grupo[0] < clave:
+                        grupo = next(grupos, None)
+                if clave is not None and grupo is not None and grupo[0] == clave:
+                    pares.append(grupo[1])
+                    en_paso1.append(True)
+                    correcto.append(grupo[2])
                 else:
-                    fila["Apto RPA"] = "SÍ"
-                    aptos += 1
-            else:
-                fila["Apto RPA"] = None
-                no_cruce += 1
+                    pares.append((None,) * len(cols_p1))
+                    en_paso1.append(False)
+                    correcto.append(False)
 
-            resultado.append(fila)
+            df2 = canonicalizar_paso2(pd.DataFrame.from_records(filas, columns=cols_p2))
+            p1 = canonicalizar_paso1(pd.DataFrame.from_records(pares, columns=cols_p1))
+            lote = _completar_cruce(df2, p1, np.array(en_paso1), np.array(correcto))
+            lote["id_paso2"] = df2["id"]
+            insertar_lote_cruce(conn, lote)
 
-        total = len(datos_paso2)
-        
-        # Contar cerrados y pendientes
-        cerrados = sum(1 for r in resultado if _esta_cerrado(r))
-        pendientes = total - cerrados
-        
+            total += len(lote)
+            cerrados += int((lote[columna_cerrado(lote)] != 0).sum())
+            aptos += int((lote["apto_rpa_cod"] == 1).sum())
+            no_cruce += int((lote["apto_rpa_cod"] == -1).sum())
+            emparejados += int(sum(en_paso1))
+            suma_confianza += float(lote["confianza_correlacion"].sum())
+            lotes += 1
+            reportar_progreso(5 + 90 * min(total / total_paso2, 1.0))
+            reportar_metrica("filas_cruzadas", total, total_paso2)
+
+        if total == 0:
+            return {"success": False, "message": "No hay datos del Paso 2"}
+
+        # SQLite no borra ni renombra tablas con lecturas abiertas en la conexión
+        cur1.close()
+        cur2.close()
+        publicar_temp_cruce(conn)
+        publicado = True
+
+        crono.etapa("estadisticas")
         estadisticas = {
             "total_cruzados": total,
-            "pendientes_cierre": pendientes,
+            "pendientes_cierre": total - cerrados,
             "cerrados": cerrados,
             "aptos_rpa": aptos,
             "sin_woq": no_cruce,
-            "porcentaje_cruce": round((aptos / total) * 100, 2) if total > 0 else 0.0
+            "porcentaje_cruce": round((aptos / total) * 100, 2),
+            "confianza_promedio": round(suma_confianza / emparejados, 4) if emparejados else 0.0
         }
-
-        return {"success": True, "datos_cruzados": resultado, "estadisticas": estadisticas}
+        reporte = construir_reporte_cruce_sqlite(conn, estadisticas)
+        logger.info(f"✅ Cruce fuera de memoria completado: {total} filas en {lotes} lotes")
+        return {"success": True, "tabla": "temp_cruce", "estadisticas": estadisticas, "reporte": reporte,
+                "lotes": lotes, **crono.informe()}
     except Exception as e:
-        logger.error(f"Error en Paso 3 (base Paso 2): {e}", exc_info=True)
+        logger.error(f"Error en Paso 3 (fuera de memoria): {e}", exc_info=True)
+        crono.terminar(error=True)
         return {"success": False, "message": f"Error en cruce: {str(e)}"}
+    finally:
+        crono.terminar()
+        if conn:
+            for cursor in (cur1, cur2):
+                if cursor is not None:
+                    cursor.close()
+            if not publicado:
+                descartar_temp_cruce_parcial(conn)
+            conn.close()
+
+# Columnas del Excel RPA y su ancho
+ANCHOS_COLUMNAS_RPA = {
+    'N_WO': 12,
+    'ORDEN_CONTRATO': 16,
+    'CONTRATO': 15,
+    'CLIENTE': 25,
+    'DEALER': 15,
+    'STATUS1': 12,
+    'STATUS2': 12,
+    'CERRADO': 10,
+    'ESTADO_PASO1': 15,
+    'APTO_RPA': 10,
+    'CONFIANZA_CORRELACION': 15,
+    'TIMESTAMP_PROCESAMIENTO': 20,
+}
+
+# Columna del cruce (construir_cruce) de la que sale cada columna del Excel RPA
+COLUMNAS_CRUCE_RPA = {
+    'N_WO': 'N_WO',
+    'ORDEN_CONTRATO': 'ORDEN_CONTRATO',
+    'CONTRATO': 'CONTRATO',
+    'CLIENTE': 'CLIENTE',
+    'DEALER': 'DEALER',
+    'STATUS1': 'STATUS1',
+    'STATUS2': 'STATUS2',
+    'CERRADO': 'CERRADO',
+    'ESTADO_PASO1': 'Estado_Paso1',
+    'APTO_RPA': 'Apto RPA',
+    'CONFIANZA_CORRELACION': 'confianza_correlacion',
+}
 
-def exportar_datos_rpa(datos_cruzados: List[Dict], carpeta_destino: str) -> Dict[str, Any]:
+def _anchos_por_letra(anchos: Dict[str, float]) -> Dict[str, float]:
+    """Convierte {columna: ancho} en {letra Excel: ancho} según el orden de columnas"""
+    return {get_column_letter(i): ancho for i, ancho in enumerate(anchos.values(), 1)}
+
+def exportar_datos_rpa(datos_cruzados, carpeta_destino: str) -> Dict[str, Any]:
     """
     Exporta datos aptos para RPA en formato Excel optimizado
     
     Args:
-        datos_cruzados: Lista de registros cruzados
+        datos_cruzados: Cruce como DataFrame (construir_cruce) o lista de registros
         carpeta_destino: Ruta de la carpeta donde guardar el archivo
         
     Returns:
@@ -135,13 +461,11 @@ def exportar_datos_rpa(datos_cruzados: List[Dict], carpeta_destino: str) -> Dict
     try:
         logger.info(f"📊 Iniciando exportación RPA a: {carpeta_destino}")
         
-        # Filtrar solo registros aptos para RPA
-        registros_rpa = [
-            r for r in datos_cruzados
-            if r.get('apto_rpa', False)
-        ]
+        # Filtrar solo registros aptos para RPA (apto_rpa_cod == 1 o 'Apto RPA' = SÍ)
+        cruce = datos_cruzados if isinstance(datos_cruzados, pd.DataFrame) else _como_dataframe(datos_cruzados)
+        registros_rpa = cruce[_mascara_apto(cruce)] if not cruce.empty else cruce
         
-        if not registros_rpa:
+        if registros_rpa.empty:
             return {
                 'success': False,
                 'message': 'No hay registros aptos para RPA'
@@ -155,57 +479,19 @@ def exportar_datos_rpa(datos_cruzados: List[Dict], carpeta_destino: str) -> Dict
         nombre_archivo = f"WOGest_RPA_Export_{timestamp}.xlsx"
         ruta_archivo = os.path.join(carpeta_destino, nombre_archivo)
         
-        # Crear workbook de Excel
-        workbook = openpyxl.Workbook()
-        worksheet = workbook.active
-        worksheet.title = "Datos_RPA"
-        
         # Definir headers optimizados para RPA
-        headers_rpa = [
-            'WO', 'MANT', 'CLIENTE', 'REFERENCIA', 'TIPO', 'CANTIDAD',
-            'PRECIO', 'CUOTA', 'TECNICO', 'PAGO',
-            'WOQ_CONTRATO', 'WOQ_N_WO', 'WOQ_CLIENTE', 'WOQ_DEALER',
-            'WOQ_STATUS1', 'WOQ_STATUS2', 'WOQ_CERRADO',
-            'ESTADO_CRUCE', 'APTO_RPA', 'TIMESTAMP_PROCESAMIENTO',
-            'CONFIANZA_CORRELACION'
-        ]
-        
-        # Escribir headers con formato
-        for col, header in enumerate(headers_rpa, 1):
-            cell = worksheet.cell(row=1, column=col, value=header)
-            cell.font = openpyxl.styles.Font(bold=True)
-            cell.fill = openpyxl.styles.PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-            cell.font = openpyxl.styles.Font(color="FFFFFF", bold=True)
-        
-        # Escribir datos
-        for row_idx, registro in enumerate(registros_rpa, 2):
-            worksheet.cell(row=row_idx, column=1, value=registro.get('wo', ''))
-            worksheet.cell(row=row_idx, column=2, value=registro.get('mant', ''))
-            worksheet.cell(row=row_idx, column=3, value=registro.get('cliente', ''))
-            worksheet.cell(row=row_idx, column=4, value=registro.get('referencia', ''))
-            worksheet.cell(row=row_idx, column=5, value=registro.get('tipo', ''))
-            worksheet.cell(row=row_idx, column=6, value=registro.get('cantidad', ''))
-            worksheet.cell(row=row_idx, column=7, value=registro.get('precio', ''))
-            worksheet.cell(row=row_idx, column=8, value=registro.get('cuota', ''))
-            worksheet.cell(row=row_idx, column=9, value=registro.get('tecnico', ''))
-            worksheet.cell(row=row_idx, column=10, value=registro.get('pago', ''))
-            worksheet.cell(row=row_idx, column=11, value=registro.get('woq_contrato', ''))
-            worksheet.cell(row=row_idx, column=12, value=registro.get('woq_n_wo', ''))
-            worksheet.cell(row=row_idx, column=13, value=registro.get('woq_cliente', ''))
-            worksheet.cell(row=row_idx, column=14, value=registro.get('woq_dealer', ''))
-            worksheet.cell(row=row_idx, column=15, value=registro.get('woq_status1', ''))
-            worksheet.cell(row=row_idx, column=16, value=registro.get('woq_status2', ''))
-            worksheet.cell(row=row_idx, column=17, value=registro.get('woq_cerrado', ''))
-            worksheet.cell(row=row_idx, column=18, value=registro.get('estado_cruce', ''))
-            worksheet.cell(row=row_idx, column=19, value='SÍ' if registro.get('apto_rpa') else 'NO')
-            worksheet.cell(row=row_idx, column=20, value=datetime.now().isoformat())
-            worksheet.cell(row=row_idx, column=21, value=registro.get('confianza_correlacion', 0.0))
-        
-        # Aplicar formato a la tabla
-        aplicar_formato_rpa(worksheet, len(registros_rpa))
-        
-        # Guardar archivo
-        workbook.save(ruta_archivo)
+        headers_rpa = list(ANCHOS_COLUMNAS_RPA)
+        columnas = registros_rpa.reindex(columns=list(COLUMNAS_CRUCE_RPA.values())).astype(object)
+        columnas = columnas.where(columnas.notna(), '')
+        columnas['TIMESTAMP_PROCESAMIENTO'] = datetime.now().isoformat()
+
+        # Escritura en streaming con formato RPA (estilos con nombre)
+        escribir_excel(
+            ruta_archivo, headers_rpa, columnas.itertuples(index=False, name=None),
+            titulo_hoja="Datos_RPA",
+            anchos=_anchos_por_letra(ANCHOS_COLUMNAS_RPA),
+            filas_alternas=True,
+        )
         
         logger.info(f"✅ Exportación RPA completada: {len(registros_rpa)} registros")
         
@@ -224,71 +510,6 @@ def exportar_datos_rpa(datos_cruzados: List[Dict], carpeta_destino: str) -> Dict
             'message': error_msg
         }
 
-def aplicar_formato_rpa(worksheet, num_registros: int):
-    """
-    Aplica formato profesional a la hoja de Excel para RPA
-    
-    Args:
-        worksheet: Hoja de trabajo de openpyxl
-        num_registros: Número de registros de datos
-    """
-    try:
-        # Ajustar ancho de columnas
-        column_widths = {
-            'A': 12,  # WO
-            'B': 15,  # MANT
-            'C': 25,  # CLIENTE
-            'D': 20,  # REFERENCIA
-            'E': 8,   # TIPO
-            'F': 10,  # CANTIDAD
-            'G': 12,  # PRECIO
-            'H': 10,  # CUOTA
-            'I': 15,  # TECNICO
-            'J': 10,  # PAGO
-            'K': 15,  # WOQ_CONTRATO
-            'L': 12,  # WOQ_N_WO
-            'M': 25,  # WOQ_CLIENTE
-            'N': 15,  # WOQ_DEALER
-            'O': 12,  # WOQ_STATUS1
-            'P': 12,  # WOQ_STATUS2
-            'Q': 10,  # WOQ_CERRADO
-            'R': 15,  # ESTADO_CRUCE
-            'S': 10,  # APTO_RPA
-            'T': 20,  # TIMESTAMP
-            'U': 15   # CONFIANZA
-        }
-        
-        for col, width in column_widths.items():
-            worksheet.column_dimensions[col].width = width
-        
-        # Aplicar bordes a toda la tabla
-        thin_border = openpyxl.styles.Border(
-            left=openpyxl.styles.Side(style='thin'),
-            right=openpyxl.styles.Side(style='thin'),
-            top=openpyxl.styles.Side(style='thin'),
-            bottom=openpyxl.styles.Side(style='thin')
-        )
-        
-        for row in range(1, num_registros + 2):  # +2 para incluir header y todos los datos
-            for col in range(1, len(column_widths) + 1):
-                worksheet.cell(row=row, column=col).border = thin_border
-        
-        # Aplicar formato alternado a las filas de datos
-        light_fill = openpyxl.styles.PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
-        
-        for row in range(2, num_registros + 2):  # Empezar desde fila 2 (después del header)
-            if row % 2 == 0:  # Filas pares
-                for col in range(1, len(column_widths) + 1):
-                    worksheet.cell(row=row, column=col).fill = light_fill
-        
-        # Congelar primera fila (headers)
-        worksheet.freeze_panes = 'A2'
-        
-        logger.info("✅ Formato aplicado a la hoja de Excel")
-        
-    except Exception as e:
-        logger.warning(f"⚠️ Error al aplicar formato: {str(e)}")
-
 def validar_integridad_cruce(registro_wo: Dict, registro_woq: Dict) -> Dict[str, Any]:
     """
     Valida la integridad de un cruce específico entre registros WO y WOQ
@@ -348,59 +569,172 @@ def validar_integridad_cruce(registro_wo: Dict, registro_woq: Dict) -> Dict[str,
         'puntuacion_confianza': puntuacion_confianza
     }
 
-def generar_reporte_cruce(datos_cruzados: List[Dict], estadisticas: Dict) -> str:
+# Dimensiones del reporte: (clave, título, columnas candidatas en el cruce)
+DIMENSIONES_REPORTE = (
+    ("cliente", "CLIENTES", ("CLIENTE", "cliente", "woq_cliente")),
+    ("dealer", "DEALERS", ("DEALER", "woq_dealer")),
+    ("status1", "STATUS1", ("STATUS1", "woq_status1")),
+    ("status2", "STATUS2", ("STATUS2", "woq_status2")),
+    ("estado", "ESTADOS PASO 1", ("Estado_Paso1", "estado_paso1", "estado")),
+)
+
+def _mascara_apto(df: pd.DataFrame) -> np.ndarray:
+    """Filas aptas para RPA, leyendo la columna tipada si existe"""
+    if "apto_rpa_cod" in df.columns:
+        return (df["apto_rpa_cod"] == 1).to_numpy()
+    col = primera_columna(df, ("Apto RPA", "APTO_RPA", "apto_rpa"))
+    if col is None:
+        return np.zeros(len(df), dtype=bool)
+    if pd.api.types.is_bool_dtype(df[col]):
+        return df[col].fillna(False).to_numpy(dtype=bool)
+    texto = df[col].astype("string").str.strip().str.upper()
+    return texto.isin(("SI", "SÍ", "TRUE", "YES", "1")).fillna(False).to_numpy(dtype=bool)
+
+def construir_reporte_cruce(datos_cruzados, estadisticas: Dict, top_n: int = 10) -> Dict[str, Any]:
+    """
+    Calcula el reporte del cruce como datos estructurados (para la UI y el texto)
+
+    Cada dimensión (cliente, dealer, STATUS1, STATUS2, estado del Paso 1) se
+    agrega en una sola pasada vectorizada (factorize + bincount) y el top-N se
+    obtiene con un heap, sin ordenar todos los grupos.
+
+    Args:
+        datos_cruzados: Cruce como DataFrame (construir_cruce) o lista de registros
+        estadisticas: Estadísticas del cruce
+        top_n: Número de grupos por dimensión a incluir
+
+    Returns:
+        Diccionario con 'generado', 'estadisticas' y 'dimensiones'; cada
+        dimensión tiene 'columna', 'total_grupos' y 'top' [{valor, total, aptos_rpa}]
+    """
+    df = datos_cruzados if isinstance(datos_cruzados, pd.DataFrame) else _como_dataframe(datos_cruzados)
+    apto = _mascara_apto(df) if not df.empty else np.zeros(0, dtype=bool)
+
+    dimensiones: Dict[str, Any] = {}
+    for clave, _, candidatas in DIMENSIONES_REPORTE:
+        col = primera_columna(df, candidatas)
+        if col is None or df.empty:
+            continue
+        # Agregación agrupada: códigos de grupo + conteos con bincount
+        codigos, valores = pd.factorize(df[col], use_na_sentinel=False)
+        totales = np.bincount(codigos, minlength=len(valores))
+        aptos_grupo = np.bincount(codigos, weights=apto, minlength=len(valores))
+        top = heapq.nlargest(
+            top_n,
+            zip(totales, aptos_grupo, valores),
+            key=lambda t: t[0]
+        )
+        dimensiones[clave] = {
+            "columna": col,
+            "total_grupos": len(valores),
+            "top": [
+                {
+                    "valor": "Sin dato" if pd.isna(valor) else str(valor),
+                    "total": int(total),
+                    "aptos_rpa": int(aptos),
+                }
+                for total, aptos, valor in top
+            ],
+        }
+
+    return {
+        "generado": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "estadisticas": dict(estadisticas or {}),
+        "dimensiones": dimensiones,
+    }
+
+def construir_reporte_cruce_sqlite(conn, estadisticas: Dict, top_n: int = 10,
+                                   tabla: str = "temp_cruce") -> Dict[str, Any]:
+    """
+    construir_reporte_cruce sobre el cruce guardado en SQLite (cruce fuera de
+    memoria): un GROUP BY por dimensión, sin cargar la tabla. Los empates se
+    resuelven como en memoria, por la primera aparición en el orden del Paso 2.
+
+    Returns:
+        Mismo formato que construir_reporte_cruce
+    """
+    existentes = {fila[1] for fila in conn.execute(f"PRAGMA table_info({tabla})")}
+    dimensiones: Dict[str, Any] = {}
+    for clave, _, candidatas in DIMENSIONES_REPORTE:
+        col = next((c for c in candidatas if c in existentes), None)
+        if col is None:
+            continue
+        # COUNT(*) OVER () se evalúa tras el GROUP BY: número de grupos
+        filas = conn.execute(
+            f'SELECT "{col}", COUNT(*) AS total, SUM(apto_rpa_cod = 1), COUNT(*) OVER () '
+            f'FROM {tabla} GROUP BY "{col}" ORDER BY total DESC, MIN(id_paso2) LIMIT ?',
+            (top_n,)
+        ).fetchall()
+        if not filas:
+            continue
+        dimensiones[clave] = {
+            "columna": col,
+            "total_grupos": int(filas[0][3]),
+            "top": [
+                {
+                    "valor": "Sin dato" if valor is None else str(valor),
+                    "total": int(total),
+                    "aptos_rpa": int(aptos or 0),
+                }
+                for valor, total, aptos, _ in filas
+            ],
+        }
+
+    return {
+        "generado": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "estadisticas": dict(estadisticas or {}),
+        "dimensiones": dimensiones,
+    }
+
+def generar_reporte_cruce(datos_cruzados, estadisticas: Dict, reporte: Optional[Dict[str, Any]] = None) -> str:
     """
     Genera un reporte textual del proceso de cruce
     
     Args:
-        datos_cruzados: Lista de registros cruzados
+        datos_cruzados: Lista de registros cruzados (o DataFrame del cruce)
         estadisticas: Estadísticas del cruce
+        reporte: Reporte ya calculado con construir_reporte_cruce (opcional)
         
     Returns:
         String con el reporte formateado
     """
-    reporte = []
-    reporte.append("=" * 60)
-    reporte.append("REPORTE DE CRUCE DE DATOS - WOGEST")
-    reporte.append("=" * 60)
-    reporte.append(f"Fecha de procesamiento: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    reporte.append("")
+    if reporte is None:
+        reporte = construir_reporte_cruce(datos_cruzados, estadisticas)
+
+    lineas = []
+    lineas.append("=" * 60)
+    lineas.append("REPORTE DE CRUCE DE DATOS - WOGEST")
+    lineas.append("=" * 60)
+    lineas.append(f"Fecha de procesamiento: {reporte['generado']}")
+    lineas.append("")
     
-    reporte.append("ESTADÍSTICAS GENERALES:")
-    reporte.append(f"  • Total registros Paso 1: {estadisticas.get('total_paso1', 0)}")
-    reporte.append(f"  • Registros cruzados exitosamente: {estadisticas.get('total_cruzados', 0)}")
-    reporte.append(f"  • Registros sin WOQ: {estadisticas.get('sin_woq', 0)}")
-    reporte.append(f"  • Porcentaje de cruce: {estadisticas.get('porcentaje_cruce', 0)}%")
-    reporte.append("")
+    lineas.append("ESTADÍSTICAS GENERALES:")
+    lineas.append(f"  • Total registros Paso 1: {estadisticas.get('total_paso1', 0)}")
+    lineas.append(f"  • Registros cruzados exitosamente: {estadisticas.get('total_cruzados', 0)}")
+    lineas.append(f"  • Registros sin WOQ: {estadisticas.get('sin_woq', 0)}")
+    lineas.append(f"  • Porcentaje de cruce: {estadisticas.get('porcentaje_cruce', 0)}%")
+    lineas.append("")
     
-    reporte.append("ANÁLISIS DE ESTADOS:")
-    reporte.append(f"  • Registros cerrados: {estadisticas.get('cerrados', 0)}")
-    reporte.append(f"  • Registros pendientes: {estadisticas.get('pendientes_cierre', 0)}")
-    reporte.append(f"  • Aptos para RPA: {estadisticas.get('aptos_rpa', 0)}")
-    reporte.append(f"  • Porcentaje aptos RPA: {estadisticas.get('porcentaje_aptos_rpa', 0)}%")
-    reporte.append("")
+    lineas.append("ANÁLISIS DE ESTADOS:")
+    lineas.append(f"  • Registros cerrados: {estadisticas.get('cerrados', 0)}")
+    lineas.append(f"  • Registros pendientes: {estadisticas.get('pendientes_cierre', 0)}")
+    lineas.append(f"  • Aptos para RPA: {estadisticas.get('aptos_rpa', 0)}")
+    lineas.append(f"  • Porcentaje aptos RPA: {estadisticas.get('porcentaje_aptos_rpa', 0)}%")
     
-    # Análisis por cliente (top 10)
-    if datos_cruzados:
-        clientes = {}
-        for registro in datos_cruzados:
-            cliente = registro.get('cliente', 'Sin cliente')
-            if cliente not in clientes:
-                clientes[cliente] = {'total': 0, 'aptos_rpa': 0}
-            clientes[cliente]['total'] += 1
-            if registro.get('apto_rpa', False):
-                clientes[cliente]['aptos_rpa'] += 1
-        
-        top_clientes = sorted(clientes.items(), key=lambda x: x[1]['total'], reverse=True)[:10]
-        
-        reporte.append("TOP 10 CLIENTES POR VOLUMEN:")
-        for cliente, datos in top_clientes:
-            reporte.append(f"  • {cliente}: {datos['total']} registros ({datos['aptos_rpa']} aptos RPA)")
+    # Análisis por dimensión (top N por volumen)
+    for clave, titulo, _ in DIMENSIONES_REPORTE:
+        dimension = reporte["dimensiones"].get(clave)
+        if not dimension:
+            continue
+        lineas.append("")
+        lineas.append(f"TOP {len(dimension['top'])} {titulo} POR VOLUMEN (de {dimension['total_grupos']}):")
+        for grupo in dimension["top"]:
+            lineas.append(f"  • {grupo['valor']}: {grupo['total']} registros ({grupo['aptos_rpa']} aptos RPA)")
     
-    reporte.append("")
-    reporte.append("=" * 60)
+    lineas.append("")
+    lineas.append("=" * 60)
     
-    return "\n".join(reporte)
+    return "\n".join(lineas)
 
 # Funciones de utilidad adicionales
 
@@ -441,24 +775,20 @@ def ejecutar_paso3_y_exportar():
     df1 = leer_temp_paso1()
     df2 = leer_temp_paso2()
 
-    # Convertir a listas de diccionarios
-    datos_paso1 = df1.to_dict(orient="records")
-    datos_paso2 = df2.to_dict(orient="records")
-
     # Realizar el cruce (usa la función ya existente en este mismo archivo)
-    resultado = realizar_cruce_datos(datos_paso1, datos_paso2)
+    resultado = realizar_cruce_datos(df1, df2)
 
     if resultado.get("success"):
         df_cruce = pd.DataFrame(resultado.get("datos_cruzados", []))
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         os.makedirs("exportables", exist_ok=True)
         export_path = f"exportables/cruce_paso3_{timestamp}.xlsx"
-        df_cruce.to_excel(export_path, index=False)
-        print(f"✅ Exportado archivo: {export_path}")
+        exportar_dataframe_excel(df_cruce, export_path)
+        logger.info(f"✅ Exportado archivo: {export_path}")
 
         # Limpieza de datos temporales
         limpiar_tablas_temporales()
-        print("🧹 Tablas temporales limpiadas.")
+        logger.info("🧹 Tablas temporales limpiadas.")
     else:
-        print(f"⚠️ Cruce fallido: {resultado.get('message')}")
+        logger.warning(f"⚠️ Cruce fallido: {resultado.get('message')}")
 
@@ -1,138 +1,368 @@
 # paso4.py - Backend del Paso 4 (Exportación RPA)
-# Requiere: paso3.realizar_cruce_datos y procesamiento.db_sqlite.*
+# Requiere: procesamiento.paso3.construir_cruce y procesamiento.db_sqlite.*
 
 from __future__ import annotations
-import os, sys, logging
+import os, sys, logging, json, hashlib, heapq, math
 from datetime import datetime
-from typing import Any, Dict, List, Optional
-
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Border, Side
-
-from paso3 import realizar_cruce_datos
+from typing import Any, Dict, List, Optional, Tuple
+
+
+import numpy as np
+import pandas as pd
+
+from procesamiento.canonico import (
+    EstadoCodigo,
+    codificar_estado,
+    columna_cerrado,
+    normalizar_cerrado,
+)
+from procesamiento.paso3 import construir_cruce, registros_visibles
+from procesamiento.serializacion import registros_json
+from procesamiento.exportador_texto import (
+    FORMATO_POR_DEFECTO,
+    escribir_filas,
+    extension_formato,
+    normalizar_formato,
+)
 from procesamiento.db_sqlite import leer_temp_paso1, leer_temp_paso2, limpiar_tablas_temporales
+from procesamiento.trabajos import reportar_progreso
+from procesamiento.metricas import medido
+from procesamiento.perfilado import perfilado
 
 try:
     import webview
 except Exception:
     webview = None
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
 log = logging.getLogger("paso4")
 
-# ------------------------- helpers de normalización -------------------------
-
-def _get_wo(row: Dict[str, Any]) -> str:
-    for k in ("WO", "wo", "N_WO", "N°_WO", "N_WO2"):
-        if k in row and row[k] is not None:
-            return str(row[k]).strip()
-    return ""
-
-def _get_orden_contrato(row: Dict[str, Any]) -> str:
-    for k in ("ORDEN_CONTRATO", "CONTRATO", "woq_contrato", "WOQ_CONTRATO"):
-        if k in row and row[k] is not None:
-            return str(row[k]).strip()
-    return ""
-
-def _val_es_cerrado(row: Dict[str, Any]) -> int:
-    # normaliza a 0/1 leyendo variantes
-    for k in ("es_cerrado", "ES_CERRADO", "woq_es_cerrado", "WOQ_ES_CERRADO", "woq_cerrado", "WOQ_CERRADO"):
-        if k in row and row[k] is not None:
-            v = str(row[k]).strip().upper()
-            if v in ("1","SI","SÍ","TRUE","YES"): return 1
-            if v in ("0","NO","FALSE"): return 0
-            if v.isdigit(): return 1 if int(v)!=0 else 0
-    return 0
-
-def _val_estado_paso1(row: Dict[str, Any]) -> str:
-    for k in ("Estado_Paso1","estado_paso1","ESTADO_PASO1"):
-        if k in row and row[k] is not None:
-            return str(row[k]).strip()
-    return ""
-
-def _val_apto_rpa(row: Dict[str, Any]) -> str:
-    for k in ("Apto RPA","APTO_RPA","apto_rpa"):
-        if k in row and row[k] is not None:
-            v = str(row[k]).strip().upper()
-            if v in ("SI","SÍ","TRUE","YES","1"): return "SÍ"
-            if v in ("NO","FALSE","0"): return "NO"
-    return ""
+# Columnas del fichero que consumen los bots RPA
+COLUMNAS_RPA = ["WO", "ORDEN_CONTRATO"]
+
+# Variantes de nombre admitidas (cruce del backend o 'detalle' enviado por la UI)
+CANDIDATAS_WO_RPA = ("WO", "wo", "N_WO", "N°_WO", "N_WO2")
+CANDIDATAS_CONTRATO_RPA = ("ORDEN_CONTRATO", "CONTRATO", "woq_contrato", "WOQ_CONTRATO")
+# Contrato al que pertenece cada orden (agrupación de las particiones)
+CANDIDATAS_AGRUPACION_RPA = ("CONTRATO", "WOQ_CONTRATO", "woq_contrato", "N_CONTRATO")
+CANDIDATAS_ESTADO_PASO1 = ("Estado_Paso1", "estado_paso1", "ESTADO_PASO1")
+CANDIDATAS_APTO_RPA = ("Apto RPA", "APTO_RPA", "apto_rpa")
+
+VALORES_APTO = ("SI", "SÍ", "TRUE", "YES", "1")
+
+# ------------------------- selección columnar -------------------------
+
+def _texto_coalescido(df: pd.DataFrame, candidatas) -> pd.Series:
+    """
+    Primer valor no nulo entre las columnas `candidatas`, como texto sin espacios.
+    Los enteros leídos como float (8000.0) se escriben sin decimales.
+    """
+    resultado = pd.Series(pd.NA, index=df.index, dtype="string")
+    for col in candidatas:
+        if col not in df.columns:
+            continue
+        serie = df[col]
+        if pd.api.types.is_float_dtype(serie) and (serie.dropna() % 1 == 0).all():
+            serie = serie.astype("Int64")
+        resultado = resultado.fillna(serie.astype("string").str.strip())
+    return resultado
+
+def mascara_exportable(cruce: pd.DataFrame) -> np.ndarray:
+    """
+    Filas exportables al RPA: WO abierta (cerrado == 0), estado del Paso 1
+    'Correcto' y 'Apto RPA' = SÍ.
+
+    Usa las columnas tipadas del cruce (estado_paso1_cod, apto_rpa_cod) cuando
+    existen; si no (p. ej. 'detalle' devuelto por la UI) las deriva por columnas.
+    """
+    col_cerrado = columna_cerrado(cruce)
+    if col_cerrado is None:
+        abierta = np.ones(len(cruce), dtype=bool)
+    else:
+        abierta = normalizar_cerrado(cruce[col_cerrado]).to_numpy() == 0
+
+    if "estado_paso1_cod" in cruce.columns:
+        estado = cruce["estado_paso1_cod"].to_numpy()
+    else:
+        estado = codificar_estado(_texto_coalescido(cruce, CANDIDATAS_ESTADO_PASO1)).to_numpy()
+
+    if "apto_rpa_cod" in cruce.columns:
+        apto = cruce["apto_rpa_cod"].to_numpy() == 1
+    else:
+        texto_apto = _texto_coalescido(cruce, CANDIDATAS_APTO_RPA).str.upper()
+        apto = texto_apto.isin(VALORES_APTO).fillna(False).to_numpy(dtype=bool)
+
+    return abierta & (estado == EstadoCodigo.CORRECTO) & apto
+
+@medido("paso4.seleccion")
+def seleccionar_exportables(cruce, incluir_contrato: bool = False) -> pd.DataFrame:
+    """
+    Aplica las condiciones del Paso 4 y devuelve un DataFrame con SOLO las
+    columnas WO y ORDEN_CONTRATO (texto). Sin deduplicar.
+
+    Args:
+        cruce: DataFrame del cruce (construir_cruce) o lista de registros
+        incluir_contrato: Añade la columna CONTRATO (para particionar); no se
+            escribe en el fichero del RPA
+
+    Returns:
+        DataFrame (WO, ORDEN_CONTRATO[, CONTRATO]) con las filas exportables
+    """
+    columnas = COLUMNAS_RPA + ["CONTRATO"] if incluir_contrato else COLUMNAS_RPA
+    if not isinstance(cruce, pd.DataFrame):
+        cruce = pd.DataFrame(list(cruce or []))
+    if cruce.empty:
+        return pd.DataFrame(columns=columnas, dtype="string")
+
+    filas = cruce[mascara_exportable(cruce)]
+    seleccion = pd.DataFrame({
+        "WO": _texto_coalescido(filas, CANDIDATAS_WO_RPA),
+        "ORDEN_CONTRATO": _texto_coalescido(filas, CANDIDATAS_CONTRATO_RPA),
+    })
+    if incluir_contrato:
+        seleccion["CONTRATO"] = _texto_coalescido(filas, CANDIDATAS_AGRUPACION_RPA)
+    seleccion = seleccion.fillna("")
+    con_valor = seleccion["WO"].ne("") | seleccion["ORDEN_CONTRATO"].ne("")
+    return seleccion[con_valor].reset_index(drop=True)
 
 # ------------------------- lectura/cruce -------------------------
 
 def _cargar_cruce() -> Dict[str, Any]:
     df1 = leer_temp_paso1()
     df2 = leer_temp_paso2()
-    datos_p1 = df1.to_dict(orient="records")
-    datos_p2 = df2.to_dict(orient="records")
-    res = realizar_cruce_datos(datos_p1, datos_p2)
-    if not res.get("success"):
-        return {"success": False, "message": res.get("message","Error en cruce")}
-    return res
-
-def _filtrar_para_exportar(datos_cruzados: List[Dict[str,Any]]) -> List[Dict[str,str]]:
-    """
-    Aplica tus condiciones y devuelve filas con SOLO columnas:
-    - WO
-    - ORDEN_CONTRATO
-    Sin deduplicar.
-    """
-    out: List[Dict[str,str]] = []
-    for r in datos_cruzados:
-        if _val_es_cerrado(r) != 0:
-            continue
-        if _val_estado_paso1(r).upper() != "CORRECTO":
-            continue
-        if _val_apto_rpa(r) != "SÍ":
-            continue
-        wo = _get_wo(r)
-        contrato = _get_orden_contrato(r)
-        if wo or contrato:
-            out.append({"WO": wo, "ORDEN_CONTRATO": contrato})
-    return out
+    if df1.empty:
+        return {"success": False, "message": "No hay datos del Paso 1 (WorkOrder)"}
+    if df2.empty:
+        return {"success": False, "message": "No hay datos del Paso 2 (WOQ)"}
+    return {"success": True, "cruce": construir_cruce(df1, df2)}
 
 # ------------------------- exportación -------------------------
 
-def _exportar_excel_wo_contrato(filas: List[Dict[str,str]], carpeta_destino: str) -> Dict[str,Any]:
-    if not filas:
+@medido("paso4.escritura", perfil_memoria=True)
+@perfilado("paso4.escritura")
+def escribir_seleccion_rpa(seleccion, ruta: str, formato: str = FORMATO_POR_DEFECTO) -> int:
+    """
+    Escribe la selección (WO, ORDEN_CONTRATO) en `ruta` en el formato pedido
+    (xlsx, csv, csv.gz, jsonl, jsonl.gz). Las filas salen directamente de las
+    columnas de la selección, sin copiarla.
+
+    Args:
+        seleccion: DataFrame de seleccionar_exportables o iterable de lotes
+    """
+    lotes = [seleccion] if isinstance(seleccion, pd.DataFrame) else seleccion
+    filas = (fila for lote in lotes for fila in zip(lote["WO"], lote["ORDEN_CONTRATO"]))
+    return escribir_filas(ruta, formato, COLUMNAS_RPA, filas, titulo_hoja="RPA",
+                          anchos={"A": 20, "B": 28}, bordes=True, fijar_encabezado=False)
+
+def _exportar_wo_contrato(filas: pd.DataFrame, carpeta_destino: str,
+                          formato: str = FORMATO_POR_DEFECTO,
+                          particiones: Optional[int] = None,
+                          max_filas: Optional[int] = None) -> Dict[str,Any]:
+    if filas.empty:
         return {"success": False, "message": "No hay registros que cumplan las condiciones."}
 
+    formato = normalizar_formato(formato)
+    if (particiones or 1) > 1 or max_filas:
+        return exportar_particionado(filas, carpeta_destino, formato, particiones, max_filas)
+
     os.makedirs(carpeta_destino, exist_ok=True)
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    nombre = f"RPA_WO_ORDEN_CONTRATO_{ts}.xlsx"
+    nombre = f"RPA_WO_ORDEN_CONTRATO_{ts}{extension_formato(formato)}"
     ruta = os.path.join(carpeta_destino, nombre)
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "RPA"
+    total = escribir_seleccion_rpa(filas, ruta, formato)
 
-    # headers
-    ws.cell(1,1,"WO")
-    ws.cell(1,2,"ORDEN_CONTRATO")
-    for c in ("A1","B1"):
-        ws[c].font = Font(bold=True, color="FFFFFF")
-        ws[c].fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    return {
+        "success": True,
+        "archivo": ruta,
+        "formato": formato,
+        "total_registros": total,
+        "message": f"Exportadas {total} filas (WO, ORDEN_CONTRATO) a {nombre}",
+    }
 
-    # datos
-    for i, fila in enumerate(filas, start=2):
-        ws.cell(i,1, fila.get("WO",""))
-        ws.cell(i,2, fila.get("ORDEN_CONTRATO",""))
+# ------------------------- exportación particionada -------------------------
+#
+# Para repartir el trabajo entre varios bots la selección se divide en N
+# ficheros (o en ficheros de como mucho K filas). Todas las órdenes de un
+# contrato van al mismo fichero y las filas se equilibran asignando cada
+# contrato, de mayor a menor, al fichero con menos filas. Al final se escribe
+# un manifiesto JSON con la lista de ficheros: cuando existe, todos los
+# ficheros están completos y cada bot puede tomar el suyo.
 
-    ws.column_dimensions["A"].width = 20
-    ws.column_dimensions["B"].width = 28
+NOMBRE_MANIFIESTO = "manifiesto.json"
 
-    thin = Border(left=Side(style="thin"), right=Side(style="thin"), top=Side(style="thin"), bottom=Side(style="thin"))
-    for r in range(1, len(filas)+2):
-        ws.cell(r,1).border = thin
-        ws.cell(r,2).border = thin
+def opciones_particion(payload: Dict[str, Any]) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Lee 'particiones' y 'max_filas_particion' del payload de exportación
+    (o de payload['datos']).
 
-    wb.save(ruta)
+    Raises:
+        ValueError: si no son enteros positivos
+    """
+    datos = payload.get("datos") or {}
+    valores = []
+    for clave in ("particiones", "max_filas_particion"):
+        valor = payload.get(clave, datos.get(clave))
+        if valor in (None, "", 0, "0"):
+            valores.append(None)
+            continue
+        try:
+            numero = int(valor)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{clave}' debe ser un número entero: {valor}") from None
+        if numero < 1:
+            raise ValueError(f"'{clave}' debe ser mayor que cero: {valor}")
+        valores.append(numero)
+    return valores[0], valores[1]
+
+def _codigos_contrato(contratos: pd.Series) -> np.ndarray:
+    """Código de grupo por fila; las filas sin contrato forman un grupo cada una"""
+    claves = contratos.fillna("").astype(str).str.strip()
+    sin_contrato = (claves == "").to_numpy()
+    # El contrato vacío no se factoriza: sería un grupo sin filas que ocuparía una partición
+    codigos, unicos = pd.factorize(claves.mask(sin_contrato))
+    if sin_contrato.any():
+        codigos = codigos.copy()
+        codigos[sin_contrato] = len(unicos) + np.arange(int(sin_contrato.sum()))
+    return codigos
+
+def _repartir_grupos(tamanos: np.ndarray, num_particiones: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Asigna cada grupo a la partición con menos filas, de mayor a menor grupo.
 
+    Returns:
+        (partición de cada grupo, filas por partición, grupos por partición)
+    """
+    asignacion = np.empty(len(tamanos), dtype=np.int64)
+    cargas = np.zeros(num_particiones, dtype=np.int64)
+    grupos = np.zeros(num_particiones, dtype=np.int64)
+    monticulo = [(0, i) for i in range(num_particiones)]
+    for grupo in np.argsort(-tamanos, kind="stable"):
+        carga, particion = heapq.heappop(monticulo)
+        asignacion[grupo] = particion
+        carga += int(tamanos[grupo])
+        cargas[particion] = carga
+        grupos[particion] += 1
+        heapq.heappush(monticulo, (carga, particion))
+    return asignacion, cargas, grupos
+
+def particionar_por_contrato(contratos: pd.Series, particiones: Optional[int] = None,
+                             max_filas: Optional[int] = None) -> List[np.ndarray]:
+    """
+    Divide las filas en particiones equilibradas sin separar un contrato.
+
+    Args:
+        contratos: Contrato de cada fila (selección con incluir_contrato=True)
+        particiones: Número de particiones pedido
+        max_filas: Máximo de filas por partición. Un contrato con más filas
+            que el máximo ocupa una partición él solo.
+
+    Returns:
+        Lista de arrays con las posiciones de fila de cada partición (en el
+        orden original), sin particiones vacías
+    """
+    total = len(contratos)
+    if total == 0:
+        return []
+    codigos = _codigos_contrato(contratos)
+    tamanos = np.bincount(codigos)
+    num_grupos = len(tamanos)
+
+    num = max(particiones or 1, math.ceil(total / max_filas) if max_filas else 1)
+    num = min(num, num_grupos)
+    while True:
+        asignacion, cargas, grupos = _repartir_grupos(tamanos, num)
+        excedidas = (cargas > max_filas) & (grupos > 1) if max_filas else np.zeros(num, dtype=bool)
+        if not excedidas.any() or num >= num_grupos:
+            break
+        num += 1
+
+    particion_fila = asignacion[codigos]
+    orden = np.argsort(particion_fila, kind="stable")
+    limites = np.searchsorted(particion_fila[orden], np.arange(num + 1))
+    return [orden[limites[i]:limites[i + 1]] for i in range(num) if limites[i + 1] > limites[i]]
+
+def _resumen_archivo(ruta: str) -> Dict[str, Any]:
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloque)
+    return {"bytes": os.path.getsize(ruta), "sha256": sha.hexdigest()}
+
+@medido("paso4.particionado", perfil_memoria=True)
+@perfilado("paso4.particionado")
+def exportar_particionado(seleccion: pd.DataFrame, carpeta_destino: str,
+                          formato: str = FORMATO_POR_DEFECTO,
+                          particiones: Optional[int] = None,
+                          max_filas: Optional[int] = None) -> Dict[str,Any]:
+    """
+    Escribe la selección en varios ficheros (uno por partición) dentro de una
+    carpeta RPA_WO_ORDEN_CONTRATO_<ts>/ junto con su manifiesto.
+
+    Args:
+        seleccion: DataFrame de seleccionar_exportables(..., incluir_contrato=True)
+        carpeta_destino: Carpeta donde se crea la carpeta de la exportación
+        formato: Formato de cada fichero (ver exportador_texto)
+        particiones / max_filas: Ver particionar_por_contrato
+    """
+    if seleccion.empty:
+        return {"success": False, "message": "No hay registros que cumplan las condiciones."}
+
+    formato = normalizar_formato(formato)
+    if "CONTRATO" not in seleccion.columns:
+        # Sin contrato cada orden se reparte por separado
+        seleccion = seleccion.assign(CONTRATO="")
+    grupos = particionar_por_contrato(seleccion["CONTRATO"], particiones, max_filas)
+
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    base = f"RPA_WO_ORDEN_CONTRATO_{ts}"
+    carpeta = os.path.join(carpeta_destino, base)
+    os.makedirs(carpeta, exist_ok=True)
+
+    num = len(grupos)
+    archivos = []
+    for indice, posiciones in enumerate(grupos, start=1):
+        reportar_progreso(10 + 80 * (indice - 1) / num, f"Partición {indice} de {num}")
+        parte = seleccion.iloc[posiciones]
+        nombre = f"{base}_parte{indice:03d}de{num:03d}{extension_formato(formato)}"
+        ruta = os.path.join(carpeta, nombre)
+        filas = escribir_seleccion_rpa(parte, ruta, formato)
+        archivos.append({
+            "particion": indice,
+            "archivo": nombre,
+            "filas": filas,
+            "contratos": int(parte["CONTRATO"].replace("", pd.NA).nunique()),
+            **_resumen_archivo(ruta),
+        })
+
+    total = sum(a["filas"] for a in archivos)
+    manifiesto = {
+        "generado": datetime.now().isoformat(timespec="seconds"),
+        "formato": formato,
+        "columnas": COLUMNAS_RPA,
+        "total_registros": total,
+        "total_particiones": num,
+        "criterio": {"particiones": particiones, "max_filas_particion": max_filas,
+                     "agrupacion": "CONTRATO"},
+        "particiones": archivos,
+    }
+    # El manifiesto aparece de golpe y solo cuando todos los ficheros están escritos
+    ruta_manifiesto = os.path.join(carpeta, NOMBRE_MANIFIESTO)
+    temporal = ruta_manifiesto + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, ruta_manifiesto)
+
+    filas_por_archivo = [a["filas"] for a in archivos]
+    log.info(f"📦 Exportación RPA particionada: {total} filas en {num} ficheros "
+             f"({min(filas_por_archivo)}-{max(filas_por_archivo)} filas) → {carpeta}")
     return {
         "success": True,
-        "archivo": ruta,
-        "total_registros": len(filas),
-        "message": f"Exportadas {len(filas)} filas (WO, ORDEN_CONTRATO) a {nombre}",
+        "archivo": ruta_manifiesto,
+        "carpeta": carpeta,
+        "formato": formato,
+        "total_registros": total,
+        "particiones": archivos,
+        "message": f"Exportadas {total} filas (WO, ORDEN_CONTRATO) en {num} ficheros en {base}",
     }
 
 # ------------------------- API para pywebview -------------------------
@@ -147,12 +377,13 @@ class Paso4API:
             cruce = _cargar_cruce()
             if not cruce.get("success"):
                 return cruce
-            datos = cruce.get("datos_cruzados", [])
-            seleccion = _filtrar_para_exportar(datos)
+            df_cruce = cruce["cruce"]
+            datos = registros_visibles(df_cruce)
+            seleccion = seleccionar_exportables(df_cruce)
             return {
                 "success": True,
                 "registros_rpa": datos,  # lo que pinta la tabla (si lo necesitas)
-                "seleccion_exportable": seleccion,  # lo que realmente se exporta
+                "seleccion_exportable": registros_json(seleccion),  # lo que realmente se exporta
                 "estadisticas": {
                     "total_cruzados": len(datos),
                     "total_exportables": len(seleccion),
@@ -169,19 +400,24 @@ class Paso4API:
         payload = {
             'datos': {...},            # ignorado/solo informativo
             'carpeta_destino': None|str,
-            'nombre_archivo_original': str
+            'nombre_archivo_original': str,
+            'formato': 'xlsx' | 'csv' | 'csv.gz' | 'jsonl' | 'jsonl.gz',  # opcional
+            'particiones': int,          # opcional: N ficheros para varios bots
+            'max_filas_particion': int,  # opcional: como mucho K filas por fichero
         }
         """
         try:
             carpeta = payload.get("carpeta_destino") or os.path.abspath("exportables")
+            formato = payload.get("formato") or (payload.get("datos") or {}).get("formato")
+            particiones, max_filas = opciones_particion(payload)
 
             cruce = _cargar_cruce()
             if not cruce.get("success"):
                 return cruce
 
-            datos = cruce.get("datos_cruzados", [])
-            filas = _filtrar_para_exportar(datos)
-            res = _exportar_excel_wo_contrato(filas, carpeta)
+            particionado = (particiones or 1) > 1 or bool(max_filas)
+            filas = seleccionar_exportables(cruce["cruce"], incluir_contrato=particionado)
+            res = _exportar_wo_contrato(filas, carpeta, formato, particiones, max_filas)
             if not res.get("success"):
                 return res
 
@@ -237,6 +473,9 @@ def create_api() -> Paso4API:
     return Paso4API()
 
 if __name__ == "__main__":
+    from procesamiento.bitacora import configurar_logging
+    configurar_logging(consola=True)
+
     api = Paso4API()
     if webview:
         webview.create_window("Paso 4 (test)", html="<html><body>API Paso 4 lista</body></html>", js_api=api)
@@ -0,0 +1,207 @@
+"""
+perfilado.py - Captura de perfiles de CPU (cProfile) bajo demanda
+WOGest - Sistema de Validación de Renovaciones
+
+Cuando un operador avisa de que "el paso 3 ha ido lento hoy" hacía falta una
+versión de desarrollo para saber en qué funciones se fue el tiempo. Con el
+perfil de CPU activado, cada llamada a un método de WOGestAPI o a un punto de
+entrada de los pasos marcado con @perfilado se ejecuta bajo cProfile y deja
+en logs/:
+
+- <nombre>_<fecha>_<ejecución>_<tamaño>.prof: el perfil completo (snakeviz,
+  pstats, gprof2dot)
+- el mismo nombre con .txt: resumen con las TOP_FUNCIONES funciones por tiempo
+  acumulado y por tiempo propio
+
+La ejecución es el trabajo en segundo plano o, fuera de un trabajo, la sesión;
+el tamaño es el de la entrada (filas de los DataFrames o bytes del archivo).
+Las llamadas anidadas (la API que llama al Paso 1) no abren otro perfil: el
+perfil exterior ya las incluye y solo toma de ellas el tamaño de la entrada.
+
+Se activa con la variable de entorno WOGEST_PERFIL_CPU=1 o con
+activar_perfil_cpu() / WOGestAPI.configurar_perfil_cpu.
+"""
+
+import contextvars
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+
+from procesamiento.sesiones import sesion_actual
+from procesamiento.trabajos import trabajo_actual
+
+logger = logging.getLogger(__name__)
+
+VARIABLE_ENTORNO = "WOGEST_PERFIL_CPU"
+# Funciones que se listan en el resumen de texto (por cada orden)
+TOP_FUNCIONES = 30
+
+_activo = os.environ.get(VARIABLE_ENTORNO, "").strip().lower() in ("1", "true", "si", "sí", "yes")
+_directorio = os.path.abspath("logs")
+
+
+def perfil_cpu_activo() -> bool:
+    return _activo
+
+
+def activar_perfil_cpu(activo: bool = True):
+    global _activo
+    _activo = bool(activo)
+    logger.info(f"🔬 Perfil de CPU {'activado' if activo else 'desactivado'} (destino: {_directorio})")
+
+
+def fijar_directorio_perfiles(directorio: str):
+    """Carpeta donde se escriben los .prof y sus resúmenes (por defecto ./logs)"""
+    global _directorio
+    _directorio = directorio
+
+
+# ---------------------- Tamaño de la entrada ----------------------
+
+def _formatear_bytes(n: int) -> str:
+    for unidad in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f}{unidad}"
+        n /= 1024
+    return f"{n:.1f}GB"
+
+
+def tamano_entrada(*args, **kwargs) -> Optional[str]:
+    """
+    Tamaño de los argumentos de una llamada: filas de cada DataFrame o lista,
+    bytes de cada ruta a un archivo existente ('252+202filas', '41KB').
+    """
+    filas, archivos = [], []
+    for valor in (*args, *kwargs.values()):
+        if isinstance(valor, pd.DataFrame):
+            filas.append(len(valor))
+        elif isinstance(valor, list):
+            filas.append(len(valor))
+        elif isinstance(valor, str) and len(valor) < 1024 and os.path.isfile(valor):
+            archivos.append(_formatear_bytes(os.path.getsize(valor)))
+    partes = []
+    if filas:
+        partes.append("+".join(str(n) for n in filas) + "filas")
+    partes.extend(archivos)
+    return "_".join(partes) or None
+
+
+# ---------------------- Captura ----------------------
+
+@dataclass
+class _Captura:
+    nombre: str
+    hilo: int
+    tamano: Optional[str] = None
+    terminada: bool = False
+
+
+# Captura en curso en el contexto actual (para no anidar perfiles)
+_captura_actual: contextvars.ContextVar[Optional[_Captura]] = contextvars.ContextVar("perfil_cpu", default=None)
+
+
+def _id_ejecucion() -> str:
+    trabajo = trabajo_actual()
+    return trabajo.id if trabajo is not None else sesion_actual()
+
+
+def _nombre_seguro(texto: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._+-]+", "-", texto)[:60]
+
+
+def _escribir_perfil(perfil: cProfile.Profile, captura: _Captura, segundos: float, error: bool) -> Optional[str]:
+    ejecucion = _id_ejecucion()
+    base = "_".join(_nombre_seguro(p) for p in (
+        captura.nombre, datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3], ejecucion[:12], captura.tamano or "na"))
+    ruta = os.path.join(_directorio, base)
+    try:
+        os.makedirs(_directorio, exist_ok=True)
+        perfil.dump_stats(ruta + ".prof")
+
+        texto = io.StringIO()
+        texto.write(f"Perfil CPU: {captura.nombre}\n"
+                    f"Ejecución: {ejecucion} (sesión {sesion_actual()})\n"
+                    f"Entrada: {captura.tamano or 'desconocida'}\n"
+                    f"Duración: {segundos:.3f} s{' (terminó con error)' if error else ''}\n"
+                    f"Fecha: {datetime.now().isoformat(timespec='seconds')}\n")
+        estadisticas = pstats.Stats(perfil, stream=texto).strip_dirs()
+        for orden, titulo in (("cumulative", "tiempo acumulado"), ("tottime", "tiempo propio")):
+            texto.write(f"\n===== Top {TOP_FUNCIONES} por {titulo} =====\n")
+            estadisticas.sort_stats(orden).print_stats(TOP_FUNCIONES)
+        with open(ruta + ".txt", "w", encoding="utf-8") as f:
+            f.write(texto.getvalue())
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudo escribir el perfil de CPU de {captura.nombre}: {e}")
+        return None
+    logger.info(f"🔬 Perfil CPU {captura.nombre} ({captura.tamano or 'entrada desconocida'}, {segundos:.2f} s) → {ruta}.prof")
+    return ruta + ".prof"
+
+
+def perfilado(nombre: str, tamano: Optional[Callable[..., Optional[str]]] = None) -> Callable[[Callable], Callable]:
+    """
+    Decorador: con el perfil de CPU activo, ejecuta la llamada bajo cProfile
+    y escribe el perfil en logs/. `tamano` recibe los mismos argumentos que la
+    función y describe la entrada (por defecto tamano_entrada).
+    """
+    def decorador(funcion: Callable) -> Callable:
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not _activo:
+                return funcion(*args, **kwargs)
+
+            try:
+                descripcion = (tamano or tamano_entrada)(*args, **kwargs)
+            except Exception as e:
+                logger.debug(f"No se pudo calcular el tamaño de la entrada de {nombre}: {e}")
+                descripcion = None
+
+            exterior = _captura_actual.get()
+            if exterior is not None and not exterior.terminada and exterior.hilo == threading.get_ident():
+                # Ya dentro de un perfil de este hilo: solo se anota el tamaño de la entrada
+                exterior.tamano = exterior.tamano or descripcion
+                return funcion(*args, **kwargs)
+
+            perfil = cProfile.Profile()
+            try:
+                perfil.enable()
+            except ValueError as e:
+                # Python 3.12+: un solo perfilador activo a la vez en todo el proceso
+                logger.warning(f"⚠️ {nombre} no se perfila: {e}")
+                return funcion(*args, **kwargs)
+
+            captura = _Captura(nombre, threading.get_ident(), descripcion)
+            token = _captura_actual.set(captura)
+            inicio = time.perf_counter()
+            error = True
+            try:
+                resultado = funcion(*args, **kwargs)
+                error = isinstance(resultado, dict) and resultado.get("success") is False
+                return resultado
+            finally:
+                perfil.disable()
+                captura.terminada = True
+                _captura_actual.reset(token)
+                _escribir_perfil(perfil, captura, time.perf_counter() - inicio, error)
+        return envoltura
+    return decorador
+
+
+def perfiles_recientes(limite: int = 20) -> Dict[str, Any]:
+    """Últimos .prof de la carpeta de perfiles (más recientes primero)"""
+    try:
+        archivos = [os.path.join(_directorio, n) for n in os.listdir(_directorio) if n.endswith(".prof")]
+    except OSError:
+        archivos = []
+    archivos.sort(key=os.path.getmtime, reverse=True)
+    return {"directorio": _directorio, "perfiles": [os.path.basename(a) for a in archivos[:limite]]}
@@ -0,0 +1,179 @@
+"""
+serializacion.py - Conversión de resultados a JSON para la UI
+WOGest - Sistema de Validación de Renovaciones
+
+Las respuestas de la API se construían fila a fila (iterrows × columnas, con
+pd.to_datetime por cada celda de fecha) y después _json_safe recorría cada
+valor llamando a pd.isna. Aquí la limpieza se hace por columnas sobre el
+DataFrame y la conversión a filas es una sola pasada al final:
+
+- valores_json: una columna como lista JSON (NaN / inf / NaT → None, fechas ISO)
+- registros_json: DataFrame → lista de diccionarios ya lista para JSON
+- detalle_paso1: tabla de resultados del Paso 1 (claves en minúsculas, 'rpa')
+- json_seguro: limpieza recursiva de respuestas pequeñas (estadísticas, estados)
+
+Las listas devueltas por registros_json son FilasJSON: json_seguro las deja
+tal cual en lugar de volver a recorrerlas.
+"""
+
+import math
+import warnings
+from datetime import date, datetime
+from typing import Any, List
+
+import numpy as np
+import pandas as pd
+
+from procesamiento.canonico import quitar_columnas_tecnicas
+
+# Columnas numéricas de la tabla del Paso 1 (nulos como 0.0)
+COLUMNAS_NUMERICAS_PASO1 = ("cantidad", "precio", "cuota")
+COLUMNA_FECHA_PASO1 = "fecha"
+
+
+class FilasJSON(list):
+    """Lista de filas ya convertida a tipos JSON (json_seguro no la recorre)"""
+
+
+def _texto_json(valor: Any) -> Any:
+    if isinstance(valor, float):
+        return valor if math.isfinite(valor) else None
+    if hasattr(valor, "isoformat"):
+        return valor.isoformat()
+    return str(valor)
+
+
+def valores_json(serie: pd.Series) -> List[Any]:
+    """Valores de una columna como lista JSON (nulos, NaN e inf como None)"""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.dt.strftime("%Y-%m-%dT%H:%M:%S").astype(object).where(serie.notna(), None).tolist()
+    if pd.api.types.is_bool_dtype(serie) and not serie.isna().any():
+        return serie.astype(bool).tolist()
+    if pd.api.types.is_numeric_dtype(serie):
+        validos = np.isfinite(serie.astype("float64").to_numpy())
+        return serie.astype(object).where(validos, None).tolist()
+
+    valores = serie.astype(object).where(serie.notna(), None)
+    tipo = pd.api.types.infer_dtype(valores, skipna=True)
+    if tipo in ("string", "empty", "integer", "boolean"):
+        return valores.tolist()
+    # Fechas, decimales, mezclas...: texto, igual que json.dumps(default=str)
+    return [v if v is None or isinstance(v, (str, int, bool)) else _texto_json(v) for v in valores.tolist()]
+
+
+def registros_json(df: pd.DataFrame) -> FilasJSON:
+    """DataFrame → lista de diccionarios con valores JSON (limpieza por columnas)"""
+    if df is None or df.empty:
+        return FilasJSON()
+    columnas = [str(c) for c in df.columns]
+    valores = [valores_json(df.iloc[:, i]) for i in range(df.shape[1])]
+    return FilasJSON(dict(zip(columnas, fila)) for fila in zip(*valores))
+
+
+def _por_valor_unico(serie: pd.Series, convertir) -> pd.Series:
+    """Aplica `convertir` una vez por valor distinto (las columnas repiten mucho)"""
+    try:
+        unicos = pd.unique(serie.dropna())
+    except TypeError:  # valores no hashables
+        return serie.map(convertir, na_action="ignore")
+    return serie.map({v: convertir(v) for v in unicos})
+
+
+def _fecha_paso1(valor: Any) -> str:
+    if isinstance(valor, datetime):
+        return valor.strftime("%Y-%m-%d")
+    if isinstance(valor, str):
+        # Cada texto se interpreta por separado: un pd.to_datetime sobre la
+        # columna deduciría un único formato del primer valor (13/02 fija
+        # día/mes y cambia el significado de 01/02)
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                return pd.to_datetime(valor).strftime("%Y-%m-%d")
+        except (ValueError, TypeError, OverflowError):
+            return valor
+    return str(valor)
+
+
+def _fechas_paso1(serie: pd.Series) -> pd.Series:
+    """Fechas como 'YYYY-MM-DD'; lo que no es fecha se deja como texto"""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.dt.strftime("%Y-%m-%d")
+    return _por_valor_unico(serie, _fecha_paso1)
+
+
+def _numeros_paso1(serie: pd.Series) -> pd.Series:
+    """Números como float; los textos se dejan como texto"""
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return serie.astype("float64")
+    es_texto = serie.map(type).eq(str)
+    return pd.to_numeric(serie.where(~es_texto), errors="coerce").astype(object).where(~es_texto, serie)
+
+
+def _textos_paso1(serie: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        # str(Timestamp) conserva las fracciones de segundo (dt.strftime las perdería)
+        return _por_valor_unico(serie, lambda v: str(pd.Timestamp(v)))
+    return serie.astype(str)
+
+
+def detalle_paso1(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Tabla de resultados del Paso 1 para la UI, calculada por columnas:
+    claves en minúsculas, valores como texto, 'fecha' como YYYY-MM-DD,
+    cantidad / precio / cuota como float (nulos 0.0) y 'rpa' = Sí / No
+    según el estado.
+    """
+    if df is None or df.empty:
+        return pd.DataFrame()
+
+    df = quitar_columnas_tecnicas(df)
+    salida = {}
+    for col in df.columns:
+        serie = df[col]
+        clave = str(col).lower()
+        nulos = serie.isna()
+        if clave in COLUMNAS_NUMERICAS_PASO1:
+            valores = _numeros_paso1(serie)
+            salida[clave] = valores.astype(object).where(~nulos, 0.0)
+        elif clave == COLUMNA_FECHA_PASO1:
+            salida[clave] = _fechas_paso1(serie).astype(object).where(~nulos, "")
+        else:
+            salida[clave] = _textos_paso1(serie).astype(object).where(~nulos, "")
+
+    detalle = pd.DataFrame(salida, index=df.index)
+    estado = df["estado"] if "estado" in df.columns else pd.Series(None, index=df.index)
+    detalle["rpa"] = np.where(estado.eq("Correcto"), "Sí", "No")
+    return detalle.reset_index(drop=True)
+
+
+def valor_json(valor: Any) -> Any:
+    """Un valor escalar apto para JSON"""
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, float) and (math.isnan(valor) or math.isinf(valor)):
+        return None
+    try:
+        if pd.isna(valor):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return valor
+
+
+def json_seguro(valor: Any) -> Any:
+    """
+    Limpia una respuesta para JSON (diccionarios y listas anidados).
+    Los DataFrames se convierten con registros_json y las FilasJSON no se recorren.
+    """
+    if isinstance(valor, FilasJSON):
+        return valor
+    if isinstance(valor, pd.DataFrame):
+        return registros_json(valor)
+    if isinstance(valor, dict):
+        return {k: json_seguro(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [json_seguro(v) for v in valor]
+    return valor_json(valor)
@@ -0,0 +1,226 @@
+"""
+servidor.py - Servidor HTTP local y archivos estáticos
+WOGest - Sistema de Validación de Renovaciones
+
+app_web.run() usaba el servidor wsgiref por defecto de Bottle, que atiende las
+peticiones de una en una: mientras se recibía una subida (/procesar_paso2,
+/subidas) las plantillas y los estáticos de los pasos quedaban esperando.
+
+- ServidorMultihilo: adaptador de Bottle sobre wsgiref + ThreadingMixIn
+  (solo biblioteca estándar), un hilo por conexión.
+- servir_estatico: sustituye a bottle.static_file con ETag / Last-Modified
+  (respuestas 304), gzip (archivo .gz precomprimido junto al original o
+  comprimido una vez en memoria) y Cache-Control.
+- huella_estaticos: resumen de los archivos de static/. Las plantillas enlazan
+  los estáticos bajo /static/v/<huella>/..., que se cachean un año: al cambiar
+  cualquier archivo (y reiniciar) cambia la URL. Las URL sin huella se
+  revalidan siempre.
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from socketserver import ThreadingMixIn
+from typing import Dict, Optional, Tuple
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from bottle import HTTPError, HTTPResponse, ServerAdapter, request
+
+logger = logging.getLogger(__name__)
+
+# En Windows el registro puede asociar .js a text/plain y los módulos no cargan
+mimetypes.add_type("application/javascript", ".js")
+
+# Tipos que se envían comprimidos (el resto, imágenes e iconos, ya lo están)
+EXTENSIONES_COMPRIMIBLES = (".js", ".css", ".html", ".json", ".svg", ".map", ".txt")
+SUFIJO_GZIP = ".gz"
+NIVEL_GZIP = 9
+
+CACHE_VERSIONADA = "public, max-age=31536000, immutable"
+CACHE_REVALIDAR = "no-cache"
+
+_comprimidos: Dict[Tuple[str, int, int], bytes] = {}
+_lock_comprimidos = threading.Lock()
+
+# Huella de static/ por carpeta raíz (ver huella_estaticos)
+_huellas: Dict[str, str] = {}
+_lock_huellas = threading.Lock()
+
+
+# ---------------------- Servidor ----------------------
+
+class _WSGIServerMultihilo(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _ManejadorSilencioso(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug("HTTP %s - " + format, self.address_string(), *args)
+
+
+class ServidorMultihilo(ServerAdapter):
+    """Servidor WSGI de la biblioteca estándar que atiende cada conexión en un hilo"""
+
+    def run(self, handler):
+        self.srv = make_server(self.host, self.port, handler,
+                               server_class=_WSGIServerMultihilo,
+                               handler_class=_ManejadorSilencioso)
+        self.port = self.srv.server_port
+        logger.info(f"🌐 Servidor HTTP multihilo en http://{self.host}:{self.port}")
+        try:
+            self.srv.serve_forever()
+        finally:
+            self.srv.server_close()
+
+
+# ---------------------- Estáticos ----------------------
+
+def huella_estaticos(root: str) -> str:
+    """
+    Resumen corto de los archivos de `root` (ruta, tamaño y fecha de cada uno).
+    Se calcula una vez por proceso: los estáticos son parte de la instalación
+    y cada página y cada estático versionado la consultan.
+    """
+    with _lock_huellas:
+        huella = _huellas.get(root)
+        if huella is None:
+            huella = _huellas[root] = _calcular_huella(root)
+    return huella
+
+
+def _calcular_huella(root: str) -> str:
+    sha = hashlib.sha1()
+    for carpeta, subcarpetas, archivos in os.walk(root):
+        subcarpetas.sort()
+        for nombre in sorted(archivos):
+            if nombre.endswith(SUFIJO_GZIP):
+                continue
+            ruta = os.path.join(carpeta, nombre)
+            stat = os.stat(ruta)
+            relativa = os.path.relpath(ruta, root).replace(os.sep, "/")
+            sha.update(f"{relativa}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    return sha.hexdigest()[:12]
+
+
+def _ruta_segura(root: str, filepath: str) -> Optional[str]:
+    root = os.path.abspath(root)
+    ruta = os.path.abspath(os.path.join(root, filepath.strip("/\\")))
+    if not ruta.startswith(root + os.sep) or not os.path.isfile(ruta):
+        return None
+    return ruta
+
+
+def _acepta_gzip() -> bool:
+    return "gzip" in request.headers.get("Accept-Encoding", "").lower()
+
+
+def _version_gzip(ruta: str, stat: os.stat_result) -> Optional[bytes]:
+    """Contenido gzip del archivo: el .gz precomprimido si está al día, si no se comprime una vez"""
+    precomprimido = ruta + SUFIJO_GZIP
+    try:
+        if os.stat(precomprimido).st_mtime >= stat.st_mtime:
+            with open(precomprimido, "rb") as f:
+                return f.read()
+    except OSError:
+        pass
+
+    clave = (ruta, stat.st_mtime_ns, stat.st_size)
+    with _lock_comprimidos:
+        contenido = _comprimidos.get(clave)
+    if contenido is None:
+        with open(ruta, "rb") as f:
+            contenido = gzip.compress(f.read(), compresslevel=NIVEL_GZIP, mtime=0)
+        with _lock_comprimidos:
+            _comprimidos[clave] = contenido
+    return contenido
+
+
+def _no_modificado(etag: str, stat: os.stat_result) -> bool:
+    si_no_coincide = request.headers.get("If-None-Match")
+    if si_no_coincide:
+        return etag in (e.strip() for e in si_no_coincide.split(",")) or si_no_coincide.strip() == "*"
+    si_modificado = request.headers.get("If-Modified-Since")
+    if si_modificado:
+        try:
+            return int(stat.st_mtime) <= int(parsedate_to_datetime(si_modificado).timestamp())
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def servir_estatico(filepath: str, root: str, versionado: bool = False) -> HTTPResponse:
+    """
+    Respuesta para un archivo de `root` con validación de caché y gzip.
+
+    Args:
+        filepath: Ruta relativa pedida
+        root: Directorio de estáticos
+        versionado: La URL lleva la huella del contenido (caché de larga duración)
+    """
+    ruta = _ruta_segura(root, filepath)
+    if ruta is None:
+        return HTTPError(404, "Archivo no encontrado")
+
+    stat = os.stat(ruta)
+    tipo, _ = mimetypes.guess_type(ruta)
+    cabeceras = {
+        "Content-Type": tipo or "application/octet-stream",
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": CACHE_VERSIONADA if versionado else CACHE_REVALIDAR,
+    }
+    if cabeceras["Content-Type"].startswith(("text/", "application/javascript", "application/json")):
+        cabeceras["Content-Type"] += "; charset=UTF-8"
+
+    comprimible = ruta.lower().endswith(EXTENSIONES_COMPRIMIBLES)
+    if comprimible:
+        cabeceras["Vary"] = "Accept-Encoding"
+    gzip_ok = comprimible and _acepta_gzip()
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-gz" if gzip_ok else ""}"'
+    cabeceras["ETag"] = etag
+
+    if _no_modificado(etag, stat):
+        return HTTPResponse(status=304, **cabeceras)
+
+    if gzip_ok:
+        cuerpo = _version_gzip(ruta, stat)
+        cabeceras["Content-Encoding"] = "gzip"
+    else:
+        with open(ruta, "rb") as f:
+            cuerpo = f.read()
+    cabeceras["Content-Length"] = str(len(cuerpo))
+    if request.method == "HEAD":
+        cuerpo = b""
+    return HTTPResponse(cuerpo, **cabeceras)
+
+
+def precomprimir_estaticos(root: str) -> int:
+    """
+    Escribe <archivo>.gz junto a cada estático comprimible (paso de empaquetado).
+    Devuelve el número de archivos escritos.
+    """
+    escritos = 0
+    for carpeta, _, archivos in os.walk(root):
+        for nombre in archivos:
+            ruta = os.path.join(carpeta, nombre)
+            if not nombre.lower().endswith(EXTENSIONES_COMPRIMIBLES):
+                continue
+            with open(ruta, "rb") as f:
+                contenido = gzip.compress(f.read(), compresslevel=NIVEL_GZIP, mtime=0)
+            with open(ruta + SUFIJO_GZIP, "wb") as f:
+                f.write(contenido)
+            escritos += 1
+    logger.info(f"🗜️ {escritos} estáticos precomprimidos en {root}")
+    return escritos
+
+
+if __name__ == "__main__":
+    import sys
+
+    from procesamiento.bitacora import configurar_logging
+    configurar_logging(consola=True)
+    directorio = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "..", "static")
+    precomprimir_estaticos(os.path.abspath(directorio))
@@ -0,0 +1,68 @@
+"""
+sesiones.py - Sesiones de trabajo aisladas
+WOGest - Sistema de Validación de Renovaciones
+
+El controlador guardaba un único resultado de validación y los pasos escribían
+en las mismas tablas temporales: una segunda validación sobrescribía la
+primera y dos validaciones no podían ejecutarse a la vez.
+
+Cada operación se ejecuta ahora dentro de una sesión (un identificador en una
+ContextVar, como el trabajo actual de procesamiento.trabajos):
+
+- controlador: resultado, historial y lock propios de cada sesión
+- db_sqlite: cada sesión tiene su propio archivo SQLite (tablas temp_*), de
+  modo que las escrituras de sesiones distintas no compiten por el mismo
+  archivo ni se pisan
+- la ventana de la aplicación usa SESION_PRINCIPAL (el archivo de siempre)
+
+    with en_sesion(nueva_sesion()):
+        controlador.validar_archivo_workorder(ruta)   # temp_paso1 de esa sesión
+
+Los trabajos en segundo plano heredan la sesión de quien los lanza.
+"""
+
+import contextvars
+import re
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+SESION_PRINCIPAL = "principal"
+
+_PATRON_SESION = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_sesion_actual: contextvars.ContextVar[str] = contextvars.ContextVar("wogest_sesion", default=SESION_PRINCIPAL)
+
+
+def sesion_actual() -> str:
+    """Identificador de la sesión del contexto actual"""
+    return _sesion_actual.get()
+
+
+def nueva_sesion() -> str:
+    return uuid.uuid4().hex
+
+
+def validar_sesion(sesion: Optional[str]) -> str:
+    """
+    Normaliza un identificador de sesión recibido de fuera (None = principal).
+
+    Raises:
+        ValueError: identificador con caracteres no permitidos (se usa en rutas de archivo)
+    """
+    if sesion in (None, ""):
+        return SESION_PRINCIPAL
+    sesion = str(sesion)
+    if not _PATRON_SESION.match(sesion):
+        raise ValueError(f"Identificador de sesión inválido: {sesion!r}")
+    return sesion
+
+
+@contextmanager
+def en_sesion(sesion: Optional[str]) -> Iterator[str]:
+    """Ejecuta el bloque dentro de la sesión indicada"""
+    token = _sesion_actual.set(validar_sesion(sesion))
+    try:
+        yield _sesion_actual.get()
+    finally:
+        _sesion_actual.reset(token)
@@ -0,0 +1,329 @@
+"""
+sintetico.py - Generador de datos sintéticos (WorkOrder + WOQ)
+WOGest - Sistema de Validación de Renovaciones
+
+Para medir el rendimiento (ver procesamiento.benchmark) hacen falta archivos
+con la forma de los reales y de tamaño controlado:
+
+- WorkOrder .xlsx: tres filas de título y la cabecera en la fila 4 (como lo
+  lee RenovacionValidator._leer_excel), un grupo por (CLIENTE, MANT) con su
+  desmontaje (DMCE) e instalación (AMCE). Las referencias salen del catálogo
+  real (config/combinaciones.db: validas, pilas, individuales) y se mezclan
+  grupos correctos y grupos rotos (desbalance, combinación no permitida,
+  signo cambiado, referencia prohibida) más algunas filas de otros tipos que
+  la limpieza descarta.
+- WOQ .csv: sin cabecera, delimitado por ';' y en latin-1, con las columnas en
+  las posiciones de paso2.get_column_map; la mayoría de las filas apuntan a WO
+  del WorkOrder generado y el resto no cruza.
+
+La generación es determinista para una misma semilla y se escribe en
+streaming (openpyxl write_only), así que 1M de filas no se cargan en memoria.
+
+    python -m procesamiento.sintetico -o benchmarks/datos --tamanos 10k 100k 1m
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from openpyxl import Workbook
+
+from procesamiento.bitacora import configurar_logging
+
+logger = logging.getLogger(__name__)
+
+TAMANOS = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+WO_INICIAL = 1_000_000
+COLUMNAS_WORKORDER = ["WO", "MANT", "FECHA", "CLIENTE", "REFERENCIA", "TIPO",
+                      "PRECIO", "CANTIDAD", "CUOTA", "TECNICO", "PAGO"]
+COLUMNAS_WOQ = 45
+
+# Tipo de grupo → (peso, estado que debe asignarle el Paso 1)
+TIPOS_GRUPO: Dict[str, Tuple[float, str]] = {
+    "correcto": (0.57, "Correcto"),
+    "correcto_pilas": (0.08, "Correcto"),
+    "advertencia": (0.05, "Advertencia"),
+    "desbalanceado": (0.10, "Incorrecto"),
+    "combinacion_invalida": (0.08, "Incorrecto"),
+    "signo": (0.05, "Incorrecto"),
+    "prohibida": (0.04, "Incorrecto"),
+}
+# Filas con un TIPO distinto de AMCE/DMCE (se descartan en la limpieza)
+PROPORCION_OTROS_TIPOS = 0.03
+OTROS_TIPOS = ("REVI", "MANT", "BAJA")
+
+CLIENTES_WOQ = ("COMERCIAL PEÑA S.A.", "FERRETERÍA NÚÑEZ", "CAFÉ ÁLAMO", "ÓPTICA MUÑOZ",
+                "PANADERÍA SEÑORÍO", "TALLERES IBÁÑEZ")
+
+
+@dataclass
+class CatalogoSintetico:
+    """
+    Referencias del catálogo real con las que se construyen los grupos.
+    `combinaciones` son las permitidas cuyas referencias no están prohibidas
+    para su tipo ni son F057 (un grupo balanceado con ellas es Correcto).
+    """
+    combinaciones: List[Tuple[str, str]]
+    antiguas: List[str]
+    nuevas: List[str]
+    pilas: List[str]
+    prohibidas_dmce: List[str]
+    prohibidas_amce: List[str]
+    _validas: set = field(default_factory=set, repr=False)
+
+    @classmethod
+    def desde_db(cls, ruta_db: Optional[str] = None) -> "CatalogoSintetico":
+        if ruta_db is None:
+            from procesamiento.paso1 import resource_path
+            ruta_db = resource_path("config/combinaciones.db")
+        conn = sqlite3.connect(ruta_db)
+        try:
+            validas = [(a.strip().upper(), n.strip().upper()) for a, n in conn.execute(
+                "SELECT REFERENCIA_ANTIGUA, REFERENCIA_NUEVA FROM validas WHERE ACTIVO = 1 ORDER BY ID")]
+            pilas = [r.strip().upper() for (r,) in conn.execute(
+                "SELECT REFERENCIA FROM pilas WHERE ACTIVO = 1 AND UPPER(TIPO) = 'AMCE' ORDER BY ID")]
+            individuales = conn.execute(
+                "SELECT UPPER(TIPO), REFERENCIA FROM individuales WHERE ACTIVO = 1 ORDER BY ID").fetchall()
+        finally:
+            conn.close()
+        prohibidas_dmce = [r.strip().upper() for t, r in individuales if t == "DMCE"]
+        prohibidas_amce = [r.strip().upper() for t, r in individuales if t == "AMCE"]
+        combinaciones = [(a, n) for a, n in validas
+                         if a not in prohibidas_dmce and n not in prohibidas_amce and n != "F057"]
+        if not combinaciones:
+            raise ValueError(f"El catálogo {ruta_db} no tiene combinaciones válidas activas")
+        return cls(
+            combinaciones=combinaciones,
+            antiguas=sorted({a for a, _ in combinaciones}),
+            nuevas=sorted({n for _, n in combinaciones}),
+            pilas=pilas,
+            prohibidas_dmce=prohibidas_dmce,
+            prohibidas_amce=prohibidas_amce,
+            _validas=set(validas),
+        )
+
+    def combinacion_no_permitida(self, rng: random.Random) -> Tuple[str, str]:
+        for _ in range(50):
+            par = (rng.choice(self.antiguas), rng.choice(self.nuevas))
+            if par not in self._validas:
+                return par
+        return ("ZZ999", rng.choice(self.nuevas))
+
+
+def filas_desde_tamano(tamano: str) -> int:
+    """'10k' / '100k' / '1m' o un número de filas"""
+    texto = str(tamano).strip().lower()
+    if texto in TAMANOS:
+        return TAMANOS[texto]
+    try:
+        filas = int(texto.replace("_", ""))
+    except ValueError:
+        raise ValueError(f"Tamaño no reconocido: {tamano!r} (use {', '.join(TAMANOS)} o un número)")
+    if filas <= 0:
+        raise ValueError("El número de filas debe ser positivo")
+    return filas
+
+
+def _elegir_tipo(rng: random.Random) -> str:
+    tipos = list(TIPOS_GRUPO)
+    return rng.choices(tipos, weights=[TIPOS_GRUPO[t][0] for t in tipos])[0]
+
+
+def _filas_grupo(tipo: str, catalogo: CatalogoSintetico, rng: random.Random) -> List[Tuple[str, str, int]]:
+    """(REFERENCIA, TIPO, CANTIDAD) de un grupo del tipo indicado"""
+    antigua, nueva = rng.choice(catalogo.combinaciones)
+    if tipo == "correcto_pilas" and catalogo.pilas:
+        return [(antigua, "DMCE", -1), (nueva, "AMCE", 1), (rng.choice(catalogo.pilas), "AMCE", 1)]
+    if tipo == "advertencia":
+        return [(antigua, "DMCE", -1), (nueva, "AMCE", 2)]
+    if tipo == "desbalanceado":
+        return [(antigua, "DMCE", -1), (nueva, "AMCE", rng.randint(3, 5))]
+    if tipo == "combinacion_invalida":
+        antigua, nueva = catalogo.combinacion_no_permitida(rng)
+        return [(antigua, "DMCE", -1), (nueva, "AMCE", 1)]
+    if tipo == "signo":
+        return [(antigua, "DMCE", 1), (nueva, "AMCE", 1)]
+    if tipo == "prohibida" and (catalogo.prohibidas_dmce or catalogo.prohibidas_amce):
+        if catalogo.prohibidas_dmce:
+            return [(rng.choice(catalogo.prohibidas_dmce), "DMCE", -1), (nueva, "AMCE", 1)]
+        return [(antigua, "DMCE", -1), (rng.choice(catalogo.prohibidas_amce), "AMCE", 1)]
+    return [(antigua, "DMCE", -1), (nueva, "AMCE", 1)]
+
+
+def generar_workorder(ruta: str, filas: int, semilla: int = 0,
+                      catalogo: Optional[CatalogoSintetico] = None) -> Dict[str, Any]:
+    """
+    Escribe un WorkOrder sintético de aproximadamente `filas` filas (los
+    grupos no se parten: puede pasarse en una o dos filas).
+
+    Returns:
+        {"ruta", "filas", "grupos", "wo_inicial", "esperado": {estado: filas}, "tipos_grupo": {tipo: grupos}}
+    """
+    catalogo = catalogo or CatalogoSintetico.desde_db()
+    rng = random.Random(semilla)
+    fecha_base = date(2025, 1, 1)
+
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet("WorkOrder")
+    hoja.append(["Informe de renovaciones (datos sintéticos)"])
+    hoja.append([f"Semilla {semilla} · {filas} filas"])
+    hoja.append([])
+    hoja.append(COLUMNAS_WORKORDER)
+
+    escritas = grupos = 0
+    esperado: Dict[str, int] = {}
+    tipos_grupo: Dict[str, int] = {}
+    while escritas < filas:
+        wo = WO_INICIAL + grupos
+        mant = 700_000 + grupos
+        cliente = 5_000 + rng.randrange(max(filas // 40, 50))
+        fecha = (fecha_base + timedelta(days=rng.randrange(365))).isoformat()
+        tecnico = rng.randint(1, 60)
+
+        if rng.random() < PROPORCION_OTROS_TIPOS:
+            hoja.append([wo, mant, fecha, cliente, rng.choice(catalogo.nuevas), rng.choice(OTROS_TIPOS),
+                         round(rng.uniform(5, 80), 2), 1, rng.randint(1, 12), tecnico, rng.randint(0, 1)])
+            escritas += 1
+            grupos += 1
+            tipos_grupo["otros_tipos"] = tipos_grupo.get("otros_tipos", 0) + 1
+            continue
+
+        tipo = _elegir_tipo(rng)
+        filas_grupo = _filas_grupo(tipo, catalogo, rng)
+        for referencia, tipo_fila, cantidad in filas_grupo:
+            hoja.append([wo, mant, fecha, cliente, referencia, tipo_fila, round(rng.uniform(5, 80), 2),
+                         cantidad, rng.randint(1, 12), tecnico, rng.randint(0, 1)])
+        escritas += len(filas_grupo)
+        grupos += 1
+        tipos_grupo[tipo] = tipos_grupo.get(tipo, 0) + 1
+        estado = TIPOS_GRUPO[tipo][1]
+        esperado[estado] = esperado.get(estado, 0) + len(filas_grupo)
+
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    libro.save(ruta)
+    logger.info(f"🧪 WorkOrder sintético: {ruta} ({escritas} filas, {grupos} grupos)")
+    return {"ruta": ruta, "filas": escritas, "grupos": grupos, "wo_inicial": WO_INICIAL,
+            "esperado": esperado, "tipos_grupo": tipos_grupo}
+
+
+def generar_woq(ruta: str, filas: int, grupos_workorder: int, semilla: int = 0,
+                proporcion_cruce: float = 0.9) -> Dict[str, Any]:
+    """
+    Escribe un WOQ sintético de `filas` filas. Con probabilidad
+    `proporcion_cruce` cada fila apunta a una WO del WorkOrder generado con
+    `grupos_workorder` grupos (se recorren en orden); el resto no cruza.
+
+    Returns:
+        {"ruta", "filas", "cruzan", "cerrados"}
+    """
+    rng = random.Random(semilla + 1)
+    fecha_base = date(2025, 1, 1)
+    cruzan = cerrados = 0
+    contrato = 80_000
+    siguiente = 0
+
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    with open(ruta, "w", encoding="latin-1", newline="") as f:
+        for i in range(filas):
+            if grupos_workorder and rng.random() < proporcion_cruce:
+                wo = WO_INICIAL + siguiente % grupos_workorder
+                siguiente += 1
+                cruzan += 1
+            else:
+                wo = WO_INICIAL + grupos_workorder + i
+            if rng.random() < 0.3:
+                contrato += 1
+            cerrado = rng.random() < 0.25
+            cerrados += cerrado
+            fecha = fecha_base + timedelta(days=rng.randrange(365))
+
+            columnas = [""] * COLUMNAS_WOQ
+            columnas[0] = f"DC{rng.randint(1, 4)}"
+            columnas[1] = str(wo)
+            columnas[2] = rng.choice(("T", "R", "I"))
+            columnas[5] = str(contrato)
+            columnas[6] = str(rng.randint(30, 90))
+            columnas[7] = rng.choice(("A", "B", "P"))
+            columnas[8] = rng.choice(("P", "Q", "T"))
+            columnas[10] = "X" if cerrado else ""
+            columnas[12] = fecha.strftime("%d/%m/%Y")
+            columnas[13] = rng.choice(CLIENTES_WOQ)
+            columnas[14] = "PERÚ" if rng.random() < 0.1 else ""
+            columnas[15] = f"{rng.uniform(10, 500):.2f}".replace(".", ",")
+            columnas[16] = rng.choice(("KODAK", "CANON", "RICOH"))
+            columnas[17] = f"M{rng.randint(100, 999)}"
+            columnas[18] = f"S{rng.randrange(10 ** 8):08d}"
+            columnas[20] = f"U{rng.randint(1, 40):03d}"
+            columnas[26] = (fecha + timedelta(days=rng.randint(1, 30))).strftime("%d/%m/%Y")
+            columnas[31] = f"{rng.uniform(10, 900):.2f}".replace(".", ",")
+            columnas[32] = fecha.strftime("%d/%m/%Y")
+            columnas[40] = "X" if cerrado and rng.random() < 0.5 else ""
+            columnas[41] = f"MT{rng.randint(1, 9999):04d}"
+            columnas[42] = str(rng.randint(0, 1))
+            columnas[43] = f"C-{contrato}"
+            columnas[44] = "S" if cerrado else "N"
+            f.write(";".join(columnas) + "\r\n")
+
+    logger.info(f"🧪 WOQ sintético: {ruta} ({filas} filas, {cruzan} con WO del WorkOrder)")
+    return {"ruta": ruta, "filas": filas, "cruzan": cruzan, "cerrados": cerrados}
+
+
+def generar_juego(carpeta: str, filas: int, semilla: int = 0, regenerar: bool = False,
+                  catalogo: Optional[CatalogoSintetico] = None) -> Dict[str, Any]:
+    """
+    WorkOrder y WOQ de `filas` filas en `carpeta`. Si ya existen con la misma
+    semilla (ver juego_<filas>_s<semilla>.json) se reutilizan.
+
+    Returns:
+        {"filas", "semilla", "workorder": {...}, "woq": {...}}
+    """
+    base = os.path.join(carpeta, f"{filas}_s{semilla}")
+    ruta_descripcion = os.path.join(carpeta, f"juego_{filas}_s{semilla}.json")
+    if not regenerar and os.path.exists(ruta_descripcion):
+        with open(ruta_descripcion, encoding="utf-8") as f:
+            juego = json.load(f)
+        if os.path.exists(juego["workorder"]["ruta"]) and os.path.exists(juego["woq"]["ruta"]):
+            return juego
+
+    workorder = generar_workorder(f"{base}_workorder.xlsx", filas, semilla, catalogo)
+    woq = generar_woq(f"{base}_woq.csv", filas, workorder["grupos"], semilla)
+    juego = {"filas": filas, "semilla": semilla, "workorder": workorder, "woq": woq}
+    with open(ruta_descripcion, "w", encoding="utf-8") as f:
+        json.dump(juego, f, ensure_ascii=False, indent=2)
+    return juego
+
+
+# ---------------------- Línea de comandos ----------------------
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    configurar_logging(consola=True)
+    parser = argparse.ArgumentParser(prog="python -m procesamiento.sintetico",
+                                     description="Genera WorkOrder (.xlsx) y WOQ (.csv) sintéticos.")
+    parser.add_argument("-o", "--salida", required=True, help="Carpeta de destino")
+    parser.add_argument("--tamanos", nargs="+", default=["10k"], help="10k, 100k, 1m o número de filas")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--regenerar", action="store_true", help="Sobrescribe los juegos ya generados")
+    args = parser.parse_args(argv)
+
+    try:
+        tamanos = [filas_desde_tamano(t) for t in args.tamanos]
+    except ValueError as e:
+        parser.error(str(e))
+    catalogo = CatalogoSintetico.desde_db()
+    for filas in tamanos:
+        juego = generar_juego(args.salida, filas, args.semilla, args.regenerar, catalogo)
+        print(json.dumps({"filas": filas, "workorder": juego["workorder"]["ruta"], "woq": juego["woq"]["ruta"],
+                          "esperado": juego["workorder"]["esperado"]}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
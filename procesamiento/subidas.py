@@ -0,0 +1,307 @@
+"""
+subidas.py - Recepción de archivos en binario por bloques
+WOGest - Sistema de Validación de Renovaciones
+
+Hasta ahora la UI enviaba el archivo como base64 dentro del JSON del puente de
+pywebview: el texto se decodificaba entero en memoria y solo después se
+escribía en datos/temp (~2,3 veces el tamaño del archivo en RAM más la
+serialización del puente). Con las subidas por bloques la UI envía el archivo
+en binario al servidor Bottle:
+
+    POST   /subidas                    {"nombre": "...", "tamano": n, "sha256": "..."} → subida_id
+    PUT    /subidas/<subida_id>        cuerpo binario del bloque (cabecera X-Offset)
+    POST   /subidas/<subida_id>/fin    → archivo_id, sha256, tamano
+    DELETE /subidas/<subida_id>        descarta la subida
+
+Cada bloque se copia del socket al disco en trozos de TAMANO_LECTURA y el
+SHA-256 se calcula a la vez. El identificador devuelto al finalizar
+('archivo_id') es lo que aceptan validar_archivo_workorder y
+procesar_archivo_woq en lugar de 'base64'.
+
+Con un AlmacenContenido (procesamiento.almacen) el archivo recibido pasa al
+almacén por su SHA-256. Si la UI declara el SHA-256 al iniciar y ese contenido
+ya está almacenado, la subida queda completada sin transferir ni escribir
+nada ('duplicada': true).
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional
+
+from procesamiento.almacen import AlmacenContenido, clave_contenido
+
+logger = logging.getLogger(__name__)
+
+# Bloque que envía la UI y trozo leído del socket en cada escritura
+TAMANO_BLOQUE = 4 * 1024 * 1024
+TAMANO_LECTURA = 1024 * 1024
+
+# Las subidas (terminadas o no) se olvidan tras este tiempo sin actividad
+CADUCIDAD_SUBIDA_SEGUNDOS = 60 * 60
+
+SUFIJO_PARCIAL = ".part"
+
+
+class ErrorSubida(Exception):
+    """Error de una subida; `estado` es el código HTTP que se devuelve a la UI"""
+
+    def __init__(self, mensaje: str, estado: int = 400):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+@dataclass
+class Subida:
+    """Archivo en recepción (o ya recibido) en el directorio temporal"""
+    id: str
+    nombre: str
+    ruta: str
+    tamano_esperado: Optional[int] = None
+    recibido: int = 0
+    sha256: Optional[str] = None
+    completada: bool = False
+    duplicada: bool = False
+    en_almacen: bool = False
+    sha256_declarado: Optional[str] = None
+    actividad: float = field(default_factory=time.monotonic)
+    _hash: Any = field(default_factory=hashlib.sha256, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def ruta_parcial(self) -> str:
+        return self.ruta + SUFIJO_PARCIAL
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "subida_id": self.id,
+            "archivo_id": self.id if self.completada else None,
+            "nombre": self.nombre,
+            "recibido": self.recibido,
+            "tamano": self.tamano_esperado,
+            "sha256": self.sha256,
+            "completada": self.completada,
+            "duplicada": self.duplicada,
+        }
+
+    @property
+    def clave_almacen(self) -> Optional[str]:
+        """Clave del archivo en el almacén de contenido (None si no está en él)"""
+        if not self.en_almacen:
+            return None
+        return clave_contenido(self.sha256, Path(self.nombre).suffix)
+
+
+class RegistroSubidas:
+    """Subidas en curso y archivos recibidos, por identificador"""
+
+    def __init__(self, directorio: str, max_bytes: int, almacen: Optional[AlmacenContenido] = None):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.almacen = almacen
+        self._subidas: Dict[str, Subida] = {}
+        self._lock = threading.Lock()
+
+    def iniciar(self, nombre: str, tamano: Optional[int] = None, sha256: Optional[str] = None,
+                ejecucion: Optional[str] = None) -> Subida:
+        """
+        Registra una subida nueva y crea su archivo parcial vacío.
+
+        Args:
+            sha256: Resumen del archivo calculado por la UI (opcional). Si el
+                almacén ya tiene ese contenido, la subida se completa al momento.
+            ejecucion: Ejecución que retiene el archivo en el almacén (para que
+                no se desaloje antes de usarlo)
+
+        Raises:
+            ErrorSubida: sin nombre, con un tamaño declarado mayor que el máximo
+                o con un sha256 mal formado
+        """
+        nombre = os.path.basename(str(nombre or "").strip())
+        if not nombre:
+            raise ErrorSubida("Nombre de archivo faltante")
+        if tamano is not None and int(tamano) > self.max_bytes:
+            raise ErrorSubida("Archivo demasiado grande", 413)
+        if sha256 is not None:
+            sha256 = str(sha256).strip().lower()
+            if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+                raise ErrorSubida("sha256 inválido")
+
+        self._purgar_caducadas()
+        subida_id = uuid.uuid4().hex
+
+        if sha256 and self.almacen is not None:
+            ruta = self.almacen.adquirir(clave_contenido(sha256, Path(nombre).suffix), ejecucion)
+            if ruta is not None:
+                subida = Subida(id=subida_id, nombre=nombre, ruta=ruta,
+                                tamano_esperado=os.path.getsize(ruta), recibido=os.path.getsize(ruta),
+                                sha256=sha256, completada=True, duplicada=True, en_almacen=True)
+                with self._lock:
+                    self._subidas[subida_id] = subida
+                logger.info(f"♻️ Subida omitida, contenido ya almacenado: {nombre} (sha256 {sha256[:12]}…)")
+                return subida
+
+        Path(self.directorio).mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        ruta = os.path.join(self.directorio, f"{Path(nombre).stem}_{timestamp}_{subida_id[:8]}{Path(nombre).suffix}")
+        subida = Subida(id=subida_id, nombre=nombre, ruta=ruta,
+                        tamano_esperado=int(tamano) if tamano is not None else None,
+                        sha256_declarado=sha256)
+        open(subida.ruta_parcial, "wb").close()
+
+        with self._lock:
+            self._subidas[subida_id] = subida
+        logger.info(f"📥 Subida iniciada: {nombre} ({subida_id})")
+        return subida
+
+    def _obtener(self, subida_id: str) -> Subida:
+        with self._lock:
+            subida = self._subidas.get(subida_id)
+        if subida is None:
+            raise ErrorSubida("Subida no encontrada", 404)
+        return subida
+
+    def escribir_bloque(self, subida_id: str, entrada: BinaryIO, longitud: int,
+                        offset: Optional[int] = None) -> Subida:
+        """
+        Copia `longitud` bytes de `entrada` (el cuerpo de la petición) al final
+        del archivo parcial, actualizando el hash.
+
+        Args:
+            offset: Posición del bloque en el archivo; debe coincidir con lo ya
+                recibido (los bloques se envían en orden)
+
+        Raises:
+            ErrorSubida: subida inexistente o terminada, bloque fuera de orden,
+                cuerpo incompleto o tamaño máximo superado
+        """
+        subida = self._obtener(subida_id)
+        with subida._lock:
+            if subida.completada:
+                raise ErrorSubida("La subida ya está finalizada", 409)
+            if offset is not None and offset != subida.recibido:
+                raise ErrorSubida(f"Bloque fuera de orden: se esperaba el offset {subida.recibido}", 409)
+            if subida.recibido + longitud > self.max_bytes:
+                self._descartar(subida)
+                raise ErrorSubida("Archivo demasiado grande", 413)
+
+            restante = longitud
+            with open(subida.ruta_parcial, "ab") as destino:
+                while restante > 0:
+                    trozo = entrada.read(min(TAMANO_LECTURA, restante))
+                    if not trozo:
+                        break
+                    destino.write(trozo)
+                    subida._hash.update(trozo)
+                    restante -= len(trozo)
+                if restante > 0:
+                    # Conexión cortada: se deshace el bloque para poder reenviarlo
+                    destino.truncate(subida.recibido)
+                    subida._hash = _hash_archivo(subida.ruta_parcial)
+                    raise ErrorSubida("Bloque incompleto", 400)
+
+            subida.recibido += longitud
+            subida.actividad = time.monotonic()
+        return subida
+
+    def finalizar(self, subida_id: str, ejecucion: Optional[str] = None) -> Subida:
+        """
+        Cierra la subida: comprueba el tamaño (y el sha256) declarados y deja
+        el archivo con su nombre definitivo o, con almacén, en el almacén
+        retenido por `ejecucion`.
+
+        Raises:
+            ErrorSubida: subida inexistente o tamaño / sha256 distintos de los declarados
+        """
+        subida = self._obtener(subida_id)
+        with subida._lock:
+            if subida.completada:
+                return subida
+            if subida.tamano_esperado is not None and subida.recibido != subida.tamano_esperado:
+                raise ErrorSubida(
+                    f"Subida incompleta: {subida.recibido} de {subida.tamano_esperado} bytes", 409)
+            sha256 = subida._hash.hexdigest()
+            if subida.sha256_declarado and sha256 != subida.sha256_declarado:
+                self._descartar(subida)
+                raise ErrorSubida("El sha256 recibido no coincide con el declarado", 409)
+            if self.almacen is not None:
+                subida.ruta = self.almacen.importar_archivo(subida.ruta_parcial, sha256, Path(subida.nombre).suffix,
+                                                            ejecucion)
+                subida.en_almacen = True
+            else:
+                os.replace(subida.ruta_parcial, subida.ruta)
+            subida.sha256 = sha256
+            subida.completada = True
+            subida.actividad = time.monotonic()
+        logger.info(f"📄 Subida completada: {subida.nombre} ({subida.recibido} bytes, sha256 {subida.sha256[:12]}…) → {subida.ruta}")
+        return subida
+
+    def ruta_archivo(self, archivo_id: str) -> str:
+        """
+        Ruta en disco de una subida finalizada (el 'archivo_id' del payload).
+
+        Raises:
+            ErrorSubida: si no existe o no está finalizada
+        """
+        subida = self._obtener(archivo_id)
+        if not subida.completada:
+            raise ErrorSubida("La subida no está finalizada", 409)
+        subida.actividad = time.monotonic()
+        return subida.ruta
+
+    def obtener(self, archivo_id: str) -> Optional[Subida]:
+        with self._lock:
+            return self._subidas.get(archivo_id)
+
+    def cancelar(self, subida_id: str) -> bool:
+        """Descarta una subida y su archivo; False si no existe"""
+        with self._lock:
+            subida = self._subidas.get(subida_id)
+        if subida is None:
+            return False
+        with subida._lock:
+            self._descartar(subida)
+        return True
+
+    def _descartar(self, subida: Subida):
+        with self._lock:
+            self._subidas.pop(subida.id, None)
+        # Los archivos del almacén pueden compartirlos otras subidas: los gestiona el almacén
+        rutas = (subida.ruta_parcial,) if subida.en_almacen else (subida.ruta_parcial, subida.ruta)
+        for ruta in rutas:
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"No se pudo eliminar {ruta}: {e}")
+
+    def _purgar_caducadas(self):
+        """
+        Elimina las subidas sin actividad (bloques recibidos o uso de su
+        archivo_id) durante CADUCIDAD_SUBIDA_SEGUNDOS, terminadas o no. Si el
+        archivo está en el almacén solo se olvida el registro: el almacén lo
+        conserva mientras alguna sesión lo retenga.
+        """
+        limite = time.monotonic() - CADUCIDAD_SUBIDA_SEGUNDOS
+        with self._lock:
+            caducadas = [s for s in self._subidas.values() if s.actividad < limite]
+        for subida in caducadas:
+            estado = "terminada" if subida.completada else "sin terminar"
+            logger.info(f"🧹 Subida {estado} caducada: {subida.nombre} ({subida.id})")
+            with subida._lock:
+                self._descartar(subida)
+
+
+def _hash_archivo(ruta: str):
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for trozo in iter(lambda: f.read(TAMANO_LECTURA), b""):
+            sha.update(trozo)
+    return sha
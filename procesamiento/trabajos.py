@@ -0,0 +1,411 @@
+"""
+trabajos.py - Ejecución de operaciones largas en segundo plano
+WOGest - Sistema de Validación de Renovaciones
+
+Las llamadas pesadas de la API (validar WorkOrder, procesar WOQ, cruce,
+exportación) se ejecutan como trabajos en un pool de hilos para no bloquear
+el puente de pywebview. Cada trabajo tiene:
+
+- un identificador que la UI usa para consultar su estado (polling)
+- etapa actual y porcentaje completado (lectura, limpieza, validación, guardado...)
+- cancelación cooperativa: se solicita con cancelar() y se hace efectiva en
+  la siguiente frontera de etapa
+- límite de tiempo (deadline): superado el límite, el trabajo se da por expirado
+
+Los módulos de procesamiento informan de su avance con reportar_etapa() /
+reportar_progreso(), que no hacen nada cuando no se ejecutan dentro de un trabajo.
+
+Además del estado consultable, cada trabajo guarda una secuencia de eventos
+numerados (inicio de etapa, progreso, métricas como filas leídas, grupos
+validados o filas guardadas con su ritmo por segundo, y fin) que la UI recibe
+por SSE o long-poll (GET /trabajos/<id>/eventos, ver flujo_sse). Las métricas
+se emiten con reportar_metrica(); al terminar, el desglose por etapa se
+escribe en el log.
+
+Cada trabajo se ejecuta con una copia del contexto de quien lo envía, así
+hereda su sesión (procesamiento.sesiones).
+"""
+
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from procesamiento.sesiones import sesion_actual
+
+logger = logging.getLogger(__name__)
+
+# Estados de un trabajo
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+COMPLETADO = "completado"
+ERROR = "error"
+CANCELADO = "cancelado"
+EXPIRADO = "expirado"
+
+ESTADOS_FINALES = (COMPLETADO, ERROR, CANCELADO, EXPIRADO)
+
+MAX_TRABAJADORES = 2
+MAX_TRABAJOS_FINALIZADOS = 50
+
+# Eventos que se conservan por trabajo (un cliente que se conecta tarde recibe los últimos)
+MAX_EVENTOS_TRABAJO = 500
+# Sin eventos nuevos, el flujo SSE envía un comentario cada este intervalo
+LATIDO_SSE_SEGUNDOS = 15.0
+
+EVENTO_FIN = "fin"
+
+
+class TrabajoCancelado(BaseException):
+    """
+    Se lanza en una frontera de etapa cuando el trabajo fue cancelado o expiró.
+
+    Deriva de BaseException (como KeyboardInterrupt) para que los
+    `except Exception` de los pasos y de la API no la registren como un error
+    inesperado ni la conviertan en {"success": False}: llega hasta el gestor.
+    """
+
+
+@dataclass
+class Trabajo:
+    """Estado de un trabajo en segundo plano"""
+    id: str
+    tipo: str
+    limite: Optional[float] = None  # instante (time.monotonic) a partir del cual expira
+    sesion: Optional[str] = None
+    estado: str = PENDIENTE
+    etapa: str = "en cola"
+    porcentaje: float = 0.0
+    mensaje: str = ""
+    creado: datetime = field(default_factory=datetime.now)
+    iniciado: Optional[datetime] = None
+    finalizado: Optional[datetime] = None
+    resultado: Any = None
+    resultado_entregado: bool = False  # el resultado ya se envió a la UI y se liberó
+    _cancelacion: threading.Event = field(default_factory=threading.Event, repr=False)
+    _motivo_cancelacion: str = field(default=CANCELADO, repr=False)
+    _eventos: Deque[Dict[str, Any]] = field(default_factory=lambda: deque(maxlen=MAX_EVENTOS_TRABAJO), repr=False)
+    _secuencia: int = field(default=0, repr=False)
+    _hay_eventos: threading.Condition = field(default_factory=threading.Condition, repr=False)
+    _inicio_etapa: float = field(default_factory=time.monotonic, repr=False)
+    # [etapa, segundos, {métrica: (valor, total, por_segundo)}] en orden
+    _etapas: List[list] = field(default_factory=list, repr=False)
+    _futuro: Optional[Future] = field(default=None, repr=False)
+
+    @property
+    def terminado(self) -> bool:
+        return self.estado in ESTADOS_FINALES
+
+    def solicitar_cancelacion(self, motivo: str = CANCELADO):
+        self._motivo_cancelacion = motivo
+        self._cancelacion.set()
+
+    def comprobar(self):
+        """Lanza TrabajoCancelado si se pidió cancelar o se superó el límite"""
+        if self.limite is not None and time.monotonic() > self.limite and not self._cancelacion.is_set():
+            self.solicitar_cancelacion(EXPIRADO)
+        if self._cancelacion.is_set():
+            raise TrabajoCancelado(
+                "Trabajo cancelado" if self._motivo_cancelacion == CANCELADO else "Tiempo límite superado"
+            )
+
+    # ---------------------- Eventos ----------------------
+
+    def emitir(self, tipo: str, **datos) -> Dict[str, Any]:
+        """Añade un evento numerado y despierta a los clientes que esperan"""
+        with self._hay_eventos:
+            self._secuencia += 1
+            evento = {
+                "id": self._secuencia,
+                "tipo": tipo,
+                "trabajo_id": self.id,
+                "etapa": self.etapa,
+                "porcentaje": round(self.porcentaje, 1),
+                "ts": round(time.time(), 3),
+                **datos,
+            }
+            self._eventos.append(evento)
+            self._hay_eventos.notify_all()
+        return evento
+
+    def eventos_desde(self, desde: int = 0, espera: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        Eventos con id > `desde`. Si no hay ninguno, espera hasta `espera`
+        segundos a que llegue alguno (long-poll).
+        """
+        with self._hay_eventos:
+            if self._secuencia <= desde and espera > 0 and not self._fin_emitido():
+                self._hay_eventos.wait_for(lambda: self._secuencia > desde or self._fin_emitido(), timeout=espera)
+            return [e for e in self._eventos if e["id"] > desde]
+
+    def _fin_emitido(self) -> bool:
+        return bool(self._eventos) and self._eventos[-1]["tipo"] == EVENTO_FIN
+
+    def _cerrar_etapa(self):
+        ahora = time.monotonic()
+        if self._etapas:
+            self._etapas[-1][1] = ahora - self._inicio_etapa
+        self._inicio_etapa = ahora
+
+    def _nueva_etapa(self, etapa: str):
+        self._cerrar_etapa()
+        self._etapas.append([etapa, 0.0, {}])
+
+    def _registrar_metrica(self, nombre: str, valor: float, total: Optional[float]) -> Tuple[float, Optional[float]]:
+        """Guarda la métrica en la etapa actual; devuelve (segundos de etapa, ritmo por segundo)"""
+        segundos = time.monotonic() - self._inicio_etapa
+        por_segundo = round(valor / segundos, 1) if segundos > 0 else None
+        if not self._etapas:
+            self._etapas.append([self.etapa, 0.0, {}])
+        self._etapas[-1][2][nombre] = (valor, total, por_segundo)
+        return segundos, por_segundo
+
+    def resumen_etapas(self) -> List[Dict[str, Any]]:
+        """Duración y métricas (con ritmo por segundo) de cada etapa"""
+        return [
+            {"etapa": etapa, "segundos": round(segundos, 3),
+             "metricas": {n: {"valor": v, "total": t, "por_segundo": ps} for n, (v, t, ps) in metricas.items()}}
+            for etapa, segundos, metricas in self._etapas
+        ]
+
+    def to_dict(self, incluir_resultado: bool = True, entregar: bool = False) -> Dict[str, Any]:
+        """
+        Estado serializable para la UI.
+
+        Con entregar=True el resultado se incluye una sola vez y después se
+        libera (el Paso 1 devuelve el detalle completo de la validación): las
+        consultas siguientes solo indican 'resultado_entregado'.
+        """
+        datos = {
+            "trabajo_id": self.id,
+            "tipo": self.tipo,
+            "sesion": self.sesion,
+            "estado": self.estado,
+            "etapa": self.etapa,
+            "porcentaje": round(self.porcentaje, 1),
+            "mensaje": self.mensaje,
+            "finalizado": self.terminado,
+            "creado": self.creado.isoformat(),
+            "iniciado": self.iniciado.isoformat() if self.iniciado else None,
+            "fin": self.finalizado.isoformat() if self.finalizado else None,
+            "resultado_entregado": self.resultado_entregado,
+        }
+        if incluir_resultado and self.estado == COMPLETADO and not self.resultado_entregado:
+            datos["resultado"] = self.resultado
+            if entregar:
+                self.resultado = None
+                self.resultado_entregado = True
+        return datos
+
+
+# Trabajo que se está ejecutando en el hilo actual (None fuera de un trabajo)
+_trabajo_actual: contextvars.ContextVar[Optional[Trabajo]] = contextvars.ContextVar("trabajo_actual", default=None)
+
+
+def trabajo_actual() -> Optional[Trabajo]:
+    return _trabajo_actual.get()
+
+
+def reportar_etapa(etapa: str, porcentaje: float, mensaje: str = ""):
+    """
+    Marca el inicio de una etapa del trabajo en curso (frontera de cancelación).
+
+    Args:
+        etapa: Nombre de la etapa ('lectura', 'limpieza', 'validacion', 'guardado'...)
+        porcentaje: Porcentaje completado al empezar la etapa (0-100)
+        mensaje: Texto opcional para la UI
+    """
+    trabajo = _trabajo_actual.get()
+    if trabajo is None:
+        return
+    trabajo.comprobar()
+    trabajo._nueva_etapa(etapa)
+    trabajo.etapa = etapa
+    trabajo.porcentaje = max(trabajo.porcentaje, float(porcentaje))
+    if mensaje:
+        trabajo.mensaje = mensaje
+    trabajo.emitir("etapa", mensaje=mensaje)
+
+
+def reportar_progreso(porcentaje: float, mensaje: str = ""):
+    """Actualiza el porcentaje dentro de la etapa actual (también comprueba cancelación)"""
+    trabajo = _trabajo_actual.get()
+    if trabajo is None:
+        return
+    trabajo.comprobar()
+    trabajo.porcentaje = max(trabajo.porcentaje, float(porcentaje))
+    if mensaje:
+        trabajo.mensaje = mensaje
+    trabajo.emitir("progreso", mensaje=mensaje)
+
+
+def reportar_metrica(nombre: str, valor: float, total: Optional[float] = None):
+    """
+    Publica una métrica de la etapa actual ('filas_leidas', 'grupos_validados',
+    'filas_guardadas'...) con su ritmo por segundo desde el inicio de la etapa.
+
+    Args:
+        valor: Cantidad acumulada en la etapa
+        total: Cantidad esperada, si se conoce
+    """
+    trabajo = _trabajo_actual.get()
+    if trabajo is None:
+        return
+    segundos, por_segundo = trabajo._registrar_metrica(nombre, valor, total)
+    trabajo.emitir("metrica", metrica=nombre, valor=valor, total=total,
+                   segundos_etapa=round(segundos, 3), por_segundo=por_segundo)
+
+
+def _texto_evento_sse(evento: Dict[str, Any]) -> str:
+    datos = json.dumps(evento, ensure_ascii=False, default=str)
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {datos}\n\n"
+
+
+def flujo_sse(trabajo: Trabajo, desde: int = 0, latido: float = LATIDO_SSE_SEGUNDOS) -> Iterator[str]:
+    """
+    Cuerpo text/event-stream con los eventos del trabajo a partir de `desde`
+    (Last-Event-ID al reconectar). Termina tras el evento 'fin'.
+    """
+    yield "retry: 2000\n\n"
+    while True:
+        eventos = trabajo.eventos_desde(desde, espera=latido)
+        if not eventos:
+            yield ": latido\n\n"
+            continue
+        for evento in eventos:
+            yield _texto_evento_sse(evento)
+            desde = evento["id"]
+            if evento["tipo"] == EVENTO_FIN:
+                return
+
+
+class GestorTrabajos:
+    """Pool de hilos y registro de trabajos en segundo plano"""
+
+    def __init__(self, max_trabajadores: int = MAX_TRABAJADORES):
+        self._pool = ThreadPoolExecutor(max_workers=max_trabajadores, thread_name_prefix="wogest-trabajo")
+        self._trabajos: Dict[str, Trabajo] = {}
+        self._lock = threading.Lock()
+
+    def enviar(self, tipo: str, funcion: Callable[..., Any], *args,
+               limite_segundos: Optional[float] = None, **kwargs) -> Trabajo:
+        """
+        Encola `funcion(*args, **kwargs)` como trabajo.
+
+        Args:
+            tipo: Nombre de la operación (para la UI y los logs)
+            funcion: Callable a ejecutar en el pool
+            limite_segundos: Tiempo máximo desde el envío (None = sin límite)
+
+        Returns:
+            El Trabajo registrado (estado PENDIENTE)
+        """
+        limite = time.monotonic() + limite_segundos if limite_segundos else None
+        trabajo = Trabajo(id=uuid.uuid4().hex, tipo=tipo, limite=limite, sesion=sesion_actual())
+        with self._lock:
+            self._trabajos[trabajo.id] = trabajo
+            self._purgar_finalizados()
+        # El hilo del pool no hereda las ContextVar (sesión actual): se copia el contexto
+        trabajo._futuro = self._pool.submit(contextvars.copy_context().run, self._ejecutar, trabajo, funcion, args, kwargs)
+        logger.info(f"🧵 Trabajo {tipo} encolado: {trabajo.id}")
+        return trabajo
+
+    def _ejecutar(self, trabajo: Trabajo, funcion, args, kwargs):
+        token = _trabajo_actual.set(trabajo)
+        try:
+            trabajo.comprobar()
+            trabajo.estado = EN_CURSO
+            trabajo.iniciado = datetime.now()
+            trabajo.etapa = "inicio"
+            trabajo.emitir("inicio", tipo_trabajo=trabajo.tipo, sesion=trabajo.sesion)
+            resultado = funcion(*args, **kwargs)
+            # Cancelación pedida después de la última frontera de etapa
+            if trabajo._cancelacion.is_set():
+                trabajo.comprobar()
+            trabajo.resultado = resultado
+            trabajo.estado = COMPLETADO
+            trabajo.etapa = "completado"
+            trabajo.porcentaje = 100.0
+        except TrabajoCancelado as e:
+            trabajo.estado = trabajo._motivo_cancelacion
+            trabajo.mensaje = str(e)
+            logger.info(f"⏹️ Trabajo {trabajo.tipo} {trabajo.id}: {trabajo.estado}")
+        except Exception as e:
+            trabajo.estado = ERROR
+            trabajo.mensaje = str(e)
+            logger.exception(f"❌ Error en trabajo {trabajo.tipo} {trabajo.id}")
+        finally:
+            trabajo.finalizado = datetime.now()
+            trabajo._cerrar_etapa()
+            etapas = trabajo.resumen_etapas()
+            trabajo.emitir(EVENTO_FIN, estado=trabajo.estado, mensaje=trabajo.mensaje, etapas=etapas)
+            _registrar_etapas(trabajo, etapas)
+            _trabajo_actual.reset(token)
+
+    def obtener(self, trabajo_id: str) -> Optional[Trabajo]:
+        with self._lock:
+            return self._trabajos.get(trabajo_id)
+
+    def cancelar(self, trabajo_id: str) -> bool:
+        """Solicita la cancelación; False si el trabajo no existe o ya terminó"""
+        trabajo = self.obtener(trabajo_id)
+        if trabajo is None or trabajo.terminado:
+            return False
+        trabajo.solicitar_cancelacion()
+        logger.info(f"🛑 Cancelación solicitada: {trabajo.tipo} {trabajo_id}")
+        return True
+
+    def listar(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            trabajos = list(self._trabajos.values())
+        return [t.to_dict(incluir_resultado=False) for t in trabajos]
+
+    def _purgar_finalizados(self):
+        finalizados = [t for t in self._trabajos.values() if t.terminado]
+        sobrantes = len(finalizados) - MAX_TRABAJOS_FINALIZADOS
+        if sobrantes > 0:
+            for trabajo in sorted(finalizados, key=lambda t: t.finalizado or t.creado)[:sobrantes]:
+                del self._trabajos[trabajo.id]
+
+    def cerrar(self):
+        """Cancela lo pendiente y libera el pool (al cerrar la aplicación)"""
+        with self._lock:
+            trabajos = list(self._trabajos.values())
+        for trabajo in trabajos:
+            if not trabajo.terminado:
+                trabajo.solicitar_cancelacion()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+        # Los que seguían en cola no llegan a ejecutarse: se cierran aquí para
+        # que quien consulta su estado o escucha sus eventos reciba el final
+        for trabajo in trabajos:
+            if trabajo._futuro is not None and trabajo._futuro.cancelled():
+                trabajo.estado = CANCELADO
+                trabajo.mensaje = "Trabajo cancelado al cerrar la aplicación"
+                trabajo.finalizado = datetime.now()
+                trabajo.emitir(EVENTO_FIN, estado=trabajo.estado, mensaje=trabajo.mensaje, etapas=[])
+
+
+def _registrar_etapas(trabajo: Trabajo, etapas: List[Dict[str, Any]]):
+    """Escribe en el log la duración y el ritmo de cada etapa del trabajo"""
+    if not etapas:
+        return
+    lineas = []
+    for e in etapas:
+        metricas = ", ".join(
+            f"{n}={m['valor']:g}" + (f" ({m['por_segundo']:g}/s)" if m["por_segundo"] is not None else "")
+            for n, m in e["metricas"].items()
+        )
+        lineas.append(f"    {e['etapa']:<16} {e['segundos'] * 1000:8.0f} ms  {metricas}")
+    logger.info(f"📈 Trabajo {trabajo.tipo} {trabajo.id} ({trabajo.estado}):\n" + "\n".join(lineas))
+
+
+# Instancia global del gestor
+gestor_trabajos = GestorTrabajos()
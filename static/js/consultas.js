@@ -0,0 +1,55 @@
+// Consultas paginadas de los datos guardados en el backend (ver procesamiento/consultas.py)
+// La tabla pide solo la página visible con sus filtros y orden; el backend
+// devuelve esas filas y los totales para los controles de paginación.
+
+import { FORMATO_RESPUESTA, decodificarFilas } from './formato-columnar.js';
+
+/**
+ * Pide una página de los datos de un paso.
+ * @param {string} origen - 'step1_p1' | 'step2_p2' | 'step3_p3'
+ * @param {Object} [opciones]
+ * @param {number} [opciones.pagina=1]
+ * @param {number} [opciones.porPagina=50]
+ * @param {string[]} [opciones.orden] - Columnas de orden ('-COL' = descendente)
+ * @param {Object} [opciones.filtros] - { contiene: {...}, igual: {...} }
+ * @returns {Promise<Object>} { success, filas, total, total_filtrado, pagina, por_pagina, total_paginas }
+ */
+export async function consultarPagina(origen, opciones = {}) {
+  const api = window.pywebview?.api;
+  if (!api || typeof api.consultar_datos !== 'function') {
+    throw new Error('Consulta paginada no disponible');
+  }
+
+  const { pagina = 1, porPagina = 50, orden = [], filtros = null } = opciones;
+  const respuesta = await api.consultar_datos({
+    origen,
+    pagina,
+    por_pagina: porPagina,
+    orden,
+    filtros,
+    formato_respuesta: FORMATO_RESPUESTA
+  });
+  if (!respuesta?.success) {
+    throw new Error(respuesta?.message || 'Error al consultar los datos');
+  }
+  respuesta.filas = (await decodificarFilas(respuesta.filas)) || [];
+  return respuesta;
+}
+
+/**
+ * Consultas en serie para una tabla: solo se aplica la respuesta de la última
+ * petición (las anteriores que lleguen tarde se descartan).
+ * @param {string} origen
+ * @returns {Function} (opciones) => Promise<Object|null> (null si la respuesta quedó obsoleta)
+ */
+export function crearConsultor(origen) {
+  let ultima = 0;
+  return async (opciones) => {
+    const numero = ++ultima;
+    const respuesta = await consultarPagina(origen, opciones);
+    return numero === ultima ? respuesta : null;
+  };
+}
+
+// Acceso para scripts que no son módulos
+window.WOGestConsultas = { consultarPagina, crearConsultor };
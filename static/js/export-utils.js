@@ -1,9 +1,11 @@
 // Utilidad para exportar datos a Excel desde cualquier paso
 // Requiere que el backend exponga una función exportar_excel_con_ruta compatible
+import { ejecutarTrabajo, describirEtapa } from './trabajos.js';
 
 /**
  * Exporta datos a Excel usando el backend (pywebview) con interfaz mejorada.
- * @param {Object} datosValidacion - Objeto con los datos a exportar (estructura igual a paso 1)
+ * @param {Object} datosValidacion - { contexto, origen: { paso, filtros } } para exportar desde los
+ *   datos guardados en el backend, o { contexto, detalle } con los registros (formato anterior)
  * @param {string} [nombreArchivoOriginal] - Nombre del archivo original (opcional)
  * @param {Function} [onSuccess] - Callback en caso de éxito
  * @param {Function} [onError] - Callback en caso de error
@@ -11,7 +13,7 @@
 export async function exportarExcel(datosValidacion, nombreArchivoOriginal = "N/A", onSuccess, onError) {
   console.log("🔥 Iniciando exportarExcel() - export-utils.js");
 
-  if (!datosValidacion?.detalle) {
+  if (!datosValidacion?.origen && !datosValidacion?.detalle) {
     alert("❌ No hay datos para exportar");
     if (onError) onError("No hay datos para exportar");
     return;
@@ -48,10 +50,14 @@ export async function exportarExcel(datosValidacion, nombreArchivoOriginal = "N/
       btnExportar.innerHTML = '⏳ Exportando...';
     }
 
-    const resultado = await window.pywebview.api.exportar_excel_con_ruta({
+    const resultado = await ejecutarTrabajo('exportar', {
       datos: datosValidacion,
       carpeta_destino: carpetaDestino,
       nombre_archivo_original: nombreArchivoOriginal
+    }, {
+      onProgreso: (estado) => {
+        if (btnExportar) btnExportar.innerHTML = `⏳ ${describirEtapa(estado)}`;
+      }
     });
 
     if (resultado.success) {
@@ -0,0 +1,52 @@
+// Decodificación del formato columnar de las respuestas (ver procesamiento/formato_columnar.py)
+// Las filas llegan como columnas (con diccionario para textos repetidos y,
+// opcionalmente, gzip + base64) y aquí se reconstruye la lista de objetos
+// que usan las tablas.
+
+// Formato que se pide al backend: gzip solo si el navegador puede descomprimir
+export const FORMATO_RESPUESTA = typeof DecompressionStream === 'function' ? 'columnar.gz' : 'columnar';
+
+async function descomprimir(base64) {
+  const comprimido = await (await fetch(`data:application/octet-stream;base64,${base64}`)).blob();
+  const flujo = comprimido.stream().pipeThrough(new DecompressionStream('gzip'));
+  return new Response(flujo).json();
+}
+
+function filasDesdeColumnas({ columnas = [], filas = 0, valores = [] }) {
+  const datos = valores.map((columna) =>
+    Array.isArray(columna) ? columna : columna.idx.map((i) => (i < 0 ? null : columna.dic[i]))
+  );
+  const resultado = new Array(filas);
+  for (let f = 0; f < filas; f++) {
+    const fila = {};
+    for (let c = 0; c < columnas.length; c++) fila[columnas[c]] = datos[c][f];
+    resultado[f] = fila;
+  }
+  return resultado;
+}
+
+/**
+ * Devuelve la lista de filas de un valor de respuesta, esté o no en formato columnar.
+ * @param {Array|Object} valor - Lista de filas, {formato:'columnar',...} o {formato:'columnar.gz',...}
+ * @returns {Promise<Array<Object>>}
+ */
+export async function decodificarFilas(valor) {
+  if (!valor || Array.isArray(valor)) return valor;
+  if (valor.formato === 'columnar') return filasDesdeColumnas(valor);
+  if (valor.formato === 'columnar.gz') return filasDesdeColumnas(await descomprimir(valor.datos));
+  return valor;
+}
+
+/**
+ * Decodifica en la propia respuesta las claves con filas ('detalle', 'datos_cruzados'...).
+ * @param {Object} respuesta
+ * @param {string[]} [claves=['detalle']]
+ * @returns {Promise<Object>} La misma respuesta, con listas de filas
+ */
+export async function decodificarRespuesta(respuesta, claves = ['detalle']) {
+  if (!respuesta) return respuesta;
+  for (const clave of claves) {
+    if (respuesta[clave]) respuesta[clave] = await decodificarFilas(respuesta[clave]);
+  }
+  return respuesta;
+}
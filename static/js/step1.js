@@ -1,3 +1,7 @@
+import { ejecutarTrabajo, describirEtapa } from './trabajos.js';
+import { payloadArchivo } from './subidas.js';
+import { FORMATO_RESPUESTA, decodificarRespuesta } from './formato-columnar.js';
+
 // Función para formatear valores según su tipo
 function formatearValor(valor, columna) {
   // Manejo especial para PRECIO y CUOTA: mostrar 0 en lugar de N/A
@@ -546,59 +550,50 @@ function validarCarga(event) {
     alert("❌ Error: La conexión con Python no está disponible");
     return;
   }
-  console.log("📖 Leyendo archivo...");
-  const reader = new FileReader();
-
-  reader.onload = function () {
-    console.log("📖 Archivo leído correctamente");
-    const base64Data = reader.result.split(',')[1];
-    console.log("📤 Base64 generado, longitud:", base64Data.length);
-    console.log("📤 Enviando archivo a Python:", archivo.name);
+  console.log("📤 Enviando archivo a Python:", archivo.name);
+  updateProcessStatus('Subiendo archivo...', 'validating');
 
+  payloadArchivo(archivo, {
+    onProgreso: (porcentaje) => updateProcessStatus(`Subiendo archivo… ${Math.round(porcentaje)}%`, 'validating')
+  }).then(payload => {
     updateProcessStatus('Validando archivo...', 'validating');
-    window.pywebview.api.validar_archivo_workorder({
-      nombre: archivo.name,
-      base64: base64Data
-    }).then(resp => {
-      console.log("📥 Respuesta de Python recibida:", resp);
-      const loading = document.getElementById('loading');
-      if (loading) loading.classList.add('hidden');
-      const preview = document.getElementById("preview");
-      if (preview) {
-        preview.classList.remove("hidden");
-        if (resp.success) {
-          preview.innerHTML = `<p class="text-green-700 font-medium">✅ ${resp.message}</p>`;
-          updateProcessStatus('Archivo validado correctamente (solo DMCE/AMCE)', 'success');
-
-          window.appState.validationResult = resp;
-
-          mostrarTablaResultados(resp);
-
-          const btn = document.getElementById("btn-siguiente");
-          if (btn) {
-            btn.disabled = false;
-            btn.classList.remove("disabled");
-          }
-        } else {
-          preview.innerHTML = `<p class="text-red-600 font-medium">❌ ${resp.message}</p>`;
-          updateProcessStatus('Error en validación', 'error');
+    return ejecutarTrabajo('validar_workorder', { ...payload, formato_respuesta: FORMATO_RESPUESTA }, {
+      onProgreso: (estado) => updateProcessStatus(`Validando archivo: ${describirEtapa(estado)}`, 'validating')
+    });
+  }).then(decodificarRespuesta).then(resp => {
+    console.log("📥 Respuesta de Python recibida:", resp);
+    const loading = document.getElementById('loading');
+    if (loading) loading.classList.add('hidden');
+    const preview = document.getElementById("preview");
+    if (preview) {
+      preview.classList.remove("hidden");
+      if (resp.success) {
+        preview.innerHTML = `<p class="text-green-700 font-medium">✅ ${resp.message}</p>`;
+        updateProcessStatus('Archivo validado correctamente (solo DMCE/AMCE)', 'success');
+
+        window.appState.validationResult = resp;
+
+        mostrarTablaResultados(resp);
+
+        const btn = document.getElementById("btn-siguiente");
+        if (btn) {
+          btn.disabled = false;
+          btn.classList.remove("disabled");
         }
+      } else {
+        preview.innerHTML = `<p class="text-red-600 font-medium">❌ ${resp.message}</p>`;
+        updateProcessStatus('Error en validación', 'error');
       }
-    }).catch(error => {
-      console.error("❌ ERROR al llamar a pywebview.api:", error);
+    }
+  }).catch(error => {
+    console.error("❌ ERROR al llamar a pywebview.api:", error);
 
-      const loading = document.getElementById('loading');
-      if (loading) loading.classList.add('hidden');
+    const loading = document.getElementById('loading');
+    if (loading) loading.classList.add('hidden');
 
-      alert("❌ Error al validar el archivo: " + error.message);
-      updateProcessStatus('Error al validar archivo', 'error');
-    });
-  };
-  reader.onerror = function() {
-    console.error("❌ Error al leer el archivo");
-    alert("❌ Error al leer el archivo");
-  };
-  reader.readAsDataURL(archivo);
+    alert("❌ Error al validar el archivo: " + error.message);
+    updateProcessStatus('Error al validar archivo', 'error');
+  });
 }
 
 function mostrarTablaResultados(resultado) {
@@ -1004,8 +999,9 @@ async function exportarExcel() {
     const { exportarExcel: exportarExcelUtils } = await import('./export-utils.js');
     
     // Usar la función centralizada de exportación  
+    // El backend exporta su propio resultado de validación (sin reenviar 'detalle')
     await exportarExcelUtils(
-      { contexto: 'step1_p1', ...window.appState.validationResult },
+      { contexto: 'step1_p1', origen: { paso: 'step1_p1' } },
       window.appState.selectedFile?.name || 'N/A'
     );
   } catch (error) {
@@ -4,6 +4,10 @@
 // ===================================================================
 
 import { exportarExcel } from './export-utils.js';
+import { ejecutarTrabajo, describirEtapa } from './trabajos.js';
+import { payloadArchivo } from './subidas.js';
+import { FORMATO_RESPUESTA, decodificarRespuesta } from './formato-columnar.js';
+import { crearConsultor } from './consultas.js';
 
 // Estado global de la aplicación para el paso 2
 window.appStateStep2 = window.appStateStep2 || {
@@ -27,6 +31,7 @@ window.appStateStep2 = window.appStateStep2 || {
     totalRegistros: 0
   },
   datosFiltrados: [],
+  paginacionServidor: false,
   dataTableInstance: null,
   yaMostroResultados: false
 };
@@ -52,7 +57,7 @@ function initializeStep2App() {
   
   // Conectar botón exportar Excel
   document.getElementById('btn-exportar-excel')?.addEventListener('click', () => {
-    exportarExcel({ contexto: 'step2_p2', detalle: window.appStateStep2.datosFiltrados }, "WOQ_step2");
+    exportarExcel({ contexto: 'step2_p2', origen: origenExportacionStep2() }, "WOQ_step2");
   });
   
   // Verificar pywebview
@@ -296,6 +301,7 @@ function clearStep2File() {
   console.log("✅ Estado de archivo limpiado");
   window.appStateStep2.validationResult = null;
   window.appStateStep2.datosFiltrados = [];
+  window.appStateStep2.paginacionServidor = false;
   window.appStateStep2.yaMostroResultados = false;
   window.appStateStep2.isProcessing = false;
 
@@ -480,95 +486,83 @@ function procesarArchivoWOQ(event) {
     estadoProceso.className = "text-blue-600";
   }
 
-  const reader = new FileReader();
+  const fallo = (error) => {
+    window.appStateStep2.isProcessing = false;
+    mostrarStep2Loading(false);
 
-  reader.onload = function () {
-    try {
-      const base64Parts = reader.result.split(',');
-      if (base64Parts.length < 2) throw new Error("Formato de base64 inválido");
+    console.error("❌ Error al procesar el archivo WOQ:", error);
 
-      const base64Data = base64Parts[1];
+    if (error.message === "Tiempo de espera agotado") {
+      mostrarErrorStep2("El procesamiento está tomando demasiado tiempo. Intente con un archivo más pequeño o contacte al soporte.");
+    } else {
+      mostrarErrorStep2("Error al procesar el archivo: " + (error.message || "Error desconocido"));
+    }
 
-      const timeoutPromise = new Promise((_, reject) => {
-        setTimeout(() => reject(new Error("Tiempo de espera agotado")), 60000);
-      });
+    habilitarBotonProcesar();
+  };
 
+  // Subida binaria por bloques (base64 solo si el servidor no la admite)
+  payloadArchivo(archivo, {
+    onProgreso: (porcentaje) => {
+      if (estadoProceso) estadoProceso.textContent = `Subiendo archivo WOQ… ${Math.round(porcentaje)}%`;
+    }
+  })
+    .then(payload => {
       console.log("📡 Enviando a pywebview.api.procesar_archivo_woq");
 
-      Promise.race([
-        window.pywebview.api.procesar_archivo_woq({ nombre: archivo.name, base64: base64Data }),
-        timeoutPromise
-      ])
-      .then(resp => {
-        console.log("📥 Respuesta recibida:", resp);
-        window.appStateStep2.isProcessing = false;
-        mostrarStep2Loading(false);
-
-        if (!resp) {
-          console.warn("⚠️ Respuesta nula del backend");
-          mostrarErrorStep2("Error: No se recibió respuesta del servidor");
-          return;
+      // Trabajo en segundo plano con límite de 60 s en el backend
+      // Paginación en el backend: solo llega la primera página de la tabla
+      const opcionesWoq = {
+        ...payload,
+        formato_respuesta: FORMATO_RESPUESTA,
+        por_pagina: window.appStateStep2.paginacion.registrosPorPagina
+      };
+      return ejecutarTrabajo('procesar_woq', opcionesWoq, {
+        limiteSegundos: 60,
+        onProgreso: (estado) => {
+          if (estadoProceso) estadoProceso.textContent = `Procesando archivo WOQ: ${describirEtapa(estado)}`;
         }
+      });
+    })
+    .then(decodificarRespuesta)
+    .then(resp => {
+      console.log("📥 Respuesta recibida:", resp);
+      window.appStateStep2.isProcessing = false;
+      mostrarStep2Loading(false);
 
-        if (!resp.success) {
-          console.warn("⚠️ Error reportado por backend:", resp.message);
-          mostrarErrorStep2(resp.message || "Error desconocido al procesar archivo");
-          return;
-        }
+      if (!resp) {
+        console.warn("⚠️ Respuesta nula del backend");
+        mostrarErrorStep2("Error: No se recibió respuesta del servidor");
+        return;
+      }
 
-        if (!resp.detalle || !Array.isArray(resp.detalle) || resp.detalle.length === 0) {
-          console.warn("⚠️ Detalle vacío o inválido en respuesta");
-          mostrarErrorStep2("El archivo no contiene datos válidos para procesar");
-          return;
-        }
+      if (!resp.success) {
+        console.warn("⚠️ Error reportado por backend:", resp.message);
+        mostrarErrorStep2(resp.message || "Error desconocido al procesar archivo");
+        return;
+      }
 
-        // ✅ Asignar los datos correctamente
-        window.appStateStep2.validationResult = resp;
-        window.appStateStep2.datosFiltrados = [...resp.detalle];
-        window.appStateStep2.yaMostroResultados = false;
-
-        // ✅ Ocultar loading y mostrar resultados en UI
-        mostrarStep2Loading(false);
-        mostrarResultadosStep2(resp);
-        mostrarBotonSiguiente();
-
-        // 🔍 Verificación (solo para depuración)
-        console.log("✅ Resultado guardado:", window.appStateStep2.validationResult);
-        console.log("✅ Tabla HTML generada:", document.getElementById('tabla-woq-resultados').innerHTML);
-      })
-      .catch(error => {
-        window.appStateStep2.isProcessing = false;
-        mostrarStep2Loading(false);
-
-        console.error("❌ Error al llamar a procesar_archivo_woq:", error);
-
-        if (error.message === "Tiempo de espera agotado") {
-          mostrarErrorStep2("El procesamiento está tomando demasiado tiempo. Intente con un archivo más pequeño o contacte al soporte.");
-        } else {
-          mostrarErrorStep2("Error al procesar el archivo: " + (error.message || "Error desconocido"));
-        }
+      if (!resp.detalle || !Array.isArray(resp.detalle) || resp.detalle.length === 0) {
+        console.warn("⚠️ Detalle vacío o inválido en respuesta");
+        mostrarErrorStep2("El archivo no contiene datos válidos para procesar");
+        return;
+      }
 
-        habilitarBotonProcesar();
-      });
+      // ✅ Asignar los datos correctamente
+      window.appStateStep2.validationResult = resp;
+      window.appStateStep2.datosFiltrados = [...resp.detalle];
+      window.appStateStep2.yaMostroResultados = false;
 
-    } catch (error) {
-      window.appStateStep2.isProcessing = false;
+      // ✅ Ocultar loading y mostrar resultados en UI
       mostrarStep2Loading(false);
-      console.error("❌ Error general durante lectura del archivo:", error);
-      mostrarErrorStep2("Error al leer el archivo: " + (error.message || "Error desconocido"));
-      habilitarBotonProcesar();
-    }
-  };
-
-
-  reader.onerror = function () {
-    window.appStateStep2.isProcessing = false;
-    mostrarStep2Loading(false);
-    mostrarErrorStep2("Error al leer el archivo. Verifique el formato del archivo e intente nuevamente.");
-    habilitarBotonProcesar();
-  };
+      mostrarResultadosStep2(resp);
+      mostrarBotonSiguiente();
 
-  reader.readAsDataURL(archivo);
+      // 🔍 Verificación (solo para depuración)
+      console.log("✅ Resultado guardado:", window.appStateStep2.validationResult);
+      console.log("✅ Tabla HTML generada:", document.getElementById('tabla-woq-resultados').innerHTML);
+    })
+    .catch(fallo);
 }
 
 
@@ -630,31 +624,28 @@ function mostrarResultadosStep2(resultado) {
     // Actualizar estado global con los datos (copia profunda para evitar referencias)
     const detalle = JSON.parse(JSON.stringify(resultado.detalle));
     window.appStateStep2.datosFiltrados = [...detalle];
-    window.appStateStep2.paginacion.totalRegistros = detalle.length;
-    window.appStateStep2.paginacion.totalPaginas = Math.ceil(detalle.length / window.appStateStep2.paginacion.registrosPorPagina);
+    window.appStateStep2.paginacionServidor = Boolean(resultado.consulta);
+
+    // Con paginación en el backend llega solo la primera página y los totales del archivo
+    const estadisticas = resultado.estadisticas || calcularEstadisticasStep2(detalle);
+    window.appStateStep2.totalSinFiltros = estadisticas.total;
+    const totalRegistros = resultado.consulta ? resultado.consulta.total_filtrado : detalle.length;
+    window.appStateStep2.paginacion.totalRegistros = totalRegistros;
+    window.appStateStep2.paginacion.totalPaginas = Math.ceil(totalRegistros / window.appStateStep2.paginacion.registrosPorPagina);
+    window.appStateStep2.paginacion.paginaActual = 1;
     console.log("✅ Estado global actualizado");
 
     // 1. Mostrar estadísticas principales
     try {
-      mostrarEstadisticasStep2(detalle);
+      mostrarEstadisticasStep2(estadisticas);
       const resumenEstadisticas = document.getElementById('resumen-estadisticas');
       if (resumenEstadisticas) {
         resumenEstadisticas.style.display = 'block';
       }
       
-      // Calcular estadísticas para el panel lateral
-      const total = detalle.length;
-      const cerrados = detalle.filter(r => r.es_cerrado === "SI" || r.cerrado === "X").length;
-      const pendientes = total - cerrados;
-      
       // Actualizar panel lateral con nuevo diseño (con pequeño delay para asegurar DOM)
       setTimeout(() => {
-        actualizarEstadisticasStep2({
-          total: total,
-          cerrados: cerrados,
-          pendientes: pendientes,
-          detalle: detalle
-        });
+        actualizarEstadisticasStep2(estadisticas);
       }, 100);
       
       console.log("✅ Estadísticas principales mostradas");
@@ -663,15 +654,6 @@ function mostrarResultadosStep2(resultado) {
       // No fallar todo el proceso por un error en estadísticas
     }
     
-    // 2. Actualizar panel lateral de estadísticas
-    try {
-      actualizarEstadisticasLaterales(detalle);
-      console.log("✅ Panel lateral actualizado");
-    } catch (lateralError) {
-      console.error("❌ Error al actualizar panel lateral:", lateralError);
-      // No fallar todo el proceso por un error en panel lateral
-    }
-
     // 3. Configurar filtros 
     try {
       setTimeout(() => {
@@ -737,17 +719,15 @@ function mostrarResultadosStep2(resultado) {
     
     // 7. Actualizar estado del proceso en la barra de estado
     try {
-      const detalle = window.appStateStep2.datosFiltrados; // Usar los datos almacenados
-      
       const estadoProceso = document.getElementById('estado-proceso');
       if (estadoProceso) {
-        estadoProceso.textContent = `${detalle.length} registros WOQ procesados`;
+        estadoProceso.textContent = `${estadisticas.total} registros WOQ procesados`;
         estadoProceso.className = "text-green-600";
       }
       
       const estadoProcesoLateral = document.getElementById('estado-proceso-lateral');
       if (estadoProcesoLateral) {
-        estadoProcesoLateral.textContent = `${detalle.length} registros WOQ procesados`;
+        estadoProcesoLateral.textContent = `${estadisticas.total} registros WOQ procesados`;
       }
       
       console.log("✅ Estado del proceso actualizado correctamente");
@@ -767,6 +747,18 @@ function mostrarResultadosStep2(resultado) {
   }
 }
 
+// Referencia a los datos del Paso 2 en el backend con los filtros activos de la tabla
+function origenExportacionStep2() {
+  const filtros = window.appStateStep2.filtrosActivos || {};
+  return {
+    paso: 'step2_p2',
+    filtros: {
+      contiene: { N_WO: filtros.N_WO || '', CONTRATO: filtros.CONTRATO || '' },
+      igual: { es_cerrado: filtros.es_cerrado || '' }
+    }
+  };
+}
+
 function configurarFiltrosStep2() {
   const mapeo = {
     'filtro-wo-step2': 'N_WO',
@@ -805,7 +797,43 @@ function configurarFiltrosStep2() {
   }
 }
 
+const consultarPaso2 = crearConsultor('step2_p2');
+
+async function cargarPaginaStep2() {
+  const { paginaActual, registrosPorPagina } = window.appStateStep2.paginacion;
+  try {
+    const respuesta = await consultarPaso2({
+      pagina: paginaActual,
+      porPagina: registrosPorPagina,
+      filtros: origenExportacionStep2().filtros
+    });
+    if (!respuesta) return; // Llegó después una consulta más reciente
+
+    window.appStateStep2.datosFiltrados = respuesta.filas;
+    window.appStateStep2.paginacion.totalRegistros = respuesta.total_filtrado;
+    window.appStateStep2.paginacion.totalPaginas = respuesta.total_paginas;
+  } catch (error) {
+    console.error("❌ Error al consultar la página del WOQ:", error);
+    mostrarErrorStep2("Error al cargar la página del WOQ: " + error.message);
+    return;
+  }
+
+  mostrarPaginaActual();
+  mostrarControlesPaginacion();
+  actualizarContadorFiltrosStep2();
+}
+
+let temporizadorFiltrosStep2 = null;
+
 function aplicarFiltrosStep2() {
+  if (window.appStateStep2.paginacionServidor) {
+    // Filtrado en el backend: se espera a que el usuario deje de escribir
+    window.appStateStep2.paginacion.paginaActual = 1;
+    clearTimeout(temporizadorFiltrosStep2);
+    temporizadorFiltrosStep2 = setTimeout(cargarPaginaStep2, 250);
+    return;
+  }
+
   if (!window.appStateStep2.validationResult || !Array.isArray(window.appStateStep2.validationResult.detalle)) {
     console.warn("❌ No hay datos para filtrar");
     return;
@@ -865,12 +893,17 @@ function aplicarFiltrosStep2() {
 }
 
 
-function mostrarEstadisticasStep2(data) {
-  if (!data || !Array.isArray(data)) return;
+// Totales calculados en el cliente (respuestas sin 'estadisticas' del backend)
+function calcularEstadisticasStep2(detalle) {
+  const total = detalle.length;
+  const cerrados = detalle.filter(r => r.es_cerrado === "SI" || r.cerrado === "X").length;
+  return { total, cerrados, pendientes: total - cerrados };
+}
 
-  const total = data.length;
-  const cerrados = data.filter(r => r.es_cerrado === "SI" || r.cerrado === "X").length;
-  const pendientes = total - cerrados;
+function mostrarEstadisticasStep2(stats) {
+  if (!stats) return;
+
+  const { total, cerrados, pendientes } = stats;
   const porcentaje = total > 0 ? Math.round((cerrados / total) * 100) : 0;
 
   // Mostrar sección
@@ -1002,6 +1035,9 @@ function mostrarPaginaActual() {
 }
 
 function obtenerDatosPaginaActual() {
+  if (window.appStateStep2.paginacionServidor) {
+    return window.appStateStep2.datosFiltrados;
+  }
   const inicio = (window.appStateStep2.paginacion.paginaActual - 1) * window.appStateStep2.paginacion.registrosPorPagina;
   const fin = inicio + window.appStateStep2.paginacion.registrosPorPagina;
   return window.appStateStep2.datosFiltrados.slice(inicio, fin);
@@ -1050,6 +1086,10 @@ function mostrarControlesPaginacion() {
       selector.addEventListener('change', (e) => {
         window.appStateStep2.paginacion.registrosPorPagina = parseInt(e.target.value);
         window.appStateStep2.paginacion.paginaActual = 1;
+        if (window.appStateStep2.paginacionServidor) {
+          cargarPaginaStep2();
+          return;
+        }
         window.appStateStep2.paginacion.totalPaginas = Math.ceil(
           window.appStateStep2.datosFiltrados.length / window.appStateStep2.paginacion.registrosPorPagina
         );
@@ -1063,6 +1103,10 @@ function mostrarControlesPaginacion() {
 function irPaginaAnterior() {
   if (window.appStateStep2.paginacion.paginaActual > 1) {
     window.appStateStep2.paginacion.paginaActual--;
+    if (window.appStateStep2.paginacionServidor) {
+      cargarPaginaStep2();
+      return;
+    }
     mostrarPaginaActual();
     mostrarControlesPaginacion();
   }
@@ -1071,6 +1115,10 @@ function irPaginaAnterior() {
 function irPaginaSiguiente() {
   if (window.appStateStep2.paginacion.paginaActual < window.appStateStep2.paginacion.totalPaginas) {
     window.appStateStep2.paginacion.paginaActual++;
+    if (window.appStateStep2.paginacionServidor) {
+      cargarPaginaStep2();
+      return;
+    }
     mostrarPaginaActual();
     mostrarControlesPaginacion();
   }
@@ -1136,8 +1184,10 @@ function generarTablaHtml(datos) {
     const estadoChip = generarChipEstadoWoq(fila.es_cerrado || 'Desconocido');
     const clasesFila = fila.es_cerrado === 'NO' ? 'bg-yellow-50' : '';
 
-    // Calcular el índice global considerando la paginación
-    const indiceGlobal = (window.appStateStep2.paginacion.paginaActual - 1) * window.appStateStep2.paginacion.registrosPorPagina + index;
+    // Calcular el índice global considerando la paginación (con paginación en el backend solo está la página)
+    const indiceGlobal = window.appStateStep2.paginacionServidor
+      ? index
+      : (window.appStateStep2.paginacion.paginaActual - 1) * window.appStateStep2.paginacion.registrosPorPagina + index;
 
     html += `
       <tr class="hover:bg-gray-50 ${clasesFila}" data-index="${index}">
@@ -1388,7 +1438,9 @@ function mostrarBotonSiguiente() {
 }
 
 function actualizarContadorFiltrosStep2() {
-  const totalRegistros = window.appStateStep2.datosFiltrados.length;
+  const totalRegistros = window.appStateStep2.paginacionServidor
+    ? window.appStateStep2.totalSinFiltros
+    : window.appStateStep2.datosFiltrados.length;
   const totalFiltrados = window.appStateStep2.paginacion.totalRegistros;
   
   const contadorFiltros = document.getElementById('contador-filtros');
@@ -1515,7 +1567,7 @@ function verDetalleWoq(index) {
 
 // Hacer la función exportarExcel disponible globalmente para los botones HTML
 window.exportarExcel = () => {
-  exportarExcel({ contexto: 'step2_p2', detalle: window.appStateStep2.datosFiltrados }, "WOQ_step2");
+  exportarExcel({ contexto: 'step2_p2', origen: origenExportacionStep2() }, "WOQ_step2");
 };
 
 // Hacer la función verDetalleWoq disponible globalmente para los botones HTML
@@ -5,6 +5,9 @@
 
 // Importar función de exportación
 import { exportarExcel } from './export-utils.js';
+import { ejecutarTrabajo, describirEtapa } from './trabajos.js';
+import { FORMATO_RESPUESTA, decodificarRespuesta } from './formato-columnar.js';
+import { crearConsultor } from './consultas.js';
 
 // ===================================================================
 // DEBUG Y ERROR TRACKING
@@ -29,6 +32,8 @@ window.appStateStep3 = window.appStateStep3 || {
     apto_rpa: ''
   },
   datosFiltrados: [],
+  // true si el backend pagina y filtra el cruce (datosFiltrados = página visible)
+  paginacionServidor: false,
   paginacion: {
     paginaActual: 1,
     registrosPorPagina: 50,
@@ -87,7 +92,7 @@ function setupStep3Buttons() {
       }
 
       exportarExcel(
-        { contexto: 'step3_p3', detalle: datos },
+        { contexto: 'step3_p3', origen: origenExportacionCruce() },
         "CrucePaso3.xlsx",
         (resp) => console.log("✅ Exportación completada", resp),
         (err) => console.error("❌ Error al exportar", err)
@@ -108,7 +113,7 @@ function setupStep3Buttons() {
       }
 
       exportarExcel(
-        { contexto: 'step3_p3', detalle: datos },
+        { contexto: 'step3_p3', origen: origenExportacionCruce() },
         "CrucePaso3.xlsx",
         (resp) => console.log("✅ Exportación completada", resp),
         (err) => console.error("❌ Error al exportar", err)
@@ -277,7 +282,17 @@ function realizarCruceDatos() {
     return;
   }
   
-  window.pywebview.api.realizar_cruce_datos()
+  const opcionesCruce = {
+    formato_respuesta: FORMATO_RESPUESTA,
+    por_pagina: window.appStateStep3.paginacion.registrosPorPagina
+  };
+
+  ejecutarTrabajo('cruce', opcionesCruce, {
+    onProgreso: (estado) => {
+      if (estadoProcesoLateral) estadoProcesoLateral.textContent = `Realizando cruce: ${describirEtapa(estado)}`;
+    }
+  })
+    .then((respuesta) => decodificarRespuesta(respuesta, ['datos_cruzados']))
     .then(respuesta => {
       console.log("📥 Respuesta del cruce recibida:", respuesta);
       mostrarStep3Loading(false);
@@ -323,11 +338,13 @@ function mostrarResultadosCruce(resultado) {
 
   // Actualizar estado global
   window.appStateStep3.datosFiltrados = [...datosCruzados];
+  window.appStateStep3.paginacionServidor = Boolean(resultado.consulta);
   
-  // Configurar paginación
-  window.appStateStep3.paginacion.totalRegistros = datosCruzados.length;
+  // Configurar paginación (con paginación en el backend llega solo la primera página)
+  const totalRegistros = resultado.consulta ? resultado.consulta.total_filtrado : datosCruzados.length;
+  window.appStateStep3.paginacion.totalRegistros = totalRegistros;
   window.appStateStep3.paginacion.totalPaginas = Math.ceil(
-    datosCruzados.length / window.appStateStep3.paginacion.registrosPorPagina
+    totalRegistros / window.appStateStep3.paginacion.registrosPorPagina
   );
   window.appStateStep3.paginacion.paginaActual = 1;
 
@@ -469,6 +486,9 @@ function mostrarTablaCruce() {
 }
 
 function obtenerDatosPaginaActualCruce() {
+  if (window.appStateStep3.paginacionServidor) {
+    return window.appStateStep3.datosFiltrados;
+  }
   const inicio = (window.appStateStep3.paginacion.paginaActual - 1) * window.appStateStep3.paginacion.registrosPorPagina;
   const fin = inicio + window.appStateStep3.paginacion.registrosPorPagina;
   return window.appStateStep3.datosFiltrados.slice(inicio, fin);
@@ -528,10 +548,9 @@ function mostrarControlesPaginacionCruce() {
         window.appStateStep3.paginacion.registrosPorPagina = parseInt(e.target.value);
         window.appStateStep3.paginacion.paginaActual = 1;
         window.appStateStep3.paginacion.totalPaginas = Math.ceil(
-          window.appStateStep3.datosFiltrados.length / window.appStateStep3.paginacion.registrosPorPagina
+          window.appStateStep3.paginacion.totalRegistros / window.appStateStep3.paginacion.registrosPorPagina
         );
-        mostrarTablaCruce();
-        mostrarControlesPaginacionCruce();
+        refrescarTablaCruce();
       });
     }
   }
@@ -540,17 +559,51 @@ function mostrarControlesPaginacionCruce() {
 function irPaginaAnteriorCruce() {
   if (window.appStateStep3.paginacion.paginaActual > 1) {
     window.appStateStep3.paginacion.paginaActual--;
-    mostrarTablaCruce();
-    mostrarControlesPaginacionCruce();
+    refrescarTablaCruce();
   }
 }
 
 function irPaginaSiguienteCruce() {
   if (window.appStateStep3.paginacion.paginaActual < window.appStateStep3.paginacion.totalPaginas) {
     window.appStateStep3.paginacion.paginaActual++;
-    mostrarTablaCruce();
-    mostrarControlesPaginacionCruce();
+    refrescarTablaCruce();
+  }
+}
+
+// Vuelve a pintar la página actual (pidiéndola al backend si pagina él)
+function refrescarTablaCruce() {
+  if (window.appStateStep3.paginacionServidor) {
+    cargarPaginaCruce();
+    return;
   }
+  mostrarTablaCruce();
+  mostrarControlesPaginacionCruce();
+}
+
+const consultarCruce = crearConsultor('step3_p3');
+
+async function cargarPaginaCruce() {
+  const { paginaActual, registrosPorPagina } = window.appStateStep3.paginacion;
+  try {
+    const respuesta = await consultarCruce({
+      pagina: paginaActual,
+      porPagina: registrosPorPagina,
+      filtros: origenExportacionCruce().filtros
+    });
+    if (!respuesta) return; // Llegó después una consulta más reciente
+
+    window.appStateStep3.datosFiltrados = respuesta.filas;
+    window.appStateStep3.paginacion.totalRegistros = respuesta.total_filtrado;
+    window.appStateStep3.paginacion.totalPaginas = respuesta.total_paginas;
+  } catch (error) {
+    console.error("❌ Error al consultar la página del cruce:", error);
+    mostrarErrorStep3("Error al cargar la página del cruce: " + error.message);
+    return;
+  }
+
+  mostrarTablaCruce();
+  mostrarControlesPaginacionCruce();
+  actualizarContadorFiltrosCruce();
 }
 
 function generarTablaHtmlCruce(datos) {
@@ -724,7 +777,7 @@ function generarChipEstadoPaso1(estado) {
 
 // Función helper para generar chip de cerrado
 function generarChipCerrado(valor) {
-  if (!valor) return '<span class="chip chip-neutral">No definido</span>';
+  if (valor === null || valor === undefined || valor === '') return '<span class="chip chip-neutral">No definido</span>';
   
   const valorStr = String(valor).toUpperCase();
   if (['SI', 'SÍ', 'TRUE', '1', 'YES'].includes(valorStr)) {
@@ -877,7 +930,29 @@ function configurarFiltrosCruce() {
   }
 }
 
+// Referencia al cruce guardado en el backend con los filtros activos de la tabla
+function origenExportacionCruce() {
+  const filtros = window.appStateStep3.filtrosActivos || {};
+  return {
+    paso: 'step3_p3',
+    filtros: {
+      contiene: { N_WO: filtros.n_wo || '', CLIENTE: filtros.cliente || '', CONTRATO: filtros.contrato || '' },
+      igual: { Estado_Paso1: filtros.estado_paso1 || '', 'Apto RPA': filtros.apto_rpa || '' }
+    }
+  };
+}
+
+let temporizadorFiltrosCruce = null;
+
 function aplicarFiltrosCruce() {
+  if (window.appStateStep3.paginacionServidor) {
+    // Filtrado en el backend: se espera a que el usuario deje de escribir
+    window.appStateStep3.paginacion.paginaActual = 1;
+    clearTimeout(temporizadorFiltrosCruce);
+    temporizadorFiltrosCruce = setTimeout(cargarPaginaCruce, 250);
+    return;
+  }
+
   const datosOriginales = window.appStateStep3.datosCruzados || [];
   
   const filtros = {
@@ -931,12 +1006,6 @@ function aplicarFiltrosCruce() {
   mostrarTablaCruce();
   mostrarControlesPaginacionCruce();
   
-  // Actualizar contador
-  const contador = document.getElementById('contador-filtrados-cruce');
-  if (contador) {
-    contador.textContent = `${datosFiltrados.length} registros mostrados`;
-  }
-  
   actualizarContadorFiltrosCruce();
 }
 
@@ -961,6 +1030,12 @@ function limpiarFiltrosCruce() {
     }
   });
   
+  if (window.appStateStep3.paginacionServidor) {
+    window.appStateStep3.paginacion.paginaActual = 1;
+    cargarPaginaCruce();
+    return;
+  }
+
   // Restaurar datos originales
   window.appStateStep3.datosFiltrados = [...(window.appStateStep3.datosCruzados || [])];
   
@@ -981,7 +1056,7 @@ function limpiarFiltrosCruce() {
 function actualizarContadorFiltrosCruce() {
   const contador = document.getElementById('contador-filtrados-cruce');
   if (contador) {
-    contador.textContent = `${window.appStateStep3.datosFiltrados.length} registros mostrados`;
+    contador.textContent = `${window.appStateStep3.paginacion.totalRegistros} registros mostrados`;
   }
 }
 
@@ -1179,10 +1254,8 @@ function exportarCruce() {
     return;
   }
 
-  const datos = window.appStateStep3.datosFiltrados || [];
-
   exportarExcel(
-    { contexto: 'step3_p3', detalle: datos },
+    { contexto: 'step3_p3', origen: origenExportacionCruce() },
     "CrucePaso3.xlsx",
     (resp) => console.log("✅ Exportación completada", resp),
     (err) => console.error("❌ Error al exportar", err)
@@ -23,7 +23,7 @@ window.appStateStep4 = window.appStateStep4 || {
 let __exportUtilsPromise = null;
 function loadExportUtils() {
   if (!__exportUtilsPromise) {
-    __exportUtilsPromise = import('/static/js/export-utils.js'); // ruta absoluta
+    __exportUtilsPromise = import('./export-utils.js'); // relativa a step4.js (misma huella de estáticos)
   }
   return __exportUtilsPromise;
 }
@@ -725,8 +725,10 @@ async function handleExportarRPA(e) {
     await exportarExcel(
       {
         contexto: 'step4_rpa', // para que el backend ejecute la rama del Paso 4
-        detalle,
-        estadisticas: window.appStateStep4.estadisticasRPA
+        formato: document.getElementById('formato-exportacion-rpa')?.value || 'xlsx',
+        origen: { paso: 'step4_rpa' }, // el backend selecciona desde su propio cruce
+        // >1: un fichero por bot (sin separar contratos) más un manifiesto
+        particiones: parseInt(document.getElementById('particiones-exportacion-rpa')?.value, 10) || 1,
       },
       "Aptos_RPA_P4.xlsx",
       // onSuccess
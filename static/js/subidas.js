@@ -0,0 +1,191 @@
+// Subida de archivos en binario por bloques al servidor Bottle
+// Evita enviar el archivo como base64 por el puente de pywebview: el backend
+// escribe cada bloque directamente en disco y devuelve un 'archivo_id' que
+// aceptan validar_archivo_workorder y procesar_archivo_woq.
+// Se envía el SHA-256 del archivo al iniciar: si el backend ya tiene ese
+// contenido, la subida se completa sin transferir ningún bloque.
+
+const TAMANO_BLOQUE_POR_DEFECTO = 4 * 1024 * 1024;
+
+async function leerJSON(respuesta) {
+  const datos = await respuesta.json().catch(() => ({}));
+  if (!respuesta.ok || datos.success === false) {
+    const error = new Error(datos.message || `Error HTTP ${respuesta.status}`);
+    error.estado = respuesta.status;
+    throw error;
+  }
+  return datos;
+}
+
+// Constantes de SHA-256 (FIPS 180-4)
+const K_SHA256 = new Uint32Array([
+  0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+  0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+  0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+  0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+  0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+  0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+  0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+  0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+]);
+
+const rotar = (x, n) => (x >>> n) | (x << (32 - n));
+
+/**
+ * SHA-256 incremental: crypto.subtle.digest solo acepta el contenido entero,
+ * lo que obligaba a cargar el archivo completo en memoria para calcularlo.
+ */
+class Sha256Incremental {
+  constructor() {
+    this.estado = new Uint32Array([
+      0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+    ]);
+    this.pendiente = new Uint8Array(64);
+    this.usados = 0;
+    this.longitud = 0;
+    this.w = new Uint32Array(64);
+  }
+
+  procesarBloque(datos, inicio) {
+    const w = this.w;
+    for (let i = 0; i < 16; i++) {
+      const j = inicio + i * 4;
+      w[i] = (datos[j] << 24) | (datos[j + 1] << 16) | (datos[j + 2] << 8) | datos[j + 3];
+    }
+    for (let i = 16; i < 64; i++) {
+      const s0 = rotar(w[i - 15], 7) ^ rotar(w[i - 15], 18) ^ (w[i - 15] >>> 3);
+      const s1 = rotar(w[i - 2], 17) ^ rotar(w[i - 2], 19) ^ (w[i - 2] >>> 10);
+      w[i] = (w[i - 16] + s0 + w[i - 7] + s1) | 0;
+    }
+    const estado = this.estado;
+    let a = estado[0], b = estado[1], c = estado[2], d = estado[3];
+    let e = estado[4], f = estado[5], g = estado[6], h = estado[7];
+    for (let i = 0; i < 64; i++) {
+      const t1 = (h + (rotar(e, 6) ^ rotar(e, 11) ^ rotar(e, 25)) + ((e & f) ^ (~e & g)) + K_SHA256[i] + w[i]) | 0;
+      const t2 = ((rotar(a, 2) ^ rotar(a, 13) ^ rotar(a, 22)) + ((a & b) ^ (a & c) ^ (b & c))) | 0;
+      h = g; g = f; f = e; e = (d + t1) | 0;
+      d = c; c = b; b = a; a = (t1 + t2) | 0;
+    }
+    estado[0] += a; estado[1] += b; estado[2] += c; estado[3] += d;
+    estado[4] += e; estado[5] += f; estado[6] += g; estado[7] += h;
+  }
+
+  actualizar(datos) {
+    this.longitud += datos.length;
+    let i = 0;
+    if (this.usados > 0) {
+      const n = Math.min(64 - this.usados, datos.length);
+      this.pendiente.set(datos.subarray(0, n), this.usados);
+      this.usados += n;
+      i = n;
+      if (this.usados < 64) return;
+      this.procesarBloque(this.pendiente, 0);
+      this.usados = 0;
+    }
+    for (; i + 64 <= datos.length; i += 64) this.procesarBloque(datos, i);
+    this.pendiente.set(datos.subarray(i), 0);
+    this.usados = datos.length - i;
+  }
+
+  hex() {
+    const bits = this.longitud * 8;
+    const relleno = new Uint8Array((this.usados < 56 ? 56 : 120) - this.usados + 8);
+    relleno[0] = 0x80;
+    const vista = new DataView(relleno.buffer);
+    vista.setUint32(relleno.length - 8, Math.floor(bits / 0x100000000));
+    vista.setUint32(relleno.length - 4, bits >>> 0);
+    this.actualizar(relleno);
+    return Array.from(this.estado, (x) => x.toString(16).padStart(8, '0')).join('');
+  }
+}
+
+/**
+ * SHA-256 en hexadecimal del archivo, leído por trozos con archivo.slice()
+ * para no cargarlo entero en memoria; null si no se pudo leer.
+ * @param {File} archivo
+ * @param {number} [tamanoTrozo]
+ * @returns {Promise<string|null>}
+ */
+async function sha256Archivo(archivo, tamanoTrozo = TAMANO_BLOQUE_POR_DEFECTO) {
+  try {
+    const resumen = new Sha256Incremental();
+    for (let offset = 0; offset < archivo.size; offset += tamanoTrozo) {
+      const trozo = await archivo.slice(offset, offset + tamanoTrozo).arrayBuffer();
+      resumen.actualizar(new Uint8Array(trozo));
+    }
+    return resumen.hex();
+  } catch (error) {
+    console.warn("⚠️ No se pudo calcular el SHA-256 del archivo:", error);
+    return null;
+  }
+}
+
+/**
+ * Sube un archivo en bloques binarios.
+ * @param {File} archivo
+ * @param {Object} [opciones]
+ * @param {Function} [opciones.onProgreso] - Recibe el porcentaje subido (0-100)
+ * @returns {Promise<Object>} { archivo_id, nombre, recibido, sha256, duplicada }
+ */
+export async function subirArchivo(archivo, opciones = {}) {
+  const { onProgreso } = opciones;
+  const sha256 = await sha256Archivo(archivo);
+  const inicio = await leerJSON(await fetch('/subidas', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ nombre: archivo.name, tamano: archivo.size, ...(sha256 ? { sha256 } : {}) })
+  }));
+  if (inicio.completada) {
+    // Contenido ya almacenado en el backend: no hay nada que enviar
+    if (onProgreso) onProgreso(100);
+    return inicio;
+  }
+  const id = inicio.subida_id;
+  const tamanoBloque = inicio.tamano_bloque || TAMANO_BLOQUE_POR_DEFECTO;
+
+  try {
+    for (let offset = 0; offset < archivo.size; offset += tamanoBloque) {
+      const bloque = archivo.slice(offset, offset + tamanoBloque);
+      await leerJSON(await fetch(`/subidas/${id}`, {
+        method: 'PUT',
+        headers: { 'Content-Type': 'application/octet-stream', 'X-Offset': String(offset) },
+        body: bloque
+      }));
+      if (onProgreso) onProgreso(Math.min(100, ((offset + bloque.size) / archivo.size) * 100));
+    }
+    return await leerJSON(await fetch(`/subidas/${id}/fin`, { method: 'POST' }));
+  } catch (error) {
+    fetch(`/subidas/${id}`, { method: 'DELETE' }).catch(() => {});
+    throw error;
+  }
+}
+
+function leerBase64(archivo) {
+  return new Promise((resolve, reject) => {
+    const reader = new FileReader();
+    reader.onload = () => {
+      const partes = String(reader.result).split(',');
+      if (partes.length < 2) reject(new Error("Formato de base64 inválido"));
+      else resolve(partes[1]);
+    };
+    reader.onerror = () => reject(new Error("Error al leer el archivo"));
+    reader.readAsDataURL(archivo);
+  });
+}
+
+/**
+ * Payload de archivo para las llamadas de validación: { nombre, archivo_id }
+ * con la subida binaria o, si el servidor no la admite, { nombre, base64 }.
+ * @param {File} archivo
+ * @param {Object} [opciones] - Ver subirArchivo
+ */
+export async function payloadArchivo(archivo, opciones = {}) {
+  try {
+    const subida = await subirArchivo(archivo, opciones);
+    return { nombre: archivo.name, archivo_id: subida.archivo_id };
+  } catch (error) {
+    if (error.estado === 413) throw error; // demasiado grande: tampoco cabe en base64
+    console.warn("⚠️ Subida binaria no disponible, se envía en base64:", error);
+    return { nombre: archivo.name, base64: await leerBase64(archivo) };
+  }
+}
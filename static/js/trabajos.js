@@ -0,0 +1,164 @@
+// Trabajos en segundo plano (validación, WOQ, cruce, exportación)
+// El backend ejecuta la operación en un pool de hilos y aquí se consulta su
+// estado periódicamente, sin bloquear la UI mientras dura. Si el navegador
+// admite EventSource, el progreso (etapas y métricas: filas leídas, grupos
+// validados, filas guardadas y su ritmo) llega además al momento por SSE desde
+// /trabajos/<id>/eventos y la consulta periódica solo recoge el resultado.
+// Con el servidor de un solo hilo (eventos_sse: false) no se abre el flujo
+// SSE, que ocuparía el único hilo: el progreso llega solo por la consulta.
+
+// Método síncrono equivalente (si el backend no expone iniciar_trabajo)
+const METODOS_SINCRONOS = {
+  validar_workorder: 'validar_archivo_workorder',
+  procesar_woq: 'procesar_archivo_woq',
+  cruce: 'realizar_cruce_datos',
+  exportar: 'exportar_excel_con_ruta'
+};
+
+const ETIQUETAS_ETAPA = {
+  'en cola': 'En cola',
+  inicio: 'Iniciando',
+  recepcion: 'Recibiendo archivo',
+  lectura: 'Leyendo datos',
+  limpieza: 'Limpiando datos',
+  validacion: 'Validando',
+  guardado: 'Guardando',
+  cruce: 'Cruzando datos',
+  estadisticas: 'Calculando estadísticas',
+  serializacion: 'Preparando resultados',
+  seleccion: 'Seleccionando registros',
+  escritura: 'Escribiendo archivo',
+  completado: 'Completado'
+};
+
+const ETIQUETAS_METRICA = {
+  filas_leidas: 'filas leídas',
+  filas_validas: 'filas válidas',
+  grupos_validados: 'grupos validados',
+  filas_guardadas: 'filas guardadas',
+  filas_cruzadas: 'filas cruzadas'
+};
+
+const INTERVALO_CON_EVENTOS_MS = 1500;
+
+const esperar = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+const numero = (n) => Number(n).toLocaleString('es-ES', { maximumFractionDigits: 0 });
+
+/**
+ * Texto de la última métrica recibida por SSE (p. ej. "12.500/40.000 grupos validados (8.300/s)").
+ * @param {Object} metrica - Evento 'metrica' de /trabajos/<id>/eventos
+ */
+export function describirMetrica(metrica) {
+  if (!metrica) return '';
+  const nombre = ETIQUETAS_METRICA[metrica.metrica] || metrica.metrica;
+  const cantidad = metrica.total ? `${numero(metrica.valor)}/${numero(metrica.total)}` : numero(metrica.valor);
+  const ritmo = metrica.por_segundo ? ` (${numero(metrica.por_segundo)}/s)` : '';
+  return `${cantidad} ${nombre}${ritmo}`;
+}
+
+/**
+ * Suscripción SSE a los eventos de un trabajo.
+ * @param {string} trabajoId
+ * @param {Function} onEvento - Recibe cada evento ({ id, tipo, etapa, porcentaje, ... })
+ * @returns {Function|null} Función para cerrar la suscripción (null sin EventSource)
+ */
+export function escucharEventos(trabajoId, onEvento) {
+  if (typeof EventSource === 'undefined') return null;
+  const fuente = new EventSource(`/trabajos/${encodeURIComponent(trabajoId)}/eventos`);
+  const recibir = (mensaje) => {
+    try {
+      const evento = JSON.parse(mensaje.data);
+      onEvento(evento);
+      if (evento.tipo === 'fin') fuente.close();
+    } catch (error) {
+      console.warn('⚠️ Evento de trabajo ilegible:', error);
+    }
+  };
+  ['inicio', 'etapa', 'progreso', 'metrica', 'fin'].forEach((tipo) => fuente.addEventListener(tipo, recibir));
+  return () => fuente.close();
+}
+
+/**
+ * Texto legible de la etapa de un trabajo.
+ * @param {Object} estado - Respuesta de estado_trabajo
+ */
+export function describirEtapa(estado) {
+  const etapa = ETIQUETAS_ETAPA[estado?.etapa] || estado?.etapa || '';
+  const metrica = estado?.metrica && estado.metrica.etapa === estado.etapa ? ` · ${describirMetrica(estado.metrica)}` : '';
+  return `${etapa}… ${Math.round(estado?.porcentaje || 0)}%${metrica}`;
+}
+
+/**
+ * Ejecuta una operación como trabajo en segundo plano y espera su resultado.
+ * @param {string} tipo - 'validar_workorder' | 'procesar_woq' | 'cruce' | 'exportar'
+ * @param {Object|null} payload - Mismo argumento que el método síncrono
+ * @param {Object} [opciones]
+ * @param {Function} [opciones.onProgreso] - Recibe el estado en cada consulta y en cada evento SSE
+ *   (con 'metrica' = último evento de métrica)
+ * @param {Function} [opciones.onInicio] - Recibe el trabajo_id (p. ej. para cancelar)
+ * @param {number} [opciones.intervaloMs=400] - Intervalo de consulta
+ * @param {number} [opciones.limiteSegundos] - Deadline del trabajo en el backend
+ * @returns {Promise<Object>} Resultado del método (mismo formato que la llamada síncrona)
+ */
+export async function ejecutarTrabajo(tipo, payload = null, opciones = {}) {
+  const api = window.pywebview?.api;
+  if (!api) throw new Error('pywebview no disponible');
+
+  if (typeof api.iniciar_trabajo !== 'function') {
+    const metodo = METODOS_SINCRONOS[tipo];
+    return payload === null ? api[metodo]() : api[metodo](payload);
+  }
+
+  const { onProgreso, onInicio, intervaloMs = 400, limiteSegundos = null } = opciones;
+  const inicio = await api.iniciar_trabajo(tipo, payload, limiteSegundos);
+  if (!inicio?.success) {
+    return { success: false, message: inicio?.message || 'No se pudo iniciar el trabajo' };
+  }
+  if (onInicio) onInicio(inicio.trabajo_id);
+
+  // Progreso en vivo por SSE; el estado consultado conserva la última métrica
+  let ultimo = { etapa: 'en cola', porcentaje: 0 };
+  let metrica = null;
+  const cerrarEventos = onProgreso && inicio.eventos_sse !== false ? escucharEventos(inicio.trabajo_id, (evento) => {
+    if (evento.tipo === 'metrica') metrica = evento;
+    if (evento.tipo === 'fin') return;
+    ultimo = { ...ultimo, etapa: evento.etapa, porcentaje: Math.max(ultimo.porcentaje || 0, evento.porcentaje) };
+    onProgreso({ ...ultimo, metrica });
+  }) : null;
+
+  try {
+    while (true) {
+      const estado = await api.estado_trabajo(inicio.trabajo_id);
+      if (!estado?.success) {
+        return { success: false, message: estado?.message || 'Trabajo no encontrado' };
+      }
+      ultimo = estado;
+      if (onProgreso) onProgreso({ ...estado, metrica });
+
+      if (estado.finalizado) {
+        if (estado.estado === 'completado') {
+          // El backend libera el resultado tras entregarlo una vez
+          if ('resultado' in estado) return estado.resultado;
+          return { success: false, message: 'El resultado del trabajo ya fue entregado' };
+        }
+        return { success: false, cancelado: estado.estado !== 'error', message: estado.mensaje || estado.estado };
+      }
+      await esperar(cerrarEventos ? Math.max(intervaloMs, INTERVALO_CON_EVENTOS_MS) : intervaloMs);
+    }
+  } finally {
+    if (cerrarEventos) cerrarEventos();
+  }
+}
+
+/**
+ * Solicita la cancelación cooperativa de un trabajo.
+ * @param {string} trabajoId
+ */
+export async function cancelarTrabajo(trabajoId) {
+  const api = window.pywebview?.api;
+  if (!api || typeof api.cancelar_trabajo !== 'function') return { success: false };
+  return api.cancelar_trabajo(trabajoId);
+}
+
+// Acceso para scripts que no son módulos
+window.WOGestTrabajos = { ejecutarTrabajo, cancelarTrabajo, describirEtapa, describirMetrica, escucharEventos };
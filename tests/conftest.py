@@ -0,0 +1,56 @@
+"""
+Fixtures comunes: datos sintéticos (procesamiento.sintetico) y una sesión
+con su base SQLite en una carpeta temporal, para no tocar .wogest/.
+"""
+
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from procesamiento import db_sqlite
+from procesamiento.sesiones import en_sesion, nueva_sesion
+from procesamiento.sintetico import generar_juego
+
+FILAS_JUEGO = 300
+
+
+@pytest.fixture(scope="session", autouse=True)
+def directorio_proyecto():
+    """Las rutas de config/ son relativas a la raíz del proyecto (como al ejecutar main.py)"""
+    anterior = os.getcwd()
+    os.chdir(RAIZ)
+    yield
+    os.chdir(anterior)
+
+
+@pytest.fixture(scope="session")
+def juego(tmp_path_factory):
+    """WorkOrder y WOQ sintéticos de FILAS_JUEGO filas (ver generar_juego)"""
+    return generar_juego(str(tmp_path_factory.mktemp("sintetico")), FILAS_JUEGO)
+
+
+@pytest.fixture
+def sesion(tmp_path, monkeypatch):
+    """Sesión nueva con la base SQLite en tmp_path"""
+    monkeypatch.setattr(db_sqlite, "_directorio_bd", lambda: tmp_path)
+    sesion = nueva_sesion()
+    with en_sesion(sesion):
+        db_sqlite.init_db()
+        yield sesion
+    db_sqlite.eliminar_sesion(sesion)
+
+
+@pytest.fixture
+def tablas_cargadas(sesion, juego):
+    """temp_paso1 y temp_paso2 de la sesión cargadas desde el juego sintético"""
+    from procesamiento.paso1 import obtener_validador
+    from procesamiento.paso2 import procesar_woq
+
+    assert obtener_validador().validar_renovaciones(juego["workorder"]["ruta"]).success
+    assert procesar_woq(juego["woq"]["ruta"]) is not None
+    assert db_sqlite.contar_registros("temp_paso2") > 0
+    return sesion
@@ -0,0 +1,28 @@
+import os
+
+from procesamiento import db_sqlite
+from procesamiento.lote import ParLote, ejecutar_lote
+
+
+def test_nombres_de_salida_saneados_y_unicos(juego, tmp_path, monkeypatch):
+    monkeypatch.setattr(db_sqlite, "_directorio_bd", lambda: tmp_path)
+    par = dict(workorder=juego["workorder"]["ruta"], woq=[juego["woq"]["ruta"]])
+    pares = [ParLote(nombre="../fuera/par", **par), ParLote(nombre="../fuera/par", **par)]
+    salida = tmp_path / "salida"
+
+    resultado = ejecutar_lote(pares, str(salida), formato="csv")
+
+    assert resultado["success"], resultado["message"]
+    archivos = [r["archivo_rpa"] for r in resultado["resultados"]]
+    assert [os.path.basename(a) for a in archivos] == ["Aptos_RPA_001__fuera_par.csv",
+                                                       "Aptos_RPA_002__fuera_par.csv"]
+    for archivo in archivos:
+        assert os.path.dirname(archivo) == str(salida)
+        assert os.path.isfile(archivo)
+
+
+def test_paralelo_no_entero(juego, tmp_path):
+    par = ParLote(nombre="par", workorder=juego["workorder"]["ruta"], woq=[juego["woq"]["ruta"]])
+    resultado = ejecutar_lote([par], str(tmp_path), paralelo="dos")
+    assert not resultado["success"]
+    assert "paralelo" in resultado["message"]
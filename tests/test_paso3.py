@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+from procesamiento import db_sqlite, paso3
+from procesamiento.trabajos import TrabajoCancelado
+
+
+def _cruce_en_memoria():
+    return paso3.realizar_cruce_datos(db_sqlite.leer_temp_paso1(), db_sqlite.leer_temp_paso2(),
+                                      incluir_filas=False)
+
+
+def test_cruce_fuera_de_memoria_igual_que_en_memoria(tablas_cargadas):
+    memoria = _cruce_en_memoria()
+    # Lotes pequeños para que el merge cruce varias fronteras de lote
+    disco = paso3.realizar_cruce_datos_sqlite(tamano_lote=37)
+    assert memoria["success"] and disco["success"]
+
+    assert disco["estadisticas"] == memoria["estadisticas"]
+    assert disco["reporte"] == memoria["reporte"]
+
+    esperado = pd.DataFrame(paso3.registros_visibles(memoria["cruce"]))
+    obtenido = pd.DataFrame(paso3.registros_visibles(db_sqlite.leer_temp_cruce()))
+    pd.testing.assert_frame_equal(obtenido[esperado.columns], esperado, check_dtype=False)
+
+
+def test_cruce_cancelado_conserva_el_anterior(tablas_cargadas, monkeypatch):
+    assert paso3.realizar_cruce_datos_sqlite(tamano_lote=50)["success"]
+    filas = db_sqlite.contar_registros("temp_cruce")
+
+    llamadas = []
+
+    def cancelar(*args, **kwargs):
+        llamadas.append(args)
+        if len(llamadas) == 2:
+            raise TrabajoCancelado()
+
+    monkeypatch.setattr(paso3, "reportar_progreso", cancelar)
+    with pytest.raises(TrabajoCancelado):
+        paso3.realizar_cruce_datos_sqlite(tamano_lote=50)
+
+    assert db_sqlite.contar_registros("temp_cruce") == filas
+    conn = db_sqlite.get_connection()
+    try:
+        parcial = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = ?",
+                               (db_sqlite.TABLA_CRUCE_PARCIAL,)).fetchone()[0]
+    finally:
+        conn.close()
+    assert parcial == 0
+